@@ -9,6 +9,7 @@ from app.schemas.user import UserResponse
 from app.api.deps import get_current_user, require_role
 from app.database import get_db
 from app.services.notification_service import notification_service
+from app.services.wip_service import wip_service
 from datetime import datetime, timedelta
 
 router = APIRouter()
@@ -35,7 +36,7 @@ async def create_alert_config(
     config_dict = config_data.model_dump()
     config_dict['created_by'] = current_user.id
     
-    result = db.table('wip_alert_config').insert(config_dict).execute()
+    result = await db.table('wip_alert_config').insert(config_dict).execute()
     
     if not result.data:
         raise Exception("Failed to create alert configuration")
@@ -62,7 +63,7 @@ async def list_alert_configs(
     if is_active is not None:
         query = query.eq('is_active', is_active)
     
-    result = query.order('alert_type', 'stage_name').execute()
+    result = await query.order('alert_type', 'stage_name').execute()
     
     return [AlertConfigResponse(**config) for config in result.data]
 
@@ -75,7 +76,7 @@ async def get_alert_config(
     """Get alert configuration by ID"""
     db = get_db()
     
-    result = db.table('wip_alert_config').select('*').eq('id', config_id).execute()
+    result = await db.table('wip_alert_config').select('*').eq('id', config_id).execute()
     
     if not result.data:
         raise Exception(f"Alert configuration {config_id} not found")
@@ -97,7 +98,7 @@ async def update_alert_config(
     if not update_dict:
         return await get_alert_config(config_id, current_user)
     
-    result = db.table('wip_alert_config').update(update_dict).eq('id', config_id).execute()
+    result = await db.table('wip_alert_config').update(update_dict).eq('id', config_id).execute()
     
     if not result.data:
         raise Exception(f"Alert configuration {config_id} not found")
@@ -113,7 +114,7 @@ async def delete_alert_config(
     """Delete alert configuration"""
     db = get_db()
     
-    result = db.table('wip_alert_config').delete().eq('id', config_id).execute()
+    result = await db.table('wip_alert_config').delete().eq('id', config_id).execute()
     
     if not result.data:
         raise Exception(f"Alert configuration {config_id} not found")
@@ -157,7 +158,7 @@ async def list_alert_history(
     if is_acknowledged is not None:
         query = query.eq('is_acknowledged', is_acknowledged)
     
-    result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+    result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
     
     return [AlertHistoryResponse(**alert) for alert in result.data]
 
@@ -170,7 +171,7 @@ async def get_alert_history(
     """Get alert history by ID"""
     db = get_db()
     
-    result = db.table('wip_alert_history').select('*').eq('id', alert_id).execute()
+    result = await db.table('wip_alert_history').select('*').eq('id', alert_id).execute()
     
     if not result.data:
         raise Exception(f"Alert {alert_id} not found")
@@ -187,7 +188,7 @@ async def acknowledge_alert(
     """Acknowledge an alert"""
     db = get_db()
     
-    result = db.table('wip_alert_history').update({
+    result = await db.table('wip_alert_history').update({
         'is_acknowledged': True,
         'acknowledged_by': current_user.id,
         'acknowledged_at': datetime.utcnow().isoformat()
@@ -214,7 +215,7 @@ async def get_alert_summary(
     cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
     
     # Get all alerts in time period
-    alerts = db.table('wip_alert_history').select('*').gte('created_at', cutoff_date).execute()
+    alerts = await db.table('wip_alert_history').select('*').gte('created_at', cutoff_date).execute()
     
     total_alerts = len(alerts.data)
     unacknowledged = len([a for a in alerts.data if not a['is_acknowledged']])
@@ -287,7 +288,7 @@ async def list_notifications(
     if notification_type:
         query = query.eq('notification_type', notification_type)
     
-    result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+    result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
     
     return [NotificationLogResponse(**log) for log in result.data]
 
@@ -300,11 +301,10 @@ async def trigger_alert_check(
     Manually trigger alert checking.
     
     Checks all WIP metrics against configured thresholds and creates alerts.
+    New alerts are pushed to live subscribers of their notify roles.
     """
-    db = get_db()
-    
     try:
-        db.rpc('check_wip_alerts').execute()
-        return {"message": "Alert check completed successfully"}
+        alerts = await wip_service.check_alerts()
+        return {"message": "Alert check completed successfully", "alerts_created": len(alerts)}
     except Exception as e:
         raise Exception(f"Failed to check alerts: {str(e)}")
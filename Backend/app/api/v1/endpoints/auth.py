@@ -101,7 +101,7 @@ async def update_current_user_profile(
         )
     
     # Update user
-    result = db.table('users').update(update_data).eq('id', current_user.id).execute()
+    result = await db.table('users').update(update_data).eq('id', current_user.id).execute()
     
     if not result.data:
         raise HTTPException(
@@ -127,7 +127,7 @@ async def change_password(
     db = get_db()
     
     # Get user with password hash
-    user_result = db.table('users').select('password_hash').eq('id', current_user.id).execute()
+    user_result = await db.table('users').select('password_hash').eq('id', current_user.id).execute()
     
     if not user_result.data:
         raise HTTPException(
@@ -148,7 +148,7 @@ async def change_password(
     new_password_hash = get_password_hash(request.new_password)
     
     # Update password
-    db.table('users').update({
+    await db.table('users').update({
         'password_hash': new_password_hash
     }).eq('id', current_user.id).execute()
     
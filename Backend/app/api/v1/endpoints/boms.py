@@ -11,6 +11,7 @@ from app.schemas.bom import (
     BOMMaterialResponse,
     BOMCalculation, 
     BOMVersion, 
+    BOMVersionDiff,
     BOMDuplicateRequest, 
     BOMValidationResult,
     BOMMaterialCreate,
@@ -18,10 +19,15 @@ from app.schemas.bom import (
     ShortageCalculationRequest,
     BOMShortageCalculation,
     BOMMaterialWithShortage,
-    BOMCreateWithProduct
+    BOMCreateWithProduct,
+    WhereUsedResult,
+    BOMCycleReport,
+    ProductionPlanShortageRequest,
+    ProductionPlanShortage
 )
 from app.schemas.user import UserResponse
 from app.services.bom_service import bom_service
+from app.services.bom_service_enhancements import bom_service_enhancements
 from app.api.deps import get_current_user, require_role
 
 router = APIRouter()
@@ -68,12 +74,17 @@ async def list_boms(
     is_active: Optional[bool] = None,
     is_template: Optional[bool] = None,
     search: Optional[str] = None,
+    min_cost: Optional[Decimal] = Query(None, ge=0, description="Minimum total cost"),
+    max_cost: Optional[Decimal] = Query(None, ge=0, description="Maximum total cost"),
+    sort_by: str = Query("created_at", description="created_at, product_code, product_name, total_cost, material_count or version"),
+    sort_desc: bool = Query(True, description="Sort descending"),
     current_user: UserResponse = Depends(get_current_user)
 ):
     """
     List all BOMs with pagination and filters.
-    - Filter by product, active status, template status
+    - Filter by product, active status, template status, cost range
     - Search by product code/name
+    - Sort by date, product, cost or material count
     """
     return await bom_service.list_boms(
         page=page,
@@ -81,7 +92,11 @@ async def list_boms(
         product_id=product_id,
         is_active=is_active,
         is_template=is_template,
-        search=search
+        search=search,
+        min_cost=min_cost,
+        max_cost=max_cost,
+        sort_by=sort_by,
+        sort_desc=sort_desc
     )
 
 
@@ -126,6 +141,31 @@ async def get_bom_versions(
     return await bom_service.get_bom_versions(bom_id)
 
 
+@router.get("/{bom_id}/versions/{version}", response_model=BOMVersion)
+async def get_bom_version(
+    bom_id: str,
+    version: int,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get one BOM version with its full snapshot."""
+    return await bom_service.get_bom_version(bom_id, version)
+
+
+@router.get("/{bom_id}/versions/{from_version}/diff/{to_version}", response_model=BOMVersionDiff)
+async def diff_bom_versions(
+    bom_id: str,
+    from_version: int,
+    to_version: int,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Compare two BOM versions.
+    - Header field changes and added / removed / changed material lines
+    - Either version may be the older one
+    """
+    return await bom_service.diff_bom_versions(bom_id, from_version, to_version)
+
+
 @router.post("/{bom_id}/duplicate", response_model=BOMResponse, status_code=status.HTTP_201_CREATED)
 async def duplicate_bom(
     bom_id: str,
@@ -305,6 +345,24 @@ async def calculate_requirements_with_shortages(
     )
 
 
+@router.post("/calculate-plan-shortages", response_model=ProductionPlanShortage)
+async def calculate_plan_shortages(
+    request: ProductionPlanShortageRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Calculate material shortages for a whole production plan.
+    
+    - **items**: list of (product_id, quantity) pairs
+    - Each item is analysed like /calculate-with-shortages
+    - **materials** checks the plan's combined requirement per material
+    """
+    return await bom_service.calculate_plan_shortages(
+        items=request.items,
+        target_location_id=request.target_location_id,
+        include_allocated=request.include_allocated
+    )
+
 @router.get("/{bom_id}/materials-with-shortages", response_model=List[BOMMaterialWithShortage])
 async def get_bom_materials_with_shortages(
     bom_id: str,
@@ -337,4 +395,85 @@ async def get_bom_materials_with_shortages(
     - shortage_status: "Sufficient" or "Shortage"
     - shortage_display: null or "Need 8000 m" ← For the new column!
     """
-    return await bom_service.get_bom_materials_with_shortages(bom_id, production_qty)
\ No newline at end of file
+    return await bom_service.get_bom_materials_with_shortages(bom_id, production_qty)
+
+# ========================================
+# WHERE-USED
+# ========================================
+
+@router.get("/where-used/{material_id}", response_model=WhereUsedResult)
+async def get_material_where_used(
+    material_id: str,
+    active_only: bool = Query(True, description="Only active BOMs"),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get every BOM that consumes a material.
+    - Includes use inside sub-assemblies at any depth (`min_level` > 0)
+    - Quantities are per BOM batch and per finished unit, scrap included
+    """
+    return await bom_service.get_where_used(material_id, active_only)
+
+# ========================================
+# MULTI-LEVEL BOM ENDPOINTS (SUB-ASSEMBLIES)
+# ========================================
+
+@router.get("/sub-assemblies/cycles", response_model=BOMCycleReport)
+async def validate_sub_assembly_cycles(
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Check all BOMs for circular sub-assembly references.
+    - Loops are listed as BOM ids and product codes, first BOM repeated at the end
+    """
+    return await bom_service_enhancements.validate_sub_assembly_cycles()
+
+
+@router.get("/{bom_id}/hierarchy", response_model=dict)
+async def get_bom_hierarchy(
+    bom_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get the BOM as a tree.
+    - Sub-assembly lines carry their own materials under `children`
+    """
+    return await bom_service_enhancements.get_bom_hierarchy(bom_id)
+
+
+@router.get("/{bom_id}/exploded", response_model=List[dict])
+async def get_exploded_bom(
+    bom_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get all leaf materials across every sub-assembly level.
+    - Quantities are multiplied through the levels, scrap included
+    - Materials used in several places are consolidated
+    """
+    return await bom_service_enhancements.get_exploded_bom(bom_id)
+
+
+@router.get("/{bom_id}/total-cost", response_model=dict)
+async def get_bom_total_cost(
+    bom_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get the material cost of the BOM including all sub-assembly levels.
+    """
+    total_cost = await bom_service_enhancements.calculate_total_cost_with_subassemblies(bom_id)
+    return {"bom_id": bom_id, "total_cost": float(total_cost)}
+
+
+@router.post("/{bom_id}/recalculate-levels", response_model=dict)
+async def recalculate_bom_levels(
+    bom_id: str,
+    current_user: UserResponse = Depends(require_role("Planner"))
+):
+    """
+    Recalculate the hierarchy level of every material line in the BOM tree.
+    - Large trees are recalculated in the background (`queued` is true and
+      `updated_materials` is null)
+    """
+    return await bom_service_enhancements.request_level_recalculation(bom_id)
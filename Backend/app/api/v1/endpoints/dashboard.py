@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
-from typing import List
-from app.schemas.dashboard import DashboardResponse, QuickAction
+from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+from app.schemas.dashboard import DashboardResponse, QuickAction, ActivityFeedPage
 from app.schemas.user import UserResponse
 from app.services.dashboard_service import dashboard_service
+from app.services.activity_service import activity_service
 from app.api.deps import get_current_user
 
 router = APIRouter()
@@ -21,8 +22,12 @@ async def get_dashboard(
     - Material shortages list
     - Rework alerts
     - Recent activities
+    - Per-section timings in `meta` (a section that times out is served
+      from its last good value, `from_cache` = true)
+    - Quick actions for the current user's roles
     
-    Data is role-based and filtered for the current user.
+    Served from a snapshot that is rebuilt in the background (see
+    `last_updated`); only quick actions are computed per request.
     """
     return await dashboard_service.get_dashboard_data(
         user_id=current_user.id,
@@ -57,6 +62,21 @@ async def get_quick_actions(
     return await dashboard_service.get_quick_actions(current_user.roles)
 
 
+@router.get("/activity", response_model=ActivityFeedPage)
+async def get_activity_feed(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    activity_type: Optional[str] = Query(None, description="e.g. inventory_in, gate_entry_accepted, transfer"),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get all activity, newest first.
+    
+    Cursor-paginated: pass `next_cursor` back as `cursor` until it is null.
+    """
+    return await activity_service.get_feed(limit, cursor, activity_type)
+
+
 @router.get("/orders-summary")
 async def get_orders_summary(
     current_user: UserResponse = Depends(get_current_user)
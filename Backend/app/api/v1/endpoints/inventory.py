@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, Query
+import json
+from fastapi import APIRouter, Depends, Query, Request
 from typing import List, Optional
 from app.schemas.inventory import (
-    InventoryResponse, InventoryListItem, StockByProduct,
+    InventoryResponse, InventoryListPage, StockByProduct,
     InventoryTransactionCreate, InventoryTransactionResponse,
     StockAlertCreate, StockAlertUpdate, StockAlertResponse,
-    ShortageAlert, LocationResponse
+    ShortageAlert, LocationResponse, InventorySummary, StockPosition, BulkTransactionResult
 )
 from app.schemas.user import UserResponse
 from app.services.inventory_service import inventory_service
+from app.services.stock_snapshot_service import stock_snapshot_service
 from app.api.deps import get_current_user, require_role
+from app.core.exceptions import ValidationException
 from app.schemas.inventory import InventoryTransactionCreate
 from decimal import Decimal
 
@@ -49,7 +52,7 @@ async def get_location(
 # INVENTORY ENDPOINTS
 # =============================================
 
-@router.get("/", response_model=List[InventoryListItem])
+@router.get("/", response_model=InventoryListPage)
 async def list_inventory(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
@@ -57,20 +60,22 @@ async def list_inventory(
     location_id: Optional[str] = None,
     search: Optional[str] = None,
     low_stock_only: bool = False,
+    after: Optional[str] = Query(None, description="next_after from the previous page"),
     current_user: UserResponse = Depends(get_current_user)
 ):
     """
     List inventory with pagination and filters.
     
-    - **page**: Page number
+    - **page**: Page number (ignored when `after` is given)
     - **limit**: Items per page (max 100)
     - **product_id**: Filter by specific product
     - **location_id**: Filter by specific location
     - **search**: Search in product code/name
     - **low_stock_only**: Show only items below minimum stock level
+    - **after**: Cursor for the next page; pass `next_after` back until it is null
     """
     return await inventory_service.list_inventory(
-        page, limit, product_id, location_id, search, low_stock_only
+        page, limit, product_id, location_id, search, low_stock_only, after
     )
 
 
@@ -134,6 +139,47 @@ async def record_transaction(
     )
 
 
+@router.post("/transactions/bulk", response_model=BulkTransactionResult)
+async def record_transactions_bulk(
+    request: Request,
+    current_user: UserResponse = Depends(require_role("Store Manager"))
+):
+    """
+    Record many inventory transactions in one call (goods receipt, stock-take).
+    
+    Send either:
+    - **JSON**: a list of transactions, or `{"transactions": [...]}`
+    - **CSV**: a `text/csv` body or a multipart `file` upload with a header row
+    
+    Each line takes the fields of `POST /transactions`; `product_code`,
+    `from_location_code` and `to_location_code` may be used instead of ids.
+    Invalid lines and lines that would drive stock negative are reported
+    per line and skipped; all other lines are applied.
+    """
+    content_type = request.headers.get('content-type', '')
+    
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            raise ValidationException(detail="Multipart upload must include a 'file' field")
+        lines = inventory_service.parse_transactions_csv((await upload.read()).decode('utf-8'))
+    elif 'csv' in content_type:
+        lines = inventory_service.parse_transactions_csv((await request.body()).decode('utf-8'))
+    else:
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            raise ValidationException(detail="Request body must be JSON or CSV")
+        if isinstance(payload, dict):
+            payload = payload.get('transactions')
+        if not isinstance(payload, list) or not all(isinstance(line, dict) for line in payload):
+            raise ValidationException(detail="Expected a list of transactions")
+        lines = payload
+    
+    return await inventory_service.record_transactions_bulk(lines, current_user.id)
+
+
 @router.get("/transactions", response_model=List[InventoryTransactionResponse])
 async def list_transactions(
     page: int = Query(1, ge=1),
@@ -288,7 +334,7 @@ async def adjust_inventory(
     transaction = InventoryTransactionCreate(
         transaction_type="ADJUSTMENT",
         product_id=product_id,
-        quantity=Decimal(str(adjustment_qty)),
+        quantity=abs(Decimal(str(adjustment_qty))),
         to_location_id=location_id if adjustment_qty > 0 else None,
         from_location_id=location_id if adjustment_qty < 0 else None,
         lot_number=lot_number,
@@ -297,7 +343,7 @@ async def adjust_inventory(
     
     return await inventory_service.record_transaction(transaction, current_user.id)
 
-@router.get("/summary")
+@router.get("/summary", response_model=InventorySummary)
 async def get_inventory_summary(
     current_user: UserResponse = Depends(get_current_user)
 ):
@@ -306,11 +352,15 @@ async def get_inventory_summary(
     
     Returns:
     - total_materials: Total count of inventory items
-    - low_stock_count: Items below minimum stock
-    - critical_count: Items with zero stock
+    - total_skus: Distinct products with an inventory record
+    - low_stock_count: Items with an alert whose stock is below minimum (not zero)
+    - critical_count: Items with an alert and zero stock
+    - out_of_stock_count: Items with no available stock
     - sufficient_count: Items at or above minimum stock
+    - total_available_qty / total_allocated_qty: Quantities across all items
     
-    Used for dashboard KPI cards.
+    Used for dashboard KPI cards. Counters are maintained incrementally in
+    the database, so this reads a single row.
     """
     return await inventory_service.get_inventory_summary()
 
@@ -412,6 +462,32 @@ async def get_stock_movements(
     )
 
 
+@router.get("/stock-as-of", response_model=List[StockPosition])
+async def get_stock_as_of(
+    as_of: datetime = Query(..., description="Point in time"),
+    product_id: Optional[str] = None,
+    location_id: Optional[str] = None,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get stock on hand at a point in time.
+    - Reads the nearest stock snapshot and replays only the ledger in between
+    - Filter by product and/or location
+    """
+    return await inventory_service.get_stock_as_of(as_of, product_id, location_id)
+
+
+@router.post("/snapshots", response_model=dict)
+async def take_stock_snapshot(
+    current_user: UserResponse = Depends(require_role("Admin"))
+):
+    """
+    Take the stock balance snapshot that is due now.
+    Normally run by the background job; a snapshot that already exists is skipped.
+    """
+    return await stock_snapshot_service.take_snapshot()
+
+
 # ========================================
 # ALLOCATION/RELEASE (For Production Orders)
 # ========================================
@@ -3,10 +3,11 @@ from typing import List, Optional
 from app.schemas.production_order import (
     ProductionOrderCreate, ProductionOrderUpdate, ProductionOrderResponse,
     ProductionOrderListItem, MaterialRequirement, OrderProgress, OrderStatusUpdate,
-    TeamAssignment, ProductionOrderValidation
+    TeamAssignment, ProductionOrderValidation, MRPRunResult
 )
 from app.schemas.user import UserResponse
 from app.services.production_order_service import production_order_service
+from app.services.mrp_service import mrp_service
 from app.api.deps import get_current_user, require_role
 from decimal import Decimal
 
@@ -232,4 +233,35 @@ async def validate_production_feasibility(
         product_id=product_id,
         quantity=quantity,
         target_location_id=target_location_id
-    )
\ No newline at end of file
+    )
+
+
+@router.post("/mrp/run", response_model=MRPRunResult)
+async def run_mrp(
+    include_in_transit: bool = Query(True, description="Count in-transit stock as supply"),
+    background: bool = Query(False, description="Return immediately and poll the run"),
+    current_user: UserResponse = Depends(require_role("Planner"))
+):
+    """
+    Run MRP over all Planned / In Progress orders.
+    
+    - Requirements are netted against free and in-transit stock in
+      priority, then due-date order
+    - Returns per-order shortages and plant-wide purchase suggestions
+    - With **background**=true the run starts in the background; poll
+      GET /production-orders/mrp/runs/{run_id}
+    """
+    if background:
+        return await mrp_service.start_run(include_in_transit)
+    return await mrp_service.run(include_in_transit)
+
+
+@router.get("/mrp/runs/{run_id}", response_model=MRPRunResult)
+async def get_mrp_run(
+    run_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Get the status or result of a background MRP run.
+    """
+    return await mrp_service.get_run(run_id)
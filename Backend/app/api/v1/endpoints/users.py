@@ -4,6 +4,7 @@ from app.schemas.user import UserResponse, UserCreate
 from app.api.deps import get_current_user, require_role
 from app.database import get_db, get_admin_db
 from app.core.security import get_password_hash
+from app.core.cache import reference_cache
 from app.core.exceptions import NotFoundException, ConflictException
 
 router = APIRouter()
@@ -42,12 +43,12 @@ async def list_users(
         query = query.eq('is_active', is_active)
     
     # Execute query with pagination
-    result = query.range(offset, offset + limit - 1).execute()
+    result = await query.range(offset, offset + limit - 1).execute()
     
     users = []
     for user in result.data:
         # Get roles for each user
-        roles_result = db.table('user_roles').select(
+        roles_result = await db.table('user_roles').select(
             'roles(name)'
         ).eq('user_id', user['id']).execute()
         
@@ -68,7 +69,7 @@ async def get_user(
     db = get_db()
     
     # Get user
-    user_result = db.table('users').select('*').eq('id', user_id).execute()
+    user_result = await db.table('users').select('*').eq('id', user_id).execute()
     
     if not user_result.data:
         raise NotFoundException(detail="User not found")
@@ -76,7 +77,7 @@ async def get_user(
     user = user_result.data[0]
     
     # Get roles
-    roles_result = db.table('user_roles').select(
+    roles_result = await db.table('user_roles').select(
         'roles(name)'
     ).eq('user_id', user_id).execute()
     
@@ -98,12 +99,12 @@ async def create_user(
     db = get_db()
     
     # Check if email already exists
-    existing_email = db.table('users').select('id').eq('email', user_data.email).execute()
+    existing_email = await db.table('users').select('id').eq('email', user_data.email).execute()
     if existing_email.data:
         raise ConflictException(detail="Email already registered")
     
     # Check if username already exists
-    existing_username = db.table('users').select('id').eq('username', user_data.username).execute()
+    existing_username = await db.table('users').select('id').eq('username', user_data.username).execute()
     if existing_username.data:
         raise ConflictException(detail="Username already taken")
     
@@ -122,7 +123,7 @@ async def create_user(
         "created_by": current_user.id
     }
     
-    result = db.table('users').insert(user_dict).execute()
+    result = await db.table('users').insert(user_dict).execute()
     
     if not result.data:
         raise HTTPException(
@@ -153,7 +154,7 @@ async def update_user(
     db = get_db()
     
     # Check if user exists
-    existing = db.table('users').select('id').eq('id', user_id).execute()
+    existing = await db.table('users').select('id').eq('id', user_id).execute()
     if not existing.data:
         raise NotFoundException(detail="User not found")
     
@@ -167,7 +168,7 @@ async def update_user(
         update_data['is_active'] = is_active
     
     # Update user
-    result = db.table('users').update(update_data).eq('id', user_id).execute()
+    result = await db.table('users').update(update_data).eq('id', user_id).execute()
     
     if not result.data:
         raise HTTPException(
@@ -176,7 +177,7 @@ async def update_user(
         )
     
     # Get updated user with roles
-    roles_result = db.table('user_roles').select(
+    roles_result = await db.table('user_roles').select(
         'roles(name)'
     ).eq('user_id', user_id).execute()
     
@@ -198,7 +199,7 @@ async def delete_user(
     db = get_db()
     
     # Check if user exists
-    existing = db.table('users').select('id').eq('id', user_id).execute()
+    existing = await db.table('users').select('id').eq('id', user_id).execute()
     if not existing.data:
         raise NotFoundException(detail="User not found")
     
@@ -210,7 +211,7 @@ async def delete_user(
         )
     
     # Deactivate user instead of deleting
-    db.table('users').update({
+    await db.table('users').update({
         'is_active': False,
         'updated_by': current_user.id
     }).eq('id', user_id).execute()
@@ -234,25 +235,31 @@ async def assign_roles(
     db = get_db()
     
     # Check if user exists
-    user_result = db.table('users').select('id').eq('id', user_id).execute()
+    user_result = await db.table('users').select('id').eq('id', user_id).execute()
     if not user_result.data:
         raise NotFoundException(detail="User not found")
     
-    # Get role IDs
-    roles_result = db.table('roles').select('id', 'name').in_('name', role_names).execute()
+    # Get role IDs (reference cache first, one query for the rest)
+    roles = {name: reference_cache.get_by_key('roles', name) for name in role_names}
+    missing = [name for name, role in roles.items() if role is None]
+    if missing:
+        roles_result = await db.table('roles').select('id', 'name').in_('name', missing).execute()
+        for role in roles_result.data:
+            reference_cache.put('roles', role)
+            roles[role['name']] = role
     
-    if len(roles_result.data) != len(role_names):
+    if any(role is None for role in roles.values()) or len(roles) != len(role_names):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="One or more role names are invalid"
         )
     
     # Delete existing roles
-    db.table('user_roles').delete().eq('user_id', user_id).execute()
+    await db.table('user_roles').delete().eq('user_id', user_id).execute()
     
     # Assign new roles
-    for role in roles_result.data:
-        db.table('user_roles').insert({
+    for role in roles.values():
+        await db.table('user_roles').insert({
             'user_id': user_id,
             'role_id': role['id'],
             'assigned_by': current_user.id
@@ -261,7 +268,7 @@ async def assign_roles(
     # Get updated user with roles
     return UserResponse(
         **user_result.data[0],
-        roles=[role['name'] for role in roles_result.data]
+        roles=[role['name'] for role in roles.values()]
     )
 
 
@@ -274,8 +281,11 @@ async def list_roles(
     
     Available to all authenticated users.
     """
-    db = get_db()
-    
-    result = db.table('roles').select('*').eq('is_active', True).execute()
-    
-    return result.data
\ No newline at end of file
+    roles = reference_cache.get_list('roles', 'active')
+    if roles is None:
+        db = get_db()
+        result = await db.table('roles').select('*').eq('is_active', True).execute()
+        roles = result.data
+        reference_cache.put_list('roles', 'active', roles)
+    
+    return roles
\ No newline at end of file
@@ -14,6 +14,59 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     SUPABASE_SERVICE_KEY: str
     
+    # Database HTTP connection pool (seconds for timeouts)
+    DB_POOL_MAX_CONNECTIONS: int = 50
+    DB_POOL_MAX_KEEPALIVE: int = 20
+    DB_POOL_KEEPALIVE_EXPIRY: float = 30.0
+    DB_TIMEOUT: float = 10.0
+    DB_CONNECT_TIMEOUT: float = 5.0
+    DB_POOL_TIMEOUT: float = 5.0
+    
+    # Reference data cache (products, locations, roles, WIP stages)
+    REFERENCE_CACHE_TTL_SECONDS: int = 300
+    REFERENCE_CACHE_MAX_ENTRIES: int = 5000
+    
+    # Shared cache tier: "memory" (per worker) or "redis" (shared by all workers)
+    CACHE_BACKEND: str = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_KEY_PREFIX: str = "omnix"
+    CACHE_DEFAULT_TTL_SECONDS: int = 300
+    CACHE_MAX_ENTRIES: int = 10000
+    
+    # Bulk inventory transaction ingestion
+    INVENTORY_BULK_MAX_LINES: int = 20000
+    
+    # Stock balance snapshots (background job)
+    STOCK_SNAPSHOT_ENABLED: bool = True
+    STOCK_SNAPSHOT_INTERVAL_HOURS: int = 24
+    STOCK_SNAPSHOT_LAG_MINUTES: int = 15
+    
+    # BOM version history: full checkpoint every N versions, diffs in between
+    BOM_VERSION_CHECKPOINT_INTERVAL: int = 10
+    
+    # Multi-level BOMs: trees with more material lines than this are
+    # re-leveled in the background
+    BOM_LEVEL_BACKGROUND_THRESHOLD: int = 500
+    
+    # Dashboard sections: time budget per section; a section that overruns
+    # is served from its last good value (kept in the shared cache)
+    DASHBOARD_SECTION_TIMEOUT_SECONDS: float = 3.0
+    DASHBOARD_SECTION_CACHE_TTL_SECONDS: int = 86400
+    
+    # Dashboard snapshot: rebuilt in the background every REFRESH seconds
+    # and after writes; requests are served from it, a snapshot older than
+    # MAX_AGE is rebuilt before answering
+    DASHBOARD_REFRESH_SECONDS: int = 30
+    DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS: int = 600
+    
+    # MRP runs (results kept in the shared cache)
+    MRP_RESULT_TTL_SECONDS: int = 3600
+    
+    # Live updates (Socket.IO): "memory" (per worker) or "redis" (emits
+    # reach clients on every worker, uses REDIS_URL)
+    LIVE_BROKER: str = "memory"
+    LIVE_PING_INTERVAL_SECONDS: int = 60
+    
     # JWT
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
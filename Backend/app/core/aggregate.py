@@ -0,0 +1,110 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.database import get_db
+
+# Filter operators understood by aggregate_rows (migration 027)
+FILTER_OPS = ('eq', 'neq', 'gt', 'gte', 'lt', 'lte')
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class AggregateResult:
+    """
+    Grouped counts and sums from `aggregate`, per grouping set:
+
+        result = await aggregate('gate_entries', group_by=['status', 'entry_type'])
+        result.total                  # all rows
+        result.counts('status')       # {'arrived': 3, 'accepted': 7, ...}
+    """
+
+    def __init__(self, groups: Dict[Tuple[str, ...], List[dict]]):
+        self._groups = groups
+
+    def _rows(self, columns: Tuple[str, ...]) -> List[dict]:
+        if columns not in self._groups:
+            raise ValueError(f"Grouping set {columns} was not requested")
+        return self._groups[columns]
+
+    @property
+    def total(self) -> int:
+        return sum(row['count'] for row in self._rows(()))
+
+    def total_sum(self, column: str) -> Decimal:
+        return sum((row['sums'][column] for row in self._rows(())), Decimal('0'))
+
+    def counts(self, *columns: str) -> Dict[Any, int]:
+        """Row count per group; keyed by value, or by tuple for several columns."""
+        return {self._key(row, columns): row['count'] for row in self._rows(columns)}
+
+    def sums(self, column: str, *by: str) -> Dict[Any, Decimal]:
+        """Sum of `column` per group of the `by` columns."""
+        return {self._key(row, by): row['sums'][column] for row in self._rows(by)}
+
+    @staticmethod
+    def _key(row: dict, columns: Tuple[str, ...]):
+        values = tuple(row['keys'].get(c) for c in columns)
+        return values[0] if len(values) == 1 else values
+
+
+async def aggregate(
+    table: str,
+    group_by: Iterable = (),
+    sums: Sequence[str] = (),
+    filters: Optional[Sequence[Tuple[str, str, Any]]] = None
+) -> AggregateResult:
+    """
+    Count (and sum `sums` columns) per group in Postgres, one pass over the
+    table for every grouping set (see migration 027). The response has a
+    row per group, not per table row.
+
+    group_by: columns grouped separately ('status'), or tuples of columns
+        grouped together (('status', 'priority')). The grand total is
+        always included.
+    filters: (column, op, value) with op in FILTER_OPS, combined with AND.
+    """
+    grouping_sets: List[Tuple[str, ...]] = [()]
+    for item in group_by:
+        columns = (item,) if isinstance(item, str) else tuple(item)
+        if columns not in grouping_sets:
+            grouping_sets.append(columns)
+
+    for _, op, _ in filters or ():
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator '{op}'")
+
+    db = get_db()
+    result = await db.rpc('aggregate_rows', {
+        'p_table': table,
+        'p_grouping_sets': [list(columns) for columns in grouping_sets],
+        'p_sums': list(sums),
+        'p_filters': [[column, op, _literal(value)] for column, op, value in filters or ()]
+    }).execute()
+
+    data = result.data or {}
+    all_columns = data.get('columns') or []
+    width = len(all_columns)
+
+    # GROUPING() sets bit i (from the left) when all_columns[i] is not grouped
+    by_mask = {
+        sum(1 << (width - 1 - i) for i, c in enumerate(all_columns) if c not in columns): columns
+        for columns in grouping_sets
+    }
+
+    groups: Dict[Tuple[str, ...], List[dict]] = {columns: [] for columns in grouping_sets}
+    for row in data.get('rows') or []:
+        columns = by_mask.get(row['mask'])
+        if columns is None:
+            continue
+        groups[columns].append({
+            'keys': row.get('keys') or {},
+            'count': int(row['count']),
+            'sums': {c: Decimal(str(v)) if v is not None else Decimal('0') for c, v in (row.get('sums') or {}).items()}
+        })
+
+    return AggregateResult(groups)
@@ -0,0 +1,285 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from pydantic import TypeAdapter, ValidationError
+from app.config import settings
+from app.core.cache_backends import CacheBackend, create_cache_backend
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Hit/miss counters for a cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire after `ttl_seconds`.
+    Not thread-safe; meant for use from the event loop.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.stats.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def delete(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Delete every key for which `predicate(key)` is true."""
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ReferenceCache:
+    """
+    Process-local cache for slowly changing reference tables.
+
+    Rows are cached by id and by the table's natural key (code or name),
+    and whole result lists (e.g. active WIP stages) can be cached by name.
+    Writers must call `invalidate` (or `put` the fresh row) after changing
+    a table; the invalidation is broadcast through the cache backend so
+    every worker evicts its copy.
+    """
+
+    # Natural key column per cached table
+    KEY_COLUMNS = {
+        'products': 'code',
+        'locations': 'code',
+        'roles': 'name',
+        'wip_stages': 'code',
+    }
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self._caches = {
+            table: TTLCache(ttl_seconds, max_entries) for table in self.KEY_COLUMNS
+        }
+
+    def _cache(self, table: str) -> TTLCache:
+        if table not in self._caches:
+            raise ValueError(f"Table '{table}' is not cached")
+        return self._caches[table]
+
+    def get(self, table: str, entity_id: Optional[str]) -> Optional[dict]:
+        if not entity_id:
+            return None
+        return self._cache(table).get(('id', str(entity_id)))
+
+    def get_by_key(self, table: str, key: Optional[str]) -> Optional[dict]:
+        """Look up a row by natural key (product/location code, role name)."""
+        if not key:
+            return None
+        cache = self._cache(table)
+        entity_id = cache.get(('key', key))
+        row = cache.get(('id', entity_id)) if entity_id else None
+        # Guard against a key that was renamed since it was cached
+        if row and row.get(self.KEY_COLUMNS[table]) == key:
+            return row
+        return None
+
+    def put(self, table: str, row: Optional[dict]):
+        if not row or not row.get('id'):
+            return
+        cache = self._cache(table)
+        entity_id = str(row['id'])
+        cache.set(('id', entity_id), dict(row))
+        key = row.get(self.KEY_COLUMNS[table])
+        if key:
+            cache.set(('key', key), entity_id)
+
+    def put_many(self, table: str, rows: List[dict]):
+        for row in rows:
+            self.put(table, row)
+
+    def get_list(self, table: str, name: str) -> Optional[List[dict]]:
+        return self._cache(table).get(('list', name))
+
+    def put_list(self, table: str, name: str, rows: List[dict]):
+        self._cache(table).set(('list', name), list(rows))
+
+    async def invalidate(self, table: str, entity_id: Optional[str] = None):
+        """Evict a row (or the whole table) here and on every other worker."""
+        self.evict(table, entity_id)
+        try:
+            await cache_backend.publish_invalidation(f'reference:{table}', entity_id)
+        except Exception as e:
+            logger.warning(f"Failed to broadcast invalidation of {table}:{entity_id}: {e}")
+
+    async def _on_invalidation(self, namespace: str, key: Optional[str]):
+        if namespace.startswith('reference:'):
+            self.evict(namespace.split(':', 1)[1], key)
+
+    def evict(self, table: str, entity_id: Optional[str] = None):
+        """
+        Drop one row (and every cached list of the table) from this
+        process, or the whole table when no id is given.
+        """
+        cache = self._cache(table)
+        if entity_id is None:
+            cache.clear()
+            return
+        cache.delete(('id', str(entity_id)))
+        cache.delete_where(lambda k: k[0] == 'list')
+
+    def clear(self):
+        for cache in self._caches.values():
+            cache.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            table: {**cache.stats.as_dict(), 'size': len(cache)}
+            for table, cache in self._caches.items()
+        }
+
+
+class Cache:
+    """
+    Namespaced cache on the shared backend.
+
+    Values are serialised to JSON through a pydantic TypeAdapter, so
+    pydantic models (or lists of them) come back as model instances:
+
+        orders_cache = Cache('orders', List[ProductionOrderListItem], ttl_seconds=60)
+        items = await orders_cache.get_or_load('page:1', load_page)
+        await orders_cache.invalidate()        # whole namespace, all workers
+
+    Backend failures and payloads that no longer validate (after a schema
+    change) are logged and treated as misses so a cache outage never
+    fails a request.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        payload_type: Any = Any,
+        ttl_seconds: Optional[int] = None,
+        backend: Optional[CacheBackend] = None
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds or settings.CACHE_DEFAULT_TTL_SECONDS
+        self.stats = CacheStats()
+        self._adapter = TypeAdapter(payload_type)
+        self._backend = backend
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend or cache_backend
+
+    def _key(self, key: str) -> str:
+        return f'{settings.CACHE_KEY_PREFIX}:{self.namespace}:{key}'
+
+    async def get(self, key: str) -> Any:
+        try:
+            raw = await self.backend.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Cache read failed for {self.namespace}:{key}: {e}")
+            raw = None
+
+        if raw is None:
+            self.stats.misses += 1
+            return None
+
+        try:
+            value = self._adapter.validate_json(raw)
+        except ValidationError as e:
+            # Written by an older payload schema; drop it and reload
+            logger.warning(f"Discarding incompatible cache entry {self.namespace}:{key}: {e}")
+            try:
+                await self.backend.delete(self._key(key))
+            except Exception as e:
+                logger.warning(f"Cache delete failed for {self.namespace}:{key}: {e}")
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None):
+        try:
+            await self.backend.set(
+                self._key(key),
+                self._adapter.dump_json(value),
+                ttl_seconds or self.ttl_seconds
+            )
+        except Exception as e:
+            logger.warning(f"Cache write failed for {self.namespace}:{key}: {e}")
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value, or load, store and return it."""
+        value = await self.get(key)
+        if value is None:
+            value = await load()
+            if value is not None:
+                await self.set(key, value)
+        return value
+
+    async def invalidate(self, key: Optional[str] = None):
+        """Delete one key, or the whole namespace, and notify every worker."""
+        try:
+            if key is None:
+                await self.backend.delete_prefix(self._key(''))
+            else:
+                await self.backend.delete(self._key(key))
+            await self.backend.publish_invalidation(self.namespace, key)
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for {self.namespace}:{key}: {e}")
+
+
+# Singleton instances
+cache_backend: CacheBackend = create_cache_backend()
+
+reference_cache = ReferenceCache(
+    ttl_seconds=settings.REFERENCE_CACHE_TTL_SECONDS,
+    max_entries=settings.REFERENCE_CACHE_MAX_ENTRIES
+)
+cache_backend.subscribe(reference_cache._on_invalidation)
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Awaitable, Callable, List, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Called with (namespace, key) when an entry is invalidated; key None means the whole namespace
+InvalidationHandler = Callable[[str, Optional[str]], Awaitable[None]]
+
+
+class CacheBackend:
+    """
+    Storage for serialised cache payloads plus an invalidation channel.
+
+    Keys passed to a backend are already namespaced by `Cache`. Every
+    invalidation is delivered to the handlers registered in this process
+    and, for shared backends, to every other worker as well.
+    """
+
+    def __init__(self):
+        self._handlers: List[InvalidationHandler] = []
+
+    def subscribe(self, handler: InvalidationHandler):
+        self._handlers.append(handler)
+
+    async def _dispatch(self, namespace: str, key: Optional[str]):
+        for handler in self._handlers:
+            try:
+                await handler(namespace, key)
+            except Exception as e:
+                logger.warning(f"Cache invalidation handler failed for {namespace}:{key}: {e}")
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl_seconds: int):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    async def publish_invalidation(self, namespace: str, key: Optional[str] = None):
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process backend; invalidations only reach this process."""
+
+    def __init__(self, max_entries: int):
+        super().__init__()
+        from app.core.cache import TTLCache
+        self._store = TTLCache(ttl_seconds=0, max_entries=max_entries)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._store.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: int):
+        self._store.set(key, value, ttl_seconds=ttl_seconds)
+
+    async def delete(self, key: str):
+        self._store.delete(key)
+
+    async def delete_prefix(self, prefix: str):
+        self._store.delete_where(lambda k: k.startswith(prefix))
+
+    async def publish_invalidation(self, namespace: str, key: Optional[str] = None):
+        await self._dispatch(namespace, key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend shared by all workers through Redis.
+
+    Invalidations are published on a channel; each worker's listener
+    forwards them to its local handlers so process-local copies are
+    evicted everywhere. A worker ignores its own messages because it
+    already dispatched them locally when publishing.
+    """
+
+    def __init__(self, url: str, channel: str, client=None):
+        super().__init__()
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+
+        self._redis = client
+        self._channel = channel
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self._redis.aclose()
+
+    async def _listen(self):
+        """Forward invalidations from other workers; reconnect on errors."""
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    payload = json.loads(message['data'])
+                    if payload.get('origin') == self._origin:
+                        continue
+                    await self._dispatch(payload['namespace'], payload.get('key'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: int):
+        await self._redis.set(key, value, ex=max(int(ttl_seconds), 1))
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def delete_prefix(self, prefix: str):
+        batch = []
+        async for key in self._redis.scan_iter(match=f'{prefix}*', count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                await self._redis.delete(*batch)
+                batch = []
+        if batch:
+            await self._redis.delete(*batch)
+
+    async def publish_invalidation(self, namespace: str, key: Optional[str] = None):
+        await self._dispatch(namespace, key)
+        message = json.dumps({'origin': self._origin, 'namespace': namespace, 'key': key})
+        await self._redis.publish(self._channel, message)
+
+
+def create_cache_backend() -> CacheBackend:
+    """Build the backend selected by CACHE_BACKEND ('memory' or 'redis')."""
+    if settings.CACHE_BACKEND == 'redis':
+        return RedisCacheBackend(
+            url=settings.REDIS_URL,
+            channel=f'{settings.CACHE_KEY_PREFIX}:invalidate'
+        )
+    if settings.CACHE_BACKEND != 'memory':
+        raise ValueError(f"Unknown CACHE_BACKEND '{settings.CACHE_BACKEND}'")
+    return InMemoryCacheBackend(max_entries=settings.CACHE_MAX_ENTRIES)
@@ -0,0 +1,109 @@
+from typing import Dict, List, Optional, Tuple
+
+
+class Embed:
+    """
+    A related table pulled into a select with PostgREST resource embedding.
+
+    `alias` is the key the related row(s) come back under. `hint` names the
+    foreign key column when a table is referenced more than once (e.g. the
+    from/to locations of a transaction). `many` marks one-to-many embeds,
+    which come back as lists.
+    """
+
+    def __init__(
+        self,
+        alias: str,
+        table: str,
+        columns: str = '*',
+        *embeds: 'Embed',
+        hint: Optional[str] = None,
+        many: bool = False,
+        inner: bool = False
+    ):
+        self.alias = alias
+        self.table = table
+        self.columns = columns
+        self.embeds: Tuple[Embed, ...] = embeds
+        self.hint = hint
+        self.many = many
+        self.inner = inner
+
+    def clause(self) -> str:
+        target = self.table
+        if self.hint:
+            target += f'!{self.hint}'
+        if self.inner:
+            target += '!inner'
+        parts = [self.columns] + [e.clause() for e in self.embeds]
+        return f"{self.alias}:{target}({', '.join(parts)})"
+
+    def flatten(self, value, prefix: str, out: dict):
+        """
+        Copy an embedded value into `out` under prefixed keys.
+        To-one rows are flattened (`product.code` -> `product_code`);
+        to-many rows are kept as lists of flattened rows.
+        """
+        key = f'{prefix}{self.alias}'
+        if self.many:
+            out[key] = [_flatten_row(row, self.embeds) for row in (value or [])]
+            return
+
+        if value is None:
+            out[key] = None
+            return
+
+        out[key] = value
+        nested = {e.alias for e in self.embeds}
+        for column, column_value in value.items():
+            if column not in nested:
+                out[f'{key}_{column}'] = column_value
+        for embed in self.embeds:
+            embed.flatten(value.get(embed.alias), f'{key}_', out)
+
+
+def _flatten_row(row: dict, embeds: Tuple[Embed, ...]) -> dict:
+    aliases = {e.alias for e in embeds}
+    out = {k: v for k, v in row.items() if k not in aliases}
+    for embed in embeds:
+        embed.flatten(row.get(embed.alias), '', out)
+    return out
+
+
+class EmbeddedSelect:
+    """
+    Declares a list view's joins once and builds a single embedded select.
+
+    Example:
+        INVENTORY_VIEW = EmbeddedSelect(
+            'inventory', '*',
+            Embed('product', 'products', 'code, name, unit'),
+            Embed('location', 'locations', 'code, name'),
+        )
+        result = await INVENTORY_VIEW.query(db).eq('location_id', loc).execute()
+        rows = INVENTORY_VIEW.flatten_all(result.data)
+        rows[0]['product_code'], rows[0]['location_name']
+
+    A to-one embed that found no row leaves `<alias>` set to None.
+    """
+
+    def __init__(self, table: str, columns: str = '*', *embeds: Embed):
+        self.table = table
+        self.columns = columns
+        self.embeds: Tuple[Embed, ...] = embeds
+
+    @property
+    def select_clause(self) -> str:
+        return ', '.join([self.columns] + [e.clause() for e in self.embeds])
+
+    def query(self, db, count: Optional[str] = None):
+        """Start a select on the base table with every join embedded."""
+        if count:
+            return db.table(self.table).select(self.select_clause, count=count)
+        return db.table(self.table).select(self.select_clause)
+
+    def flatten(self, row: dict) -> dict:
+        return _flatten_row(row, self.embeds)
+
+    def flatten_all(self, rows: List[dict]) -> List[Dict]:
+        return [self.flatten(row) for row in rows]
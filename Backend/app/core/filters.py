@@ -0,0 +1,42 @@
+from typing import Sequence
+
+
+def _quote(value: str) -> str:
+    """Double-quote a PostgREST filter value so , . ( ) : are literal."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def contains_pattern(term: str) -> str:
+    """
+    ILIKE pattern matching `term` as a literal substring: % _ and \\ are
+    escaped. PostgREST turns every * in a like pattern into %, so * is
+    matched as a single-character wildcard instead.
+    """
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '_')
+    return f'%{escaped}%'
+
+
+def ilike_any(columns: Sequence[str], term: str) -> str:
+    """
+    `or_` filter matching rows where any of `columns` contains `term`
+    (case-insensitive):
+
+        query = query.or_(ilike_any(['product_code', 'product_name'], search))
+    """
+    value = _quote(contains_pattern(term))
+    return ','.join(f'{column}.ilike.{value}' for column in columns)
+
+
+def after_keyset(columns: Sequence[str], values: Sequence[str]) -> str:
+    """
+    `or_` filter matching rows that sort after `values` when ordered
+    ascending by `columns` (keyset pagination):
+
+        query = query.or_(after_keyset(['code', 'id'], [last['code'], last['id']]))
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        terms = [f'{c}.eq.{_quote(v)}' for c, v in zip(columns[:i], values[:i])]
+        terms.append(f'{column}.gt.{_quote(values[i])}')
+        clauses.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return ','.join(clauses)
@@ -0,0 +1,106 @@
+"""
+Live updates pushed to clients over Socket.IO (mounted at /ws, so the
+client path is /ws/socket.io).
+
+Clients connect with their access token (`auth: {token}`) and subscribe
+to topics:
+
+    dashboard  - changed dashboard sections ('dashboard:update')
+    wip        - working order / stage transfer deltas and stage metrics
+                 ('wip:order', 'wip:transfer', 'wip:stages')
+    alerts     - new WIP alerts for the user's roles ('alert:new')
+
+Nothing is sent unless a write changes something, so an idle screen
+costs its socket and a heartbeat every LIVE_PING_INTERVAL_SECONDS.
+With LIVE_BROKER=redis, emits reach clients connected to any worker.
+"""
+
+import logging
+from typing import Any, List
+import socketio
+from app.config import settings
+from app.core.security import decode_token
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('dashboard', 'wip', 'alerts')
+
+
+def create_client_manager() -> socketio.AsyncManager:
+    """Build the broker selected by LIVE_BROKER ('memory' or 'redis')."""
+    if settings.LIVE_BROKER == 'redis':
+        return socketio.AsyncRedisManager(settings.REDIS_URL, channel=f'{settings.CACHE_KEY_PREFIX}:live')
+    if settings.LIVE_BROKER != 'memory':
+        raise ValueError(f"Unknown LIVE_BROKER '{settings.LIVE_BROKER}'")
+    return socketio.AsyncManager()
+
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    client_manager=create_client_manager(),
+    cors_allowed_origins=settings.allowed_origins_list,
+    ping_interval=settings.LIVE_PING_INTERVAL_SECONDS,
+    logger=False,
+    engineio_logger=False
+)
+
+# Mounted at /ws; the mount keeps the full request path, so it is matched here
+live_app = socketio.ASGIApp(sio, socketio_path='ws/socket.io')
+
+
+def alerts_room(role: str) -> str:
+    return f'alerts:{role}'
+
+
+def _rooms(topic: str, roles: List[str]) -> List[str]:
+    if topic == 'alerts':
+        return [alerts_room(role) for role in roles]
+    return [topic]
+
+
+@sio.event
+async def connect(sid, environ, auth):
+    """Accept clients with a valid access token; roles are looked up once."""
+    from app.services.auth_service import auth_service
+
+    payload = decode_token((auth or {}).get('token') or '')
+    if not payload or payload.get('type') != 'access' or not payload.get('sub'):
+        raise socketio.exceptions.ConnectionRefusedError('Could not validate credentials')
+
+    try:
+        user = await auth_service.get_current_user(payload['sub'])
+    except Exception:
+        raise socketio.exceptions.ConnectionRefusedError('Could not validate credentials')
+    if not user.is_active:
+        raise socketio.exceptions.ConnectionRefusedError('Inactive user')
+
+    await sio.save_session(sid, {'user_id': user.id, 'roles': list(user.roles)})
+
+
+@sio.event
+async def subscribe(sid, data):
+    """Join a topic; the reply lists the topics that were accepted."""
+    session = await sio.get_session(sid)
+    topics = [t for t in (data or {}).get('topics', []) if t in TOPICS]
+    for topic in topics:
+        for room in _rooms(topic, session['roles']):
+            await sio.enter_room(sid, room)
+    return {'topics': topics}
+
+
+@sio.event
+async def unsubscribe(sid, data):
+    session = await sio.get_session(sid)
+    topics = [t for t in (data or {}).get('topics', []) if t in TOPICS]
+    for topic in topics:
+        for room in _rooms(topic, session['roles']):
+            await sio.leave_room(sid, room)
+    return {'topics': topics}
+
+
+async def publish(room: str, event: str, data: Any):
+    """Emit to a room. Failures are logged and never fail the write that published."""
+    try:
+        await sio.emit(event, data, room=room)
+    except Exception as e:
+        logger.error(f"Live publish of '{event}' to '{room}' failed: {e}")
@@ -0,0 +1,178 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+from app.database import get_db
+from app.core.cache import reference_cache
+
+
+class EntityLoader:
+    """
+    Request-scoped batched loader for rows referenced by foreign keys.
+
+    Services collect the ids a response needs, call `load_many` once per
+    table and read the rows from the returned dict. Each table is fetched
+    with a single `in_()` query and the rows are memoised for the rest of
+    the request, so repeated lookups cost nothing. Large id sets are
+    split into concurrent chunks of IN_CHUNK_SIZE. Reference tables
+    (products, locations) are served from the process-wide reference
+    cache first.
+    """
+
+    # Columns fetched per table (kept narrow; never expose password hashes)
+    TABLE_COLUMNS = {
+        'products': 'id, code, name, category, unit, is_active',
+        'locations': 'id, code, name, type, is_active',
+        'users': 'id, username, full_name, email',
+        'boms': 'id, product_id, version, batch_size, is_active',
+    }
+
+    # Ids per `in_()` query, keeps request URLs well under proxy limits
+    IN_CHUNK_SIZE = 200
+
+    def __init__(self):
+        self._rows: Dict[str, Dict[str, Optional[dict]]] = {}
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+
+    async def load_many(self, table: str, ids: Iterable[Optional[str]]) -> Dict[str, dict]:
+        """Load rows by id. Missing rows are left out of the result."""
+        if table not in self.TABLE_COLUMNS:
+            raise ValueError(f"No loader configured for table '{table}'")
+
+        wanted = {str(i) for i in ids if i}
+        rows = self._rows.setdefault(table, {})
+        pending = self._pending.setdefault(table, {})
+
+        if table in reference_cache.KEY_COLUMNS:
+            for i in wanted:
+                if i not in rows and i not in pending:
+                    cached = reference_cache.get(table, i)
+                    if cached:
+                        rows[i] = cached
+
+        missing = [i for i in wanted if i not in rows and i not in pending]
+        waiting = [pending[i] for i in wanted if i in pending]
+
+        if missing:
+            future = asyncio.get_running_loop().create_future()
+            for i in missing:
+                pending[i] = future
+            try:
+                fetched = await self._fetch_in(table, 'id', missing)
+                found = {row['id']: row for row in fetched}
+                if table in reference_cache.KEY_COLUMNS:
+                    reference_cache.put_many(table, fetched)
+                for i in missing:
+                    rows[i] = found.get(i)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+                # Mark retrieved so an unawaited future does not log a warning
+                future.exception()
+                raise
+            finally:
+                for i in missing:
+                    pending.pop(i, None)
+
+        for future in {id(f): f for f in waiting}.values():
+            await future
+
+        return {i: rows[i] for i in wanted if rows.get(i)}
+
+    async def load(self, table: str, entity_id: Optional[str]) -> Optional[dict]:
+        """Load a single row by id."""
+        if not entity_id:
+            return None
+        rows = await self.load_many(table, [entity_id])
+        return rows.get(str(entity_id))
+
+    async def load_by_key(self, table: str, key: Optional[str]) -> Optional[dict]:
+        """Load a reference row by its natural key (e.g. location code)."""
+        if not key:
+            return None
+        row = reference_cache.get_by_key(table, key)
+        if row is None:
+            db = get_db()
+            column = reference_cache.KEY_COLUMNS[table]
+            result = await db.table(table).select(self.TABLE_COLUMNS[table]).eq(column, key).execute()
+            if not result.data:
+                return None
+            row = result.data[0]
+            reference_cache.put(table, row)
+        self.prime(table, row)
+        return row
+
+    async def load_many_by_key(self, table: str, keys: Iterable[Optional[str]]) -> Dict[str, dict]:
+        """Load reference rows by natural key. Unknown keys are left out."""
+        column = reference_cache.KEY_COLUMNS[table]
+        found = {}
+        missing = []
+        for key in {k for k in keys if k}:
+            row = reference_cache.get_by_key(table, key)
+            if row is None:
+                missing.append(key)
+            else:
+                found[key] = row
+
+        if missing:
+            fetched = await self._fetch_in(table, column, missing)
+            reference_cache.put_many(table, fetched)
+            found.update({row[column]: row for row in fetched})
+
+        for row in found.values():
+            self.prime(table, row)
+        return found
+
+    async def _fetch_in(self, table: str, column: str, values: List[str]) -> List[dict]:
+        """Select rows whose `column` is in `values`, one query per chunk."""
+        db = get_db()
+        size = self.IN_CHUNK_SIZE
+        results = await asyncio.gather(*(
+            db.table(table).select(self.TABLE_COLUMNS[table]).in_(column, values[i:i + size]).execute()
+            for i in range(0, len(values), size)
+        ))
+        return [row for result in results for row in result.data]
+
+    def prime(self, table: str, row: dict):
+        """Seed the loader with a row the caller already has."""
+        if row and row.get('id'):
+            self._rows.setdefault(table, {})[str(row['id'])] = row
+
+    def clear(self, table: Optional[str] = None, entity_id: Optional[str] = None):
+        """Forget memoised rows after a write in the same request."""
+        if table is None:
+            self._rows.clear()
+        elif entity_id is None:
+            self._rows.pop(table, None)
+        else:
+            self._rows.get(table, {}).pop(str(entity_id), None)
+
+
+def user_display_name(user: Optional[dict]) -> Optional[str]:
+    """Full name with username fallback, as shown across the UI."""
+    if not user:
+        return None
+    return user.get('full_name') or user.get('username')
+
+
+_current_loader: ContextVar[Optional[EntityLoader]] = ContextVar('entity_loader', default=None)
+
+
+def get_loader() -> EntityLoader:
+    """
+    Get the loader for the current request.
+    Outside a request (background jobs) a loader is created for the current context.
+    """
+    loader = _current_loader.get()
+    if loader is None:
+        loader = EntityLoader()
+        _current_loader.set(loader)
+    return loader
+
+
+def begin_request_scope():
+    """Install a fresh loader; returns a token for `end_request_scope`."""
+    return _current_loader.set(EntityLoader())
+
+
+def end_request_scope(token):
+    _current_loader.reset(token)
@@ -1,22 +1,64 @@
-from supabase import create_client, Client
+import httpx
+from supabase import AsyncClient, AsyncClientOptions
 from app.config import settings
 
+
+def _create_http_client() -> httpx.AsyncClient:
+    """
+    Build the pooled HTTP client shared by every query of one Supabase client.
+
+    Connections are kept alive between requests and bounded so a burst of
+    concurrent queries queues on the pool instead of opening unlimited sockets.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.DB_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.DB_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.DB_POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.DB_TIMEOUT,
+            connect=settings.DB_CONNECT_TIMEOUT,
+            pool=settings.DB_POOL_TIMEOUT,
+        ),
+        follow_redirects=True,
+    )
+
+
+def _create_client(key: str) -> AsyncClient:
+    options = AsyncClientOptions(
+        httpx_client=_create_http_client(),
+        auto_refresh_token=False,
+        persist_session=False,
+    )
+    return AsyncClient(settings.SUPABASE_URL, key, options)
+
+
 # Initialize Supabase client
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+supabase: AsyncClient = _create_client(settings.SUPABASE_KEY)
 
 # Service role client (for admin operations)
-supabase_admin: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+supabase_admin: AsyncClient = _create_client(settings.SUPABASE_SERVICE_KEY)
 
 
-def get_db():
+def get_db() -> AsyncClient:
     """
     Dependency to get database client.
+    Queries must be awaited: `await db.table(...).select(...).execute()`.
     """
     return supabase
 
 
-def get_admin_db():
+def get_admin_db() -> AsyncClient:
     """
     Dependency to get admin database client.
     """
-    return supabase_admin
\ No newline at end of file
+    return supabase_admin
+
+
+async def close_db():
+    """
+    Close the pooled HTTP connections on application shutdown.
+    """
+    for client in (supabase, supabase_admin):
+        await client.options.httpx_client.aclose()
@@ -2,6 +2,12 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
 from .api.v1.router import api_router
+from .database import close_db
+from .core.loader import begin_request_scope, end_request_scope
+from .core.cache import reference_cache, cache_backend
+from .core.live import live_app
+from .services.stock_snapshot_service import stock_snapshot_service
+from .services.dashboard_service import dashboard_service, REFRESH_PATH_PREFIXES
 import logging
 import time
 
@@ -47,6 +53,27 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+# Give each request its own entity loader so lookups are batched and memoised per request
+@app.middleware("http")
+async def entity_loader_scope(request: Request, call_next):
+    token = begin_request_scope()
+    try:
+        return await call_next(request)
+    finally:
+        end_request_scope(token)
+
+# Rebuild the dashboard snapshot after writes that change what it shows
+@app.middleware("http")
+async def dashboard_refresh_on_write(request: Request, call_next):
+    response = await call_next(request)
+    if (
+        request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+        and response.status_code < 400
+        and request.url.path.startswith(REFRESH_PATH_PREFIXES)
+    ):
+        dashboard_service.request_refresh()
+    return response
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -62,6 +89,39 @@ logger.info("CORS middleware configured")
 app.include_router(api_router, prefix="/api/v1")
 logger.info("API router registered at /api/v1")
 
+# Live updates (Socket.IO) - clients connect to /ws/socket.io
+app.mount("/ws", live_app)
+logger.info(f"Live updates mounted at /ws (broker: {settings.LIVE_BROKER})")
+
+
+# Start the cache invalidation listener
+@app.on_event("startup")
+async def startup_cache():
+    await cache_backend.start()
+    logger.info(f"Cache backend started: {settings.CACHE_BACKEND}")
+
+
+# Start the periodic stock balance snapshot job
+@app.on_event("startup")
+async def startup_stock_snapshots():
+    await stock_snapshot_service.start()
+
+
+# Start the dashboard snapshot refresher
+@app.on_event("startup")
+async def startup_dashboard():
+    await dashboard_service.start()
+
+
+# Release pooled database connections
+@app.on_event("shutdown")
+async def shutdown_db():
+    await dashboard_service.stop()
+    await stock_snapshot_service.stop()
+    await cache_backend.close()
+    await close_db()
+    logger.info("Database connections closed")
+
 
 # Root endpoint
 @app.get("/")
@@ -78,7 +138,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     logger.info("Health check endpoint accessed")
-    return {"status": "healthy"}
+    return {"status": "healthy", "reference_cache": reference_cache.stats()}
 
 
 if __name__ == "__main__":
@@ -114,7 +114,18 @@ class BOMVersion(BaseModel):
     created_by: Optional[str] = None
     created_at: datetime
     notes: Optional[str] = None
-    snapshot: dict  # Full BOM data
+    is_checkpoint: bool = True
+    changes: Optional[dict] = None  # Changes since the previous version
+    snapshot: Optional[dict] = None  # Full BOM data (single-version lookups only)
+
+
+class BOMVersionDiff(BaseModel):
+    """Changes between two BOM versions"""
+    bom_id: str
+    from_version: int
+    to_version: int
+    changes: dict  # bom: {field: {from, to}}, added / removed / changed material lines
+    summary: dict
 
 
 class BOMDuplicateRequest(BaseModel):
@@ -200,4 +211,68 @@ class BOMMaterialWithShortage(BaseModel):
     shortage_display: Optional[str] = None  # "Need 800 m" or null
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ProductionPlanItem(BaseModel):
+    """One product of a production plan"""
+    product_id: str = Field(..., description="Finished goods product ID")
+    quantity: Decimal = Field(..., gt=0, description="Production quantity")
+
+
+class ProductionPlanShortageRequest(BaseModel):
+    """Request for shortage calculation over a production plan"""
+    items: List[ProductionPlanItem] = Field(..., min_length=1)
+    target_location_id: Optional[str] = Field(None, description="Check inventory at specific location")
+    include_allocated: bool = Field(False, description="Include allocated inventory in availability")
+
+
+class ProductionPlanShortage(BaseModel):
+    """Shortage analysis of a production plan"""
+    items: List[BOMShortageCalculation]  # Each product checked on its own
+    materials: List[MaterialShortageDetail]  # Combined requirement of the plan
+    summary: Dict[str, Any]
+
+# ========================================
+# WHERE-USED SCHEMAS
+# ========================================
+
+class WhereUsedEntry(BaseModel):
+    """A BOM that consumes a material, directly or through sub-assemblies"""
+    bom_id: str
+    bom_version: Optional[int] = None
+    product_id: str
+    product_code: str = ''
+    product_name: str = ''
+    is_active: bool = True
+    is_direct: bool  # Listed on the BOM itself
+    min_level: int  # 0 = direct, 1 = inside a sub-assembly, ...
+    max_level: int
+    quantity_per_batch: Decimal  # Per BOM batch, scrap included
+    quantity_per_unit: Decimal  # Per unit of the finished product
+
+
+class WhereUsedResult(BaseModel):
+    """Every BOM affected by a material"""
+    material_id: str
+    material_code: str = ''
+    material_name: str = ''
+    used_in: List[WhereUsedEntry] = []
+
+
+# ========================================
+# SUB-ASSEMBLY CYCLE SCHEMAS
+# ========================================
+
+class BOMCycle(BaseModel):
+    """A loop of sub-assembly links"""
+    bom_ids: List[str]  # First BOM repeated at the end
+    product_codes: List[str] = []
+
+
+class BOMCycleReport(BaseModel):
+    """Sub-assembly loop check over all BOMs"""
+    bom_count: int  # BOMs that have or are sub-assemblies
+    link_count: int
+    has_cycles: bool
+    cycles: List[BOMCycle] = []
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -54,6 +54,12 @@ class RecentActivity(BaseModel):
     icon: Optional[str] = None
 
 
+class ActivityFeedPage(BaseModel):
+    """One page of the activity feed, newest first"""
+    items: List[RecentActivity]
+    next_cursor: Optional[str] = None  # Pass as `cursor` for the next page; None on the last page
+
+
 class DashboardKPIs(BaseModel):
     """Complete dashboard KPIs"""
     live_orders: KPICard
@@ -63,14 +69,17 @@ class DashboardKPIs(BaseModel):
     production_efficiency: KPICard
 
 
-class DashboardResponse(BaseModel):
-    """Complete dashboard response"""
-    kpis: DashboardKPIs
-    orders_summary: OrderSummary
-    shortages: List[ShortageItem]
-    rework_alerts: List[ReworkAlert]
-    recent_activities: List[RecentActivity]
-    last_updated: datetime
+class DashboardSectionTiming(BaseModel):
+    """How one dashboard section was produced"""
+    duration_ms: int
+    status: str  # "ok", "timeout", "error"
+    from_cache: bool = False  # Served the section's last good value
+
+
+class DashboardMeta(BaseModel):
+    """Dashboard response metadata"""
+    duration_ms: int
+    sections: Dict[str, DashboardSectionTiming]
 
 
 class QuickAction(BaseModel):
@@ -80,4 +89,16 @@ class QuickAction(BaseModel):
     description: str
     route: str
     icon: str
-    roles: List[str]  # Roles that can see this action
\ No newline at end of file
+    roles: List[str]  # Roles that can see this action
+
+
+class DashboardResponse(BaseModel):
+    """Complete dashboard response"""
+    kpis: DashboardKPIs
+    orders_summary: OrderSummary
+    shortages: List[ShortageItem]
+    rework_alerts: List[ReworkAlert]
+    recent_activities: List[RecentActivity]
+    last_updated: datetime
+    meta: Optional[DashboardMeta] = None
+    quick_actions: List[QuickAction] = []  # For the requesting user's roles
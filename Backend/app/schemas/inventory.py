@@ -124,6 +124,38 @@ class InventoryTransactionCreate(BaseModel):
     reference_id: Optional[str] = None
     reference_type: Optional[str] = Field(None, description="material_transfer, gate_entry, gate_exit, production_order")
     notes: Optional[str] = None
+    lot_number: Optional[str] = None
+
+
+class BulkTransactionLine(InventoryTransactionCreate):
+    """One line of a bulk upload; products and locations may be given by code"""
+    product_id: Optional[str] = None
+    product_code: Optional[str] = None
+    from_location_code: Optional[str] = None
+    to_location_code: Optional[str] = None
+
+
+class BulkTransactionLineResult(BaseModel):
+    line: int
+    ok: bool
+    transaction_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkTransactionResult(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BulkTransactionLineResult]
+
+
+class StockBalance(BaseModel):
+    """Inventory balance after a stock movement"""
+    location_id: str
+    lot_number: Optional[str] = None
+    available_qty: Decimal
+    allocated_qty: Decimal
+    free_qty: Decimal
 
 
 class InventoryTransactionResponse(BaseModel):
@@ -137,11 +169,13 @@ class InventoryTransactionResponse(BaseModel):
     from_location_name: Optional[str] = None
     to_location_id: Optional[str] = None
     to_location_name: Optional[str] = None
+    lot_number: Optional[str] = None
     reference_id: Optional[str] = None
     reference_type: Optional[str] = None
     notes: Optional[str] = None
     performed_by: Optional[str] = None
     created_at: datetime
+    balances: Optional[List[StockBalance]] = None
     
     class Config:
         from_attributes = True
@@ -174,6 +208,17 @@ class StockMovementSummary(BaseModel):
     net_movement: Decimal
     transaction_count: int
 
+
+class StockPosition(BaseModel):
+    """Stock on hand for a product/location/lot at a point in time"""
+    product_id: str
+    product_code: Optional[str] = None
+    product_name: Optional[str] = None
+    location_id: str
+    location_name: Optional[str] = None
+    lot_number: Optional[str] = None
+    on_hand_qty: Decimal
+
 class StockAlertUpdate(BaseModel):
     min_qty: Optional[Decimal] = Field(None, ge=0)
     max_qty: Optional[Decimal] = Field(None, ge=0)
@@ -240,9 +285,20 @@ class InventoryListItem(BaseModel):
         from_attributes = True
 
 
+class InventoryListPage(BaseModel):
+    """One page of the inventory list, ordered by product code, location code"""
+    items: List[InventoryListItem]
+    next_after: Optional[str] = None  # Pass as `after` for the next page; None on the last page
+
+
 class InventorySummary(BaseModel):
     """Summary KPIs for inventory dashboard"""
-    total_materials: int
-    low_stock_count: int
-    critical_count: int
-    sufficient_count: int
\ No newline at end of file
+    total_materials: int = 0
+    total_skus: int = 0
+    low_stock_count: int = 0
+    critical_count: int = 0
+    out_of_stock_count: int = 0
+    sufficient_count: int = 0
+    total_available_qty: Decimal = Decimal(0)
+    total_allocated_qty: Decimal = Decimal(0)
+    updated_at: Optional[datetime] = None
\ No newline at end of file
@@ -216,4 +216,67 @@ class ProductionOrderWithShortages(ProductionOrderResponse):
     can_produce: bool = True
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# ========================================
+# MRP SCHEMAS
+# ========================================
+
+class MRPMaterialShortage(BaseModel):
+    """Material an order cannot cover after netting"""
+    material_id: str
+    material_code: str = ''
+    material_name: str = ''
+    unit: Optional[str] = None
+    gross_qty: Decimal  # Outstanding requirement (required - issued)
+    allocated_qty: Decimal = Decimal('0')  # Already allocated to this order
+    net_qty: Decimal  # Still to be covered from free stock
+    covered_on_hand_qty: Decimal = Decimal('0')
+    covered_in_transit_qty: Decimal = Decimal('0')
+    shortage_qty: Decimal
+
+
+class MRPOrderResult(BaseModel):
+    """Netting result for one open production order"""
+    order_id: str
+    order_number: str
+    product_id: str
+    product_code: str = ''
+    product_name: str = ''
+    status: str
+    priority: str
+    due_date: date
+    sequence: int  # Position in the netting order (1 = served first)
+    can_produce: bool
+    material_count: int
+    shortages: List[MRPMaterialShortage] = []
+
+
+class MRPPurchaseSuggestion(BaseModel):
+    """Plant-wide purchase need for one material"""
+    material_id: str
+    material_code: str = ''
+    material_name: str = ''
+    unit: Optional[str] = None
+    net_requirement_qty: Decimal
+    free_on_hand_qty: Decimal
+    in_transit_qty: Decimal
+    shortage_qty: Decimal
+    suggested_purchase_qty: Decimal
+    orders_short: int
+
+
+class MRPRunResult(BaseModel):
+    """MRP run over all open production orders"""
+    run_id: str
+    status: str  # Running, Completed, Failed
+    started_at: datetime
+    completed_at: Optional[datetime] = None
+    duration_ms: Optional[int] = None
+    include_in_transit: bool = True
+    order_count: int = 0
+    material_count: int = 0
+    orders_short: int = 0
+    orders: List[MRPOrderResult] = []
+    purchases: List[MRPPurchaseSuggestion] = []
+    error: Optional[str] = None
@@ -0,0 +1,165 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+from app.database import get_db
+from app.core.exceptions import ValidationException
+from app.schemas.dashboard import ActivityFeedPage, RecentActivity
+
+# inventory_item_transactions.transaction_type -> (icon, action)
+INVENTORY_ITEM_ACTIONS = {
+    'IN': ('📥', 'Inventory added'),
+    'OUT': ('📤', 'Inventory removed'),
+    'ADJUST': ('⚙️', 'Inventory updated'),
+    'ALLOCATE': ('🔒', 'Stock allocated'),
+    'RELEASE': ('🔓', 'Stock released')
+}
+
+# inventory_transactions.transaction_type -> (icon, action)
+INVENTORY_ACTIONS = {
+    'TRANSFER': ('🔄', 'Material transferred'),
+    'GATE_IN': ('📥', 'Gate entry received'),
+    'GATE_OUT': ('📤', 'Gate exit processed'),
+    'ADJUSTMENT': ('⚙️', 'Stock adjusted'),
+    'ALLOCATION': ('🔒', 'Inventory allocated'),
+    'RELEASE': ('🔓', 'Allocation released'),
+    'PRODUCTION': ('🏭', 'Production consumed')
+}
+
+GATE_ENTRY_ICONS = {
+    'material': '📦',
+    'courier': '📮',
+    'visitor': '👤',
+    'jobwork_return': '🔄',
+    'subcontract_return': '↩️',
+    'delivery': '🚚',
+    'machine_spare': '⚙️'
+}
+
+GATE_ENTRY_ACTIONS = {
+    'arrived': 'arrived at gate',
+    'under_verification': 'under verification',
+    'accepted': 'accepted',
+    'rejected': 'rejected'
+}
+
+FEED_COLUMNS = (
+    'id, activity_type, source_type, source_id, subject_code, subject_name, '
+    'quantity, unit, details, user_name, created_at'
+)
+
+
+def _number(value) -> str:
+    """Quantity as entered: no trailing zeros from the DECIMAL column."""
+    text = str(value)
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+
+class ActivityService:
+    """
+    Activity feed over `activity_events` (migration 026). Events are
+    written by triggers on the source tables with their display fields
+    (codes, names, user name) already filled in, so reading the feed is
+    one indexed query with no lookups.
+    """
+
+    @staticmethod
+    def encode_cursor(created_at: str, event_id: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([created_at, event_id]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            created_at, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            return created_at, str(uuid.UUID(event_id))
+        except (ValueError, TypeError):
+            raise ValidationException(detail="Invalid cursor")
+
+    @staticmethod
+    async def get_feed(
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        activity_type: Optional[str] = None
+    ) -> ActivityFeedPage:
+        """
+        Newest events first. Pass `next_cursor` back as `cursor` for the
+        next page (keyset pagination on created_at, id).
+        """
+        db = get_db()
+
+        query = db.table('activity_events').select(FEED_COLUMNS)
+        if activity_type:
+            query = query.eq('activity_type', activity_type)
+        if cursor:
+            created_at, event_id = ActivityService.decode_cursor(cursor)
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{event_id})'
+            )
+
+        result = await query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+        rows = result.data or []
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = ActivityService.encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+        return ActivityFeedPage(
+            items=[ActivityService.to_activity(row) for row in rows],
+            next_cursor=next_cursor
+        )
+
+    @staticmethod
+    def to_activity(event: dict) -> RecentActivity:
+        """Display form of an event (description and icon per source)."""
+        details = event.get('details') or {}
+        source_type = event['source_type']
+        code = event.get('subject_code') or ''
+        name = event.get('subject_name') or ''
+        user_name = event.get('user_name')
+
+        if source_type == 'inventory_item_transaction':
+            icon, action = INVENTORY_ITEM_ACTIONS.get(details.get('transaction_type'), ('📦', 'Inventory transaction'))
+            quantity = float(event.get('quantity') or 0)
+            sign = '+' if quantity > 0 else ''
+            description = f"{action}: {code} - {name} ({sign}{_number(event.get('quantity'))} {event.get('unit')})"
+            if details.get('reason'):
+                description += f" - {details['reason'][:50]}"
+            user_name = user_name or "System"
+
+        elif source_type == 'gate_entry':
+            icon = GATE_ENTRY_ICONS.get(details.get('entry_type'), '🚪')
+            action = GATE_ENTRY_ACTIONS.get(details.get('status'), 'processed')
+            entry_type_display = (details.get('entry_type') or '').replace('_', ' ').title()
+            description = (
+                f"Gate Entry {action}: {code} - {entry_type_display} from {details.get('vendor')} "
+                f"→ {details.get('destination_department')}"
+            )
+            user_name = user_name or "Security"
+
+        elif source_type == 'inventory_transaction':
+            icon, action = INVENTORY_ACTIONS.get(details.get('transaction_type'), ('📦', 'Transaction'))
+            description = f"{action}: {code} - {name or 'Unknown Product'} ({_number(event.get('quantity'))} units)"
+            if details.get('notes'):
+                description += f" - {details['notes'][:50]}"
+            user_name = user_name or "System"
+
+        else:
+            icon = "👤"
+            description = f"New user registered: {name or code}"
+            user_name = user_name or code
+
+        return RecentActivity(
+            id=event['id'],
+            activity_type=event['activity_type'],
+            description=description,
+            user_name=user_name,
+            timestamp=datetime.fromisoformat(event['created_at'].replace('Z', '+00:00')).replace(tzinfo=None),
+            icon=icon
+        )
+
+
+# Singleton instance
+activity_service = ActivityService()
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict
 import secrets
 from app.database import get_db, get_admin_db
+from app.core.cache import reference_cache
 from app.core.security import (
     verify_password,
     get_password_hash,
@@ -30,12 +31,12 @@ class AuthService:
         db = get_db()
         
         # Check if email already exists
-        existing_email = db.table('users').select('id').eq('email', user_data.email).execute()
+        existing_email = await db.table('users').select('id').eq('email', user_data.email).execute()
         if existing_email.data:
             raise ConflictException(detail="Email already registered")
         
         # Check if username already exists
-        existing_username = db.table('users').select('id').eq('username', user_data.username).execute()
+        existing_username = await db.table('users').select('id').eq('username', user_data.username).execute()
         if existing_username.data:
             raise ConflictException(detail="Username already taken")
         
@@ -53,7 +54,7 @@ class AuthService:
             "is_verified": False,
         }
         
-        result = db.table('users').insert(user_dict).execute()
+        result = await db.table('users').insert(user_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create user")
@@ -61,11 +62,15 @@ class AuthService:
         created_user = result.data[0]
         
         # Assign default role (Operator)
-        operator_role = db.table('roles').select('id').eq('name', 'Operator').execute()
-        if operator_role.data:
-            db.table('user_roles').insert({
+        operator_role = reference_cache.get_by_key('roles', 'Operator')
+        if operator_role is None:
+            role_result = await db.table('roles').select('id', 'name').eq('name', 'Operator').execute()
+            operator_role = role_result.data[0] if role_result.data else None
+            reference_cache.put('roles', operator_role)
+        if operator_role:
+            await db.table('user_roles').insert({
                 'user_id': created_user['id'],
-                'role_id': operator_role.data[0]['id']
+                'role_id': operator_role['id']
             }).execute()
         
         return UserResponse(**created_user, roles=['Operator'])
@@ -78,7 +83,7 @@ class AuthService:
         db = get_db()
         
         # Find user by email or username
-        user_result = db.table('users').select('*').or_(
+        user_result = await db.table('users').select('*').or_(
             f"email.eq.{credentials.email_or_username},username.eq.{credentials.email_or_username}"
         ).execute()
         
@@ -96,7 +101,7 @@ class AuthService:
             raise AuthenticationException(detail="Account is inactive")
         
         # Update last login
-        db.table('users').update({
+        await db.table('users').update({
             'last_login': datetime.utcnow().isoformat()
         }).eq('id', user['id']).execute()
         
@@ -106,7 +111,7 @@ class AuthService:
         refresh_token = create_refresh_token(token_data)
         
         # Store refresh token
-        db.table('refresh_tokens').insert({
+        await db.table('refresh_tokens').insert({
             'user_id': user['id'],
             'token': refresh_token,
             'expires_at': (datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)).isoformat()
@@ -131,7 +136,7 @@ class AuthService:
             raise AuthenticationException(detail="Invalid refresh token")
         
         # Check if token exists and not revoked
-        token_record = db.table('refresh_tokens').select('*').eq(
+        token_record = await db.table('refresh_tokens').select('*').eq(
             'token', refresh_token
         ).eq('revoked', False).execute()
         
@@ -145,7 +150,7 @@ class AuthService:
             raise AuthenticationException(detail="Refresh token expired")
         
         # Get user
-        user = db.table('users').select('*').eq('id', payload['sub']).execute()
+        user = await db.table('users').select('*').eq('id', payload['sub']).execute()
         if not user.data or not user.data[0]['is_active']:
             raise AuthenticationException(detail="User not found or inactive")
         
@@ -157,13 +162,13 @@ class AuthService:
         new_refresh_token = create_refresh_token(new_token_data)
         
         # Revoke old refresh token
-        db.table('refresh_tokens').update({
+        await db.table('refresh_tokens').update({
             'revoked': True,
             'revoked_at': datetime.utcnow().isoformat()
         }).eq('token', refresh_token).execute()
         
         # Store new refresh token
-        db.table('refresh_tokens').insert({
+        await db.table('refresh_tokens').insert({
             'user_id': user_data['id'],
             'token': new_refresh_token,
             'expires_at': (datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)).isoformat()
@@ -183,7 +188,7 @@ class AuthService:
         db = get_db()
         
         # Revoke refresh token
-        result = db.table('refresh_tokens').update({
+        result = await db.table('refresh_tokens').update({
             'revoked': True,
             'revoked_at': datetime.utcnow().isoformat()
         }).eq('token', refresh_token).execute()
@@ -198,7 +203,7 @@ class AuthService:
         db = get_db()
         
         # Get user
-        user_result = db.table('users').select('*').eq('id', user_id).execute()
+        user_result = await db.table('users').select('*').eq('id', user_id).execute()
         
         if not user_result.data:
             raise NotFoundException(detail="User not found")
@@ -206,7 +211,7 @@ class AuthService:
         user = user_result.data[0]
         
         # Get user roles
-        roles_result = db.table('user_roles').select(
+        roles_result = await db.table('user_roles').select(
             'roles(name)'
         ).eq('user_id', user_id).execute()
         
@@ -222,7 +227,7 @@ class AuthService:
         db = get_db()
         
         # Find user by email
-        user_result = db.table('users').select('id, email, full_name, is_active').eq('email', email).execute()
+        user_result = await db.table('users').select('id, email, full_name, is_active').eq('email', email).execute()
         
         if not user_result.data:
             # Don't reveal if email exists or not for security
@@ -239,7 +244,7 @@ class AuthService:
         # Store token in database with 1 hour expiry
         expires_at = datetime.utcnow() + timedelta(hours=1)
         
-        db.table('password_reset_tokens').insert({
+        await db.table('password_reset_tokens').insert({
             'user_id': user['id'],
             'token': reset_token,
             'expires_at': expires_at.isoformat(),
@@ -266,7 +271,7 @@ class AuthService:
         db = get_db()
         
         # Find valid token
-        token_result = db.table('password_reset_tokens').select(
+        token_result = await db.table('password_reset_tokens').select(
             'id, user_id, expires_at, used'
         ).eq('token', token).execute()
         
@@ -288,19 +293,19 @@ class AuthService:
         hashed_password = get_password_hash(new_password)
         
         # Update user password
-        db.table('users').update({
+        await db.table('users').update({
             'password_hash': hashed_password,
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', token_data['user_id']).execute()
         
         # Mark token as used
-        db.table('password_reset_tokens').update({
+        await db.table('password_reset_tokens').update({
             'used': True,
             'used_at': datetime.utcnow().isoformat()
         }).eq('id', token_data['id']).execute()
         
         # Invalidate all refresh tokens for this user (force re-login)
-        db.table('refresh_tokens').update({
+        await db.table('refresh_tokens').update({
             'revoked': True,
             'revoked_at': datetime.utcnow().isoformat()
         }).eq('user_id', token_data['user_id']).execute()
@@ -0,0 +1,288 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.database import get_db
+from app.core.loader import get_loader
+from app.core.exceptions import NotFoundException, ValidationException
+
+
+def _decimal(value, default: str = '0') -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal(default)
+
+
+class BOMGraph:
+    """
+    In-memory multi-level BOM graph.
+
+    `load` fetches every BOM reachable from the given roots (one recursive
+    query) plus the referenced products, and builds an adjacency list of
+    material lines per BOM. Explosions and cost rollups are memoised per
+    BOM, so a sub-assembly used in several places is expanded once.
+    Circular references raise ValidationException when walked.
+    """
+
+    def __init__(self, boms: List[dict], materials: List[dict], products: Dict[str, dict]):
+        self.boms: Dict[str, dict] = {b['id']: b for b in boms}
+        self.products = products
+        self.children: Dict[str, List[dict]] = defaultdict(list)
+        for material in materials:
+            self.children[material['bom_id']].append(material)
+        for lines in self.children.values():
+            lines.sort(key=lambda m: (m.get('sequence_number') is None, m.get('sequence_number') or 0))
+
+        self._explosions: Dict[str, Dict[str, dict]] = {}
+
+    @classmethod
+    async def load(cls, bom_ids: Iterable[str]) -> 'BOMGraph':
+        """Load the graph reachable from `bom_ids` in one database call."""
+        roots = list(dict.fromkeys(str(b) for b in bom_ids if b))
+        if not roots:
+            return cls([], [], {})
+
+        db = get_db()
+        result = await db.rpc('get_bom_graph', {'p_bom_ids': roots}).execute()
+        graph = result.data or {}
+        boms = graph.get('boms') or []
+        materials = graph.get('materials') or []
+
+        products = await get_loader().load_many(
+            'products',
+            [m['material_id'] for m in materials] + [b['product_id'] for b in boms]
+        )
+        return cls(boms, materials, products)
+
+    def bom(self, bom_id: str) -> dict:
+        bom = self.boms.get(bom_id)
+        if bom is None:
+            raise NotFoundException(detail="BOM not found")
+        return bom
+
+    def product(self, product_id: Optional[str]) -> dict:
+        return self.products.get(product_id) or {}
+
+    @staticmethod
+    def line_quantity(material: dict) -> Decimal:
+        """Quantity of a line including its scrap allowance."""
+        quantity = _decimal(material.get('quantity'))
+        scrap = _decimal(material.get('scrap_percentage'))
+        return quantity * (1 + scrap / 100)
+
+    @staticmethod
+    def is_sub_assembly(material: dict) -> bool:
+        return bool(material.get('is_sub_assembly') and material.get('sub_assembly_bom_id'))
+
+    # =============================================
+    # EXPLOSION & COST ROLLUP
+    # =============================================
+
+    def explode(self, bom_id: str) -> Dict[str, dict]:
+        """
+        Leaf materials of a BOM for one multiple of its listed quantities,
+        consolidated by material id. Sub-assembly lines are replaced by
+        their own explosion scaled by the line quantity (scrap included).
+        """
+        self.bom(bom_id)
+        return self._explode(bom_id, [])
+
+    def _explode(self, bom_id: str, path: List[str]) -> Dict[str, dict]:
+        if bom_id in self._explosions:
+            return self._explosions[bom_id]
+        if bom_id in path:
+            raise ValidationException(detail="Circular reference detected in BOM hierarchy")
+
+        path.append(bom_id)
+        leaves: Dict[str, dict] = {}
+
+        def add(material_id: str, line: dict):
+            existing = leaves.get(material_id)
+            if existing is None:
+                leaves[material_id] = line
+                return
+            existing['quantity_per_unit'] += line['quantity_per_unit']
+            existing['total_quantity'] += line['total_quantity']
+            existing['total_cost'] += line['total_cost']
+            existing['level'] = min(existing['level'], line['level'])
+
+        for material in self.children.get(bom_id, []):
+            total_qty = self.line_quantity(material)
+
+            if self.is_sub_assembly(material):
+                for material_id, sub in self._explode(material['sub_assembly_bom_id'], path).items():
+                    add(material_id, {
+                        **sub,
+                        'quantity_per_unit': sub['quantity_per_unit'] * total_qty,
+                        'total_quantity': sub['total_quantity'] * total_qty,
+                        'total_cost': sub['total_cost'] * total_qty,
+                        'level': sub['level'] + 1
+                    })
+            else:
+                unit_cost = _decimal(material.get('unit_cost'))
+                add(material['material_id'], {
+                    'material_id': material['material_id'],
+                    'quantity_per_unit': _decimal(material.get('quantity')),
+                    'total_quantity': total_qty,
+                    'unit': material.get('unit'),
+                    'scrap_percentage': _decimal(material.get('scrap_percentage')),
+                    'unit_cost': unit_cost,
+                    'total_cost': total_qty * unit_cost,
+                    'level': 0
+                })
+
+        path.pop()
+        self._explosions[bom_id] = leaves
+        return leaves
+
+    def total_cost(self, bom_id: str) -> Decimal:
+        """Material cost of one multiple of the BOM across all levels."""
+        return sum((leaf['total_cost'] for leaf in self.explode(bom_id).values()), Decimal('0'))
+
+    # =============================================
+    # HIERARCHY
+    # =============================================
+
+    def tree(self, bom_id: str, level: int = 0, path: Optional[List[str]] = None) -> List[dict]:
+        """Nested material lines for display; sub-assemblies carry `children`."""
+        path = path or []
+        if bom_id in path:
+            raise ValidationException(detail="Circular reference detected in BOM hierarchy")
+        path.append(bom_id)
+
+        nodes = []
+        for material in self.children.get(bom_id, []):
+            product = self.product(material['material_id'])
+            node = {
+                'id': material['id'],
+                'material_id': material['material_id'],
+                'material_code': product.get('code', ''),
+                'material_name': product.get('name', ''),
+                'quantity': float(_decimal(material.get('quantity'))),
+                'unit': material.get('unit'),
+                'scrap_percentage': float(_decimal(material.get('scrap_percentage'))),
+                'unit_cost': float(_decimal(material.get('unit_cost'))),
+                'is_sub_assembly': material.get('is_sub_assembly', False),
+                'level': level
+            }
+            if self.is_sub_assembly(material):
+                node['children'] = self.tree(material['sub_assembly_bom_id'], level + 1, path)
+            nodes.append(node)
+
+        path.pop()
+        return nodes
+
+    def depths(self, root_bom_id: str) -> Dict[str, int]:
+        """
+        Level of every BOM below a root: the longest sub-assembly path
+        from the root, so a shared sub-assembly sits below all its users.
+        """
+        order: List[str] = []
+        state: Dict[str, int] = {}  # 1 = on the current path, 2 = done
+
+        # Iterative post-order DFS; reversed it is a topological order
+        stack = [(root_bom_id, iter(self._sub_boms(root_bom_id)))]
+        state[root_bom_id] = 1
+        while stack:
+            bom_id, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                state[bom_id] = 2
+                order.append(bom_id)
+            elif state.get(child) == 1:
+                raise ValidationException(detail="Circular reference detected in BOM hierarchy")
+            elif child not in state:
+                state[child] = 1
+                stack.append((child, iter(self._sub_boms(child))))
+
+        depths = {root_bom_id: 0}
+        for bom_id in reversed(order):
+            for child in self._sub_boms(bom_id):
+                depths[child] = max(depths.get(child, 0), depths[bom_id] + 1)
+        return depths
+
+    def _sub_boms(self, bom_id: str) -> List[str]:
+        return [
+            m['sub_assembly_bom_id'] for m in self.children.get(bom_id, [])
+            if self.is_sub_assembly(m)
+        ]
+
+
+class SubAssemblyLinks:
+    """
+    Plant-wide sub-assembly graph: for every BOM, the BOMs used on it as
+    sub-assemblies. Loaded in one call (no material lines or products),
+    so cycle checks over any depth are in-memory walks.
+    """
+
+    def __init__(self, links: Iterable[Tuple[str, str]]):
+        self.edges: Dict[str, List[str]] = defaultdict(list)
+        self.link_count = 0
+        for parent, child in links:
+            self.edges[str(parent)].append(str(child))
+            self.link_count += 1
+
+    @classmethod
+    async def load(cls) -> 'SubAssemblyLinks':
+        db = get_db()
+        result = await db.rpc('get_bom_sub_assembly_links', {}).execute()
+        return cls(result.data or [])
+
+    @property
+    def bom_ids(self) -> List[str]:
+        """Every BOM that has or is a sub-assembly."""
+        ids = dict.fromkeys(self.edges)
+        for children in self.edges.values():
+            ids.update(dict.fromkeys(children))
+        return list(ids)
+
+    def path(self, start: str, goal: str) -> Optional[List[str]]:
+        """A chain of sub-assembly links from `start` down to `goal`, if any."""
+        came_from: Dict[str, Optional[str]] = {start: None}
+        stack = [start]
+        while stack:
+            bom_id = stack.pop()
+            if bom_id == goal:
+                path = []
+                while bom_id is not None:
+                    path.append(bom_id)
+                    bom_id = came_from[bom_id]
+                return path[::-1]
+            for child in self.edges.get(bom_id, []):
+                if child not in came_from:
+                    came_from[child] = bom_id
+                    stack.append(child)
+        return None
+
+    def cycle_through(self, parent_bom_id: str, child_bom_id: str) -> Optional[List[str]]:
+        """
+        The loop that using `child_bom_id` as a sub-assembly of
+        `parent_bom_id` would close, as [parent, child, ..., parent].
+        """
+        path = self.path(child_bom_id, parent_bom_id)
+        return [parent_bom_id] + path if path else None
+
+    def cycles(self) -> List[List[str]]:
+        """
+        Existing loops, each as [a, b, ..., a]. Every loop in the graph
+        contains at least one of the reported ones.
+        """
+        found = []
+        state: Dict[str, int] = {}  # 1 = on the current path, 2 = done
+
+        for root in self.bom_ids:
+            if root in state:
+                continue
+            state[root] = 1
+            path = [root]
+            stack = [iter(self.edges.get(root, []))]
+            while stack:
+                child = next(stack[-1], None)
+                if child is None:
+                    stack.pop()
+                    state[path.pop()] = 2
+                elif state.get(child) == 1:
+                    found.append(path[path.index(child):] + [child])
+                elif child not in state:
+                    state[child] = 1
+                    path.append(child)
+                    stack.append(iter(self.edges.get(child, [])))
+        return found
@@ -1,8 +1,11 @@
 from datetime import datetime, date
 from typing import List, Optional
 from decimal import Decimal
-import json
+from app.config import settings
 from app.database import get_db
+from app.core.loader import get_loader
+from app.core.filters import ilike_any
+from app.services import bom_versioning
 from app.schemas.bom import (
     BOMCreate, 
     BOMUpdate, 
@@ -11,6 +14,7 @@ from app.schemas.bom import (
     BOMMaterialResponse,
     BOMCalculation, 
     BOMVersion, 
+    BOMVersionDiff,
     BOMDuplicateRequest, 
     BOMValidationResult,
     BOMMaterialCreate,
@@ -18,11 +22,19 @@ from app.schemas.bom import (
     ShortageCalculationRequest,
     BOMShortageCalculation,
     BOMMaterialWithShortage,
-    BOMCreateWithProduct
+    BOMCreateWithProduct,
+    WhereUsedEntry,
+    WhereUsedResult,
+    ProductionPlanItem,
+    ProductionPlanShortage
 )
 from app.core.exceptions import NotFoundException, ValidationException
 
 
+# Columns the BOM list can be sorted by
+BOM_SORT_COLUMNS = ('created_at', 'product_code', 'product_name', 'total_cost', 'material_count', 'version')
+
+
 class BOMService:
     
     @staticmethod
@@ -43,23 +55,24 @@ class BOMService:
             'created_by': user_id
         }
         
-        product_result = db.table('products').insert(product_dict).execute()
+        product_result = await db.table('products').insert(product_dict).execute()
         if not product_result.data:
             raise Exception("Failed to create product")
         
         created_product = product_result.data[0]
         product_id = created_product['id']
         
-        # 2. Get inventory items for materials
+        # 2. Get inventory items for materials (one lookup)
+        item_codes = list({
+            m['itemCode'] for m in bom_data.materials
+            if m.get('itemCode') and m.get('qty', 0)
+        })
         inventory_items = {}
-        for material in bom_data.materials:
-            item_code = material.get('itemCode')
-            if item_code:
-                item = db.table('inventory_items').select('id', 'material_code', 'material_name', 'unit', 'unit_cost').eq(
-                    'material_code', item_code
-                ).execute()
-                if item.data:
-                    inventory_items[item_code] = item.data[0]
+        if item_codes:
+            items = await db.table('inventory_items').select(
+                'id', 'material_code', 'material_name', 'unit', 'unit_cost'
+            ).in_('material_code', item_codes).execute()
+            inventory_items = {item['material_code']: item for item in items.data}
         
         # 3. Create BOM header
         bom_dict = {
@@ -73,56 +86,50 @@ class BOMService:
             'created_by': user_id
         }
         
-        bom_result = db.table('boms').insert(bom_dict).execute()
+        bom_result = await db.table('boms').insert(bom_dict).execute()
         if not bom_result.data:
             raise Exception("Failed to create BOM")
         
         created_bom = bom_result.data[0]
         
         # 4. Create BOM materials (linking to inventory_items via products table)
-        # Note: We need to create product entries for inventory items if they don't exist
+        # Products for inventory items that have none yet are created in one batch
+        existing = {}
+        if inventory_items:
+            products = await db.table('products').select('id', 'code').in_('code', list(inventory_items)).execute()
+            existing = {p['code']: p['id'] for p in products.data}
+        
+        new_products = [
+            {
+                'code': code,
+                'name': item['material_name'],
+                'category': 'Raw Material',
+                'unit': item['unit'],
+                'is_active': True,
+                'created_by': user_id
+            }
+            for code, item in inventory_items.items() if code not in existing
+        ]
+        if new_products:
+            created = await db.table('products').insert(new_products).execute()
+            existing.update({p['code']: p['id'] for p in created.data})
+        
+        material_rows = []
         for idx, material in enumerate(bom_data.materials, start=1):
             item_code = material.get('itemCode')
-            qty = material.get('qty', 0)
-            unit = material.get('unit', 'kg')
-            unit_cost = material.get('unitCost', 0)
-            
-            if not item_code or not qty:
+            if not item_code or not material.get('qty', 0) or item_code not in inventory_items:
                 continue
-            
-            # Get or create product for this inventory item
-            inv_item = inventory_items.get(item_code)
-            if inv_item:
-                # Check if product exists for this inventory item
-                product_check = db.table('products').select('id').eq('code', item_code).execute()
-                
-                if product_check.data:
-                    material_product_id = product_check.data[0]['id']
-                else:
-                    # Create product for inventory item
-                    mat_product_dict = {
-                        'code': item_code,
-                        'name': inv_item['material_name'],
-                        'category': 'Raw Material',
-                        'unit': inv_item['unit'],
-                        'is_active': True,
-                        'created_by': user_id
-                    }
-                    mat_product_result = db.table('products').insert(mat_product_dict).execute()
-                    material_product_id = mat_product_result.data[0]['id']
-                
-                # Create BOM material entry
-                material_dict = {
-                    'bom_id': created_bom['id'],
-                    'material_id': material_product_id,
-                    'quantity': float(qty),
-                    'unit': unit,
-                    'unit_cost': float(unit_cost) if unit_cost else 0,
-                    'scrap_percentage': 0,
-                    'sequence_number': idx
-                }
-                
-                db.table('bom_materials').insert(material_dict).execute()
+            unit_cost = material.get('unitCost', 0)
+            material_rows.append({
+                'material_id': existing[item_code],
+                'quantity': float(material['qty']),
+                'unit': material.get('unit', 'kg'),
+                'unit_cost': float(unit_cost) if unit_cost else 0,
+                'scrap_percentage': 0,
+                'sequence_number': idx
+            })
+        
+        await BOMService._save_materials(created_bom['id'], material_rows)
         
         # 5. Return the created BOM
         return await BOMService.get_bom_by_id(created_bom['id'])
@@ -136,24 +143,19 @@ class BOMService:
         db = get_db()
         
         # Validate product exists and is finished goods
-        product = db.table('products').select('id', 'category').eq('id', bom_data.product_id).execute()
+        product = await db.table('products').select('id', 'category').eq('id', bom_data.product_id).execute()
         if not product.data:
             raise NotFoundException(detail="Product not found")
         if product.data[0].get('category') != 'Finished Goods':
             raise ValidationException(detail="BOM can only be created for finished goods")
         
         # Check if active BOM already exists for this product
-        existing = db.table('boms').select('id').eq('product_id', bom_data.product_id).eq('is_active', True).execute()
+        existing = await db.table('boms').select('id').eq('product_id', bom_data.product_id).eq('is_active', True).execute()
         if existing.data and not bom_data.is_template:
             raise ValidationException(detail="Active BOM already exists for this product. Use update instead.")
         
         # Validate all materials exist and are raw materials
-        for material in bom_data.materials:
-            mat = db.table('products').select('id', 'category').eq('id', material.material_id).execute()
-            if not mat.data:
-                raise ValidationException(detail=f"Material {material.material_id} not found")
-            if mat.data[0].get('category') != 'Raw Material':
-                raise ValidationException(detail=f"Product {material.material_id} is not a raw material")
+        await BOMService._validate_raw_materials(bom_data.materials)
         
         # Create BOM header
         bom_dict = {
@@ -168,7 +170,7 @@ class BOMService:
             'created_by': user_id
         }
         
-        bom_result = db.table('boms').insert(bom_dict).execute()
+        bom_result = await db.table('boms').insert(bom_dict).execute()
         
         if not bom_result.data:
             raise Exception("Failed to create BOM")
@@ -176,20 +178,9 @@ class BOMService:
         created_bom = bom_result.data[0]
         
         # Create BOM materials
-        materials_snapshot = []
-        for idx, material in enumerate(bom_data.materials, start=1):
-            material_dict = {
-                'bom_id': created_bom['id'],
-                'material_id': material.material_id,
-                'quantity': float(material.quantity),
-                'unit': material.unit,
-                'scrap_percentage': float(material.scrap_percentage),
-                'unit_cost': float(material.unit_cost),
-                'sequence_number': material.sequence_number or idx
-            }
-            
-            mat_result = db.table('bom_materials').insert(material_dict).execute()
-            materials_snapshot.append(mat_result.data[0] if mat_result.data else material_dict)
+        await BOMService._save_materials(
+            created_bom['id'], BOMService._material_rows(bom_data.materials)
+        )
         
         # Create version snapshot
         await BOMService._create_version_snapshot(
@@ -202,6 +193,71 @@ class BOMService:
         # Return complete BOM
         return await BOMService.get_bom_by_id(created_bom['id'])
     
+    @staticmethod
+    async def _validate_raw_materials(materials: List[BOMMaterialCreate]):
+        """Check every material exists and is a raw material (one lookup)."""
+        products = await get_loader().load_many('products', (m.material_id for m in materials))
+        for material in materials:
+            product = products.get(material.material_id)
+            if not product:
+                raise ValidationException(detail=f"Material {material.material_id} not found")
+            if product.get('category') != 'Raw Material':
+                raise ValidationException(detail=f"Product {material.material_id} is not a raw material")
+    
+    @staticmethod
+    def _material_rows(materials: List[BOMMaterialCreate]) -> List[dict]:
+        return [
+            {
+                'material_id': material.material_id,
+                'quantity': float(material.quantity),
+                'unit': material.unit,
+                'scrap_percentage': float(material.scrap_percentage),
+                'unit_cost': float(material.unit_cost),
+                'sequence_number': material.sequence_number or idx
+            }
+            for idx, material in enumerate(materials, start=1)
+        ]
+    
+    @staticmethod
+    async def _save_materials(bom_id: str, rows: List[dict], replace: bool = False) -> int:
+        """
+        Insert all material lines of a BOM in one statement (see migration
+        022); with `replace` the existing lines are deleted in the same
+        transaction.
+        """
+        if not rows and not replace:
+            return 0
+        
+        db = get_db()
+        result = await db.rpc('save_bom_materials', {
+            'p_bom_id': bom_id,
+            'p_materials': rows,
+            'p_replace': replace
+        }).execute()
+        return result.data or 0
+    
+    @staticmethod
+    async def _load_version_rows(bom_id: str, from_version: int, to_version: int) -> List[dict]:
+        """
+        Version rows needed to rebuild versions from_version..to_version:
+        the nearest checkpoint at or before from_version and everything
+        after it, ascending.
+        """
+        db = get_db()
+        
+        checkpoint = await db.table('bom_versions').select('version').eq('bom_id', bom_id).eq(
+            'is_checkpoint', True
+        ).lte('version', from_version).order('version', desc=True).limit(1).execute()
+        if not checkpoint.data:
+            return []
+        
+        rows = await db.table('bom_versions').select(
+            'version, is_checkpoint, snapshot, changes'
+        ).eq('bom_id', bom_id).gte('version', checkpoint.data[0]['version']).lte(
+            'version', to_version
+        ).order('version').execute()
+        return rows.data or []
+    
     @staticmethod
     async def _create_version_snapshot(
         bom_id: str,
@@ -209,26 +265,44 @@ class BOMService:
         user_id: str,
         notes: Optional[str] = None
     ):
-        """Create a version snapshot for BOM history."""
+        """
+        Record a BOM version as the changes since the previous version,
+        with a full snapshot every BOM_VERSION_CHECKPOINT_INTERVAL versions.
+        """
         db = get_db()
         
         # Get current BOM state
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
-        materials = db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
-        
-        snapshot = {
-            'bom': bom.data[0] if bom.data else {},
-            'materials': materials.data if materials.data else []
-        }
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
+        materials = await db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
+        state = bom_versioning.state_from_rows(bom.data[0] if bom.data else {}, materials.data or [])
+        
+        # Previous version, rebuilt from its checkpoint
+        previous = await db.table('bom_versions').select('version').eq('bom_id', bom_id).lt(
+            'version', version
+        ).order('version', desc=True).limit(1).execute()
+        
+        previous_state = None
+        rows = []
+        if previous.data:
+            previous_version = previous.data[0]['version']
+            rows = await BOMService._load_version_rows(bom_id, previous_version, previous_version)
+            previous_state = bom_versioning.replay(rows, [previous_version]).get(previous_version)
+        
+        is_checkpoint = (
+            previous_state is None
+            or version - rows[0]['version'] >= settings.BOM_VERSION_CHECKPOINT_INTERVAL
+        )
         
         # Create version record
-        db.table('bom_versions').insert({
+        await db.table('bom_versions').insert({
             'bom_id': bom_id,
             'version': version,
             'effective_date': date.today().isoformat(),
             'created_by': user_id,
             'notes': notes,
-            'snapshot': json.dumps(snapshot)
+            'is_checkpoint': is_checkpoint,
+            'snapshot': bom_versioning.to_snapshot(state) if is_checkpoint else None,
+            'changes': bom_versioning.diff(previous_state, state) if previous_state else None
         }).execute()
     
     @staticmethod
@@ -238,9 +312,22 @@ class BOMService:
         product_id: Optional[str] = None,
         is_active: Optional[bool] = None,
         is_template: Optional[bool] = None,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        min_cost: Optional[Decimal] = None,
+        max_cost: Optional[Decimal] = None,
+        sort_by: str = 'created_at',
+        sort_desc: bool = True
     ) -> List[BOMListItem]:
-        """List BOMs with pagination and filters."""
+        """
+        List BOMs with pagination and filters.
+        Product code/name, material count and total cost are columns on
+        boms (migration 021), so this is a single query.
+        """
+        if sort_by not in BOM_SORT_COLUMNS:
+            raise ValidationException(
+                detail=f"sort_by must be one of: {', '.join(BOM_SORT_COLUMNS)}"
+            )
+        
         db = get_db()
         
         offset = (page - 1) * limit
@@ -257,55 +344,35 @@ class BOMService:
         if is_template is not None:
             query = query.eq('is_template', is_template)
         
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        if search:
+            query = query.or_(ilike_any(['product_code', 'product_name'], search))
         
-        boms = []
-        for bom in result.data:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', bom['product_id']).execute()
-            
-            if not product.data:
-                continue
-            
-            # Count materials
-            materials_count_result = db.table('bom_materials').select('id', count='exact').eq('bom_id', bom['id']).execute()
-            materials_count = materials_count_result.count if hasattr(materials_count_result, 'count') else 0
-            
-            # Calculate total cost WITH SCRAP
-            materials = db.table('bom_materials').select('quantity', 'unit_cost', 'scrap_percentage').eq('bom_id', bom['id']).execute()
-            total_cost = Decimal('0')
-            for m in materials.data:
-                qty = Decimal(str(m['quantity']))
-                cost = Decimal(str(m['unit_cost']))
-                scrap = Decimal(str(m.get('scrap_percentage', 0)))
-                total_cost += qty * cost * (1 + scrap / 100)
-            
-            # Apply search filter
-            if search:
-                product_code = product.data[0]['code'].lower()
-                product_name = product.data[0]['name'].lower()
-                search_lower = search.lower()
-                
-                if search_lower not in product_code and search_lower not in product_name:
-                    continue
-            
-            boms.append(BOMListItem(
+        if min_cost is not None:
+            query = query.gte('total_cost', float(min_cost))
+        
+        if max_cost is not None:
+            query = query.lte('total_cost', float(max_cost))
+        
+        result = await query.order(sort_by, desc=sort_desc).order('id').range(offset, offset + limit - 1).execute()
+        
+        return [
+            BOMListItem(
                 id=bom['id'],
                 product_id=bom['product_id'],
-                product_code=product.data[0]['code'],
-                product_name=product.data[0]['name'],
+                product_code=bom.get('product_code') or '',
+                product_name=bom.get('product_name') or '',
                 version=bom.get('version', 1),
                 batch_size=Decimal(str(bom.get('batch_size', 100))),
                 is_active=bom['is_active'],
                 is_template=bom.get('is_template', False),
                 template_name=bom.get('template_name'),
-                materials_count=materials_count,
-                total_cost=total_cost,
+                materials_count=bom.get('material_count', 0),
+                total_cost=Decimal(str(bom.get('total_cost', 0))),
                 effective_date=bom.get('effective_date', bom['created_at']),
                 created_at=datetime.fromisoformat(bom['created_at'].replace('Z', '+00:00'))
-            ))
-        
-        return boms
+            )
+            for bom in result.data
+        ]
     
     @staticmethod
     async def get_bom_by_id(bom_id: str) -> BOMResponse:
@@ -313,27 +380,29 @@ class BOMService:
         db = get_db()
         
         # Get BOM header
-        bom_result = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom_result = await db.table('boms').select('*').eq('id', bom_id).execute()
         
         if not bom_result.data:
             raise NotFoundException(detail="BOM not found")
         
         bom = bom_result.data[0]
         
+        loader = get_loader()
+        
         # Get product info
-        product = db.table('products').select('code', 'name').eq('id', bom['product_id']).execute()
-        product_code = product.data[0]['code'] if product.data else None
-        product_name = product.data[0]['name'] if product.data else None
+        product = await loader.load('products', bom['product_id']) or {}
+        product_code = product.get('code')
+        product_name = product.get('name')
         
         # Get BOM materials with details
-        materials_result = db.table('bom_materials').select('*').eq('bom_id', bom_id).order('sequence_number').execute()
+        materials_result = await db.table('bom_materials').select('*').eq('bom_id', bom_id).order('sequence_number').execute()
+        mat_products = await loader.load_many('products', (m['material_id'] for m in materials_result.data))
         
         materials = []
         total_bom_cost = Decimal('0')
         
         for mat in materials_result.data:
-            # Get material product info
-            mat_product = db.table('products').select('code', 'name').eq('id', mat['material_id']).execute()
+            mat_product = mat_products.get(mat['material_id'], {})
             
             quantity = Decimal(str(mat['quantity']))
             unit_cost = Decimal(str(mat['unit_cost']))
@@ -347,8 +416,8 @@ class BOMService:
                 id=mat['id'],
                 bom_id=mat['bom_id'],
                 material_id=mat['material_id'],
-                material_code=mat_product.data[0]['code'] if mat_product.data else None,
-                material_name=mat_product.data[0]['name'] if mat_product.data else None,
+                material_code=mat_product.get('code'),
+                material_name=mat_product.get('name'),
                 quantity=quantity,
                 unit=mat['unit'],
                 scrap_percentage=scrap_pct,
@@ -359,6 +428,10 @@ class BOMService:
                 updated_at=datetime.fromisoformat(mat['updated_at'].replace('Z', '+00:00'))
             ))
         
+        # Stored rollup includes sub-assembly costs; line sum is the fallback
+        if bom.get('total_cost') is not None:
+            total_bom_cost = Decimal(str(bom['total_cost']))
+        
         return BOMResponse(
             id=bom['id'],
             product_id=bom['product_id'],
@@ -383,7 +456,7 @@ class BOMService:
         """Get active BOM by product ID."""
         db = get_db()
         
-        bom = db.table('boms').select('id').eq('product_id', product_id).eq('is_active', True).execute()
+        bom = await db.table('boms').select('id').eq('product_id', product_id).eq('is_active', True).execute()
         
         if not bom.data:
             raise NotFoundException(detail="No active BOM found for this product")
@@ -398,31 +471,12 @@ class BOMService:
         db = get_db()
         
         # Check if BOM exists
-        existing = db.table('boms').select('*').eq('id', bom_id).execute()
+        existing = await db.table('boms').select('*').eq('id', bom_id).execute()
         if not existing.data:
             raise NotFoundException(detail="BOM not found")
         
         bom = existing.data[0]
         
-        # If BOM is active, create new version
-        if bom['is_active']:
-            current_version = bom.get('version', 1)
-            new_version = current_version + 1
-            
-            # Update version number
-            db.table('boms').update({
-                'version': new_version,
-                'updated_at': datetime.utcnow().isoformat()
-            }).eq('id', bom_id).execute()
-            
-            # Create version snapshot
-            await BOMService._create_version_snapshot(
-                bom_id=bom_id,
-                version=new_version,
-                user_id=user_id,
-                notes=update_data.notes or f"Updated to version {new_version}"
-            )
-        
         # Update BOM fields
         update_dict = {}
         
@@ -434,34 +488,34 @@ class BOMService:
         
         if update_dict:
             update_dict['updated_at'] = datetime.utcnow().isoformat()
-            db.table('boms').update(update_dict).eq('id', bom_id).execute()
+            await db.table('boms').update(update_dict).eq('id', bom_id).execute()
         
         # If materials are being updated, replace all materials
         if update_data.materials is not None:
-            # Validate all materials
-            for material in update_data.materials:
-                mat = db.table('products').select('id', 'category').eq('id', material.material_id).execute()
-                if not mat.data:
-                    raise ValidationException(detail=f"Material {material.material_id} not found")
-                if mat.data[0].get('category') != 'Raw Material':
-                    raise ValidationException(detail=f"Product {material.material_id} is not a raw material")
+            await BOMService._validate_raw_materials(update_data.materials)
+            await BOMService._save_materials(
+                bom_id, BOMService._material_rows(update_data.materials), replace=True
+            )
+        
+        # If BOM is active, create new version (recorded after the changes
+        # so the version holds what it was updated to)
+        if bom['is_active']:
+            current_version = bom.get('version', 1)
+            new_version = current_version + 1
             
-            # Delete existing materials
-            db.table('bom_materials').delete().eq('bom_id', bom_id).execute()
+            # Update version number
+            await db.table('boms').update({
+                'version': new_version,
+                'updated_at': datetime.utcnow().isoformat()
+            }).eq('id', bom_id).execute()
             
-            # Add new materials
-            for idx, material in enumerate(update_data.materials, start=1):
-                material_dict = {
-                    'bom_id': bom_id,
-                    'material_id': material.material_id,
-                    'quantity': float(material.quantity),
-                    'unit': material.unit,
-                    'scrap_percentage': float(material.scrap_percentage),
-                    'unit_cost': float(material.unit_cost),
-                    'sequence_number': material.sequence_number or idx
-                }
-                
-                db.table('bom_materials').insert(material_dict).execute()
+            # Create version snapshot
+            await BOMService._create_version_snapshot(
+                bom_id=bom_id,
+                version=new_version,
+                user_id=user_id,
+                notes=update_data.notes or f"Updated to version {new_version}"
+            )
         
         return await BOMService.get_bom_by_id(bom_id)
     
@@ -471,12 +525,12 @@ class BOMService:
         db = get_db()
         
         # Check if BOM exists
-        existing = db.table('boms').select('id').eq('id', bom_id).execute()
+        existing = await db.table('boms').select('id').eq('id', bom_id).execute()
         if not existing.data:
             raise NotFoundException(detail="BOM not found")
         
         # Deactivate BOM
-        db.table('boms').update({
+        await db.table('boms').update({
             'is_active': False,
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', bom_id).execute()
@@ -485,33 +539,94 @@ class BOMService:
     
     @staticmethod
     async def get_bom_versions(bom_id: str) -> List[BOMVersion]:
-        """Get version history for a BOM."""
+        """
+        Get version history for a BOM: each version's changes, without
+        snapshots (use get_bom_version for the full state).
+        """
         db = get_db()
         
         # Check if BOM exists
-        bom = db.table('boms').select('id').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('id').eq('id', bom_id).execute()
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
         # Get versions
-        versions = db.table('bom_versions').select('*').eq('bom_id', bom_id).order('version', desc=True).execute()
+        versions = await db.table('bom_versions').select(
+            'id, bom_id, version, effective_date, created_by, created_at, notes, is_checkpoint, changes'
+        ).eq('bom_id', bom_id).order('version', desc=True).execute()
         
-        result = []
-        for ver in versions.data:
-            snapshot = json.loads(ver['snapshot']) if isinstance(ver['snapshot'], str) else ver['snapshot']
-            
-            result.append(BOMVersion(
-                id=ver['id'],
-                bom_id=ver['bom_id'],
-                version=ver['version'],
-                effective_date=ver['effective_date'],
-                created_by=ver.get('created_by'),
-                created_at=datetime.fromisoformat(ver['created_at'].replace('Z', '+00:00')),
-                notes=ver.get('notes'),
-                snapshot=snapshot
-            ))
+        return [BOMService._version_from_row(ver) for ver in versions.data]
+    
+    @staticmethod
+    def _version_from_row(ver: dict, snapshot: Optional[dict] = None) -> BOMVersion:
+        return BOMVersion(
+            id=ver['id'],
+            bom_id=ver['bom_id'],
+            version=ver['version'],
+            effective_date=ver['effective_date'],
+            created_by=ver.get('created_by'),
+            created_at=datetime.fromisoformat(ver['created_at'].replace('Z', '+00:00')),
+            notes=ver.get('notes'),
+            is_checkpoint=ver.get('is_checkpoint', True),
+            changes=ver.get('changes'),
+            snapshot=snapshot
+        )
+    
+    @staticmethod
+    async def get_bom_version(bom_id: str, version: int) -> BOMVersion:
+        """Get one BOM version with its full snapshot, rebuilt from the nearest checkpoint."""
+        db = get_db()
         
-        return result
+        ver = await db.table('bom_versions').select(
+            'id, bom_id, version, effective_date, created_by, created_at, notes, is_checkpoint, changes'
+        ).eq('bom_id', bom_id).eq('version', version).execute()
+        if not ver.data:
+            raise NotFoundException(detail=f"Version {version} of BOM not found")
+        
+        rows = await BOMService._load_version_rows(bom_id, version, version)
+        state = bom_versioning.replay(rows, [version]).get(version)
+        if state is None:
+            raise NotFoundException(detail=f"Version {version} of BOM cannot be reconstructed")
+        
+        return BOMService._version_from_row(ver.data[0], bom_versioning.to_snapshot(state))
+    
+    @staticmethod
+    async def diff_bom_versions(bom_id: str, from_version: int, to_version: int) -> BOMVersionDiff:
+        """
+        Changes between two versions of a BOM. Both are rebuilt in a single
+        pass from the checkpoint at or before the older one.
+        """
+        low, high = min(from_version, to_version), max(from_version, to_version)
+        rows = await BOMService._load_version_rows(bom_id, low, high)
+        states = bom_versioning.replay(rows, [from_version, to_version])
+        
+        for version in (from_version, to_version):
+            if version not in states:
+                raise NotFoundException(detail=f"Version {version} of BOM not found")
+        
+        changes = bom_versioning.diff(states[from_version], states[to_version])
+        
+        # Label material lines with product codes/names
+        entries = [
+            *(changes.get('added') or []),
+            *(changes.get('removed') or []),
+            *(changes.get('changed') or [])
+        ]
+        products = await get_loader().load_many(
+            'products', (e.get('material_id') or e['line'].get('material_id') for e in entries)
+        )
+        for entry in entries:
+            product = products.get(entry.get('material_id') or entry['line'].get('material_id'), {})
+            entry['material_code'] = product.get('code', '')
+            entry['material_name'] = product.get('name', '')
+        
+        return BOMVersionDiff(
+            bom_id=bom_id,
+            from_version=from_version,
+            to_version=to_version,
+            changes=changes,
+            summary=bom_versioning.summarise(changes)
+        )
     
     @staticmethod
     async def duplicate_bom(
@@ -526,14 +641,14 @@ class BOMService:
         source_bom = await BOMService.get_bom_by_id(bom_id)
         
         # Validate new product
-        product = db.table('products').select('id', 'category').eq('id', duplicate_data.new_product_id).execute()
+        product = await db.table('products').select('id', 'category').eq('id', duplicate_data.new_product_id).execute()
         if not product.data:
             raise NotFoundException(detail="Target product not found")
         if product.data[0].get('category') != 'Finished Goods':
             raise ValidationException(detail="Target product must be finished goods")
         
         # Check if BOM already exists for new product
-        existing = db.table('boms').select('id').eq('product_id', duplicate_data.new_product_id).eq('is_active', True).execute()
+        existing = await db.table('boms').select('id').eq('product_id', duplicate_data.new_product_id).eq('is_active', True).execute()
         if existing.data and not duplicate_data.copy_as_template:
             raise ValidationException(detail="Active BOM already exists for target product")
         
@@ -550,7 +665,7 @@ class BOMService:
             'created_by': user_id
         }
         
-        new_bom_result = db.table('boms').insert(new_bom_dict).execute()
+        new_bom_result = await db.table('boms').insert(new_bom_dict).execute()
         
         if not new_bom_result.data:
             raise Exception("Failed to duplicate BOM")
@@ -558,9 +673,8 @@ class BOMService:
         new_bom = new_bom_result.data[0]
         
         # Copy materials
-        for material in source_bom.materials:
-            material_dict = {
-                'bom_id': new_bom['id'],
+        await BOMService._save_materials(new_bom['id'], [
+            {
                 'material_id': material.material_id,
                 'quantity': float(material.quantity),
                 'unit': material.unit,
@@ -568,8 +682,8 @@ class BOMService:
                 'unit_cost': float(material.unit_cost),
                 'sequence_number': material.sequence_number
             }
-            
-            db.table('bom_materials').insert(material_dict).execute()
+            for material in source_bom.materials
+        ])
         
         # Create version snapshot
         await BOMService._create_version_snapshot(
@@ -596,7 +710,7 @@ class BOMService:
         
         for material in bom.materials:
             # Check inventory
-            inventory = db.table('inventory').select('available_qty', 'allocated_qty').eq(
+            inventory = await db.table('inventory').select('available_qty', 'allocated_qty').eq(
                 'product_id', material.material_id
             ).execute()
             
@@ -641,7 +755,7 @@ class BOMService:
         db = get_db()
         
         # Get active BOM
-        bom_result = db.table('boms').select('*').eq('product_id', product_id).eq('is_active', True).execute()
+        bom_result = await db.table('boms').select('*').eq('product_id', product_id).eq('is_active', True).execute()
         
         if not bom_result.data:
             raise NotFoundException(detail="No active BOM found for this product")
@@ -650,13 +764,13 @@ class BOMService:
         batch_size = Decimal(str(bom.get('batch_size', 100)))
         
         # Get materials
-        materials = db.table('bom_materials').select('*').eq('bom_id', bom['id']).execute()
+        materials = await db.table('bom_materials').select('*').eq('bom_id', bom['id']).execute()
+        mat_products = await get_loader().load_many('products', (m['material_id'] for m in materials.data))
         
         calculations = []
         
         for mat in materials.data:
-            # Get material info
-            mat_product = db.table('products').select('code', 'name').eq('id', mat['material_id']).execute()
+            mat_product = mat_products.get(mat['material_id'], {})
             
             mat_quantity = Decimal(str(mat['quantity']))
             mat_unit_cost = Decimal(str(mat['unit_cost']))
@@ -668,8 +782,8 @@ class BOMService:
             
             calculations.append(BOMCalculation(
                 material_id=mat['material_id'],
-                material_code=mat_product.data[0]['code'] if mat_product.data else '',
-                material_name=mat_product.data[0]['name'] if mat_product.data else '',
+                material_code=mat_product.get('code', ''),
+                material_name=mat_product.get('name', ''),
                 required_quantity=required_quantity,
                 unit=mat['unit'],
                 unit_cost=mat_unit_cost,
@@ -689,24 +803,24 @@ class BOMService:
         db = get_db()
         
         # Validate BOM exists
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
         # Validate material
-        mat = db.table('products').select('id', 'category').eq('id', material.material_id).execute()
+        mat = await db.table('products').select('id', 'category').eq('id', material.material_id).execute()
         if not mat.data:
             raise ValidationException(detail="Material not found")
         if mat.data[0]['category'] != 'Raw Material':
             raise ValidationException(detail="Product must be a raw material")
         
         # Check if material already exists in BOM
-        existing = db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('material_id', material.material_id).execute()
+        existing = await db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('material_id', material.material_id).execute()
         if existing.data:
             raise ValidationException(detail="Material already exists in BOM")
         
         # Get next sequence number
-        max_seq = db.table('bom_materials').select('sequence_number').eq('bom_id', bom_id).order('sequence_number', desc=True).limit(1).execute()
+        max_seq = await db.table('bom_materials').select('sequence_number').eq('bom_id', bom_id).order('sequence_number', desc=True).limit(1).execute()
         next_seq = (max_seq.data[0]['sequence_number'] + 1) if max_seq.data else 1
         
         # Insert material
@@ -720,12 +834,12 @@ class BOMService:
             'sequence_number': material.sequence_number or next_seq
         }
         
-        db.table('bom_materials').insert(material_dict).execute()
+        await db.table('bom_materials').insert(material_dict).execute()
         
         # Create new version if BOM is active
         if bom.data[0]['is_active']:
             new_version = bom.data[0].get('version', 1) + 1
-            db.table('boms').update({
+            await db.table('boms').update({
                 'version': new_version,
                 'updated_at': datetime.utcnow().isoformat()
             }).eq('id', bom_id).execute()
@@ -748,12 +862,12 @@ class BOMService:
         db = get_db()
         
         # Validate BOM exists
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
         # Validate material exists in BOM
-        existing = db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('id', material_id).execute()
+        existing = await db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('id', material_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Material not found in BOM")
         
@@ -769,12 +883,12 @@ class BOMService:
         if material_update.sequence_number:
             update_dict['sequence_number'] = material_update.sequence_number
         
-        db.table('bom_materials').update(update_dict).eq('id', material_id).execute()
+        await db.table('bom_materials').update(update_dict).eq('id', material_id).execute()
         
         # Create new version if BOM is active
         if bom.data[0]['is_active']:
             new_version = bom.data[0].get('version', 1) + 1
-            db.table('boms').update({
+            await db.table('boms').update({
                 'version': new_version,
                 'updated_at': datetime.utcnow().isoformat()
             }).eq('id', bom_id).execute()
@@ -796,22 +910,22 @@ class BOMService:
         db = get_db()
         
         # Validate BOM exists
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
         # Validate material exists in BOM
-        existing = db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('id', material_id).execute()
+        existing = await db.table('bom_materials').select('id').eq('bom_id', bom_id).eq('id', material_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Material not found in BOM")
         
         # Delete material
-        db.table('bom_materials').delete().eq('id', material_id).execute()
+        await db.table('bom_materials').delete().eq('id', material_id).execute()
         
         # Create new version if BOM is active
         if bom.data[0]['is_active']:
             new_version = bom.data[0].get('version', 1) + 1
-            db.table('boms').update({
+            await db.table('boms').update({
                 'version': new_version,
                 'updated_at': datetime.utcnow().isoformat()
             }).eq('id', bom_id).execute()
@@ -829,20 +943,20 @@ class BOMService:
         db = get_db()
         
         # Get BOM
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
         product_id = bom.data[0]['product_id']
         
         # Deactivate all other BOMs for this product
-        db.table('boms').update({
+        await db.table('boms').update({
             'is_active': False,
             'updated_at': datetime.utcnow().isoformat()
         }).eq('product_id', product_id).neq('id', bom_id).execute()
         
         # Activate this BOM
-        db.table('boms').update({
+        await db.table('boms').update({
             'is_active': True,
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', bom_id).execute()
@@ -896,165 +1010,232 @@ class BOMService:
             'materials': breakdown
         }
     @staticmethod
-    async def calculate_requirements_with_shortages(
-        product_id: str,
-        quantity: Decimal,
-        target_location_id: Optional[str] = None,
-        include_allocated: bool = False
-    ) -> BOMShortageCalculation:
+    def _shortage_status(required_qty: Decimal, free_qty: Decimal) -> tuple:
+        """Shortage status and whether procurement is needed."""
+        if free_qty >= required_qty:
+            return "Sufficient", False
+        if free_qty == 0:
+            return "Out of Stock", True
+        if free_qty >= required_qty * Decimal('0.5'):
+            return "Moderate", True
+        return "Critical", True
+    
+    @staticmethod
+    async def _load_shortage_inputs(
+        boms: List[dict],
+        target_location_id: Optional[str] = None
+    ) -> dict:
         """
-        Calculate material requirements with shortage analysis.
-        
-        Checks inventory availability and calculates shortages.
+        Everything a shortage calculation needs for a set of BOMs: their
+        material lines, the material products, the inventory rows of those
+        materials and their locations (one query each).
         """
-        from app.schemas.bom import MaterialShortageDetail, BOMShortageCalculation
-        
         db = get_db()
+        loader = get_loader()
+        
+        bom_ids = [b['id'] for b in boms]
+        materials_result = await db.table('bom_materials').select('*').in_('bom_id', bom_ids).order('sequence_number').execute()
+        materials_by_bom = {}
+        for m in materials_result.data:
+            materials_by_bom.setdefault(m['bom_id'], []).append(m)
+        
+        material_ids = list({m['material_id'] for m in materials_result.data})
+        products = await loader.load_many('products', material_ids + [b['product_id'] for b in boms])
+        
+        inventory_by_material = {}
+        if material_ids:
+            inventory_query = db.table('inventory').select(
+                'product_id', 'location_id', 'available_qty', 'allocated_qty'
+            ).in_('product_id', material_ids)
+            if target_location_id:
+                inventory_query = inventory_query.eq('location_id', target_location_id)
+            inventory_result = await inventory_query.execute()
+            for inv in inventory_result.data:
+                inventory_by_material.setdefault(inv['product_id'], []).append(inv)
         
-        # Get active BOM
-        bom = db.table('boms').select('*').eq('product_id', product_id).eq('is_active', True).execute()
-        
-        if not bom.data:
-            raise NotFoundException(detail="No active BOM found for this product")
+        locations = await loader.load_many(
+            'locations',
+            (inv['location_id'] for rows in inventory_by_material.values() for inv in rows)
+        )
         
-        bom_data = bom.data[0]
-        batch_size = Decimal(str(bom_data.get('batch_size', 100)))
+        return {
+            'materials_by_bom': materials_by_bom,
+            'products': products,
+            'inventory_by_material': inventory_by_material,
+            'locations': locations
+        }
+    
+    @staticmethod
+    def _material_shortage(
+        material: dict,
+        required_qty: Decimal,
+        inputs: dict,
+        include_allocated: bool
+    ) -> MaterialShortageDetail:
+        """Shortage of one material against its inventory rows."""
+        available_qty = Decimal('0')
+        allocated_qty = Decimal('0')
+        location_breakdown = []
+        
+        for inv in inputs['inventory_by_material'].get(material['id'], []):
+            inv_available = Decimal(str(inv['available_qty']))
+            inv_allocated = Decimal(str(inv['allocated_qty']))
+            
+            available_qty += inv_available
+            allocated_qty += inv_allocated
+            
+            location_breakdown.append({
+                'location_id': inv['location_id'],
+                'location_name': inputs['locations'].get(inv['location_id'], {}).get('name', 'Unknown'),
+                'available_qty': float(inv_available),
+                'allocated_qty': float(inv_allocated),
+                'free_qty': float(inv_available - inv_allocated)
+            })
         
-        # Get product details
-        product = db.table('products').select('code', 'name').eq('id', product_id).execute()
-        product_code = product.data[0]['code'] if product.data else 'Unknown'
-        product_name = product.data[0]['name'] if product.data else 'Unknown'
+        free_qty = available_qty if include_allocated else available_qty - allocated_qty
+        shortage_status, procurement_needed = BOMService._shortage_status(required_qty, free_qty)
+        
+        return MaterialShortageDetail(
+            material_id=material['id'],
+            material_code=material['code'],
+            material_name=material['name'],
+            required_qty=required_qty,
+            unit=material['unit'],
+            available_qty=available_qty,
+            allocated_qty=allocated_qty,
+            free_qty=free_qty,
+            shortage_qty=max(Decimal('0'), required_qty - free_qty),
+            shortage_status=shortage_status,
+            procurement_needed=procurement_needed,
+            location_breakdown=location_breakdown or None
+        )
+    
+    @staticmethod
+    def _shortage_summary(details: List[MaterialShortageDetail]) -> dict:
+        counts = {'Sufficient': 0, 'Moderate': 0, 'Critical': 0, 'Out of Stock': 0}
+        for detail in details:
+            counts[detail.shortage_status] += 1
         
-        # Get BOM materials
-        materials = db.table('bom_materials').select('*').eq('bom_id', bom_data['id']).execute()
+        procurement_required = counts['Moderate'] + counts['Critical'] + counts['Out of Stock']
+        return {
+            'total_materials': len(details),
+            'sufficient': counts['Sufficient'],
+            'moderate': counts['Moderate'],
+            'critical': counts['Critical'],
+            'out_of_stock': counts['Out of Stock'],
+            'procurement_required': procurement_required,
+            'can_produce': counts['Sufficient'] == len(details),
+            'total_shortage_items': len(details) - counts['Sufficient']
+        }
+    
+    @staticmethod
+    def _bom_shortage(
+        bom: dict,
+        quantity: Decimal,
+        inputs: dict,
+        include_allocated: bool
+    ) -> BOMShortageCalculation:
+        """Shortage analysis of one BOM from preloaded inputs."""
+        batch_size = Decimal(str(bom.get('batch_size', 100)))
+        product = inputs['products'].get(bom['product_id'], {})
         
         shortage_details = []
         total_bom_cost = Decimal('0')
         
-        sufficient_count = 0
-        moderate_count = 0
-        critical_count = 0
-        out_of_stock_count = 0
-        
-        for material in materials.data:
-            material_id = material['material_id']
-            
-            # Get material details (without unit_cost - it's in BOM, not products)
-            mat_product = db.table('products').select('code', 'name', 'unit').eq('id', material_id).execute()
-            
-            if not mat_product.data:
+        for line in inputs['materials_by_bom'].get(bom['id'], []):
+            material = inputs['products'].get(line['material_id'])
+            if not material:
                 continue
             
-            mat = mat_product.data[0]
-            
-            # Calculate required quantity
-            material_qty = Decimal(str(material['quantity']))
-            scrap_pct = Decimal(str(material.get('scrap_percentage', 0)))
-            
+            material_qty = Decimal(str(line['quantity']))
+            scrap_pct = Decimal(str(line.get('scrap_percentage', 0)))
             required_qty = (quantity / batch_size) * material_qty * (1 + scrap_pct / 100)
             required_qty = required_qty.quantize(Decimal('0.001'))
             
-            # Calculate cost (unit_cost is in BOM materials, not products table)
-            unit_cost = Decimal(str(material.get('unit_cost', 0)))
-            material_cost = required_qty * unit_cost
-            total_bom_cost += material_cost
-            
-            # Check inventory availability
-            inventory_query = db.table('inventory').select('*').eq('product_id', material_id)
+            # unit_cost is in BOM materials, not products table
+            total_bom_cost += required_qty * Decimal(str(line.get('unit_cost', 0)))
             
-            if target_location_id:
-                inventory_query = inventory_query.eq('location_id', target_location_id)
-            
-            inventory_result = inventory_query.execute()
-            
-            # Aggregate inventory across locations
-            available_qty = Decimal('0')
-            allocated_qty = Decimal('0')
-            location_breakdown = []
-            
-            for inv in inventory_result.data:
-                inv_available = Decimal(str(inv['available_qty']))
-                inv_allocated = Decimal(str(inv['allocated_qty']))
-                
-                available_qty += inv_available
-                allocated_qty += inv_allocated
-                
-                # Get location name
-                loc = db.table('locations').select('code', 'name').eq('id', inv['location_id']).execute()
-                loc_name = loc.data[0]['name'] if loc.data else 'Unknown'
-                
-                location_breakdown.append({
-                    'location_id': inv['location_id'],
-                    'location_name': loc_name,
-                    'available_qty': float(inv_available),
-                    'allocated_qty': float(inv_allocated),
-                    'free_qty': float(inv_available - inv_allocated)
-                })
-            
-            # Calculate free quantity
-            if include_allocated:
-                free_qty = available_qty
-            else:
-                free_qty = available_qty - allocated_qty
-            
-            # Calculate shortage
-            shortage_qty = max(Decimal('0'), required_qty - free_qty)
-            
-            # Determine shortage status
-            if free_qty >= required_qty:
-                shortage_status = "Sufficient"
-                procurement_needed = False
-                sufficient_count += 1
-            elif free_qty == 0:
-                shortage_status = "Out of Stock"
-                procurement_needed = True
-                out_of_stock_count += 1
-            elif free_qty >= required_qty * Decimal('0.5'):
-                shortage_status = "Moderate"
-                procurement_needed = True
-                moderate_count += 1
-            else:
-                shortage_status = "Critical"
-                procurement_needed = True
-                critical_count += 1
-            
-            shortage_details.append(MaterialShortageDetail(
-                material_id=material_id,
-                material_code=mat['code'],
-                material_name=mat['name'],
-                required_qty=required_qty,
-                unit=mat['unit'],
-                available_qty=available_qty,
-                allocated_qty=allocated_qty,
-                free_qty=free_qty,
-                shortage_qty=shortage_qty,
-                shortage_status=shortage_status,
-                procurement_needed=procurement_needed,
-                location_breakdown=location_breakdown if location_breakdown else None
-            ))
-        
-        # Summary
-        summary = {
-            'total_materials': len(shortage_details),
-            'sufficient': sufficient_count,
-            'moderate': moderate_count,
-            'critical': critical_count,
-            'out_of_stock': out_of_stock_count,
-            'procurement_required': moderate_count + critical_count + out_of_stock_count,
-            'can_produce': sufficient_count == len(shortage_details),
-            'total_shortage_items': len(shortage_details) - sufficient_count
-        }
+            shortage_details.append(
+                BOMService._material_shortage(material, required_qty, inputs, include_allocated)
+            )
         
         return BOMShortageCalculation(
-            product_id=product_id,
-            product_code=product_code,
-            product_name=product_name,
+            product_id=bom['product_id'],
+            product_code=product.get('code', 'Unknown'),
+            product_name=product.get('name', 'Unknown'),
             production_qty=quantity,
             bom_batch_size=batch_size,
             total_bom_cost=total_bom_cost,
             materials=shortage_details,
-            summary=summary
+            summary=BOMService._shortage_summary(shortage_details)
         )
+    
+    @staticmethod
+    async def calculate_plan_shortages(
+        items: List[ProductionPlanItem],
+        target_location_id: Optional[str] = None,
+        include_allocated: bool = False
+    ) -> ProductionPlanShortage:
+        """
+        Shortage analysis for a production plan (several products).
+        
+        Each item is checked against stock on its own, as
+        `calculate_requirements_with_shortages` does; `materials` then
+        checks the plan's combined requirement per material.
+        """
+        db = get_db()
+        
+        product_ids = list({item.product_id for item in items})
+        boms_result = await db.table('boms').select('*').in_('product_id', product_ids).eq('is_active', True).execute()
+        boms = {b['product_id']: b for b in boms_result.data}
+        
+        missing = [pid for pid in product_ids if pid not in boms]
+        if missing:
+            raise NotFoundException(detail=f"No active BOM found for product(s): {', '.join(missing)}")
+        
+        inputs = await BOMService._load_shortage_inputs(list(boms.values()), target_location_id)
+        
+        results = [
+            BOMService._bom_shortage(boms[item.product_id], item.quantity, inputs, include_allocated)
+            for item in items
+        ]
+        
+        combined = {}
+        for result in results:
+            for detail in result.materials:
+                combined[detail.material_id] = combined.get(detail.material_id, Decimal('0')) + detail.required_qty
+        
+        materials = [
+            BOMService._material_shortage(inputs['products'][material_id], required_qty, inputs, include_allocated)
+            for material_id, required_qty in combined.items()
+        ]
+        summary = BOMService._shortage_summary(materials)
+        summary['total_bom_cost'] = float(sum((r.total_bom_cost for r in results), Decimal('0')))
+        
+        return ProductionPlanShortage(items=results, materials=materials, summary=summary)
+    
+    @staticmethod
+    async def calculate_requirements_with_shortages(
+        product_id: str,
+        quantity: Decimal,
+        target_location_id: Optional[str] = None,
+        include_allocated: bool = False
+    ) -> BOMShortageCalculation:
+        """
+        Calculate material requirements with shortage analysis.
+        
+        Checks inventory availability and calculates shortages.
+        """
+        db = get_db()
+        
+        # Get active BOM
+        bom = await db.table('boms').select('*').eq('product_id', product_id).eq('is_active', True).execute()
+        
+        if not bom.data:
+            raise NotFoundException(detail="No active BOM found for this product")
+        
+        inputs = await BOMService._load_shortage_inputs(bom.data, target_location_id)
+        return BOMService._bom_shortage(bom.data[0], quantity, inputs, include_allocated)
 
     @staticmethod
     async def get_bom_materials_with_shortages(
@@ -1064,47 +1245,30 @@ class BOMService:
         """
         Get BOM materials with shortage information for UI display.
         """
-        from app.schemas.bom import BOMMaterialWithShortage
-        
         db = get_db()
         
         # Get BOM
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('*').eq('id', bom_id).execute()
         
         if not bom.data:
             raise NotFoundException(detail="BOM not found")
         
-        bom_data = bom.data[0]
-        batch_size = Decimal(str(bom_data.get('batch_size', 1)))
-        product_id = bom_data['product_id']
-        
-        # Get shortage calculation
-        shortage_calc = await BOMService.calculate_requirements_with_shortages(
-            product_id=product_id,
-            quantity=production_qty,
-            target_location_id=None,
-            include_allocated=False
-        )
-        
-        # Get BOM materials
-        materials = db.table('bom_materials').select('*').eq('bom_id', bom_id).order('sequence_number').execute()
+        inputs = await BOMService._load_shortage_inputs(bom.data)
+        shortage_calc = BOMService._bom_shortage(bom.data[0], production_qty, inputs, include_allocated=False)
+        shortage_by_material = {s.material_id: s for s in shortage_calc.materials}
         
         result = []
         
-        for mat in materials.data:
+        for mat in inputs['materials_by_bom'].get(bom_id, []):
             material_id = mat['material_id']
             
             # Find corresponding shortage detail
-            shortage_detail = next(
-                (s for s in shortage_calc.materials if s.material_id == material_id),
-                None
-            )
+            shortage_detail = shortage_by_material.get(material_id)
             
             if not shortage_detail:
                 continue
             
-            # Get material product info
-            mat_product = db.table('products').select('code', 'name').eq('id', material_id).execute()
+            mat_product = inputs['products'].get(material_id, {})
             
             quantity_per_unit = Decimal(str(mat['quantity']))
             
@@ -1117,8 +1281,8 @@ class BOMService:
             result.append(BOMMaterialWithShortage(
                 id=mat['id'],
                 material_id=material_id,
-                material_code=mat_product.data[0]['code'] if mat_product.data else '',
-                material_name=mat_product.data[0]['name'] if mat_product.data else '',
+                material_code=mat_product.get('code', ''),
+                material_name=mat_product.get('name', ''),
                 quantity_per_unit=quantity_per_unit,
                 required_qty=shortage_detail.required_qty,
                 unit=mat['unit'],
@@ -1136,5 +1300,63 @@ class BOMService:
         
         return result
 
+    # =============================================
+    # WHERE-USED
+    # =============================================
+
+    @staticmethod
+    async def get_where_used_rows(material_ids: List[str], active_only: bool = True) -> List[dict]:
+        """
+        Rows of the where-used index (see migration 018) for the given
+        materials: one per (material, BOM) at any sub-assembly depth.
+        """
+        material_ids = list(dict.fromkeys(str(m) for m in material_ids if m))
+        if not material_ids:
+            return []
+
+        db = get_db()
+        query = db.table('bom_where_used').select('*').in_('material_id', material_ids)
+        if active_only:
+            query = query.eq('is_active', True)
+        result = await query.execute()
+        return result.data or []
+
+    @staticmethod
+    async def get_where_used(material_id: str, active_only: bool = True) -> WhereUsedResult:
+        """Every BOM that consumes a material, directly or through sub-assemblies."""
+        loader = get_loader()
+        material = await loader.load('products', material_id)
+        if not material:
+            raise NotFoundException(detail="Material not found")
+
+        rows = await BOMService.get_where_used_rows([material_id], active_only)
+        boms = await loader.load_many('boms', (r['bom_id'] for r in rows))
+        products = await loader.load_many('products', (r['product_id'] for r in rows))
+
+        used_in = []
+        for row in rows:
+            product = products.get(row['product_id'], {})
+            used_in.append(WhereUsedEntry(
+                bom_id=row['bom_id'],
+                bom_version=boms.get(row['bom_id'], {}).get('version'),
+                product_id=row['product_id'],
+                product_code=product.get('code', ''),
+                product_name=product.get('name', ''),
+                is_active=row['is_active'],
+                is_direct=row['is_direct'],
+                min_level=row['min_level'],
+                max_level=row['max_level'],
+                quantity_per_batch=Decimal(str(row['quantity_per_batch'])),
+                quantity_per_unit=Decimal(str(row['quantity_per_unit']))
+            ))
+        used_in.sort(key=lambda e: (e.min_level, e.product_code))
+
+        return WhereUsedResult(
+            material_id=material_id,
+            material_code=material.get('code', ''),
+            material_name=material.get('name', ''),
+            used_in=used_in
+        )
+
 # Singleton instance
 bom_service = BOMService()
\ No newline at end of file
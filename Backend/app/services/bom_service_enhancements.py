@@ -3,10 +3,22 @@ BOM Service Enhancements - Sub-Assembly Support
 Add these methods to the existing BOMService class
 """
 
-from typing import List, Dict, Optional
+import asyncio
+import logging
+from typing import List, Dict, Optional, Set
 from decimal import Decimal
+from app.config import settings
 from app.database import get_db
+from app.core.loader import get_loader, begin_request_scope, end_request_scope
 from app.core.exceptions import ValidationException, NotFoundException
+from app.schemas.bom import BOMCycle, BOMCycleReport
+from app.services.bom_graph import BOMGraph, SubAssemblyLinks
+
+
+logger = logging.getLogger(__name__)
+
+# Background level recalculations (referenced until they finish)
+_level_tasks: Set[asyncio.Task] = set()
 
 class BOMServiceEnhancements:
     """
@@ -42,12 +54,12 @@ class BOMServiceEnhancements:
         db = get_db()
         
         # Validate parent BOM exists
-        parent_bom = db.table('boms').select('id', 'product_id').eq('id', bom_id).execute()
+        parent_bom = await db.table('boms').select('id', 'product_id').eq('id', bom_id).execute()
         if not parent_bom.data:
             raise NotFoundException(detail="Parent BOM not found")
         
         # Get sub-assembly BOM
-        sub_bom = db.table('boms').select('id', 'product_id', 'is_active').eq(
+        sub_bom = await db.table('boms').select('id', 'product_id', 'is_active').eq(
             'product_id', sub_assembly_product_id
         ).eq('is_active', True).execute()
         
@@ -59,14 +71,16 @@ class BOMServiceEnhancements:
         sub_bom_id = sub_bom.data[0]['id']
         
         # Check for circular reference
-        if await BOMServiceEnhancements._check_circular_reference(bom_id, sub_bom_id):
+        cycle = await BOMServiceEnhancements._check_circular_reference(bom_id, sub_bom_id)
+        if cycle:
+            labels = await BOMServiceEnhancements._cycle_labels(cycle)
             raise ValidationException(
-                detail="Circular reference detected. This sub-assembly contains the parent BOM in its hierarchy."
+                detail=f"Circular reference detected. This sub-assembly contains the parent BOM in its hierarchy: {' -> '.join(labels)}"
             )
         
         # Get next sequence number if not provided
         if sequence_number is None:
-            existing = db.table('bom_materials').select('sequence_number').eq('bom_id', bom_id).execute()
+            existing = await db.table('bom_materials').select('sequence_number').eq('bom_id', bom_id).execute()
             sequence_number = max([m.get('sequence_number', 0) for m in existing.data], default=0) + 1
         
         # Add sub-assembly as material
@@ -82,77 +96,138 @@ class BOMServiceEnhancements:
             'level': 1  # Will be recalculated if nested deeper
         }
         
-        result = db.table('bom_materials').insert(material_dict).execute()
+        result = await db.table('bom_materials').insert(material_dict).execute()
         
         # Update sub-assembly BOM to mark it as used in assemblies
-        db.table('boms').update({
+        await db.table('boms').update({
             'is_sub_assembly': True
         }).eq('id', sub_bom_id).execute()
         
-        # Recalculate hierarchy levels
-        await BOMServiceEnhancements._recalculate_hierarchy_levels(bom_id)
+        # Recalculate hierarchy levels (in the background; the response does not wait)
+        BOMServiceEnhancements.schedule_level_recalculation(bom_id)
         
         return result.data[0] if result.data else material_dict
     
     @staticmethod
-    async def _check_circular_reference(parent_bom_id: str, child_bom_id: str) -> bool:
+    async def _check_circular_reference(parent_bom_id: str, child_bom_id: str) -> Optional[List[str]]:
         """
         Check if adding child_bom_id to parent_bom_id would create a circular reference.
         
-        Returns True if circular reference detected, False otherwise.
+        Returns the BOM ids of the loop it would close (parent first and
+        last), or None if there is none.
         """
-        db = get_db()
-        
-        # Get all sub-assemblies in the child BOM hierarchy
-        visited = set()
-        to_check = [child_bom_id]
-        
-        while to_check:
-            current_bom_id = to_check.pop(0)
-            
-            if current_bom_id in visited:
-                continue
-            
-            visited.add(current_bom_id)
-            
-            # If we find the parent in the child's hierarchy, it's circular
-            if current_bom_id == parent_bom_id:
-                return True
-            
-            # Get sub-assemblies of current BOM
-            materials = db.table('bom_materials').select('sub_assembly_bom_id').eq(
-                'bom_id', current_bom_id
-            ).eq('is_sub_assembly', True).execute()
-            
-            for mat in materials.data:
-                sub_bom_id = mat.get('sub_assembly_bom_id')
-                if sub_bom_id and sub_bom_id not in visited:
-                    to_check.append(sub_bom_id)
+        links = await SubAssemblyLinks.load()
+        return links.cycle_through(parent_bom_id, child_bom_id)
+    
+    @staticmethod
+    async def _cycle_labels(bom_ids: List[str]) -> List[str]:
+        """Product code of each BOM in a loop (BOM id if unknown)."""
+        loader = get_loader()
+        boms = await loader.load_many('boms', bom_ids)
+        products = await loader.load_many('products', (b['product_id'] for b in boms.values()))
+        return [
+            products.get(boms.get(bom_id, {}).get('product_id'), {}).get('code') or bom_id
+            for bom_id in bom_ids
+        ]
+    
+    @staticmethod
+    async def validate_sub_assembly_cycles() -> BOMCycleReport:
+        """Check every BOM for sub-assembly loops (one query for the whole plant)."""
+        links = await SubAssemblyLinks.load()
+        cycles = links.cycles()
+        
+        loader = get_loader()
+        boms = await loader.load_many('boms', (bom_id for cycle in cycles for bom_id in cycle))
+        products = await loader.load_many('products', (b['product_id'] for b in boms.values()))
+        
+        return BOMCycleReport(
+            bom_count=len(links.bom_ids),
+            link_count=links.link_count,
+            has_cycles=bool(cycles),
+            cycles=[
+                BOMCycle(
+                    bom_ids=cycle,
+                    product_codes=[
+                        products.get(boms.get(bom_id, {}).get('product_id'), {}).get('code', '')
+                        for bom_id in cycle
+                    ]
+                )
+                for cycle in cycles
+            ]
+        )
+    
+    @staticmethod
+    def _level_changes(graph: BOMGraph, bom_id: str) -> List[Dict]:
+        """Material rows in the tree whose level differs from their depth."""
+        return [
+            {'id': mat['id'], 'level': level}
+            for current_bom_id, level in graph.depths(bom_id).items()
+            for mat in graph.children.get(current_bom_id, [])
+            if mat.get('level') != level
+        ]
+    
+    @staticmethod
+    async def _write_levels(changes: List[Dict]) -> int:
+        """Write level changes in one set-based update (see migration 025)."""
+        if not changes:
+            return 0
         
-        return False
+        db = get_db()
+        result = await db.rpc('set_bom_material_levels', {'p_levels': changes}).execute()
+        return result.data or 0
     
     @staticmethod
-    async def _recalculate_hierarchy_levels(bom_id: str):
+    async def recalculate_hierarchy_levels(bom_id: str) -> int:
         """
         Recalculate hierarchy levels for all materials in a BOM tree.
+        A shared sub-assembly gets the deepest level it is used at.
+        Returns the number of material rows whose level changed.
         """
-        db = get_db()
-        
-        # Recursive function to set levels
-        async def set_levels(current_bom_id: str, current_level: int = 0):
-            materials = db.table('bom_materials').select('*').eq('bom_id', current_bom_id).execute()
-            
-            for mat in materials.data:
-                # Update level
-                db.table('bom_materials').update({
-                    'level': current_level
-                }).eq('id', mat['id']).execute()
-                
-                # Recursively process sub-assemblies
-                if mat.get('is_sub_assembly') and mat.get('sub_assembly_bom_id'):
-                    await set_levels(mat['sub_assembly_bom_id'], current_level + 1)
-        
-        await set_levels(bom_id, 0)
+        graph = await BOMGraph.load([bom_id])
+        graph.bom(bom_id)
+        return await BOMServiceEnhancements._write_levels(
+            BOMServiceEnhancements._level_changes(graph, bom_id)
+        )
+    
+    @staticmethod
+    async def request_level_recalculation(bom_id: str) -> Dict:
+        """
+        Recalculate levels now, or in the background when the tree has more
+        than BOM_LEVEL_BACKGROUND_THRESHOLD material lines.
+        """
+        graph = await BOMGraph.load([bom_id])
+        graph.bom(bom_id)
+        material_count = sum(len(lines) for lines in graph.children.values())
+        
+        if material_count > settings.BOM_LEVEL_BACKGROUND_THRESHOLD:
+            BOMServiceEnhancements.schedule_level_recalculation(bom_id, graph)
+            return {'bom_id': bom_id, 'material_count': material_count, 'queued': True, 'updated_materials': None}
+        
+        updated = await BOMServiceEnhancements._write_levels(
+            BOMServiceEnhancements._level_changes(graph, bom_id)
+        )
+        return {'bom_id': bom_id, 'material_count': material_count, 'queued': False, 'updated_materials': updated}
+    
+    @staticmethod
+    def schedule_level_recalculation(bom_id: str, graph: Optional[BOMGraph] = None):
+        """Recalculate levels in a background task (reusing `graph` if already loaded)."""
+        task = asyncio.create_task(BOMServiceEnhancements._recalculate_in_background(bom_id, graph))
+        _level_tasks.add(task)
+        task.add_done_callback(_level_tasks.discard)
+    
+    @staticmethod
+    async def _recalculate_in_background(bom_id: str, graph: Optional[BOMGraph]):
+        token = begin_request_scope()
+        try:
+            if graph is None:
+                graph = await BOMGraph.load([bom_id])
+            changes = BOMServiceEnhancements._level_changes(graph, bom_id)
+            updated = await BOMServiceEnhancements._write_levels(changes)
+            logger.info(f"Recalculated levels for BOM {bom_id}: {updated} material rows updated")
+        except Exception as e:
+            logger.error(f"Level recalculation for BOM {bom_id} failed: {e}")
+        finally:
+            end_request_scope(token)
     
     @staticmethod
     async def get_exploded_bom(bom_id: str) -> List[Dict]:
@@ -161,62 +236,25 @@ class BOMServiceEnhancements:
         
         Returns a list of materials with calculated total quantities considering all sub-assembly levels.
         """
-        db = get_db()
-        
-        # Validate BOM exists
-        bom = db.table('boms').select('id', 'batch_size').eq('id', bom_id).execute()
-        if not bom.data:
-            raise NotFoundException(detail="BOM not found")
-        
-        batch_size = Decimal(str(bom.data[0].get('batch_size', 100)))
-        
-        # Recursive function to explode BOM
-        async def explode_level(current_bom_id: str, multiplier: Decimal = Decimal('1')) -> List[Dict]:
-            materials = db.table('bom_materials').select('*').eq('bom_id', current_bom_id).execute()
-            
-            result = []
-            
-            for mat in materials.data:
-                quantity = Decimal(str(mat['quantity'])) * multiplier
-                scrap_pct = Decimal(str(mat.get('scrap_percentage', 0)))
-                total_qty = quantity * (1 + scrap_pct / 100)
-                
-                if mat.get('is_sub_assembly') and mat.get('sub_assembly_bom_id'):
-                    # Recursively explode sub-assembly
-                    sub_materials = await explode_level(mat['sub_assembly_bom_id'], total_qty)
-                    result.extend(sub_materials)
-                else:
-                    # Get product details
-                    product = db.table('products').select('code', 'name').eq('id', mat['material_id']).execute()
-                    
-                    result.append({
-                        'material_id': mat['material_id'],
-                        'material_code': product.data[0]['code'] if product.data else '',
-                        'material_name': product.data[0]['name'] if product.data else '',
-                        'quantity_per_unit': float(quantity),
-                        'total_quantity': float(total_qty),
-                        'unit': mat['unit'],
-                        'scrap_percentage': float(scrap_pct),
-                        'unit_cost': float(mat.get('unit_cost', 0)),
-                        'total_cost': float(total_qty * Decimal(str(mat.get('unit_cost', 0)))),
-                        'level': mat.get('level', 0)
-                    })
-            
-            return result
-        
-        exploded = await explode_level(bom_id)
-        
-        # Consolidate duplicate materials
-        consolidated = {}
-        for mat in exploded:
-            mat_id = mat['material_id']
-            if mat_id in consolidated:
-                consolidated[mat_id]['total_quantity'] += mat['total_quantity']
-                consolidated[mat_id]['total_cost'] += mat['total_cost']
-            else:
-                consolidated[mat_id] = mat
-        
-        return list(consolidated.values())
+        graph = await BOMGraph.load([bom_id])
+        
+        exploded = []
+        for material_id, mat in graph.explode(bom_id).items():
+            product = graph.product(material_id)
+            exploded.append({
+                'material_id': material_id,
+                'material_code': product.get('code', ''),
+                'material_name': product.get('name', ''),
+                'quantity_per_unit': float(mat['quantity_per_unit']),
+                'total_quantity': float(mat['total_quantity']),
+                'unit': mat['unit'],
+                'scrap_percentage': float(mat['scrap_percentage']),
+                'unit_cost': float(mat['unit_cost']),
+                'total_cost': float(mat['total_cost']),
+                'level': mat['level']
+            })
+        
+        return exploded
     
     @staticmethod
     async def get_bom_hierarchy(bom_id: str) -> Dict:
@@ -225,66 +263,34 @@ class BOMServiceEnhancements:
         
         Returns nested structure showing all levels of the BOM.
         """
-        db = get_db()
-        
-        # Get BOM details
-        bom = db.table('boms').select('*').eq('id', bom_id).execute()
-        if not bom.data:
-            raise NotFoundException(detail="BOM not found")
-        
-        bom_data = bom.data[0]
-        
-        # Get product details
-        product = db.table('products').select('code', 'name').eq('id', bom_data['product_id']).execute()
-        
-        # Recursive function to build tree
-        async def build_tree(current_bom_id: str, level: int = 0) -> Dict:
-            materials = db.table('bom_materials').select('*').eq('bom_id', current_bom_id).order('sequence_number').execute()
-            
-            material_list = []
-            
-            for mat in materials.data:
-                # Get material product details
-                mat_product = db.table('products').select('code', 'name').eq('id', mat['material_id']).execute()
-                
-                material_dict = {
-                    'id': mat['id'],
-                    'material_id': mat['material_id'],
-                    'material_code': mat_product.data[0]['code'] if mat_product.data else '',
-                    'material_name': mat_product.data[0]['name'] if mat_product.data else '',
-                    'quantity': float(mat['quantity']),
-                    'unit': mat['unit'],
-                    'scrap_percentage': float(mat.get('scrap_percentage', 0)),
-                    'unit_cost': float(mat.get('unit_cost', 0)),
-                    'is_sub_assembly': mat.get('is_sub_assembly', False),
-                    'level': level
-                }
-                
-                # Recursively add sub-assembly children
-                if mat.get('is_sub_assembly') and mat.get('sub_assembly_bom_id'):
-                    material_dict['children'] = await build_tree(mat['sub_assembly_bom_id'], level + 1)
-                
-                material_list.append(material_dict)
-            
-            return material_list
+        graph = await BOMGraph.load([bom_id])
+        bom_data = graph.bom(bom_id)
+        product = graph.product(bom_data['product_id'])
         
-        hierarchy = {
+        return {
             'bom_id': bom_id,
             'product_id': bom_data['product_id'],
-            'product_code': product.data[0]['code'] if product.data else '',
-            'product_name': product.data[0]['name'] if product.data else '',
+            'product_code': product.get('code', ''),
+            'product_name': product.get('name', ''),
             'version': bom_data.get('version', 1),
-            'batch_size': float(bom_data.get('batch_size', 100)),
-            'materials': await build_tree(bom_id, 0)
+            'batch_size': float(bom_data.get('batch_size') or 100),
+            'materials': graph.tree(bom_id)
         }
-        
-        return hierarchy
     
     @staticmethod
     async def calculate_total_cost_with_subassemblies(bom_id: str) -> Decimal:
         """
         Calculate total material cost including all sub-assembly levels.
+        Reads the stored rollup; walks the graph only if none exists yet.
         """
-        exploded = await BOMServiceEnhancements.get_exploded_bom(bom_id)
-        total_cost = sum(Decimal(str(mat['total_cost'])) for mat in exploded)
-        return total_cost
+        db = get_db()
+        rollup = await db.table('bom_cost_rollups').select('total_cost').eq('bom_id', bom_id).execute()
+        if rollup.data:
+            return Decimal(str(rollup.data[0]['total_cost']))
+
+        graph = await BOMGraph.load([bom_id])
+        return graph.total_cost(bom_id)
+
+
+# Singleton instance
+bom_service_enhancements = BOMServiceEnhancements()
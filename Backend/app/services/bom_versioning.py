@@ -0,0 +1,165 @@
+"""
+BOM version history as diffs.
+
+A version row stores `changes` (a diff against the previous version)
+and, every BOM_VERSION_CHECKPOINT_INTERVAL versions, a full `snapshot`
+checkpoint. Any version is rebuilt by taking the nearest checkpoint at
+or before it and replaying the diffs after it.
+
+State is {'bom': {header fields}, 'materials': {line key: line}}. Lines
+are keyed by material id (with an occurrence suffix for repeats) since
+replacing a BOM's materials gives every line a new row id.
+"""
+
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional
+
+# Header fields that make up a BOM version
+HEADER_FIELDS = (
+    'product_id', 'batch_size', 'is_active', 'is_template', 'template_name',
+    'effective_date', 'notes',
+)
+
+# Material line fields that make up a BOM version
+LINE_FIELDS = (
+    'material_id', 'quantity', 'unit', 'scrap_percentage', 'unit_cost',
+    'sequence_number', 'is_sub_assembly', 'sub_assembly_bom_id',
+)
+
+
+def _same(a, b) -> bool:
+    """Equality that treats 1, 1.0 and "1.000" as the same number."""
+    if a == b:
+        return True
+    if isinstance(a, bool) or isinstance(b, bool) or a is None or b is None:
+        return False
+    try:
+        return Decimal(str(a)) == Decimal(str(b))
+    except InvalidOperation:
+        return False
+
+
+def _sort_key(line: dict):
+    sequence = line.get('sequence_number')
+    return (sequence is None, sequence or 0, str(line.get('material_id')))
+
+
+def state_from_rows(bom: dict, materials: Iterable[dict]) -> dict:
+    """Version state from a `boms` row and its `bom_materials` rows."""
+    lines = {}
+    seen: Dict[str, int] = {}
+    for row in sorted(materials, key=_sort_key):
+        material_id = str(row.get('material_id'))
+        occurrence = seen.get(material_id, 0)
+        seen[material_id] = occurrence + 1
+        key = material_id if occurrence == 0 else f'{material_id}#{occurrence}'
+        lines[key] = {field: row.get(field) for field in LINE_FIELDS}
+
+    return {
+        'bom': {field: bom.get(field) for field in HEADER_FIELDS},
+        'materials': lines
+    }
+
+
+def state_from_snapshot(snapshot) -> dict:
+    """Version state from a stored checkpoint (also reads legacy full-row snapshots)."""
+    if isinstance(snapshot, str):
+        snapshot = json.loads(snapshot)
+    materials = snapshot.get('materials') or []
+    if isinstance(materials, dict):
+        return {'bom': dict(snapshot.get('bom') or {}), 'materials': dict(materials)}
+    return state_from_rows(snapshot.get('bom') or {}, materials)
+
+
+def to_snapshot(state: dict) -> dict:
+    """API shape of a state: header plus lines in display order."""
+    return {
+        'bom': state['bom'],
+        'materials': sorted(state['materials'].values(), key=_sort_key)
+    }
+
+
+def _field_changes(old: dict, new: dict, fields) -> dict:
+    return {
+        field: {'from': old.get(field), 'to': new.get(field)}
+        for field in fields
+        if not _same(old.get(field), new.get(field))
+    }
+
+
+def diff(old: dict, new: dict) -> dict:
+    """Changes turning state `old` into state `new`; empty sections are omitted."""
+    changes = {}
+
+    header = _field_changes(old['bom'], new['bom'], HEADER_FIELDS)
+    if header:
+        changes['bom'] = header
+
+    old_lines, new_lines = old['materials'], new['materials']
+    added = [{'key': k, 'line': line} for k, line in new_lines.items() if k not in old_lines]
+    removed = [{'key': k, 'line': line} for k, line in old_lines.items() if k not in new_lines]
+    changed = []
+    for key, line in new_lines.items():
+        if key in old_lines:
+            fields = _field_changes(old_lines[key], line, LINE_FIELDS)
+            if fields:
+                changed.append({'key': key, 'material_id': line.get('material_id'), 'fields': fields})
+
+    if added:
+        changes['added'] = added
+    if removed:
+        changes['removed'] = removed
+    if changed:
+        changes['changed'] = changed
+    return changes
+
+
+def apply(state: dict, changes: Optional[dict]) -> dict:
+    """State after applying `changes` (does not modify `state`)."""
+    if not changes:
+        return state
+
+    bom = dict(state['bom'])
+    for field, change in (changes.get('bom') or {}).items():
+        bom[field] = change['to']
+
+    lines = dict(state['materials'])
+    for entry in changes.get('removed') or []:
+        lines.pop(entry['key'], None)
+    for entry in changes.get('added') or []:
+        lines[entry['key']] = entry['line']
+    for entry in changes.get('changed') or []:
+        line = dict(lines.get(entry['key']) or {})
+        for field, change in entry['fields'].items():
+            line[field] = change['to']
+        lines[entry['key']] = line
+
+    return {'bom': bom, 'materials': lines}
+
+
+def replay(rows: List[dict], versions: Iterable[int]) -> Dict[int, dict]:
+    """
+    States at the requested versions from version rows in ascending
+    order, the first of which must be a checkpoint.
+    """
+    wanted = set(versions)
+    states = {}
+    state = None
+    for row in rows:
+        if row.get('is_checkpoint', True) and row.get('snapshot'):
+            state = state_from_snapshot(row['snapshot'])
+        elif state is not None:
+            state = apply(state, row.get('changes'))
+        if row['version'] in wanted and state is not None:
+            states[row['version']] = state
+    return states
+
+
+def summarise(changes: dict) -> dict:
+    return {
+        'header_fields_changed': len(changes.get('bom') or {}),
+        'materials_added': len(changes.get('added') or []),
+        'materials_removed': len(changes.get('removed') or []),
+        'materials_changed': len(changes.get('changed') or [])
+    }
@@ -1,10 +1,20 @@
+import asyncio
+import logging
+import time
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from decimal import Decimal
+from app.config import settings
 from app.database import get_db
+from app.core.aggregate import aggregate
+from app.core.cache import Cache
+from app.core.live import publish
+from app.core.loader import begin_request_scope, end_request_scope
 from app.schemas.dashboard import (
     DashboardResponse,
     DashboardKPIs,
+    DashboardMeta,
+    DashboardSectionTiming,
     KPICard,
     OrderSummary,
     ShortageItem,
@@ -12,40 +22,213 @@ from app.schemas.dashboard import (
     RecentActivity,
     QuickAction
 )
+from app.services.activity_service import activity_service
+from app.services.inventory_service import SHORTAGE_ALERT_VIEW
+
+logger = logging.getLogger(__name__)
+
+# Writes under these API paths change what the dashboard shows
+REFRESH_PATH_PREFIXES = (
+    '/api/v1/production-orders',
+    '/api/v1/inventory',  # also /inventory-items
+    '/api/v1/gate-entries',
+    '/api/v1/material-transfers',
+    '/api/v1/alerts',
+)
 
 
 class DashboardService:
+    """
+    The dashboard is served from a snapshot in the shared cache, so its
+    cost does not depend on how many tabs poll it. The snapshot is
+    rebuilt every DASHBOARD_REFRESH_SECONDS and after relevant writes;
+    a request that finds it stale is answered from it and triggers a
+    rebuild (stale-while-revalidate). Role-specific quick actions are
+    added per request.
+
+    A rebuild loads the sections (KPIs, orders summary, shortages,
+    rework alerts, recent activity) concurrently. Each section has
+    DASHBOARD_SECTION_TIMEOUT_SECONDS to answer; one that overruns or
+    fails is served from its last good value and keeps running in the
+    background to refresh it.
+    """
     
-    @staticmethod
-    async def get_dashboard_data(user_id: str, user_roles: List[str]) -> DashboardResponse:
+    def __init__(self):
+        ttl = settings.DASHBOARD_SECTION_CACHE_TTL_SECONDS
+        # Section name -> (loader, cache of its last good value)
+        self._sections: Dict[str, Tuple[Callable[[Any], Awaitable[Any]], Cache]] = {
+            'kpis': (self._calculate_kpis, Cache('dashboard:kpis', DashboardKPIs, ttl)),
+            'orders_summary': (self._get_orders_summary, Cache('dashboard:orders_summary', OrderSummary, ttl)),
+            'shortages': (self._get_material_shortages, Cache('dashboard:shortages', List[ShortageItem], ttl)),
+            'rework_alerts': (self._get_rework_alerts, Cache('dashboard:rework_alerts', List[ReworkAlert], ttl)),
+            'recent_activities': (
+                self._get_recent_activities, Cache('dashboard:recent_activities', List[RecentActivity], ttl)
+            ),
+        }
+        self._tasks: Set[asyncio.Task] = set()
+        
+        self._snapshot = Cache('dashboard', DashboardResponse, ttl_seconds=settings.DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS)
+        self._rebuild: Optional[asyncio.Task] = None
+        self._rebuild_again = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def get_dashboard_data(self, user_id: str, user_roles: List[str]) -> DashboardResponse:
         """
         Get complete dashboard data for user.
         """
+        snapshot = await self._snapshot.get('snapshot')
+        if snapshot is None:
+            snapshot = await self.refresh()
+        elif (datetime.utcnow() - snapshot.last_updated).total_seconds() > settings.DASHBOARD_REFRESH_SECONDS:
+            self.request_refresh()
+        
+        return snapshot.model_copy(update={
+            'quick_actions': await self.get_quick_actions(user_roles)
+        })
+    
+    # =============================================
+    # SNAPSHOT
+    # =============================================
+    
+    async def refresh(self) -> DashboardResponse:
+        """Rebuild the snapshot now (joining a rebuild already in progress)."""
+        if self._rebuild is None:
+            self._start_rebuild()
+        return await asyncio.shield(self._rebuild)
+    
+    def request_refresh(self):
+        """
+        Rebuild the snapshot in the background. Requests made while a
+        rebuild runs are coalesced into one more rebuild after it.
+        """
+        if self._rebuild is None:
+            self._start_rebuild()
+        else:
+            self._rebuild_again = True
+    
+    def _start_rebuild(self):
+        self._rebuild_again = False
+        self._rebuild = asyncio.create_task(self._build_and_store())
+        self._rebuild.add_done_callback(self._rebuild_done)
+    
+    def _rebuild_done(self, task: asyncio.Task):
+        self._rebuild = None
+        if not task.cancelled() and task.exception():
+            logger.error(f"Dashboard snapshot rebuild failed: {task.exception()}")
+        if self._rebuild_again:
+            self._start_rebuild()
+    
+    async def _build_and_store(self) -> DashboardResponse:
+        token = begin_request_scope()
+        try:
+            snapshot = await self.build_snapshot()
+        finally:
+            end_request_scope(token)
+        previous = await self._snapshot.get('snapshot')
+        await self._snapshot.set('snapshot', snapshot)
+        await self._publish_changes(previous, snapshot)
+        return snapshot
+    
+    async def _publish_changes(self, previous: Optional[DashboardResponse], snapshot: DashboardResponse):
+        """Push the sections that differ from the previous snapshot to live subscribers."""
+        current = snapshot.model_dump(mode='json', include=set(self._sections))
+        before = previous.model_dump(mode='json', include=set(self._sections)) if previous else {}
+        changed = {name: value for name, value in current.items() if before.get(name) != value}
+        if changed:
+            await publish('dashboard', 'dashboard:update', {
+                'sections': changed,
+                'last_updated': snapshot.last_updated.isoformat()
+            })
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass  # Logged by _rebuild_done
+            await asyncio.sleep(settings.DASHBOARD_REFRESH_SECONDS)
+    
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def build_snapshot(self) -> DashboardResponse:
+        """Load every section (concurrently) into a role-independent dashboard."""
+        started = time.perf_counter()
         db = get_db()
         
-        # Calculate KPIs
-        kpis = await DashboardService._calculate_kpis(db)
+        names = list(self._sections)
+        results = await asyncio.gather(*(self._load_section(name, db) for name in names))
+        values = {name: value for name, (value, _) in zip(names, results)}
+        
+        return DashboardResponse(
+            **values,
+            last_updated=datetime.utcnow(),
+            meta=DashboardMeta(
+                duration_ms=int((time.perf_counter() - started) * 1000),
+                sections={name: timing for name, (_, timing) in zip(names, results)}
+            )
+        )
+    
+    async def _load_section(self, name: str, db) -> Tuple[Any, DashboardSectionTiming]:
+        """
+        Load one section within its time budget. On timeout or error the
+        last good value is returned; without one, a timed-out section is
+        awaited to completion and an error is raised.
+        """
+        load, cache = self._sections[name]
+        started = time.perf_counter()
         
-        # Get orders summary
-        orders_summary = await DashboardService._get_orders_summary(db)
+        def timing(status: str, from_cache: bool = False) -> DashboardSectionTiming:
+            return DashboardSectionTiming(
+                duration_ms=int((time.perf_counter() - started) * 1000),
+                status=status,
+                from_cache=from_cache
+            )
         
-        # Get material shortages
-        shortages = await DashboardService._get_material_shortages(db)
+        async def load_and_store():
+            value = await load(db)
+            await cache.set('latest', value)
+            return value
         
-        # Get rework alerts
-        rework_alerts = await DashboardService._get_rework_alerts(db)
+        task = asyncio.create_task(load_and_store())
+        try:
+            value = await asyncio.wait_for(asyncio.shield(task), settings.DASHBOARD_SECTION_TIMEOUT_SECONDS)
+            return value, timing('ok')
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            logger.warning(f"Dashboard section '{name}' exceeded {settings.DASHBOARD_SECTION_TIMEOUT_SECONDS}s")
+        except Exception as e:
+            status = 'error'
+            logger.error(f"Dashboard section '{name}' failed: {e}")
         
-        # Get recent activities
-        recent_activities = await DashboardService._get_recent_activities(db)
+        cached = await cache.get('latest')
+        if cached is not None:
+            if not task.done():
+                # Let it finish and refresh the cached value for the next request
+                self._tasks.add(task)
+                task.add_done_callback(self._background_done)
+            return cached, timing(status, from_cache=True)
         
-        return DashboardResponse(
-            kpis=kpis,
-            orders_summary=orders_summary,
-            shortages=shortages,
-            rework_alerts=rework_alerts,
-            recent_activities=recent_activities,
-            last_updated=datetime.utcnow()
-        )
+        if status == 'error':
+            raise task.exception()
+        return await task, timing(status)
+    
+    def _background_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background dashboard section refresh failed: {task.exception()}")
     
     @staticmethod
     async def _calculate_kpis(db) -> DashboardKPIs:
@@ -57,14 +240,11 @@ class DashboardService:
         # ========================================
         live_orders_count = 0
         
-        try:
-            # Count orders that are Planned or In Progress
-            orders = db.table('production_orders').select('id', count='exact').in_(
-                'status', ['Planned', 'In Progress']
-            ).execute()
-            live_orders_count = orders.count if hasattr(orders, 'count') else len(orders.data)
-        except Exception:
-            pass
+        # Count orders that are Planned or In Progress
+        orders = await db.table('production_orders').select('id', count='exact').in_(
+            'status', ['Planned', 'In Progress']
+        ).execute()
+        live_orders_count = orders.count if hasattr(orders, 'count') else len(orders.data)
         
         live_orders = KPICard(
             title="Live Orders",
@@ -83,30 +263,26 @@ class DashboardService:
         critical_count = 0
         low_count = 0
         
-        try:
-            # Get all active inventory items with low or critical status
-            items = db.table('inventory_items').select(
-                'id', 'material_name', 'quantity', 'reorder_level', 'status', 'allocated_quantity'
-            ).eq('is_active', True).execute()
+        # Get all active inventory items with low or critical status
+        items = await db.table('inventory_items').select(
+            'id', 'material_name', 'quantity', 'reorder_level', 'status', 'allocated_quantity'
+        ).eq('is_active', True).execute()
+        
+        for item in items.data:
+            status = item.get('status', 'sufficient')
+            quantity = Decimal(str(item.get('quantity', 0)))
+            allocated_quantity = Decimal(str(item.get('allocated_quantity', 0)))
+            free_qty = quantity - allocated_quantity
+            reorder_level = Decimal(str(item.get('reorder_level', 0)))
             
-            for item in items.data:
-                status = item.get('status', 'sufficient')
-                quantity = Decimal(str(item.get('quantity', 0)))
-                allocated_quantity = Decimal(str(item.get('allocated_quantity', 0)))
-                free_qty = quantity - allocated_quantity
-                reorder_level = Decimal(str(item.get('reorder_level', 0)))
+            # Count items below reorder level
+            if free_qty <= reorder_level:
+                shortage_count += 1
                 
-                # Count items below reorder level
-                if free_qty <= reorder_level:
-                    shortage_count += 1
-                    
-                    if status == 'critical' or free_qty == 0:
-                        critical_count += 1
-                    elif status == 'low':
-                        low_count += 1
-                        
-        except Exception:
-            pass
+                if status == 'critical' or free_qty == 0:
+                    critical_count += 1
+                elif status == 'low':
+                    low_count += 1
         
         # Calculate trend percentage
         trend_pct = 0.0
@@ -142,29 +318,26 @@ class DashboardService:
         # ========================================
         otd_percentage_value = 0.0
         
-        try:
-            # Get completed orders from last 30 days
-            from datetime import timedelta
-            thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
-            
-            completed_orders = db.table('production_orders').select(
-                'id', 'due_date', 'completion_date'
-            ).eq('status', 'Completed').gte('completion_date', thirty_days_ago).execute()
+        # Get completed orders from last 30 days
+        from datetime import timedelta
+        thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
+        
+        completed_orders = await db.table('production_orders').select(
+            'id', 'due_date', 'completion_date'
+        ).eq('status', 'Completed').gte('completion_date', thirty_days_ago).execute()
+        
+        if completed_orders.data:
+            on_time_count = 0
+            total_count = len(completed_orders.data)
             
-            if completed_orders.data:
-                on_time_count = 0
-                total_count = len(completed_orders.data)
-                
-                for order in completed_orders.data:
-                    due_date = datetime.fromisoformat(order['due_date']).date() if isinstance(order['due_date'], str) else order['due_date']
-                    completed_at = datetime.fromisoformat(order['completion_date'].replace('Z', '+00:00')).date()
-                    
-                    if completed_at <= due_date:
-                        on_time_count += 1
+            for order in completed_orders.data:
+                due_date = datetime.fromisoformat(order['due_date']).date() if isinstance(order['due_date'], str) else order['due_date']
+                completed_at = datetime.fromisoformat(order['completion_date'].replace('Z', '+00:00')).date()
                 
-                otd_percentage_value = (on_time_count / total_count * 100) if total_count > 0 else 0
-        except Exception:
-            pass
+                if completed_at <= due_date:
+                    on_time_count += 1
+            
+            otd_percentage_value = (on_time_count / total_count * 100) if total_count > 0 else 0
         
         otd_percentage = KPICard(
             title="On-Time Delivery",
@@ -201,33 +374,18 @@ class DashboardService:
     @staticmethod
     async def _get_orders_summary(db) -> OrderSummary:
         """
-        Get orders breakdown by status (REAL DATA!).
+        Get orders breakdown by status (counted in the database).
         """
-        try:
-            orders = db.table('production_orders').select('status').execute()
-            
-            total = len(orders.data)
-            planned = sum(1 for o in orders.data if o['status'] == 'Planned')
-            in_progress = sum(1 for o in orders.data if o['status'] == 'In Progress')
-            completed = sum(1 for o in orders.data if o['status'] == 'Completed')
-            on_hold = sum(1 for o in orders.data if o['status'] == 'On Hold')
-            
-            return OrderSummary(
-                total=total,
-                planned=planned,
-                in_progress=in_progress,
-                completed=completed,
-                on_hold=on_hold
-            )
-        except Exception:
-            pass
-            return OrderSummary(
-                total=0,
-                planned=0,
-                in_progress=0,
-                completed=0,
-                on_hold=0
-            )
+        result = await aggregate('production_orders', group_by=['status'])
+        by_status = result.counts('status')
+        
+        return OrderSummary(
+            total=result.total,
+            planned=by_status.get('Planned', 0),
+            in_progress=by_status.get('In Progress', 0),
+            completed=by_status.get('Completed', 0),
+            on_hold=by_status.get('On Hold', 0)
+        )
     
     @staticmethod
     async def _get_material_shortages(db) -> List[ShortageItem]:
@@ -236,65 +394,52 @@ class DashboardService:
         """
         shortages = []
         
-        try:
-            # Get all active stock alerts
-            alerts = db.table('stock_alerts').select('*').eq('is_active', True).execute()
-            
-            for alert in alerts.data:
-                # Get current stock
-                inv_query = db.table('inventory').select('available_qty', 'allocated_qty').eq(
-                    'product_id', alert['product_id']
-                )
-                
-                if alert.get('location_id'):
-                    inv_query = inv_query.eq('location_id', alert['location_id'])
-                
-                inv_result = inv_query.execute()
-                
-                current_stock = Decimal('0')
-                for inv in inv_result.data:
-                    available = Decimal(str(inv['available_qty']))
-                    allocated = Decimal(str(inv['allocated_qty']))
-                    current_stock += (available - allocated)
-                
-                min_qty = Decimal(str(alert['min_qty']))
-                
-                if current_stock < min_qty:
-                    # Get product details
-                    product = db.table('products').select('code', 'name', 'unit').eq(
-                        'id', alert['product_id']
-                    ).execute()
-                    
-                    if product.data:
-                        shortage_qty = min_qty - current_stock
-                        
-                        # Determine priority
-                        if current_stock == 0:
-                            priority = "high"
-                        elif current_stock < (min_qty * Decimal('0.5')):
-                            priority = "high"
-                        else:
-                            priority = "medium"
-                        
-                        shortages.append(ShortageItem(
-                            item_id=alert['product_id'],
-                            item_name=product.data[0]['name'],
-                            current_stock=float(current_stock),
-                            required_stock=float(min_qty),
-                            shortage_qty=float(shortage_qty),
-                            unit=product.data[0]['unit'],
-                            priority=priority
-                        ))
+        # Active stock alerts with product inventory in one round trip
+        alerts = await SHORTAGE_ALERT_VIEW.query(db).eq('is_active', True).execute()
+        
+        for alert in SHORTAGE_ALERT_VIEW.flatten_all(alerts.data):
+            # Free stock at the alert's location, or across all locations
+            stock_rows = alert.get('product_inventory') or []
+            if alert.get('location_id'):
+                stock_rows = [i for i in stock_rows if i['location_id'] == alert['location_id']]
             
-            # Sort by priority (high first) and shortage quantity
-            shortages.sort(key=lambda x: (x.priority != "high", x.shortage_qty), reverse=True)
+            current_stock = Decimal('0')
+            for inv in stock_rows:
+                available = Decimal(str(inv['available_qty']))
+                allocated = Decimal(str(inv['allocated_qty']))
+                current_stock += (available - allocated)
             
-            # Return top 10
-            return shortages[:10]
+            min_qty = Decimal(str(alert['min_qty']))
             
-        except Exception:
-            pass
-            return []
+            if current_stock < min_qty:
+                product = alert['product']
+                
+                if product:
+                    shortage_qty = min_qty - current_stock
+                    
+                    # Determine priority
+                    if current_stock == 0:
+                        priority = "high"
+                    elif current_stock < (min_qty * Decimal('0.5')):
+                        priority = "high"
+                    else:
+                        priority = "medium"
+                    
+                    shortages.append(ShortageItem(
+                        item_id=alert['product_id'],
+                        item_name=product['name'],
+                        current_stock=float(current_stock),
+                        required_stock=float(min_qty),
+                        shortage_qty=float(shortage_qty),
+                        unit=product['unit'],
+                        priority=priority
+                    ))
+        
+        # Sort by priority (high first) and shortage quantity
+        shortages.sort(key=lambda x: (x.priority != "high", x.shortage_qty), reverse=True)
+        
+        # Return top 10
+        return shortages[:10]
     
     @staticmethod
     async def _get_rework_alerts(db) -> List[ReworkAlert]:
@@ -307,190 +452,10 @@ class DashboardService:
     @staticmethod
     async def _get_recent_activities(db) -> List[RecentActivity]:
         """
-        Get recent system activities (REAL DATA!).
+        Get recent system activities (latest events of the activity feed).
         """
-        activities = []
-        
-        # ========================================
-        # 1. Get recent inventory_items transactions (NEW!)
-        # ========================================
-        try:
-            inv_items_trans = db.table('inventory_item_transactions').select(
-                'id', 'transaction_type', 'inventory_item_id', 'quantity_change', 'reason', 'created_by', 'transaction_date'
-            ).order('transaction_date', desc=True).limit(10).execute()
-            
-            for trans in inv_items_trans.data:
-                # Get inventory item details
-                item = db.table('inventory_items').select('material_code', 'material_name', 'unit').eq(
-                    'id', trans['inventory_item_id']
-                ).execute()
-                
-                if item.data:
-                    material_name = item.data[0]['material_name']
-                    material_code = item.data[0]['material_code']
-                    unit = item.data[0]['unit']
-                    
-                    # Get user name
-                    user_name = "System"
-                    if trans.get('created_by'):
-                        user = db.table('users').select('full_name', 'username').eq('id', trans['created_by']).execute()
-                        if user.data:
-                            user_name = user.data[0].get('full_name') or user.data[0].get('username')
-                    
-                    # Activity descriptions and icons
-                    activity_map = {
-                        'IN': ('📥', 'Inventory added'),
-                        'OUT': ('📤', 'Inventory removed'),
-                        'ADJUST': ('⚙️', 'Inventory updated'),
-                        'ALLOCATE': ('🔒', 'Stock allocated'),
-                        'RELEASE': ('🔓', 'Stock released')
-                    }
-                    
-                    icon, action = activity_map.get(trans['transaction_type'], ('📦', 'Inventory transaction'))
-                    
-                    qty_change = trans['quantity_change']
-                    sign = '+' if qty_change > 0 else ''
-                    description = f"{action}: {material_code} - {material_name} ({sign}{qty_change} {unit})"
-                    if trans.get('reason'):
-                        description += f" - {trans['reason'][:50]}"
-                    
-                    activities.append(RecentActivity(
-                        id=trans['id'],
-                        activity_type=f"inventory_{trans['transaction_type'].lower()}",
-                        description=description,
-                        user_name=user_name,
-                        timestamp=datetime.fromisoformat(trans['transaction_date'].replace('Z', '+00:00')).replace(tzinfo=None),
-                        icon=icon
-                    ))
-        except Exception:
-            pass
-        
-        # ========================================
-        # 2. Get recent gate entries (NEW!)
-        # ========================================
-        try:
-            gate_entries = db.table('gate_entries').select(
-                'id', 'entry_number', 'entry_type', 'vendor', 'status', 'destination_department', 'created_by', 'created_at'
-            ).order('created_at', desc=True).limit(10).execute()
-            
-            for entry in gate_entries.data:
-                # Get user name
-                user_name = "Security"
-                if entry.get('created_by'):
-                    user = db.table('users').select('full_name', 'username').eq('id', entry['created_by']).execute()
-                    if user.data:
-                        user_name = user.data[0].get('full_name') or user.data[0].get('username')
-                
-                # Activity descriptions and icons based on entry type and status
-                entry_type_icons = {
-                    'material': '📦',
-                    'courier': '📮',
-                    'visitor': '👤',
-                    'jobwork_return': '🔄',
-                    'subcontract_return': '↩️',
-                    'delivery': '🚚',
-                    'machine_spare': '⚙️'
-                }
-                
-                status_actions = {
-                    'arrived': 'arrived at gate',
-                    'under_verification': 'under verification',
-                    'accepted': 'accepted',
-                    'rejected': 'rejected'
-                }
-                
-                icon = entry_type_icons.get(entry['entry_type'], '🚪')
-                action = status_actions.get(entry['status'], 'processed')
-                
-                # Format entry type for display
-                entry_type_display = entry['entry_type'].replace('_', ' ').title()
-                
-                description = f"Gate Entry {action}: {entry['entry_number']} - {entry_type_display} from {entry['vendor']} → {entry['destination_department']}"
-                
-                activities.append(RecentActivity(
-                    id=entry['id'],
-                    activity_type=f"gate_entry_{entry['status']}",
-                    description=description,
-                    user_name=user_name,
-                    timestamp=datetime.fromisoformat(entry['created_at'].replace('Z', '+00:00')).replace(tzinfo=None),
-                    icon=icon
-                ))
-        except Exception:
-            pass
-        
-        # ========================================
-        # 3. Get recent inventory transactions (existing)
-        # ========================================
-        try:
-            # Get recent inventory transactions
-            trans_result = db.table('inventory_transactions').select(
-                'id', 'transaction_type', 'product_id', 'quantity', 'performed_by', 'created_at', 'notes'
-            ).order('created_at', desc=True).limit(10).execute()
-            
-            for trans in trans_result.data:
-                # Get product name
-                product = db.table('products').select('code', 'name').eq('id', trans['product_id']).execute()
-                product_name = product.data[0]['name'] if product.data else 'Unknown Product'
-                product_code = product.data[0]['code'] if product.data else ''
-                
-                # Get user name
-                user_name = "System"
-                if trans.get('performed_by'):
-                    user = db.table('users').select('full_name', 'username').eq('id', trans['performed_by']).execute()
-                    if user.data:
-                        user_name = user.data[0].get('full_name') or user.data[0].get('username')
-                
-                # Activity descriptions and icons
-                activity_map = {
-                    'TRANSFER': ('🔄', 'Material transferred'),
-                    'GATE_IN': ('📥', 'Gate entry received'),
-                    'GATE_OUT': ('📤', 'Gate exit processed'),
-                    'ADJUSTMENT': ('⚙️', 'Stock adjusted'),
-                    'ALLOCATION': ('🔒', 'Inventory allocated'),
-                    'RELEASE': ('🔓', 'Allocation released'),
-                    'PRODUCTION': ('🏭', 'Production consumed')
-                }
-                
-                icon, action = activity_map.get(trans['transaction_type'], ('📦', 'Transaction'))
-                
-                description = f"{action}: {product_code} - {product_name} ({trans['quantity']} units)"
-                if trans.get('notes'):
-                    description += f" - {trans['notes'][:50]}"
-                
-                activities.append(RecentActivity(
-                    id=trans['id'],
-                    activity_type=trans['transaction_type'].lower(),
-                    description=description,
-                    user_name=user_name,
-                    timestamp=datetime.fromisoformat(trans['created_at'].replace('Z', '+00:00')).replace(tzinfo=None),
-                    icon=icon
-                ))
-        
-        except Exception:
-            pass
-        
-        # Also add recent user registrations if not many transactions
-        if len(activities) < 10:
-            try:
-                users = db.table('users').select(
-                    'id', 'username', 'full_name', 'created_at'
-                ).order('created_at', desc=True).limit(5).execute()
-                
-                for user in users.data:
-                    activities.append(RecentActivity(
-                        id=user['id'],
-                        activity_type="user_registered",
-                        description=f"New user registered: {user.get('full_name') or user['username']}",
-                        user_name=user['username'],
-                        timestamp=datetime.fromisoformat(user['created_at'].replace('Z', '+00:00')).replace(tzinfo=None),
-                        icon="👤"
-                    ))
-            except Exception:
-                pass
-        
-        # Sort by timestamp and return top 10
-        activities.sort(key=lambda x: x.timestamp, reverse=True)
-        return activities[:10]
+        page = await activity_service.get_feed(limit=10)
+        return page.items
     
     @staticmethod
     async def get_quick_actions(user_roles: List[str]) -> List[QuickAction]:
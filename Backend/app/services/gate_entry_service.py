@@ -1,7 +1,10 @@
-from datetime import datetime, date
+import asyncio
+from datetime import datetime, date, timedelta
 from typing import List, Optional
 from decimal import Decimal
 from app.database import get_db
+from app.core.aggregate import aggregate
+from app.core.embedding import Embed, EmbeddedSelect
 from app.schemas.gate_entry import (
     GateEntryCreate, GateEntryUpdate, GateEntryResponse,
     GateEntryListItem, GateEntryMaterialResponse, GateEntryStatusUpdate,
@@ -10,16 +13,25 @@ from app.schemas.gate_entry import (
 from app.core.exceptions import NotFoundException, ValidationException
 
 
+# Gate entries with their material lines for count, first material and totals
+GATE_ENTRY_LIST_VIEW = EmbeddedSelect(
+    'gate_entries',
+    'id, entry_number, entry_type, vendor, vehicle_no, driver_name, '
+    'destination_department, status, linked_document, created_at',
+    Embed('materials', 'gate_entry_materials', 'material_name, quantity', many=True),
+)
+
+
 class GateEntryService:
     
     @staticmethod
-    def _generate_entry_number() -> str:
+    async def _generate_entry_number() -> str:
         """Generate unique entry number: GE-YYYY-XXXX"""
         db = get_db()
         year = datetime.now().year
         
         # Get count of entries this year
-        result = db.table('gate_entries').select('entry_number', count='exact').like(
+        result = await db.table('gate_entries').select('entry_number', count='exact').like(
             'entry_number', f'GE-{year}-%'
         ).execute()
         
@@ -48,7 +60,7 @@ class GateEntryService:
             raise ValidationException(detail=f"Invalid department. Must be one of: {', '.join(valid_departments)}")
         
         # Generate entry number
-        entry_number = GateEntryService._generate_entry_number()
+        entry_number = await GateEntryService._generate_entry_number()
         
         # Create gate entry
         entry_insert = {
@@ -64,7 +76,7 @@ class GateEntryService:
             'created_by': user_id
         }
         
-        result = db.table('gate_entries').insert(entry_insert).execute()
+        result = await db.table('gate_entries').insert(entry_insert).execute()
         
         if not result.data:
             raise ValidationException(detail="Failed to create gate entry")
@@ -80,7 +92,7 @@ class GateEntryService:
                 'quantity': str(material.quantity),
                 'uom': material.uom
             }
-            db.table('gate_entry_materials').insert(material_insert).execute()
+            await db.table('gate_entry_materials').insert(material_insert).execute()
         
         # Fetch and return complete entry
         return await GateEntryService.get_entry_by_id(entry_id)
@@ -91,7 +103,7 @@ class GateEntryService:
         db = get_db()
         
         # Get entry
-        entry_result = db.table('gate_entries').select('*').eq('id', entry_id).execute()
+        entry_result = await db.table('gate_entries').select('*').eq('id', entry_id).execute()
         
         if not entry_result.data:
             raise NotFoundException(detail="Gate entry not found")
@@ -99,7 +111,7 @@ class GateEntryService:
         entry = entry_result.data[0]
         
         # Get materials
-        materials_result = db.table('gate_entry_materials').select('*').eq(
+        materials_result = await db.table('gate_entry_materials').select('*').eq(
             'gate_entry_id', entry_id
         ).execute()
         
@@ -150,10 +162,7 @@ class GateEntryService:
         offset = (page - 1) * limit
         
         # Build query
-        query = db.table('gate_entries').select(
-            'id, entry_number, entry_type, vendor, vehicle_no, driver_name, '
-            'destination_department, status, linked_document, created_at'
-        )
+        query = GATE_ENTRY_LIST_VIEW.query(db)
         
         # Apply filters
         if status:
@@ -172,28 +181,16 @@ class GateEntryService:
             query = query.lte('created_at', date_to)
         
         # Order and paginate
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
         
         entries = []
-        for entry in result.data:
-            # Get material count and first material
-            materials_result = db.table('gate_entry_materials').select(
-                'material_name, quantity'
-            ).eq('gate_entry_id', entry['id']).limit(1).execute()
-            
-            material_count_result = db.table('gate_entry_materials').select(
-                'id', count='exact'
-            ).eq('gate_entry_id', entry['id']).execute()
-            
-            material_count = material_count_result.count if hasattr(material_count_result, 'count') else 0
-            first_material = materials_result.data[0]['material_name'] if materials_result.data else None
-            
-            # Calculate total items
-            total_items_result = db.table('gate_entry_materials').select(
-                'quantity'
-            ).eq('gate_entry_id', entry['id']).execute()
+        for entry in GATE_ENTRY_LIST_VIEW.flatten_all(result.data):
+            materials = entry['materials']
             
-            total_items = sum(Decimal(str(m['quantity'])) for m in total_items_result.data) if total_items_result.data else None
+            # Material count, first material and total items
+            material_count = len(materials)
+            first_material = materials[0]['material_name'] if materials else None
+            total_items = sum(Decimal(str(m['quantity'])) for m in materials) if materials else None
             
             entries.append(GateEntryListItem(
                 id=entry['id'],
@@ -223,7 +220,7 @@ class GateEntryService:
         db = get_db()
         
         # Check if entry exists
-        existing = db.table('gate_entries').select('id, status').eq('id', entry_id).execute()
+        existing = await db.table('gate_entries').select('id, status').eq('id', entry_id).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Gate entry not found")
@@ -249,12 +246,12 @@ class GateEntryService:
             update_data['remarks'] = entry_data.remarks
         
         if update_data:
-            db.table('gate_entries').update(update_data).eq('id', entry_id).execute()
+            await db.table('gate_entries').update(update_data).eq('id', entry_id).execute()
         
         # Update materials if provided
         if entry_data.materials is not None:
             # Delete existing materials
-            db.table('gate_entry_materials').delete().eq('gate_entry_id', entry_id).execute()
+            await db.table('gate_entry_materials').delete().eq('gate_entry_id', entry_id).execute()
             
             # Insert new materials
             for material in entry_data.materials:
@@ -265,7 +262,7 @@ class GateEntryService:
                     'quantity': str(material.quantity),
                     'uom': material.uom
                 }
-                db.table('gate_entry_materials').insert(material_insert).execute()
+                await db.table('gate_entry_materials').insert(material_insert).execute()
         
         return await GateEntryService.get_entry_by_id(entry_id)
     
@@ -284,7 +281,7 @@ class GateEntryService:
             raise ValidationException(detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
         
         # Check if entry exists
-        existing = db.table('gate_entries').select('id').eq('id', entry_id).execute()
+        existing = await db.table('gate_entries').select('id').eq('id', entry_id).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Gate entry not found")
@@ -297,7 +294,7 @@ class GateEntryService:
         if status_data.remarks:
             update_data['remarks'] = status_data.remarks
         
-        db.table('gate_entries').update(update_data).eq('id', entry_id).execute()
+        await db.table('gate_entries').update(update_data).eq('id', entry_id).execute()
         
         return await GateEntryService.get_entry_by_id(entry_id)
     
@@ -307,7 +304,7 @@ class GateEntryService:
         db = get_db()
         
         # Check if entry exists
-        existing = db.table('gate_entries').select('id, status').eq('id', entry_id).execute()
+        existing = await db.table('gate_entries').select('id, status').eq('id', entry_id).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Gate entry not found")
@@ -321,49 +318,33 @@ class GateEntryService:
             )
         
         # Delete entry (materials will be cascade deleted)
-        db.table('gate_entries').delete().eq('id', entry_id).execute()
+        await db.table('gate_entries').delete().eq('id', entry_id).execute()
         
         return {"message": "Gate entry deleted successfully"}
     
     @staticmethod
     async def get_gate_entry_stats() -> GateEntryStats:
-        """Get gate entry statistics"""
-        db = get_db()
-        
-        # Get all entries
-        all_entries = db.table('gate_entries').select('status, entry_type, destination_department, created_at').execute()
-        
-        total = len(all_entries.data)
-        arrived = sum(1 for e in all_entries.data if e['status'] == 'arrived')
-        under_verification = sum(1 for e in all_entries.data if e['status'] == 'under_verification')
-        accepted = sum(1 for e in all_entries.data if e['status'] == 'accepted')
-        rejected = sum(1 for e in all_entries.data if e['status'] == 'rejected')
-        
-        # Today's entries
-        today = date.today().isoformat()
-        today_entries = sum(1 for e in all_entries.data if e['created_at'].startswith(today))
-        
-        # By type
-        by_type = {}
-        for entry in all_entries.data:
-            entry_type = entry['entry_type']
-            by_type[entry_type] = by_type.get(entry_type, 0) + 1
-        
-        # By department
-        by_department = {}
-        for entry in all_entries.data:
-            dept = entry['destination_department']
-            by_department[dept] = by_department.get(dept, 0) + 1
+        """Get gate entry statistics (grouped counts from the database)"""
+        today = date.today()
+        
+        stats, today_stats = await asyncio.gather(
+            aggregate('gate_entries', group_by=['status', 'entry_type', 'destination_department']),
+            aggregate('gate_entries', filters=[
+                ('created_at', 'gte', today),
+                ('created_at', 'lt', today + timedelta(days=1))
+            ])
+        )
+        by_status = stats.counts('status')
         
         return GateEntryStats(
-            total_entries=total,
-            arrived=arrived,
-            under_verification=under_verification,
-            accepted=accepted,
-            rejected=rejected,
-            today_entries=today_entries,
-            by_type=by_type,
-            by_department=by_department
+            total_entries=stats.total,
+            arrived=by_status.get('arrived', 0),
+            under_verification=by_status.get('under_verification', 0),
+            accepted=by_status.get('accepted', 0),
+            rejected=by_status.get('rejected', 0),
+            today_entries=today_stats.total,
+            by_type=stats.counts('entry_type'),
+            by_department=stats.counts('destination_department')
         )
 
 
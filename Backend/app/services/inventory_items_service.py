@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import List, Optional
 from decimal import Decimal
 from app.database import get_db
+from app.core.aggregate import aggregate
 from app.schemas.inventory_items import (
     InventoryItemCreate, InventoryItemUpdate, InventoryItemResponse,
     InventoryItemListResponse, InventoryItemTransactionCreate,
@@ -34,7 +35,7 @@ class InventoryItemsService:
         if category:
             query = query.eq('category', category)
         
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
         
         items = []
         for item in result.data:
@@ -72,7 +73,7 @@ class InventoryItemsService:
         """Get inventory item by ID."""
         db = get_db()
         
-        result = db.table('inventory_items').select('*').eq('id', item_id).eq('is_active', True).execute()
+        result = await db.table('inventory_items').select('*').eq('id', item_id).eq('is_active', True).execute()
         
         if not result.data:
             raise NotFoundException(detail="Inventory item not found")
@@ -96,7 +97,7 @@ class InventoryItemsService:
         db = get_db()
         
         # Check for duplicate material code
-        existing = db.table('inventory_items').select('id').eq(
+        existing = await db.table('inventory_items').select('id').eq(
             'material_code', item_data.material_code
         ).eq('is_active', True).execute()
         
@@ -104,7 +105,7 @@ class InventoryItemsService:
             raise ValidationException(detail="Material code already exists")
         
         # Check for duplicate material name
-        existing_name = db.table('inventory_items').select('id').eq(
+        existing_name = await db.table('inventory_items').select('id').eq(
             'material_name', item_data.material_name
         ).eq('is_active', True).execute()
         
@@ -132,7 +133,7 @@ class InventoryItemsService:
         else:
             item_dict['status'] = 'sufficient'
         
-        result = db.table('inventory_items').insert(item_dict).execute()
+        result = await db.table('inventory_items').insert(item_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create inventory item")
@@ -165,7 +166,7 @@ class InventoryItemsService:
         db = get_db()
         
         # Check if item exists
-        existing = db.table('inventory_items').select('*').eq('id', item_id).eq('is_active', True).execute()
+        existing = await db.table('inventory_items').select('*').eq('id', item_id).eq('is_active', True).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Inventory item not found")
@@ -177,7 +178,7 @@ class InventoryItemsService:
         
         if item_data.material_name is not None:
             # Check for duplicate name (excluding current item)
-            name_check = db.table('inventory_items').select('id').eq(
+            name_check = await db.table('inventory_items').select('id').eq(
                 'material_name', item_data.material_name
             ).neq('id', item_id).eq('is_active', True).execute()
             
@@ -239,7 +240,7 @@ class InventoryItemsService:
         
         if update_dict:
             update_dict['updated_by'] = user_id
-            db.table('inventory_items').update(update_dict).eq('id', item_id).execute()
+            await db.table('inventory_items').update(update_dict).eq('id', item_id).execute()
         
         return await InventoryItemsService.get_inventory_item(item_id)
     
@@ -249,13 +250,13 @@ class InventoryItemsService:
         db = get_db()
         
         # Check if item exists
-        existing = db.table('inventory_items').select('id').eq('id', item_id).eq('is_active', True).execute()
+        existing = await db.table('inventory_items').select('id').eq('id', item_id).eq('is_active', True).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Inventory item not found")
         
         # Soft delete
-        db.table('inventory_items').update({
+        await db.table('inventory_items').update({
             'is_active': False,
             'deleted_at': datetime.utcnow().isoformat(),
             'updated_by': user_id
@@ -272,7 +273,7 @@ class InventoryItemsService:
         db = get_db()
         
         # Get current item
-        item = db.table('inventory_items').select('*').eq('id', adjustment.inventory_item_id).eq('is_active', True).execute()
+        item = await db.table('inventory_items').select('*').eq('id', adjustment.inventory_item_id).eq('is_active', True).execute()
         
         if not item.data:
             raise NotFoundException(detail="Inventory item not found")
@@ -285,7 +286,7 @@ class InventoryItemsService:
             raise ValidationException(detail="Adjustment would result in negative quantity")
         
         # Update quantity
-        db.table('inventory_items').update({
+        await db.table('inventory_items').update({
             'quantity': float(new_qty),
             'updated_by': user_id
         }).eq('id', adjustment.inventory_item_id).execute()
@@ -339,7 +340,7 @@ class InventoryItemsService:
             'created_by': user_id
         }
         
-        db.table('inventory_item_transactions').insert(transaction).execute()
+        await db.table('inventory_item_transactions').insert(transaction).execute()
     
     @staticmethod
     async def list_transactions(
@@ -358,12 +359,12 @@ class InventoryItemsService:
         if transaction_type:
             query = query.eq('transaction_type', transaction_type)
         
-        result = query.order('transaction_date', desc=True).limit(limit).execute()
+        result = await query.order('transaction_date', desc=True).limit(limit).execute()
         
         transactions = []
         for trans in result.data:
             # Get item details
-            item = db.table('inventory_items').select('material_code', 'material_name').eq('id', trans['inventory_item_id']).execute()
+            item = await db.table('inventory_items').select('material_code', 'material_name').eq('id', trans['inventory_item_id']).execute()
             
             transactions.append(InventoryItemTransactionResponse(
                 **trans,
@@ -378,12 +379,12 @@ class InventoryItemsService:
         """Get active stock alerts."""
         db = get_db()
         
-        result = db.table('stock_alerts_items').select('*').eq('status', 'ACTIVE').order('created_at', desc=True).execute()
+        result = await db.table('stock_alerts_items').select('*').eq('status', 'ACTIVE').order('created_at', desc=True).execute()
         
         alerts = []
         for alert in result.data:
             # Get item details
-            item = db.table('inventory_items').select('material_code', 'material_name').eq('id', alert['inventory_item_id']).execute()
+            item = await db.table('inventory_items').select('material_code', 'material_name').eq('id', alert['inventory_item_id']).execute()
             
             alerts.append(StockAlertItemResponse(
                 **alert,
@@ -395,39 +396,26 @@ class InventoryItemsService:
     
     @staticmethod
     async def get_inventory_summary() -> InventoryItemsSummary:
-        """Get inventory summary KPIs."""
-        db = get_db()
-        
-        result = db.table('inventory_items').select('*').eq('is_active', True).execute()
-        
-        total_materials = len(result.data)
-        low_stock_count = 0
-        critical_count = 0
-        out_of_stock_count = 0
-        sufficient_count = 0
-        total_value = Decimal('0')
+        """Get inventory summary KPIs (grouped counts and sums from the database)."""
+        result = await aggregate(
+            'inventory_items',
+            group_by=['status'],
+            sums=['total_value'],
+            filters=[('is_active', 'eq', True)]
+        )
+        by_status = result.counts('status')
         
-        for item in result.data:
-            status = item['status']
-            
-            if status == 'out_of_stock':
-                out_of_stock_count += 1
-            elif status == 'critical':
-                critical_count += 1
-            elif status == 'low':
-                low_stock_count += 1
-            else:
-                sufficient_count += 1
-            
-            total_value += Decimal(str(item['total_value']))
+        out_of_stock_count = by_status.get('out_of_stock', 0)
+        critical_count = by_status.get('critical', 0)
+        low_stock_count = by_status.get('low', 0)
         
         return InventoryItemsSummary(
-            total_materials=total_materials,
+            total_materials=result.total,
             low_stock_count=low_stock_count,
             critical_count=critical_count,
             out_of_stock_count=out_of_stock_count,
-            sufficient_count=sufficient_count,
-            total_value=total_value
+            sufficient_count=result.total - out_of_stock_count - critical_count - low_stock_count,
+            total_value=result.total_sum('total_value')
         )
 
 
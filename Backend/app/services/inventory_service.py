@@ -1,14 +1,52 @@
-from datetime import datetime
-from typing import List, Optional
+import asyncio
+import base64
+import csv
+import io
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
+from pydantic import ValidationError
+from app.config import settings
 from app.database import get_db
+from app.core.loader import get_loader
+from app.core.cache import reference_cache
+from app.core.embedding import Embed, EmbeddedSelect
+from app.core.filters import after_keyset, ilike_any
 from app.schemas.inventory import (
     InventoryCreate, InventoryUpdate, InventoryResponse,
-    InventoryListItem, StockByProduct, InventoryTransactionCreate,
+    InventoryListItem, InventoryListPage, StockByProduct, InventoryTransactionCreate,
     InventoryTransactionResponse, StockAlertCreate, StockAlertUpdate,
-    StockAlertResponse, ShortageAlert, StockAdjustment, LocationResponse, StockMovementSummary
+    StockAlertResponse, ShortageAlert, StockAdjustment, LocationResponse, StockMovementSummary,
+    StockPosition, StockBalance, InventorySummary, BulkTransactionLine, BulkTransactionLineResult, BulkTransactionResult
 )
 from app.core.exceptions import NotFoundException, ValidationException
+from postgrest.exceptions import APIError
+
+
+# SQLSTATEs raised by apply_stock_movement for bad input / insufficient stock
+STOCK_MOVEMENT_ERROR_CODES = {'22023', '23514'}
+
+BULK_TRANSACTION_TYPES = ['RECEIPT', 'ISSUE', 'TRANSFER', 'ADJUSTMENT']
+
+# inventory_list_view page order, also the keyset of list cursors
+LIST_ORDER = ['product_code', 'location_code', 'id']
+
+
+STOCK_ALERT_VIEW = EmbeddedSelect(
+    'stock_alerts', '*',
+    Embed('product', 'products', 'code, name, unit'),
+    Embed('location', 'locations', 'code, name'),
+)
+
+# Stock alerts with the product's inventory across locations
+SHORTAGE_ALERT_VIEW = EmbeddedSelect(
+    'stock_alerts', '*',
+    Embed('product', 'products', 'code, name, unit',
+          Embed('inventory', 'inventory', 'location_id, available_qty, allocated_qty', many=True)),
+    Embed('location', 'locations', 'name'),
+)
 
 
 class InventoryService:
@@ -19,26 +57,32 @@ class InventoryService:
         location_type: Optional[str] = None
     ) -> List[LocationResponse]:
         """List all locations with optional filters."""
-        db = get_db()
-        
-        query = db.table('locations').select('*')
-        
-        if is_active is not None:
-            query = query.eq('is_active', is_active)
-        
-        if location_type:
-            query = query.eq('type', location_type)
+        cache_key = f"list:{is_active}:{location_type}"
+        locations = reference_cache.get_list('locations', cache_key)
         
-        result = query.execute()
+        if locations is None:
+            db = get_db()
+            
+            query = db.table('locations').select('*')
+            
+            if is_active is not None:
+                query = query.eq('is_active', is_active)
+            
+            if location_type:
+                query = query.eq('type', location_type)
+            
+            result = await query.execute()
+            locations = result.data
+            reference_cache.put_list('locations', cache_key, locations)
         
-        return [LocationResponse(**loc) for loc in result.data]
+        return [LocationResponse(**loc) for loc in locations]
 
     @staticmethod
     async def get_location_by_id(location_id: str) -> LocationResponse:
         """Get location by ID."""
         db = get_db()
         
-        result = db.table('locations').select('*').eq('id', location_id).execute()
+        result = await db.table('locations').select('*').eq('id', location_id).execute()
         
         if not result.data:
             raise NotFoundException(detail="Location not found")
@@ -59,7 +103,7 @@ class InventoryService:
         if lot_number:
             query = query.eq('lot_number', lot_number)
         
-        result = query.execute()
+        result = await query.execute()
         
         if not result.data:
             return None
@@ -67,8 +111,9 @@ class InventoryService:
         inv = result.data[0]
         
         # Get product and location details
-        product = db.table('products').select('code', 'name').eq('id', product_id).execute()
-        location = db.table('locations').select('code', 'name').eq('id', location_id).execute()
+        loader = get_loader()
+        product = await loader.load('products', product_id) or {}
+        location = await loader.load('locations', location_id) or {}
         
         available = Decimal(str(inv['available_qty']))
         allocated = Decimal(str(inv['allocated_qty']))
@@ -76,10 +121,10 @@ class InventoryService:
         return InventoryResponse(
             **inv,
             free_qty=available - allocated,
-            product_code=product.data[0]['code'] if product.data else None,
-            product_name=product.data[0]['name'] if product.data else None,
-            location_code=location.data[0]['code'] if location.data else None,
-            location_name=location.data[0]['name'] if location.data else None
+            product_code=product.get('code'),
+            product_name=product.get('name'),
+            location_code=location.get('code'),
+            location_name=location.get('name')
         )
     
     # @staticmethod
@@ -168,22 +213,23 @@ class InventoryService:
         """Get stock summary for a product across all locations."""
         db = get_db()
         
+        loader = get_loader()
+        
         # Get product details
-        product = db.table('products').select('code', 'name', 'category', 'unit').eq('id', product_id).execute()
-        if not product.data:
+        product_data = await loader.load('products', product_id)
+        if not product_data:
             raise NotFoundException(detail="Product not found")
         
-        product_data = product.data[0]
-        
         # Get inventory across all locations
-        inventory = db.table('inventory').select('*').eq('product_id', product_id).execute()
+        inventory = await db.table('inventory').select('*').eq('product_id', product_id).execute()
+        locations = await loader.load_many('locations', (inv['location_id'] for inv in inventory.data))
         
         total_available = Decimal('0')
         total_allocated = Decimal('0')
         locations_data = []
         
         for inv in inventory.data:
-            location = db.table('locations').select('code', 'name').eq('id', inv['location_id']).execute()
+            location = locations.get(inv['location_id'], {})
             
             available = Decimal(str(inv['available_qty']))
             allocated = Decimal(str(inv['allocated_qty']))
@@ -193,8 +239,8 @@ class InventoryService:
             
             locations_data.append({
                 'location_id': inv['location_id'],
-                'location_code': location.data[0]['code'] if location.data else '',
-                'location_name': location.data[0]['name'] if location.data else '',
+                'location_code': location.get('code', ''),
+                'location_name': location.get('name', ''),
                 'available_qty': float(available),
                 'allocated_qty': float(allocated),
                 'free_qty': float(available - allocated),
@@ -226,145 +272,267 @@ class InventoryService:
         if transaction_data.transaction_type not in valid_types:
             raise ValidationException(detail=f"Invalid transaction type. Must be one of: {', '.join(valid_types)}")
         
-        # Create transaction record
-        trans_dict = transaction_data.model_dump()
-        trans_dict['performed_by'] = user_id
-        trans_dict['quantity'] = float(transaction_data.quantity)
-        
-        trans_result = db.table('inventory_transactions').insert(trans_dict).execute()
+        # Ledger row and balance updates happen atomically in one database call
+        try:
+            result = await db.rpc('apply_stock_movement', {
+                'p_product_id': transaction_data.product_id,
+                'p_transaction_type': transaction_data.transaction_type,
+                'p_quantity': float(transaction_data.quantity),
+                'p_from_location_id': transaction_data.from_location_id,
+                'p_to_location_id': transaction_data.to_location_id,
+                'p_lot_number': transaction_data.lot_number,
+                'p_reference_id': transaction_data.reference_id,
+                'p_reference_type': transaction_data.reference_type,
+                'p_notes': transaction_data.notes,
+                'p_performed_by': user_id
+            }).execute()
+        except APIError as e:
+            if e.code in STOCK_MOVEMENT_ERROR_CODES:
+                raise ValidationException(detail=e.message)
+            raise
         
-        if not trans_result.data:
+        if not result.data:
             raise Exception("Failed to create transaction")
         
-        transaction = trans_result.data[0]
-        
-        # Update inventory based on transaction type
-        if transaction_data.transaction_type == 'RECEIPT':
-            # Add stock to location
-            await InventoryService._update_stock(
-                product_id=transaction_data.product_id,
-                location_id=transaction_data.to_location_id,
-                quantity_change=transaction_data.quantity,
-                lot_number=transaction_data.lot_number
-            )
+        movement = result.data
+        transactions = await InventoryService._build_transaction_responses([movement['transaction']])
         
-        elif transaction_data.transaction_type == 'ISSUE':
-            # Remove stock from location
-            await InventoryService._update_stock(
-                product_id=transaction_data.product_id,
-                location_id=transaction_data.from_location_id,
-                quantity_change=-transaction_data.quantity,
-                lot_number=transaction_data.lot_number
-            )
-        
-        elif transaction_data.transaction_type == 'TRANSFER':
-            # Remove from source, add to destination
-            await InventoryService._update_stock(
-                product_id=transaction_data.product_id,
-                location_id=transaction_data.from_location_id,
-                quantity_change=-transaction_data.quantity,
-                lot_number=transaction_data.lot_number
-            )
-            await InventoryService._update_stock(
-                product_id=transaction_data.product_id,
-                location_id=transaction_data.to_location_id,
-                quantity_change=transaction_data.quantity,
-                lot_number=transaction_data.lot_number
-            )
-        
-        elif transaction_data.transaction_type == 'ADJUSTMENT':
-            # Adjust stock at location
-            await InventoryService._update_stock(
-                product_id=transaction_data.product_id,
-                location_id=transaction_data.to_location_id or transaction_data.from_location_id,
-                quantity_change=transaction_data.quantity,
-                lot_number=transaction_data.lot_number
-            )
-        
-        # Get complete transaction details
-        return await InventoryService.get_transaction_by_id(transaction['id'])
-    
+        transaction = transactions[0]
+        transaction.balances = [StockBalance(**b) for b in movement['balances']]
+        return transaction
+
     @staticmethod
-    async def _update_stock(
-        product_id: str,
-        location_id: str,
-        quantity_change: Decimal,
-        lot_number: Optional[str] = None
-    ):
-        """Internal method to update stock levels."""
+    def parse_transactions_csv(content: str) -> List[dict]:
+        """Parse a CSV upload (header row with BulkTransactionLine fields) into line dicts."""
+        reader = csv.DictReader(io.StringIO(content.lstrip('\ufeff')))
+        return [
+            {
+                key.strip(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in row.items() if key
+            }
+            for row in reader
+        ]
+
+    @staticmethod
+    async def record_transactions_bulk(
+        lines: List[dict],
+        user_id: str
+    ) -> BulkTransactionResult:
+        """
+        Record many stock movements at once.
+
+        Lines are validated in memory; invalid lines and lines that would
+        drive a balance negative are reported and skipped, the rest are
+        written by one set-based database call.
+        """
+        if len(lines) > settings.INVENTORY_BULK_MAX_LINES:
+            raise ValidationException(
+                detail=f"Too many lines: {len(lines)} (maximum {settings.INVENTORY_BULK_MAX_LINES})"
+            )
+
+        results: Dict[int, BulkTransactionLineResult] = {}
+
+        def fail(number: int, error: str):
+            results[number] = BulkTransactionLineResult(line=number, ok=False, error=error)
+
+        parsed = []
+        for number, raw in enumerate(lines, start=1):
+            try:
+                parsed.append((number, BulkTransactionLine(**raw)))
+            except ValidationError as e:
+                first = e.errors()[0]
+                field = '.'.join(str(part) for part in first['loc'])
+                fail(number, f"{field}: {first['msg']}" if field else first['msg'])
+
+        # Resolve codes and check every referenced row exists, one batch per table
+        loader = get_loader()
+        products_by_code = await loader.load_many_by_key(
+            'products', (line.product_code for _, line in parsed if not line.product_id)
+        )
+        locations_by_code = await loader.load_many_by_key(
+            'locations',
+            [line.from_location_code for _, line in parsed if not line.from_location_id]
+            + [line.to_location_code for _, line in parsed if not line.to_location_id]
+        )
+
+        def resolve(entity_id, code, by_code):
+            if entity_id or not code:
+                return entity_id
+            return (by_code.get(code) or {}).get('id')
+
+        for _, line in parsed:
+            line.product_id = resolve(line.product_id, line.product_code, products_by_code)
+            line.from_location_id = resolve(line.from_location_id, line.from_location_code, locations_by_code)
+            line.to_location_id = resolve(line.to_location_id, line.to_location_code, locations_by_code)
+
+        products = await loader.load_many('products', (line.product_id for _, line in parsed))
+        locations = await loader.load_many(
+            'locations',
+            [line.from_location_id for _, line in parsed] + [line.to_location_id for _, line in parsed]
+        )
+
+        movements = []
+        for number, line in parsed:
+            error = InventoryService._validate_bulk_line(line, products, locations)
+            if error:
+                fail(number, error)
+                continue
+            movements.append({
+                'line': number,
+                'product_id': line.product_id,
+                'transaction_type': line.transaction_type,
+                'quantity': float(line.quantity),
+                'from_location_id': line.from_location_id,
+                'to_location_id': line.to_location_id,
+                'lot_number': line.lot_number,
+                'reference_id': line.reference_id,
+                'reference_type': line.reference_type,
+                'notes': line.notes
+            })
+
+        # The database reports balances that would go negative without
+        # writing anything; drop the lines touching them and resubmit.
         db = get_db()
-        
-        # Find existing inventory
-        query = db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id)
-        
-        if lot_number:
-            query = query.eq('lot_number', lot_number)
-        else:
-            query = query.is_('lot_number', 'null')
-        
-        existing = query.execute()
-        
-        if existing.data:
-            # Update existing
-            inv = existing.data[0]
-            new_available = Decimal(str(inv['available_qty'])) + quantity_change
-            
-            if new_available < 0:
-                raise ValidationException(detail="Insufficient stock for this operation")
-            
-            db.table('inventory').update({
-                'available_qty': float(new_available),
-                'last_updated': datetime.utcnow().isoformat()
-            }).eq('id', inv['id']).execute()
-        else:
-            # Create new inventory record
-            if quantity_change < 0:
-                raise ValidationException(detail="Cannot create inventory with negative quantity")
-            
-            db.table('inventory').insert({
-                'product_id': product_id,
-                'location_id': location_id,
-                'available_qty': float(quantity_change),
-                'allocated_qty': 0,
-                'in_transit_qty': 0,
-                'lot_number': lot_number
-            }).execute()
-    
+        while movements:
+            try:
+                result = await db.rpc('apply_stock_movements_bulk', {
+                    'p_movements': movements,
+                    'p_performed_by': user_id
+                }).execute()
+            except APIError as e:
+                if e.code in STOCK_MOVEMENT_ERROR_CODES:
+                    raise ValidationException(detail=e.message)
+                raise
+
+            shortages = {
+                (s['product_id'], s['location_id'], s['lot_number'])
+                for s in result.data['shortages']
+            }
+            if not shortages:
+                for row in result.data['transactions']:
+                    results[row['line']] = BulkTransactionLineResult(
+                        line=row['line'], ok=True, transaction_id=row['id']
+                    )
+                break
+
+            # Only lines taking stock out of a short balance are dropped
+            remaining = []
+            for movement in movements:
+                if any(
+                    delta < 0 and key in shortages
+                    for key, delta in InventoryService._movement_legs(movement)
+                ):
+                    fail(movement['line'], "Insufficient stock for this operation")
+                else:
+                    remaining.append(movement)
+            if len(remaining) == len(movements):
+                raise Exception(f"Bulk stock movement shortages matched no lines: {sorted(shortages, key=str)}")
+            movements = remaining
+
+        ordered = [results[number] for number in sorted(results)]
+        succeeded = sum(1 for r in ordered if r.ok)
+        return BulkTransactionResult(
+            total=len(lines),
+            succeeded=succeeded,
+            failed=len(ordered) - succeeded,
+            results=ordered
+        )
+
+    @staticmethod
+    def _validate_bulk_line(
+        line: BulkTransactionLine,
+        products: Dict[str, dict],
+        locations: Dict[str, dict]
+    ) -> Optional[str]:
+        """Mirror apply_stock_movement's checks; returns an error message or None."""
+        if line.transaction_type not in BULK_TRANSACTION_TYPES:
+            return f"Invalid transaction type. Must be one of: {', '.join(BULK_TRANSACTION_TYPES)}"
+        if not line.product_id:
+            return f"Product '{line.product_code}' not found" if line.product_code else "product_id or product_code is required"
+        if line.product_id not in products:
+            return "Product not found"
+
+        for side in ('from', 'to'):
+            location_id = getattr(line, f'{side}_location_id')
+            code = getattr(line, f'{side}_location_code')
+            if location_id is None and code:
+                return f"Location '{code}' not found"
+            if location_id is not None and location_id not in locations:
+                return f"{side.capitalize()} location not found"
+
+        source, target = line.from_location_id, line.to_location_id
+        if line.transaction_type == 'RECEIPT' and not target:
+            return "RECEIPT requires to_location_id"
+        if line.transaction_type == 'ISSUE' and not source:
+            return "ISSUE requires from_location_id"
+        if line.transaction_type == 'TRANSFER':
+            if not source or not target:
+                return "TRANSFER requires from_location_id and to_location_id"
+            if source == target:
+                return "TRANSFER source and destination must differ"
+        if line.transaction_type == 'ADJUSTMENT' and not source and not target:
+            return "ADJUSTMENT requires to_location_id or from_location_id"
+        return None
+
+    @staticmethod
+    def _movement_legs(movement: dict) -> List[tuple]:
+        """
+        ((product, location, lot), delta) per balance a movement changes;
+        same legs as _bulk_deltas in apply_stock_movements_bulk.
+        """
+        kind = movement['transaction_type']
+        source, target = movement['from_location_id'], movement['to_location_id']
+        lot = movement['lot_number'] or None
+        quantity = movement['quantity']
+
+        legs = []
+        if kind in ('RECEIPT', 'TRANSFER') or (kind == 'ADJUSTMENT' and target):
+            legs.append(((movement['product_id'], target, lot), quantity))
+        if kind in ('ISSUE', 'TRANSFER') or (kind == 'ADJUSTMENT' and not target):
+            legs.append(((movement['product_id'], source, lot), -quantity))
+        return legs
+
     @staticmethod
     async def get_transaction_by_id(transaction_id: str) -> InventoryTransactionResponse:
         """Get transaction details."""
         db = get_db()
         
-        trans = db.table('inventory_transactions').select('*').eq('id', transaction_id).execute()
+        trans = await db.table('inventory_transactions').select('*').eq('id', transaction_id).execute()
         
         if not trans.data:
             raise NotFoundException(detail="Transaction not found")
         
-        trans_data = trans.data[0]
-        
-        # Get product, locations, user details
-        product = db.table('products').select('code', 'name').eq('id', trans_data['product_id']).execute()
-        
-        from_location = None
-        if trans_data.get('from_location_id'):
-            from_location = db.table('locations').select('name').eq('id', trans_data['from_location_id']).execute()
-        
-        to_location = None
-        if trans_data.get('to_location_id'):
-            to_location = db.table('locations').select('name').eq('id', trans_data['to_location_id']).execute()
+        transactions = await InventoryService._build_transaction_responses(trans.data)
+        return transactions[0]
+    
+    @staticmethod
+    async def _build_transaction_responses(rows: List[dict]) -> List[InventoryTransactionResponse]:
+        """Resolve product, location and user names for a page of transactions."""
+        loader = get_loader()
+        
+        products = await loader.load_many('products', (t['product_id'] for t in rows))
+        locations = await loader.load_many(
+            'locations',
+            [t.get('from_location_id') for t in rows] + [t.get('to_location_id') for t in rows]
+        )
+        users = await loader.load_many('users', (t.get('performed_by') for t in rows))
         
-        user = None
-        if trans_data.get('performed_by'):
-            user = db.table('users').select('full_name').eq('id', trans_data['performed_by']).execute()
+        transactions = []
+        for trans in rows:
+            product = products.get(trans['product_id'], {})
+            from_location = locations.get(trans.get('from_location_id'), {})
+            to_location = locations.get(trans.get('to_location_id'), {})
+            
+            transactions.append(InventoryTransactionResponse(
+                **trans,
+                product_code=product.get('code'),
+                product_name=product.get('name'),
+                from_location_name=from_location.get('name'),
+                to_location_name=to_location.get('name'),
+                performed_by_name=(users.get(trans.get('performed_by')) or {}).get('full_name')
+            ))
         
-        return InventoryTransactionResponse(
-            **trans_data,
-            product_code=product.data[0]['code'] if product.data else None,
-            product_name=product.data[0]['name'] if product.data else None,
-            from_location_name=from_location.data[0]['name'] if from_location and from_location.data else None,
-            to_location_name=to_location.data[0]['name'] if to_location and to_location.data else None,
-            performed_by_name=user.data[0]['full_name'] if user and user.data else None
-        )
+        return transactions
     
     @staticmethod
     async def list_transactions(
@@ -398,35 +566,9 @@ class InventoryService:
         if date_to:
             query = query.lte('transaction_date', date_to)
         
-        result = query.order('transaction_date', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('transaction_date', desc=True).range(offset, offset + limit - 1).execute()
         
-        transactions = []
-        for trans in result.data:
-            # Get product details
-            product = db.table('products').select('code', 'name').eq('id', trans['product_id']).execute()
-            
-            from_location = None
-            if trans.get('from_location_id'):
-                from_location = db.table('locations').select('name').eq('id', trans['from_location_id']).execute()
-            
-            to_location = None
-            if trans.get('to_location_id'):
-                to_location = db.table('locations').select('name').eq('id', trans['to_location_id']).execute()
-            
-            user = None
-            if trans.get('performed_by'):
-                user = db.table('users').select('full_name').eq('id', trans['performed_by']).execute()
-            
-            transactions.append(InventoryTransactionResponse(
-                **trans,
-                product_code=product.data[0]['code'] if product.data else None,
-                product_name=product.data[0]['name'] if product.data else None,
-                from_location_name=from_location.data[0]['name'] if from_location and from_location.data else None,
-                to_location_name=to_location.data[0]['name'] if to_location and to_location.data else None,
-                performed_by_name=user.data[0]['full_name'] if user and user.data else None
-            ))
-        
-        return transactions
+        return await InventoryService._build_transaction_responses(result.data)
     
     @staticmethod
     async def create_stock_alert(
@@ -446,7 +588,7 @@ class InventoryService:
         else:
             existing = existing.is_('location_id', 'null')
         
-        existing_result = existing.execute()
+        existing_result = await existing.execute()
         
         if existing_result.data:
             raise ValidationException(detail="Stock alert already exists for this product and location")
@@ -461,7 +603,7 @@ class InventoryService:
         if alert_data.reorder_qty:
             alert_dict['reorder_qty'] = float(alert_data.reorder_qty)
         
-        result = db.table('stock_alerts').insert(alert_dict).execute()
+        result = await db.table('stock_alerts').insert(alert_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create stock alert")
@@ -477,7 +619,7 @@ class InventoryService:
         """List stock alerts with filters."""
         db = get_db()
         
-        query = db.table('stock_alerts').select('*')
+        query = STOCK_ALERT_VIEW.query(db)
         
         if is_active is not None:
             query = query.eq('is_active', is_active)
@@ -488,53 +630,21 @@ class InventoryService:
         if location_id:
             query = query.eq('location_id', location_id)
         
-        result = query.execute()
+        result = await query.execute()
         
-        alerts = []
-        for alert in result.data:
-            # Get product details
-            product = db.table('products').select('code', 'name').eq('id', alert['product_id']).execute()
-            
-            location_name = None
-            if alert.get('location_id'):
-                location = db.table('locations').select('name').eq('id', alert['location_id']).execute()
-                location_name = location.data[0]['name'] if location.data else None
-            
-            alerts.append(StockAlertResponse(
-                **alert,
-                product_code=product.data[0]['code'] if product.data else None,
-                product_name=product.data[0]['name'] if product.data else None,
-                location_name=location_name
-            ))
-        
-        return alerts
+        return [StockAlertResponse(**alert) for alert in STOCK_ALERT_VIEW.flatten_all(result.data)]
 
     @staticmethod
     async def get_stock_alert_by_id(alert_id: str) -> StockAlertResponse:
         """Get stock alert by ID."""
         db = get_db()
         
-        result = db.table('stock_alerts').select('*').eq('id', alert_id).execute()
+        result = await STOCK_ALERT_VIEW.query(db).eq('id', alert_id).execute()
         
         if not result.data:
             raise NotFoundException(detail="Stock alert not found")
         
-        alert = result.data[0]
-        
-        # Get product details
-        product = db.table('products').select('code', 'name').eq('id', alert['product_id']).execute()
-        
-        location_name = None
-        if alert.get('location_id'):
-            location = db.table('locations').select('name').eq('id', alert['location_id']).execute()
-            location_name = location.data[0]['name'] if location.data else None
-        
-        return StockAlertResponse(
-            **alert,
-            product_code=product.data[0]['code'] if product.data else None,
-            product_name=product.data[0]['name'] if product.data else None,
-            location_name=location_name
-        )
+        return StockAlertResponse(**STOCK_ALERT_VIEW.flatten(result.data[0]))
 
     @staticmethod
     async def update_stock_alert(
@@ -546,7 +656,7 @@ class InventoryService:
         db = get_db()
         
         # Check if alert exists
-        existing = db.table('stock_alerts').select('id').eq('id', alert_id).execute()
+        existing = await db.table('stock_alerts').select('id').eq('id', alert_id).execute()
         
         if not existing.data:
             raise NotFoundException(detail="Stock alert not found")
@@ -568,7 +678,7 @@ class InventoryService:
         
         if update_dict:
             update_dict['updated_at'] = datetime.utcnow().isoformat()
-            db.table('stock_alerts').update(update_dict).eq('id', alert_id).execute()
+            await db.table('stock_alerts').update(update_dict).eq('id', alert_id).execute()
         
         return await InventoryService.get_stock_alert_by_id(alert_id)
 
@@ -577,7 +687,7 @@ class InventoryService:
         """Delete stock alert."""
         db = get_db()
         
-        result = db.table('stock_alerts').delete().eq('id', alert_id).execute()
+        result = await db.table('stock_alerts').delete().eq('id', alert_id).execute()
         
         if not result.data:
             raise NotFoundException(detail="Stock alert not found")
@@ -589,31 +699,23 @@ class InventoryService:
         """Get all items below minimum stock level."""
         db = get_db()
         
-        # Get all active stock alerts
-        alerts = db.table('stock_alerts').select('*').eq('is_active', True).execute()
+        # Get all active stock alerts with product stock in one round trip
+        alerts = await SHORTAGE_ALERT_VIEW.query(db).eq('is_active', True).execute()
         
         shortages = []
         
-        for alert in alerts.data:
-            # Get current stock
-            inv_query = db.table('inventory').select('available_qty').eq('product_id', alert['product_id'])
-            
+        for alert in SHORTAGE_ALERT_VIEW.flatten_all(alerts.data):
+            # Current stock at the alert's location, or across all locations
+            stock_rows = alert.get('product_inventory') or []
             if alert.get('location_id'):
-                inv_query = inv_query.eq('location_id', alert['location_id'])
-            
-            inv_result = inv_query.execute()
+                stock_rows = [i for i in stock_rows if i['location_id'] == alert['location_id']]
             
-            current_stock = sum(Decimal(str(i['available_qty'])) for i in inv_result.data) if inv_result.data else Decimal('0')
+            current_stock = sum(Decimal(str(i['available_qty'])) for i in stock_rows) if stock_rows else Decimal('0')
             min_qty = Decimal(str(alert['min_qty']))
             
             if current_stock < min_qty:
-                # Get product details
-                product = db.table('products').select('code', 'name', 'unit').eq('id', alert['product_id']).execute()
-                
-                location_name = None
-                if alert.get('location_id'):
-                    location = db.table('locations').select('name').eq('id', alert['location_id']).execute()
-                    location_name = location.data[0]['name'] if location.data else None
+                product = alert['product']
+                location_name = alert.get('location_name')
                 
                 shortage_qty = min_qty - current_stock
                 
@@ -625,61 +727,37 @@ class InventoryService:
                 else:
                     priority = 'MEDIUM'
                 
-                if product.data:
+                if product:
                     shortages.append(ShortageAlert(
                         product_id=alert['product_id'],
-                        product_code=product.data[0]['code'],
-                        product_name=product.data[0]['name'],
+                        product_code=product['code'],
+                        product_name=product['name'],
                         location_id=alert.get('location_id'),
                         location_name=location_name,
                         current_stock=current_stock,
                         min_qty=min_qty,
                         shortage_qty=shortage_qty,
-                        unit=product.data[0]['unit'],
+                        unit=product['unit'],
                         priority=priority
                     ))
         
         return shortages
 
     @staticmethod
-    async def get_inventory_summary() -> dict:
-        """Get inventory summary KPIs for dashboard cards."""
+    async def get_inventory_summary() -> InventorySummary:
+        """
+        Get inventory summary KPIs for dashboard cards.
+        Counters are maintained by database triggers in shard rows and
+        summed by inventory_summary_totals (see migration 029).
+        """
         db = get_db()
         
-        # Get all inventory items
-        inventory = db.table('inventory').select('*').execute()
+        result = await db.table('inventory_summary_totals').select('*').execute()
         
-        total_materials = len(inventory.data)
-        low_stock_count = 0
-        critical_count = 0
-        sufficient_count = 0
+        if not result.data:
+            return InventorySummary()
         
-        for inv in inventory.data:
-            # Check stock alert for this product-location
-            alert = db.table('stock_alerts').select('min_qty').eq(
-                'product_id', inv['product_id']
-            ).eq('location_id', inv['location_id']).eq('is_active', True).execute()
-            
-            available = Decimal(str(inv['available_qty']))
-            
-            if alert.data:
-                min_qty = Decimal(str(alert.data[0]['min_qty']))
-                
-                if available == 0:
-                    critical_count += 1
-                elif available < min_qty:
-                    low_stock_count += 1
-                else:
-                    sufficient_count += 1
-            else:
-                sufficient_count += 1
-        
-        return {
-            "total_materials": total_materials,
-            "low_stock_count": low_stock_count,
-            "critical_count": critical_count,
-            "sufficient_count": sufficient_count
-        }
+        return InventorySummary(**result.data[0])
 
 
     @staticmethod
@@ -689,15 +767,19 @@ class InventoryService:
         product_id: Optional[str] = None,
         location_id: Optional[str] = None,
         search: Optional[str] = None,
-        low_stock_only: bool = False
-    ) -> List[InventoryListItem]:
-        """List inventory with filters."""
+        low_stock_only: bool = False,
+        after: Optional[str] = None
+    ) -> InventoryListPage:
+        """
+        List inventory with filters.
+        Search and low-stock filters run in inventory_list_view before
+        pagination, so every page but the last is full. Pass `next_after`
+        back as `after` for the next page (keyset pagination on
+        product_code, location_code, id); `page` is only used without it.
+        """
         db = get_db()
         
-        offset = (page - 1) * limit
-        
-        # Build query
-        query = db.table('inventory').select('*')
+        query = db.table('inventory_list_view').select('*')
         
         if product_id:
             query = query.eq('product_id', product_id)
@@ -705,77 +787,42 @@ class InventoryService:
         if location_id:
             query = query.eq('location_id', location_id)
         
-        result = query.range(offset, offset + limit - 1).execute()
+        if search:
+            query = query.or_(ilike_any(['product_code', 'product_name'], search))
         
-        inventory_items = []
+        if low_stock_only:
+            query = query.eq('is_low_stock', True)
         
-        for inv in result.data:
-            # Get product details
-            product = db.table('products').select('code', 'name', 'unit').eq('id', inv['product_id']).execute()
-            if not product.data:
-                continue
-            
-            # Get location details
-            location = db.table('locations').select('code', 'name').eq('id', inv['location_id']).execute()
-            if not location.data:
-                continue
-            
-            product_data = product.data[0]
-            location_data = location.data[0]
-            
-            # Apply search filter
-            if search:
-                search_lower = search.lower()
-                if (search_lower not in product_data['code'].lower() and 
-                    search_lower not in product_data['name'].lower()):
-                    continue
-            
-            available = Decimal(str(inv['available_qty']))
-            allocated = Decimal(str(inv['allocated_qty']))
-            free_qty = available - allocated
-            
-            # Check stock alert to determine status and reorder level
-            alert = db.table('stock_alerts').select('min_qty').eq(
-                'product_id', inv['product_id']
-            ).eq('location_id', inv['location_id']).eq('is_active', True).execute()
-            
-            status = "Sufficient"
-            reorder_level = None
-            
-            if alert.data:
-                min_qty = Decimal(str(alert.data[0]['min_qty']))
-                reorder_level = min_qty
-                
-                # Determine status
-                if available == 0:
-                    status = "Critical"
-                elif available < min_qty:
-                    status = "Low Stock"
-                else:
-                    status = "Sufficient"
-                
-                # Apply low stock filter
-                if low_stock_only and status == "Sufficient":
-                    continue
-            
-            inventory_items.append(InventoryListItem(
-                id=inv['id'],
-                product_id=inv['product_id'],
-                product_code=product_data['code'],
-                product_name=product_data['name'],
-                location_id=inv['location_id'],
-                location_code=location_data['code'],
-                location_name=location_data['name'],
-                available_qty=available,
-                allocated_qty=allocated,
-                free_qty=free_qty,
-                unit=product_data['unit'],
-                lot_number=inv.get('lot_number'),
-                reorder_level=reorder_level,
-                status=status
-            ))
+        query = query.order('product_code').order('location_code').order('id')
+        if after:
+            query = query.or_(after_keyset(LIST_ORDER, InventoryService.decode_list_cursor(after))).limit(limit + 1)
+        else:
+            offset = (page - 1) * limit
+            query = query.range(offset, offset + limit)
         
-        return inventory_items
+        rows = (await query.execute()).data or []
+        
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = InventoryService.encode_list_cursor(rows[-1])
+        
+        return InventoryListPage(
+            items=[InventoryListItem(**row) for row in rows],
+            next_after=next_after
+        )
+    
+    @staticmethod
+    def encode_list_cursor(row: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps([row[c] for c in LIST_ORDER]).encode()).decode()
+    
+    @staticmethod
+    def decode_list_cursor(cursor: str) -> Tuple[str, str, str]:
+        try:
+            product_code, location_code, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return str(product_code), str(location_code), str(uuid.UUID(row_id))
+        except (ValueError, TypeError):
+            raise ValidationException(detail="Invalid cursor")
 
     @staticmethod
     async def log_transaction(
@@ -804,7 +851,7 @@ class InventoryService:
             'performed_by': user_id
         }
         
-        result = db.table('inventory_transactions').insert(transaction).execute()
+        result = await db.table('inventory_transactions').insert(transaction).execute()
         return result.data[0] if result.data else None
 
 
@@ -837,30 +884,26 @@ class InventoryService:
         if end_date:
             query = query.lte('created_at', end_date.isoformat())
         
-        result = query.order('created_at', desc=True).limit(limit).execute()
+        result = await query.order('created_at', desc=True).limit(limit).execute()
+        
+        loader = get_loader()
+        products = await loader.load_many('products', (t['product_id'] for t in result.data))
+        locations = await loader.load_many(
+            'locations',
+            [t.get('from_location_id') for t in result.data] + [t.get('to_location_id') for t in result.data]
+        )
         
         transactions = []
         for trans in result.data:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', trans['product_id']).execute()
-            
-            # Get location names
-            from_loc = None
-            to_loc = None
-            
-            if trans.get('from_location_id'):
-                from_loc_data = db.table('locations').select('name').eq('id', trans['from_location_id']).execute()
-                from_loc = from_loc_data.data[0]['name'] if from_loc_data.data else None
-            
-            if trans.get('to_location_id'):
-                to_loc_data = db.table('locations').select('name').eq('id', trans['to_location_id']).execute()
-                to_loc = to_loc_data.data[0]['name'] if to_loc_data.data else None
+            product = products.get(trans['product_id'], {})
+            from_loc = (locations.get(trans.get('from_location_id')) or {}).get('name')
+            to_loc = (locations.get(trans.get('to_location_id')) or {}).get('name')
             
             transactions.append(InventoryTransactionResponse(
                 id=trans['id'],
                 product_id=trans['product_id'],
-                product_code=product.data[0]['code'] if product.data else None,
-                product_name=product.data[0]['name'] if product.data else None,
+                product_code=product.get('code'),
+                product_name=product.get('name'),
                 transaction_type=trans['transaction_type'],
                 quantity=Decimal(str(trans['quantity'])),
                 from_location_id=trans.get('from_location_id'),
@@ -890,47 +933,24 @@ class InventoryService:
         Adjust inventory (stock count corrections, damaged goods, etc.)
         Positive qty = increase, Negative qty = decrease
         """
-        db = get_db()
-        
-        # Get current inventory
-        inv = db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id).execute()
-        
-        if not inv.data:
-            # Create new inventory record if doesn't exist
-            if adjustment_qty < 0:
-                raise ValidationException(detail="Cannot decrease non-existent inventory")
-            
-            db.table('inventory').insert({
-                'product_id': product_id,
-                'location_id': location_id,
-                'available_qty': float(adjustment_qty),
-                'allocated_qty': 0
-            }).execute()
-        else:
-            current = inv.data[0]
-            new_qty = Decimal(str(current['available_qty'])) + adjustment_qty
-            
-            if new_qty < 0:
-                raise ValidationException(detail="Adjustment would result in negative inventory")
-            
-            db.table('inventory').update({
-                'available_qty': float(new_qty),
-                'updated_at': datetime.utcnow().isoformat()
-            }).eq('id', current['id']).execute()
-        
-        # Log transaction
-        await InventoryService.log_transaction(
-            product_id=product_id,
-            transaction_type='ADJUSTMENT',
-            quantity=abs(adjustment_qty),
-            user_id=user_id,
-            from_location_id=location_id if adjustment_qty < 0 else None,
-            to_location_id=location_id if adjustment_qty > 0 else None,
-            reference_type='stock_adjustment',
-            notes=f"{reason}. {notes}" if notes else reason
+        if adjustment_qty == 0:
+            raise ValidationException(detail="Adjustment quantity cannot be zero")
+        
+        # Balance update and ledger row in one atomic call
+        await InventoryService.record_transaction(
+            InventoryTransactionCreate(
+                product_id=product_id,
+                transaction_type='ADJUSTMENT',
+                quantity=abs(adjustment_qty),
+                from_location_id=location_id if adjustment_qty < 0 else None,
+                to_location_id=location_id if adjustment_qty > 0 else None,
+                reference_type='stock_adjustment',
+                notes=f"{reason}. {notes}" if notes else reason
+            ),
+            user_id
         )
         
-        return await InventoryService.get_inventory_by_id(inv.data[0]['id'] if inv.data else None)
+        return await InventoryService.get_inventory_by_product_location(product_id, location_id)
 
 
     @staticmethod
@@ -939,46 +959,95 @@ class InventoryService:
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None
     ) -> StockMovementSummary:
-        """Get summary of stock movements for a product."""
+        """
+        Get summary of stock movements for a product.
+        
+        Cumulative counters are read at both ends of the window from the
+        nearest stock snapshot plus the ledger tail, so the cost depends on
+        the snapshot interval rather than the age of the ledger. Transfers
+        between locations are not counted as in or out.
+        """
         db = get_db()
         
         # Get product info
-        product = db.table('products').select('code', 'name').eq('id', product_id).execute()
-        if not product.data:
+        product = await get_loader().load('products', product_id)
+        if not product:
             raise NotFoundException(detail="Product not found")
         
-        # Get transactions
-        query = db.table('inventory_transactions').select('transaction_type', 'quantity').eq('product_id', product_id)
+        def totals(rows: List[dict]) -> dict:
+            def total(column: str) -> Decimal:
+                return sum((Decimal(str(r[column])) for r in rows), Decimal('0'))
+            return {
+                'in': total('in_qty') - total('transfer_in_qty'),
+                'out': total('out_qty') - total('transfer_out_qty'),
+                'count': int(total('transaction_count'))
+            }
+        
+        async def position_at(at: datetime) -> dict:
+            result = await db.rpc('stock_position_at', {
+                'p_at': at.isoformat(),
+                'p_product_id': product_id
+            }).execute()
+            return totals(result.data)
         
         if start_date:
-            query = query.gte('created_at', start_date.isoformat())
-        if end_date:
-            query = query.lte('created_at', end_date.isoformat())
-        
-        result = query.execute()
-        
-        total_in = Decimal('0')
-        total_out = Decimal('0')
+            start, end = await asyncio.gather(
+                position_at(start_date),
+                position_at(end_date or datetime.now(timezone.utc))
+            )
+        else:
+            start = {'in': 0, 'out': 0, 'count': 0}
+            end = await position_at(end_date or datetime.now(timezone.utc))
         
-        for trans in result.data:
-            qty = Decimal(str(trans['quantity']))
-            trans_type = trans['transaction_type']
-            
-            if trans_type in ['GATE_IN', 'TRANSFER_IN', 'ADJUSTMENT']:
-                total_in += qty
-            elif trans_type in ['GATE_OUT', 'TRANSFER_OUT', 'PRODUCTION', 'ALLOCATION']:
-                total_out += qty
+        total_in = end['in'] - start['in']
+        total_out = end['out'] - start['out']
         
         return StockMovementSummary(
             product_id=product_id,
-            product_code=product.data[0]['code'],
-            product_name=product.data[0]['name'],
+            product_code=product['code'],
+            product_name=product['name'],
             total_in=total_in,
             total_out=total_out,
             net_movement=total_in - total_out,
-            transaction_count=len(result.data)
+            transaction_count=end['count'] - start['count']
         )
 
+    @staticmethod
+    async def get_stock_as_of(
+        as_of: datetime,
+        product_id: Optional[str] = None,
+        location_id: Optional[str] = None
+    ) -> List[StockPosition]:
+        """Stock on hand at a point in time, from the nearest snapshot plus the ledger between."""
+        db = get_db()
+        
+        result = await db.rpc('stock_position_at', {
+            'p_at': as_of.isoformat(),
+            'p_product_id': product_id,
+            'p_location_id': location_id
+        }).execute()
+        
+        rows = [r for r in result.data if Decimal(str(r['on_hand_qty'])) != 0]
+        
+        loader = get_loader()
+        products = await loader.load_many('products', (r['product_id'] for r in rows))
+        locations = await loader.load_many('locations', (r['location_id'] for r in rows))
+        
+        positions = [
+            StockPosition(
+                product_id=r['product_id'],
+                product_code=(products.get(r['product_id']) or {}).get('code'),
+                product_name=(products.get(r['product_id']) or {}).get('name'),
+                location_id=r['location_id'],
+                location_name=(locations.get(r['location_id']) or {}).get('name'),
+                lot_number=r.get('lot_number'),
+                on_hand_qty=Decimal(str(r['on_hand_qty']))
+            )
+            for r in rows
+        ]
+        positions.sort(key=lambda p: (p.product_code or '', p.location_name or '', p.lot_number or ''))
+        return positions
+
 
     @staticmethod
     async def allocate_inventory(
@@ -996,7 +1065,7 @@ class InventoryService:
         db = get_db()
         
         # Get inventory
-        inv = db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id).execute()
+        inv = await db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id).execute()
         
         if not inv.data:
             raise NotFoundException(detail="Inventory not found")
@@ -1010,7 +1079,7 @@ class InventoryService:
             raise ValidationException(detail=f"Insufficient free inventory. Available: {free}, Requested: {quantity}")
         
         # Update allocation
-        db.table('inventory').update({
+        await db.table('inventory').update({
             'allocated_qty': float(allocated + quantity),
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', current['id']).execute()
@@ -1046,7 +1115,7 @@ class InventoryService:
         db = get_db()
         
         # Get inventory
-        inv = db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id).execute()
+        inv = await db.table('inventory').select('*').eq('product_id', product_id).eq('location_id', location_id).execute()
         
         if not inv.data:
             raise NotFoundException(detail="Inventory not found")
@@ -1058,7 +1127,7 @@ class InventoryService:
             raise ValidationException(detail=f"Cannot release more than allocated. Allocated: {allocated}, Requested: {quantity}")
         
         # Release allocation
-        db.table('inventory').update({
+        await db.table('inventory').update({
             'allocated_qty': float(allocated - quantity),
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', current['id']).execute()
@@ -2,6 +2,9 @@ from datetime import datetime, date
 from typing import List, Optional
 from decimal import Decimal
 from app.database import get_db
+from app.core.loader import get_loader
+from app.core.cache import reference_cache
+from app.core.embedding import Embed, EmbeddedSelect
 from app.schemas.material_request import (
     MaterialRequestCreate, MaterialRequestUpdate, MaterialRequestResponse,
     MaterialRequestListItem, RequestItemResponse, ReviewRequest,
@@ -11,16 +14,24 @@ from app.schemas.material_request import (
 from app.core.exceptions import NotFoundException, ValidationException
 
 
+# Requests with their first item and its product for the list view
+REQUEST_LIST_VIEW = EmbeddedSelect(
+    'material_requests', '*',
+    Embed('items', 'request_items', 'product_id, requested_qty',
+          Embed('product', 'products', 'name'), many=True),
+)
+
+
 class MaterialRequestService:
     
     @staticmethod
-    def _generate_request_number() -> str:
+    async def _generate_request_number() -> str:
         """Generate unique request number: MR-YYYY-XXXX"""
         db = get_db()
         year = datetime.now().year
         
         # Get count of requests this year
-        result = db.table('material_requests').select('request_number', count='exact').like(
+        result = await db.table('material_requests').select('request_number', count='exact').like(
             'request_number', f'MR-{year}-%'
         ).execute()
         
@@ -36,24 +47,28 @@ class MaterialRequestService:
         """Check stock availability for requested items"""
         db = get_db()
         
+        product_ids = list({item['product_id'] for item in stock_check.items})
+        products = await get_loader().load_many('products', product_ids)
+        
+        # Get available stock across all locations for every requested product
+        free_by_product = {}
+        if products:
+            inv = await db.table('inventory').select('product_id', 'available_qty', 'allocated_qty').in_(
+                'product_id', list(products)
+            ).execute()
+            for i in inv.data:
+                free = Decimal(str(i['available_qty'])) - Decimal(str(i['allocated_qty']))
+                free_by_product[i['product_id']] = free_by_product.get(i['product_id'], Decimal('0')) + free
+        
         results = []
         
         for item in stock_check.items:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', item['product_id']).execute()
+            product = products.get(item['product_id'])
             
-            if not product.data:
+            if not product:
                 continue
             
-            # Get available stock across all locations
-            inv = db.table('inventory').select('available_qty', 'allocated_qty').eq(
-                'product_id', item['product_id']
-            ).execute()
-            
-            available_qty = Decimal('0')
-            for i in inv.data:
-                free = Decimal(str(i['available_qty'])) - Decimal(str(i['allocated_qty']))
-                available_qty += free
+            available_qty = free_by_product.get(item['product_id'], Decimal('0'))
             
             requested_qty = Decimal(str(item['requested_qty']))
             
@@ -67,8 +82,8 @@ class MaterialRequestService:
             
             results.append(StockAvailabilityResponse(
                 product_id=item['product_id'],
-                product_code=product.data[0]['code'],
-                product_name=product.data[0]['name'],
+                product_code=product['code'],
+                product_name=product['name'],
                 requested_qty=requested_qty,
                 available_qty=available_qty,
                 status=status
@@ -88,7 +103,7 @@ class MaterialRequestService:
         db = get_db()
         
         # Generate request number
-        request_number = MaterialRequestService._generate_request_number()
+        request_number = await MaterialRequestService._generate_request_number()
         
         # Create request
         request_dict = {
@@ -109,7 +124,7 @@ class MaterialRequestService:
             'status': 'Pending'
         }
         
-        result = db.table('material_requests').insert(request_dict).execute()
+        result = await db.table('material_requests').insert(request_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create material request")
@@ -119,7 +134,7 @@ class MaterialRequestService:
         # Create request items with stock availability check
         for item in request_data.items:
             # Check stock availability
-            inv = db.table('inventory').select('available_qty', 'allocated_qty').eq(
+            inv = await db.table('inventory').select('available_qty', 'allocated_qty').eq(
                 'product_id', item.product_id
             ).execute()
             
@@ -154,7 +169,7 @@ class MaterialRequestService:
                 'status': 'Pending'
             }
             
-            db.table('request_items').insert(item_dict).execute()
+            await db.table('request_items').insert(item_dict).execute()
         
         return await MaterialRequestService.get_request_by_id(request_id)
     
@@ -173,7 +188,7 @@ class MaterialRequestService:
         
         offset = (page - 1) * limit
         
-        query = db.table('material_requests').select('*')
+        query = REQUEST_LIST_VIEW.query(db).limit(1, foreign_table='items')
         
         if status:
             query = query.eq('status', status)
@@ -187,20 +202,15 @@ class MaterialRequestService:
         if end_date:
             query = query.lte('request_date', end_date.isoformat())
         
-        result = query.order('request_date', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('request_date', desc=True).range(offset, offset + limit - 1).execute()
         
         requests = []
-        for req in result.data:
-            # Get first item or count
-            items = db.table('request_items').select('product_id', 'requested_qty').eq(
-                'request_id', req['id']
-            ).limit(1).execute()
+        for req in REQUEST_LIST_VIEW.flatten_all(result.data):
+            first_item = req['items'][0] if req['items'] else None
             
-            if items.data:
-                # Get product name
-                product = db.table('products').select('name').eq('id', items.data[0]['product_id']).execute()
-                material_name = product.data[0]['name'] if product.data else 'Unknown'
-                quantity = Decimal(str(items.data[0]['requested_qty']))
+            if first_item:
+                material_name = first_item.get('product_name') or 'Unknown'
+                quantity = Decimal(str(first_item['requested_qty']))
             else:
                 material_name = 'No items'
                 quantity = Decimal('0')
@@ -231,7 +241,7 @@ class MaterialRequestService:
         db = get_db()
         
         # Get request
-        request = db.table('material_requests').select('*').eq('id', request_id).execute()
+        request = await db.table('material_requests').select('*').eq('id', request_id).execute()
         
         if not request.data:
             raise NotFoundException(detail="Material request not found")
@@ -239,19 +249,19 @@ class MaterialRequestService:
         req = request.data[0]
         
         # Get request items
-        items_result = db.table('request_items').select('*').eq('request_id', request_id).execute()
+        items_result = await db.table('request_items').select('*').eq('request_id', request_id).execute()
+        products = await get_loader().load_many('products', (i['product_id'] for i in items_result.data))
         
         items = []
         for item in items_result.data:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', item['product_id']).execute()
+            product = products.get(item['product_id'], {})
             
             items.append(RequestItemResponse(
                 id=item['id'],
                 request_id=item['request_id'],
                 product_id=item['product_id'],
-                product_code=product.data[0]['code'] if product.data else None,
-                product_name=product.data[0]['name'] if product.data else None,
+                product_code=product.get('code'),
+                product_name=product.get('name'),
                 item_code=item.get('item_code'),
                 material_description=item.get('material_description'),
                 requested_qty=Decimal(str(item['requested_qty'])),
@@ -307,7 +317,7 @@ class MaterialRequestService:
         db = get_db()
         
         # Get request
-        request = db.table('material_requests').select('status').eq('id', request_id).execute()
+        request = await db.table('material_requests').select('status').eq('id', request_id).execute()
         
         if not request.data:
             raise NotFoundException(detail="Material request not found")
@@ -316,7 +326,7 @@ class MaterialRequestService:
             raise ValidationException(detail=f"Cannot review request with status: {request.data[0]['status']}")
         
         # Update request
-        db.table('material_requests').update({
+        await db.table('material_requests').update({
             'status': 'Reviewed',
             'reviewed_by': user_id,
             'reviewed_at': datetime.utcnow().isoformat()
@@ -337,7 +347,7 @@ class MaterialRequestService:
         db = get_db()
         
         # Get request
-        request = db.table('material_requests').select('*').eq('id', request_id).execute()
+        request = await db.table('material_requests').select('*').eq('id', request_id).execute()
         
         if not request.data:
             raise NotFoundException(detail="Material request not found")
@@ -350,10 +360,10 @@ class MaterialRequestService:
         # Update request items
         if approval.approve_all:
             # Approve all items with full quantities
-            items = db.table('request_items').select('*').eq('request_id', request_id).execute()
+            items = await db.table('request_items').select('*').eq('request_id', request_id).execute()
             
             for item in items.data:
-                db.table('request_items').update({
+                await db.table('request_items').update({
                     'approved_qty': item['requested_qty'],
                     'status': 'Approved'
                 }).eq('id', item['id']).execute()
@@ -369,7 +379,7 @@ class MaterialRequestService:
                 approved_qty = Decimal(str(item_approval['approved_qty']))
                 
                 # Get item
-                item = db.table('request_items').select('*').eq('id', item_id).execute()
+                item = await db.table('request_items').select('*').eq('id', item_id).execute()
                 
                 if item.data:
                     requested_qty = Decimal(str(item.data[0]['requested_qty']))
@@ -383,7 +393,7 @@ class MaterialRequestService:
                         item_status = 'Approved'
                         has_full = True
                     
-                    db.table('request_items').update({
+                    await db.table('request_items').update({
                         'approved_qty': float(approved_qty),
                         'status': item_status
                     }).eq('id', item_id).execute()
@@ -396,7 +406,7 @@ class MaterialRequestService:
                 request_status = 'Rejected'
         
         # Update request
-        db.table('material_requests').update({
+        await db.table('material_requests').update({
             'status': request_status,
             'approved_by': user_id,
             'approved_at': datetime.utcnow().isoformat()
@@ -414,7 +424,7 @@ class MaterialRequestService:
         db = get_db()
         
         # Get request details
-        request = db.table('material_requests').select('*').eq('id', request_id).execute()
+        request = await db.table('material_requests').select('*').eq('id', request_id).execute()
         
         if not request.data:
             return
@@ -422,33 +432,40 @@ class MaterialRequestService:
         req = request.data[0]
         
         # Get approved items
-        items = db.table('request_items').select('*').eq('request_id', request_id).in_(
+        items = await db.table('request_items').select('*').eq('request_id', request_id).in_(
             'status', ['Approved', 'Partially Approved']
         ).execute()
         
         # Get default source location (Main Store)
-        from_location = db.table('locations').select('id').eq('code', 'STORE-01').execute()
+        from_location = await get_loader().load_by_key('locations', 'STORE-01')
         
-        if not from_location.data:
+        if not from_location:
             return
         
-        from_location_id = from_location.data[0]['id']
+        from_location_id = from_location['id']
+        
+        # Find destination location based on department
+        department_key = f"department:{req['department']}"
+        to_locations = reference_cache.get_list('locations', department_key)
+        if to_locations is None:
+            to_location = await db.table('locations').select('id').ilike(
+                'name', f"%{req['department']}%"
+            ).execute()
+            to_locations = to_location.data
+            reference_cache.put_list('locations', department_key, to_locations)
         
         # Create transfer for each item
         for item in items.data:
             if Decimal(str(item['approved_qty'])) > 0:
-                # Find destination location based on department
-                to_location = db.table('locations').select('id').ilike('name', f"%{req['department']}%").execute()
-                
-                if to_location.data:
-                    to_location_id = to_location.data[0]['id']
+                if to_locations:
+                    to_location_id = to_locations[0]['id']
                     
                     # Generate transfer number
                     from app.services.material_transfer_service import MaterialTransferService
-                    transfer_number = MaterialTransferService._generate_transfer_number()
+                    transfer_number = await MaterialTransferService._generate_transfer_number()
                     
                     # Create transfer
-                    db.table('material_transfers').insert({
+                    await db.table('material_transfers').insert({
                         'transfer_number': transfer_number,
                         'product_id': item['product_id'],
                         'from_location_id': from_location_id,
@@ -470,7 +487,7 @@ class MaterialRequestService:
         """Reject material request"""
         db = get_db()
         
-        request = db.table('material_requests').select('status').eq('id', request_id).execute()
+        request = await db.table('material_requests').select('status').eq('id', request_id).execute()
         
         if not request.data:
             raise NotFoundException(detail="Material request not found")
@@ -479,14 +496,14 @@ class MaterialRequestService:
             raise ValidationException(detail=f"Cannot reject request with status: {request.data[0]['status']}")
         
         # Update request
-        db.table('material_requests').update({
+        await db.table('material_requests').update({
             'status': 'Rejected',
             'approved_by': user_id,
             'approved_at': datetime.utcnow().isoformat()
         }).eq('id', request_id).execute()
         
         # Update all items to rejected
-        db.table('request_items').update({
+        await db.table('request_items').update({
             'status': 'Rejected'
         }).eq('request_id', request_id).execute()
         
@@ -532,19 +549,20 @@ class MaterialRequestService:
         """Get quick request templates for quick actions"""
         db = get_db()
         
-        templates = db.table('quick_request_templates').select('*').eq('is_active', True).execute()
+        templates = await db.table('quick_request_templates').select('*').eq('is_active', True).execute()
+        
+        products = await get_loader().load_many('products', (t['product_id'] for t in templates.data))
         
         result = []
         for tmpl in templates.data:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', tmpl['product_id']).execute()
+            product = products.get(tmpl['product_id'], {})
             
             result.append(QuickRequestTemplate(
                 id=tmpl['id'],
                 name=tmpl['name'],
                 product_id=tmpl['product_id'],
-                product_code=product.data[0]['code'] if product.data else None,
-                product_name=product.data[0]['name'] if product.data else None,
+                product_code=product.get('code'),
+                product_name=product.get('name'),
                 default_quantity=Decimal(str(tmpl['default_quantity'])),
                 unit=tmpl['unit'],
                 destination_location=tmpl.get('destination_location'),
@@ -1,7 +1,11 @@
 from datetime import datetime
 from typing import List, Optional
 from decimal import Decimal
+from postgrest.exceptions import APIError
 from app.database import get_db
+from app.core.loader import get_loader, user_display_name
+from app.core.cache import reference_cache
+from app.core.live import publish
 from app.schemas.material_transfer import (
     MaterialTransferCreate, MaterialTransferUpdate, MaterialTransferResponse,
     MaterialTransferListItem, TransferStatusUpdate, TransferApprovalRequest,
@@ -9,18 +13,19 @@ from app.schemas.material_transfer import (
     WIPStageWithUnits, OrderStageStatus
 )
 from app.core.exceptions import NotFoundException, ValidationException
+from app.services.inventory_service import STOCK_MOVEMENT_ERROR_CODES
 
 
 class MaterialTransferService:
     
     @staticmethod
-    def _generate_transfer_number() -> str:
+    async def _generate_transfer_number() -> str:
         """Generate unique transfer number: TRF-YYYY-XXXX"""
         db = get_db()
         year = datetime.now().year
         
         # Get count of transfers this year
-        result = db.table('material_transfers').select('transfer_number', count='exact').like(
+        result = await db.table('material_transfers').select('transfer_number', count='exact').like(
             'transfer_number', f'TRF-{year}-%'
         ).execute()
         
@@ -41,13 +46,13 @@ class MaterialTransferService:
         db = get_db()
         
         # Validate product exists
-        product = db.table('products').select('id', 'unit').eq('id', transfer_data.product_id).execute()
+        product = await db.table('products').select('id', 'unit').eq('id', transfer_data.product_id).execute()
         if not product.data:
             raise NotFoundException(detail="Product not found")
         
         # Validate locations exist
-        from_loc = db.table('locations').select('id').eq('id', transfer_data.from_location_id).execute()
-        to_loc = db.table('locations').select('id').eq('id', transfer_data.to_location_id).execute()
+        from_loc = await db.table('locations').select('id').eq('id', transfer_data.from_location_id).execute()
+        to_loc = await db.table('locations').select('id').eq('id', transfer_data.to_location_id).execute()
         
         if not from_loc.data:
             raise NotFoundException(detail="Source location not found")
@@ -58,7 +63,7 @@ class MaterialTransferService:
             raise ValidationException(detail="Source and destination locations cannot be the same")
         
         # Check inventory availability at source
-        inv = db.table('inventory').select('available_qty', 'allocated_qty').eq(
+        inv = await db.table('inventory').select('available_qty', 'allocated_qty').eq(
             'product_id', transfer_data.product_id
         ).eq('location_id', transfer_data.from_location_id).execute()
         
@@ -73,7 +78,7 @@ class MaterialTransferService:
             )
         
         # Generate transfer number
-        transfer_number = MaterialTransferService._generate_transfer_number()
+        transfer_number = await MaterialTransferService._generate_transfer_number()
         
         # Create transfer
         transfer_dict = {
@@ -92,7 +97,7 @@ class MaterialTransferService:
             'requested_by': user_id
         }
         
-        result = db.table('material_transfers').insert(transfer_dict).execute()
+        result = await db.table('material_transfers').insert(transfer_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create transfer")
@@ -128,20 +133,20 @@ class MaterialTransferService:
         if product_id:
             query = query.eq('product_id', product_id)
         
-        result = query.order('requested_at', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('requested_at', desc=True).range(offset, offset + limit - 1).execute()
+        
+        loader = get_loader()
+        products = await loader.load_many('products', (t['product_id'] for t in result.data))
+        locations = await loader.load_many(
+            'locations',
+            [t['from_location_id'] for t in result.data] + [t['to_location_id'] for t in result.data]
+        )
         
         transfers = []
         for transfer in result.data:
-            # Get product info
-            product = db.table('products').select('name').eq('id', transfer['product_id']).execute()
-            product_name = product.data[0]['name'] if product.data else 'Unknown'
-            
-            # Get location names
-            from_loc = db.table('locations').select('name').eq('id', transfer['from_location_id']).execute()
-            to_loc = db.table('locations').select('name').eq('id', transfer['to_location_id']).execute()
-            
-            from_location_name = from_loc.data[0]['name'] if from_loc.data else 'Unknown'
-            to_location_name = to_loc.data[0]['name'] if to_loc.data else 'Unknown'
+            product_name = products.get(transfer['product_id'], {}).get('name', 'Unknown')
+            from_location_name = locations.get(transfer['from_location_id'], {}).get('name', 'Unknown')
+            to_location_name = locations.get(transfer['to_location_id'], {}).get('name', 'Unknown')
             
             # Determine date to show based on status
             if transfer['status'] == 'Completed' and transfer.get('executed_at'):
@@ -178,41 +183,30 @@ class MaterialTransferService:
         db = get_db()
         
         # Get transfer
-        transfer = db.table('material_transfers').select('*').eq('id', transfer_id).execute()
+        transfer = await db.table('material_transfers').select('*').eq('id', transfer_id).execute()
         
         if not transfer.data:
             raise NotFoundException(detail="Transfer not found")
         
         t = transfer.data[0]
         
+        loader = get_loader()
+        
         # Get product info
-        product = db.table('products').select('code', 'name').eq('id', t['product_id']).execute()
-        product_code = product.data[0]['code'] if product.data else None
-        product_name = product.data[0]['name'] if product.data else None
+        product = await loader.load('products', t['product_id']) or {}
+        product_code = product.get('code')
+        product_name = product.get('name')
         
         # Get location names
-        from_loc = db.table('locations').select('name').eq('id', t['from_location_id']).execute()
-        to_loc = db.table('locations').select('name').eq('id', t['to_location_id']).execute()
-        
-        from_location_name = from_loc.data[0]['name'] if from_loc.data else None
-        to_location_name = to_loc.data[0]['name'] if to_loc.data else None
+        locations = await loader.load_many('locations', [t['from_location_id'], t['to_location_id']])
+        from_location_name = locations.get(t['from_location_id'], {}).get('name')
+        to_location_name = locations.get(t['to_location_id'], {}).get('name')
         
         # Get user names
-        requested_by_name = None
-        approved_by_name = None
-        executed_by_name = None
-        
-        if t.get('requested_by'):
-            user = db.table('users').select('full_name', 'username').eq('id', t['requested_by']).execute()
-            requested_by_name = user.data[0].get('full_name') or user.data[0].get('username') if user.data else None
-        
-        if t.get('approved_by'):
-            user = db.table('users').select('full_name', 'username').eq('id', t['approved_by']).execute()
-            approved_by_name = user.data[0].get('full_name') or user.data[0].get('username') if user.data else None
-        
-        if t.get('executed_by'):
-            user = db.table('users').select('full_name', 'username').eq('id', t['executed_by']).execute()
-            executed_by_name = user.data[0].get('full_name') or user.data[0].get('username') if user.data else None
+        users = await loader.load_many('users', [t.get('requested_by'), t.get('approved_by'), t.get('executed_by')])
+        requested_by_name = user_display_name(users.get(t.get('requested_by')))
+        approved_by_name = user_display_name(users.get(t.get('approved_by')))
+        executed_by_name = user_display_name(users.get(t.get('executed_by')))
         
         return MaterialTransferResponse(
             id=t['id'],
@@ -255,7 +249,7 @@ class MaterialTransferService:
         db = get_db()
         
         # Get transfer
-        transfer = db.table('material_transfers').select('*').eq('id', transfer_id).execute()
+        transfer = await db.table('material_transfers').select('*').eq('id', transfer_id).execute()
         
         if not transfer.data:
             raise NotFoundException(detail="Transfer not found")
@@ -273,7 +267,7 @@ class MaterialTransferService:
         if approval.notes:
             update_dict['notes'] = approval.notes
         
-        db.table('material_transfers').update(update_dict).eq('id', transfer_id).execute()
+        await db.table('material_transfers').update(update_dict).eq('id', transfer_id).execute()
         
         return await MaterialTransferService.get_transfer_by_id(transfer_id)
     
@@ -289,7 +283,7 @@ class MaterialTransferService:
         db = get_db()
         
         # Get transfer
-        transfer = db.table('material_transfers').select('*').eq('id', transfer_id).execute()
+        transfer = await db.table('material_transfers').select('*').eq('id', transfer_id).execute()
         
         if not transfer.data:
             raise NotFoundException(detail="Transfer not found")
@@ -299,81 +293,39 @@ class MaterialTransferService:
         if t['status'] != 'Approved':
             raise ValidationException(detail=f"Can only execute approved transfers. Current status: {t['status']}")
         
-        # Update inventory atomically
+        # Both stock legs and the ledger row are applied in one database call
         try:
-            # 1. Deduct from source location
-            source_inv = db.table('inventory').select('*').eq(
-                'product_id', t['product_id']
-            ).eq('location_id', t['from_location_id']).execute()
-            
-            if not source_inv.data:
-                raise ValidationException(detail="Source inventory not found")
-            
-            source = source_inv.data[0]
-            new_available = Decimal(str(source['available_qty'])) - Decimal(str(t['quantity']))
-            
-            if new_available < 0:
-                raise ValidationException(detail="Insufficient inventory at source")
-            
-            db.table('inventory').update({
-                'available_qty': float(new_available),
-                'updated_at': datetime.utcnow().isoformat()
-            }).eq('id', source['id']).execute()
-            
-            # 2. Add to destination location
-            dest_inv = db.table('inventory').select('*').eq(
-                'product_id', t['product_id']
-            ).eq('location_id', t['to_location_id']).execute()
-            
-            if dest_inv.data:
-                # Update existing
-                dest = dest_inv.data[0]
-                new_dest_qty = Decimal(str(dest['available_qty'])) + Decimal(str(t['quantity']))
-                
-                db.table('inventory').update({
-                    'available_qty': float(new_dest_qty),
-                    'updated_at': datetime.utcnow().isoformat()
-                }).eq('id', dest['id']).execute()
-            else:
-                # Insert new
-                db.table('inventory').insert({
-                    'product_id': t['product_id'],
-                    'location_id': t['to_location_id'],
-                    'available_qty': float(t['quantity']),
-                    'allocated_qty': 0
-                }).execute()
-            
-            # 3. Log inventory transaction
-            db.table('inventory_transactions').insert({
-                'product_id': t['product_id'],
-                'transaction_type': 'TRANSFER',
-                'quantity': float(t['quantity']),
-                'from_location_id': t['from_location_id'],
-                'to_location_id': t['to_location_id'],
-                'reference_id': transfer_id,
-                'reference_type': 'material_transfer',
-                'notes': f"Transfer {t['transfer_number']}",
-                'performed_by': user_id
+            await db.rpc('apply_stock_movement', {
+                'p_product_id': t['product_id'],
+                'p_transaction_type': 'TRANSFER',
+                'p_quantity': float(t['quantity']),
+                'p_from_location_id': t['from_location_id'],
+                'p_to_location_id': t['to_location_id'],
+                'p_lot_number': t.get('lot_number'),
+                'p_reference_id': transfer_id,
+                'p_reference_type': 'material_transfer',
+                'p_notes': f"Transfer {t['transfer_number']}",
+                'p_performed_by': user_id
             }).execute()
-            
-            # 4. Update transfer status
-            db.table('material_transfers').update({
-                'status': 'Completed',
-                'executed_by': user_id,
-                'executed_at': datetime.utcnow().isoformat()
-            }).eq('id', transfer_id).execute()
-            
-            return await MaterialTransferService.get_transfer_by_id(transfer_id)
-            
-        except Exception as e:
-            raise Exception(f"Transfer execution failed: {str(e)}")
+        except APIError as e:
+            if e.code in STOCK_MOVEMENT_ERROR_CODES:
+                raise ValidationException(detail=e.message)
+            raise
+        
+        await db.table('material_transfers').update({
+            'status': 'Completed',
+            'executed_by': user_id,
+            'executed_at': datetime.utcnow().isoformat()
+        }).eq('id', transfer_id).execute()
+        
+        return await MaterialTransferService.get_transfer_by_id(transfer_id)
     
     @staticmethod
     async def cancel_transfer(transfer_id: str) -> dict:
         """Cancel transfer (only if Pending or Approved)"""
         db = get_db()
         
-        transfer = db.table('material_transfers').select('status').eq('id', transfer_id).execute()
+        transfer = await db.table('material_transfers').select('status').eq('id', transfer_id).execute()
         
         if not transfer.data:
             raise NotFoundException(detail="Transfer not found")
@@ -381,7 +333,7 @@ class MaterialTransferService:
         if transfer.data[0]['status'] not in ['Pending', 'Approved']:
             raise ValidationException(detail=f"Cannot cancel transfer with status: {transfer.data[0]['status']}")
         
-        db.table('material_transfers').update({
+        await db.table('material_transfers').update({
             'status': 'Cancelled',
             'updated_at': datetime.utcnow().isoformat()
         }).eq('id', transfer_id).execute()
@@ -392,12 +344,21 @@ class MaterialTransferService:
     # WIP STAGE TRANSFER METHODS
     # =============================================
     
+    @staticmethod
+    async def _get_active_stages() -> List[dict]:
+        """Active WIP stages in sequence, served from the reference cache"""
+        stages = reference_cache.get_list('wip_stages', 'active')
+        if stages is None:
+            db = get_db()
+            result = await db.table('wip_stages').select('*').eq('is_active', True).order('sequence_number').execute()
+            stages = result.data
+            reference_cache.put_list('wip_stages', 'active', stages)
+        return stages
+    
     @staticmethod
     async def list_wip_stages() -> List[WIPStageResponse]:
         """Get all WIP stages in sequence"""
-        db = get_db()
-        
-        stages = db.table('wip_stages').select('*').eq('is_active', True).order('sequence_number').execute()
+        stages = await MaterialTransferService._get_active_stages()
         
         return [
             WIPStageResponse(
@@ -412,7 +373,7 @@ class MaterialTransferService:
                 created_at=datetime.fromisoformat(s['created_at'].replace('Z', '+00:00')),
                 updated_at=datetime.fromisoformat(s['updated_at'].replace('Z', '+00:00'))
             )
-            for s in stages.data
+            for s in stages
         ]
     
     @staticmethod
@@ -420,16 +381,22 @@ class MaterialTransferService:
         """Get WIP stages with current unit counts (for UI display)"""
         db = get_db()
         
-        stages = db.table('wip_stages').select('*').eq('is_active', True).order('sequence_number').execute()
+        stages = await MaterialTransferService._get_active_stages()
         
-        result = []
-        for stage in stages.data:
-            # Count units in this stage
-            tracking = db.table('order_stage_tracking').select('quantity_in_stage').eq(
-                'current_stage_id', stage['id']
+        # Count units per stage in one query
+        units_by_stage = {}
+        if stages:
+            tracking = await db.table('order_stage_tracking').select('current_stage_id', 'quantity_in_stage').in_(
+                'current_stage_id', [stage['id'] for stage in stages]
             ).execute()
-            
-            total_units = sum(Decimal(str(t['quantity_in_stage'])) for t in tracking.data) if tracking.data else Decimal('0')
+            for t in tracking.data:
+                units_by_stage[t['current_stage_id']] = (
+                    units_by_stage.get(t['current_stage_id'], Decimal('0')) + Decimal(str(t['quantity_in_stage']))
+                )
+        
+        result = []
+        for stage in stages:
+            total_units = units_by_stage.get(stage['id'], Decimal('0'))
             
             result.append(WIPStageWithUnits(
                 id=stage['id'],
@@ -454,18 +421,18 @@ class MaterialTransferService:
         db = get_db()
         
         # Validate order exists
-        order = db.table('production_orders').select('*').eq('id', wip_transfer.order_id).execute()
+        order = await db.table('production_orders').select('*').eq('id', wip_transfer.order_id).execute()
         if not order.data:
             raise NotFoundException(detail="Production order not found")
         
         # Validate stages
-        to_stage = db.table('wip_stages').select('*').eq('id', wip_transfer.to_stage_id).execute()
+        to_stage = await db.table('wip_stages').select('*').eq('id', wip_transfer.to_stage_id).execute()
         if not to_stage.data:
             raise NotFoundException(detail="Destination stage not found")
         
         from_stage_name = None
         if wip_transfer.from_stage_id:
-            from_stage = db.table('wip_stages').select('name').eq('id', wip_transfer.from_stage_id).execute()
+            from_stage = await db.table('wip_stages').select('name').eq('id', wip_transfer.from_stage_id).execute()
             from_stage_name = from_stage.data[0]['name'] if from_stage.data else None
         
         # Create WIP stage transfer record
@@ -480,31 +447,31 @@ class MaterialTransferService:
             'transferred_by': user_id
         }
         
-        result = db.table('wip_stage_transfers').insert(wip_transfer_dict).execute()
+        result = await db.table('wip_stage_transfers').insert(wip_transfer_dict).execute()
         
         # Update order stage tracking
         if wip_transfer.from_stage_id:
             # Reduce quantity in previous stage
-            db.table('order_stage_tracking').update({
+            await db.table('order_stage_tracking').update({
                 'quantity_in_stage': Decimal(str(wip_transfer.quantity)) * -1,  # Reduce
                 'updated_at': datetime.utcnow().isoformat()
             }).eq('order_id', wip_transfer.order_id).eq('current_stage_id', wip_transfer.from_stage_id).execute()
         
         # Add to new stage
-        existing_tracking = db.table('order_stage_tracking').select('*').eq(
+        existing_tracking = await db.table('order_stage_tracking').select('*').eq(
             'order_id', wip_transfer.order_id
         ).eq('current_stage_id', wip_transfer.to_stage_id).execute()
         
         if existing_tracking.data:
             # Update existing
             new_qty = Decimal(str(existing_tracking.data[0]['quantity_in_stage'])) + wip_transfer.quantity
-            db.table('order_stage_tracking').update({
+            await db.table('order_stage_tracking').update({
                 'quantity_in_stage': float(new_qty),
                 'updated_at': datetime.utcnow().isoformat()
             }).eq('id', existing_tracking.data[0]['id']).execute()
         else:
             # Insert new
-            db.table('order_stage_tracking').insert({
+            await db.table('order_stage_tracking').insert({
                 'order_id': wip_transfer.order_id,
                 'current_stage_id': wip_transfer.to_stage_id,
                 'quantity_in_stage': float(wip_transfer.quantity),
@@ -512,10 +479,9 @@ class MaterialTransferService:
             }).execute()
         
         # Get user name
-        user = db.table('users').select('full_name', 'username').eq('id', user_id).execute()
-        user_name = user.data[0].get('full_name') or user.data[0].get('username') if user.data else None
+        user_name = user_display_name(await get_loader().load('users', user_id))
         
-        return WIPStageTransferResponse(
+        response = WIPStageTransferResponse(
             id=result.data[0]['id'],
             transfer_id=None,
             order_id=wip_transfer.order_id,
@@ -532,6 +498,13 @@ class MaterialTransferService:
             transferred_by_name=user_name,
             transferred_at=datetime.utcnow()
         )
+        
+        await publish('wip', 'wip:transfer', response.model_dump(mode='json', include={
+            'id', 'order_id', 'order_number', 'from_stage_id', 'from_stage_name',
+            'to_stage_id', 'to_stage_name', 'quantity', 'unit', 'transferred_at'
+        }))
+        
+        return response
 
 
 # Singleton instance
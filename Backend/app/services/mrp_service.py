@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.database import get_db
+from app.core.cache import Cache
+from app.core.loader import get_loader, begin_request_scope, end_request_scope
+from app.core.exceptions import NotFoundException
+from app.services.bom_graph import BOMGraph
+from app.schemas.production_order import (
+    MRPMaterialShortage, MRPOrderResult, MRPPurchaseSuggestion, MRPRunResult
+)
+
+logger = logging.getLogger(__name__)
+
+# Netting order: most urgent first, then earliest due date
+PRIORITY_RANK = {'Urgent': 0, 'High': 1, 'Medium': 2, 'Low': 3}
+
+# Quantities below this are treated as zero (float rounding)
+QTY_EPSILON = 1e-9
+
+
+def _qty(value: float) -> Decimal:
+    return Decimal(str(round(float(value), 3)))
+
+
+class MRPService:
+    """
+    Material requirements planning across all open production orders.
+
+    Requirements of every Planned / In Progress order are netted against
+    free on-hand stock (available - allocated) and then in-transit stock,
+    material by material, in priority / due-date order: an order only
+    gets what the orders ahead of it left over. Netting is done on
+    pandas arrays (a grouped running sum per material), so a plant-wide
+    run costs two database calls (inputs and the BOM graph) plus a few
+    vectorised passes.
+    """
+
+    def __init__(self):
+        self._runs = Cache('mrp_runs', MRPRunResult, ttl_seconds=settings.MRP_RESULT_TTL_SECONDS)
+        self._tasks: Set[asyncio.Task] = set()
+
+    # =============================================
+    # NETTING
+    # =============================================
+
+    @staticmethod
+    def net_requirements(
+        orders: pd.DataFrame,
+        requirements: pd.DataFrame,
+        stock: pd.DataFrame,
+        include_in_transit: bool = True
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Net requirements against stock.
+
+        orders: id, priority, due_date, created_at, order_number
+        requirements: order_id, material_id, gross_qty, allocated_qty
+        stock: material_id, available_qty, allocated_qty, in_transit_qty
+
+        Returns (orders with `sequence`, one row per requirement with
+        covered/shortage quantities, one row per material).
+        """
+        orders = orders.assign(
+            _rank=orders['priority'].map(PRIORITY_RANK).fillna(len(PRIORITY_RANK))
+        ).sort_values(['_rank', 'due_date', 'created_at', 'order_number'], kind='stable')
+        orders = orders.drop(columns='_rank').assign(sequence=np.arange(1, len(orders) + 1))
+
+        lines = requirements.merge(orders[['id', 'sequence']], left_on='order_id', right_on='id')
+        lines = lines.drop(columns='id')
+        lines['net_qty'] = np.maximum(lines['gross_qty'] - lines['allocated_qty'], 0.0)
+
+        stock = stock.set_index('material_id')
+        free = np.maximum(stock['available_qty'] - stock['allocated_qty'], 0.0)
+        transit = stock['in_transit_qty'] if include_in_transit else pd.Series(0.0, index=stock.index)
+        lines['free_on_hand_qty'] = lines['material_id'].map(free).fillna(0.0)
+        lines['in_transit_qty'] = lines['material_id'].map(transit).fillna(0.0)
+
+        # Demand of the orders ahead of each line, per material
+        lines = lines.sort_values(['material_id', 'sequence'], kind='stable')
+        ahead = lines.groupby('material_id', sort=False)['net_qty'].cumsum() - lines['net_qty']
+
+        net = lines['net_qty'].to_numpy()
+        ahead = ahead.to_numpy()
+        on_hand = lines['free_on_hand_qty'].to_numpy()
+        in_transit = lines['in_transit_qty'].to_numpy()
+
+        covered_on_hand = np.clip(on_hand - ahead, 0.0, net)
+        covered_total = np.clip(on_hand + in_transit - ahead, 0.0, net)
+        shortage = net - covered_total
+        shortage[shortage < QTY_EPSILON] = 0.0
+
+        lines['covered_on_hand_qty'] = covered_on_hand
+        lines['covered_in_transit_qty'] = covered_total - covered_on_hand
+        lines['shortage_qty'] = shortage
+        lines['is_short'] = shortage > 0
+
+        materials = lines.groupby('material_id', sort=True).agg(
+            net_requirement_qty=('net_qty', 'sum'),
+            free_on_hand_qty=('free_on_hand_qty', 'first'),
+            in_transit_qty=('in_transit_qty', 'first'),
+            shortage_qty=('shortage_qty', 'sum'),
+            orders_short=('is_short', 'sum')
+        ).reset_index()
+        # Round purchases up so the suggestion always covers the shortage
+        materials['suggested_purchase_qty'] = np.ceil(materials['shortage_qty'] * 1000 - QTY_EPSILON) / 1000
+
+        return orders, lines, materials
+
+    @staticmethod
+    async def load_inputs() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Open orders, outstanding requirements and stock (see migration 028).
+        Orders without recorded materials are exploded through their BOM,
+        so only leaf materials are required and sub-assemblies are not
+        netted or purchased.
+        """
+        db = get_db()
+        result = await db.rpc('get_mrp_inputs', {}).execute()
+        data = result.data or {}
+
+        bom_orders = data.get('bom_orders') or []
+        graph = await BOMGraph.load(o['bom_id'] for o in bom_orders)
+        exploded = []
+        for order in bom_orders:
+            batches = float(order['quantity']) / float(order['batch_size'] or 100)
+            for material_id, leaf in graph.explode(order['bom_id']).items():
+                exploded.append({
+                    'order_id': order['order_id'],
+                    'material_id': material_id,
+                    'gross_qty': batches * float(leaf['total_quantity']),
+                    'allocated_qty': 0.0
+                })
+
+        orders = pd.DataFrame(
+            data.get('orders') or [],
+            columns=['id', 'order_number', 'product_id', 'quantity', 'status', 'priority', 'due_date', 'created_at']
+        )
+        requirements = pd.DataFrame(
+            (data.get('requirements') or []) + exploded,
+            columns=['order_id', 'material_id', 'gross_qty', 'allocated_qty']
+        )
+        stock = pd.DataFrame(
+            data.get('stock') or [],
+            columns=['material_id', 'available_qty', 'allocated_qty', 'in_transit_qty']
+        )
+
+        for frame, columns in (
+            (requirements, ['gross_qty', 'allocated_qty']),
+            (stock, ['available_qty', 'allocated_qty', 'in_transit_qty'])
+        ):
+            for column in columns:
+                frame[column] = pd.to_numeric(frame[column]).fillna(0.0).astype(float)
+        return orders, requirements, stock
+
+    # =============================================
+    # RUNS
+    # =============================================
+
+    async def run(self, include_in_transit: bool = True, run_id: Optional[str] = None) -> MRPRunResult:
+        """Run MRP over all open orders and return per-order shortages and purchase suggestions."""
+        started_at = datetime.now(timezone.utc)
+        orders, requirements, stock = await self.load_inputs()
+
+        # Netting is CPU-bound; keep it off the event loop
+        orders, lines, materials = await asyncio.to_thread(
+            self.net_requirements, orders, requirements, stock, include_in_transit
+        )
+
+        shortages = lines[lines['shortage_qty'] > 0]
+        products = await get_loader().load_many(
+            'products',
+            list(orders['product_id']) + list(shortages['material_id']) + list(materials['material_id'])
+        )
+
+        def material_fields(material_id: str) -> dict:
+            product = products.get(material_id, {})
+            return {
+                'material_code': product.get('code', ''),
+                'material_name': product.get('name', ''),
+                'unit': product.get('unit')
+            }
+
+        shortages_by_order: Dict[str, List[MRPMaterialShortage]] = {}
+        for row in shortages.itertuples(index=False):
+            shortages_by_order.setdefault(row.order_id, []).append(MRPMaterialShortage(
+                material_id=row.material_id,
+                **material_fields(row.material_id),
+                gross_qty=_qty(row.gross_qty),
+                allocated_qty=_qty(row.allocated_qty),
+                net_qty=_qty(row.net_qty),
+                covered_on_hand_qty=_qty(row.covered_on_hand_qty),
+                covered_in_transit_qty=_qty(row.covered_in_transit_qty),
+                shortage_qty=_qty(row.shortage_qty)
+            ))
+        line_counts = lines.groupby('order_id').size().to_dict()
+
+        order_results = []
+        for row in orders.itertuples(index=False):
+            product = products.get(row.product_id, {})
+            order_shortages = shortages_by_order.get(row.id, [])
+            order_results.append(MRPOrderResult(
+                order_id=row.id,
+                order_number=row.order_number,
+                product_id=row.product_id,
+                product_code=product.get('code', ''),
+                product_name=product.get('name', ''),
+                status=row.status,
+                priority=row.priority,
+                due_date=date.fromisoformat(str(row.due_date)[:10]),
+                sequence=int(row.sequence),
+                can_produce=not order_shortages,
+                material_count=int(line_counts.get(row.id, 0)),
+                shortages=order_shortages
+            ))
+
+        purchases = [
+            MRPPurchaseSuggestion(
+                material_id=row.material_id,
+                **material_fields(row.material_id),
+                net_requirement_qty=_qty(row.net_requirement_qty),
+                free_on_hand_qty=_qty(row.free_on_hand_qty),
+                in_transit_qty=_qty(row.in_transit_qty),
+                shortage_qty=_qty(row.shortage_qty),
+                suggested_purchase_qty=_qty(row.suggested_purchase_qty),
+                orders_short=int(row.orders_short)
+            )
+            for row in materials[materials['shortage_qty'] > 0].itertuples(index=False)
+        ]
+
+        completed_at = datetime.now(timezone.utc)
+        return MRPRunResult(
+            run_id=run_id or str(uuid.uuid4()),
+            status='Completed',
+            started_at=started_at,
+            completed_at=completed_at,
+            duration_ms=int((completed_at - started_at).total_seconds() * 1000),
+            include_in_transit=include_in_transit,
+            order_count=len(order_results),
+            material_count=len(materials),
+            orders_short=sum(1 for o in order_results if not o.can_produce),
+            orders=order_results,
+            purchases=purchases
+        )
+
+    async def start_run(self, include_in_transit: bool = True) -> MRPRunResult:
+        """Start a run in the background; poll `get_run` with the returned run_id."""
+        pending = MRPRunResult(
+            run_id=str(uuid.uuid4()),
+            status='Running',
+            started_at=datetime.now(timezone.utc),
+            include_in_transit=include_in_transit
+        )
+        await self._runs.set(pending.run_id, pending)
+
+        task = asyncio.create_task(self._run_in_background(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return pending
+
+    async def _run_in_background(self, pending: MRPRunResult):
+        token = begin_request_scope()
+        try:
+            result = await self.run(pending.include_in_transit, run_id=pending.run_id)
+        except Exception as e:
+            logger.error(f"MRP run {pending.run_id} failed: {e}")
+            result = pending.model_copy(update={
+                'status': 'Failed',
+                'completed_at': datetime.now(timezone.utc),
+                'error': str(e)
+            })
+        finally:
+            end_request_scope(token)
+        await self._runs.set(pending.run_id, result)
+
+    async def get_run(self, run_id: str) -> MRPRunResult:
+        run = await self._runs.get(run_id)
+        if run is None:
+            raise NotFoundException(detail="MRP run not found or expired")
+        return run
+
+
+# Singleton instance
+mrp_service = MRPService()
@@ -30,7 +30,7 @@ class NotificationService:
         db = get_db()
         
         # Get alert details
-        alert = db.table('wip_alert_history').select('*').eq('id', alert_id).execute()
+        alert = await db.table('wip_alert_history').select('*').eq('id', alert_id).execute()
         
         if not alert.data:
             raise Exception(f"Alert {alert_id} not found")
@@ -51,7 +51,7 @@ class NotificationService:
                     result = {'status': 'failed', 'error': 'Unsupported notification type'}
                 
                 # Log notification
-                db.table('wip_notification_log').insert({
+                await db.table('wip_notification_log').insert({
                     'alert_history_id': alert_id,
                     'notification_type': notification_type,
                     'recipient': recipient,
@@ -159,7 +159,7 @@ class NotificationService:
         
         try:
             # Create in-app notification (stored in database for user to view)
-            db.table('notifications').insert({
+            await db.table('notifications').insert({
                 'user_id': recipient,  # Assuming recipient is user_id for in-app
                 'type': 'wip_alert',
                 'title': f"WIP Alert: {alert_data['stage_name']}",
@@ -194,7 +194,7 @@ class NotificationService:
         
         try:
             # Get users with specified roles
-            users = db.table('users').select('email, user_roles(roles(name))').execute()
+            users = await db.table('users').select('email, user_roles(roles(name))').execute()
             
             supervisor_emails = []
             for user in users.data:
@@ -214,7 +214,7 @@ class NotificationService:
         db = get_db()
         
         # Get unacknowledged alerts from last 24 hours
-        alerts = db.table('wip_alert_history').select('*').eq(
+        alerts = await db.table('wip_alert_history').select('*').eq(
             'is_acknowledged', False
         ).gte(
             'created_at', datetime.utcnow().replace(hour=0, minute=0, second=0).isoformat()
@@ -222,7 +222,7 @@ class NotificationService:
         
         for alert in alerts.data:
             # Get alert configuration
-            config = db.table('wip_alert_config').select('*').eq('id', alert['alert_config_id']).execute()
+            config = await db.table('wip_alert_config').select('*').eq('id', alert['alert_config_id']).execute()
             
             if not config.data:
                 continue
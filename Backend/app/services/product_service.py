@@ -1,6 +1,8 @@
 from typing import List, Optional
 from datetime import datetime
 from app.database import get_db
+from app.core.loader import get_loader
+from app.core.cache import reference_cache
 from app.schemas.product import ProductCreate, ProductUpdate, ProductResponse, ProductListItem
 from app.core.exceptions import NotFoundException, ConflictException
 
@@ -13,7 +15,7 @@ class ProductService:
         db = get_db()
         
         # Check if code already exists
-        existing = db.table('products').select('id').eq('code', product_data.code).execute()
+        existing = await db.table('products').select('id').eq('code', product_data.code).execute()
         if existing.data:
             raise ConflictException(detail=f"Product with code '{product_data.code}' already exists")
         
@@ -21,11 +23,12 @@ class ProductService:
         product_dict = product_data.model_dump()
         product_dict['created_by'] = user_id
         
-        result = db.table('products').insert(product_dict).execute()
+        result = await db.table('products').insert(product_dict).execute()
         
         if not result.data:
             raise Exception("Failed to create product")
         
+        reference_cache.put('products', result.data[0])
         return ProductResponse(**result.data[0])
     
     @staticmethod
@@ -33,7 +36,7 @@ class ProductService:
         """Get product by ID."""
         db = get_db()
         
-        result = db.table('products').select('*').eq('id', product_id).execute()
+        result = await db.table('products').select('*').eq('id', product_id).execute()
         
         if not result.data:
             raise NotFoundException(detail="Product not found")
@@ -45,7 +48,7 @@ class ProductService:
         """Get product by code."""
         db = get_db()
         
-        result = db.table('products').select('*').eq('code', code).execute()
+        result = await db.table('products').select('*').eq('code', code).execute()
         
         if not result.data:
             raise NotFoundException(detail=f"Product with code '{code}' not found")
@@ -79,7 +82,7 @@ class ProductService:
                 f"code.ilike.%{search}%,name.ilike.%{search}%,description.ilike.%{search}%"
             )
         
-        result = query.order('name').range(offset, offset + limit - 1).execute()
+        result = await query.order('name').range(offset, offset + limit - 1).execute()
         
         return [ProductResponse(**product) for product in result.data]
     
@@ -94,7 +97,7 @@ class ProductService:
         if search:
             query = query.or_(f"code.ilike.%{search}%,name.ilike.%{search}%")
         
-        result = query.order('name').limit(100).execute()
+        result = await query.order('name').limit(100).execute()
         
         return [ProductListItem(**product) for product in result.data]
     
@@ -109,7 +112,7 @@ class ProductService:
         if search:
             query = query.or_(f"code.ilike.%{search}%,name.ilike.%{search}%")
         
-        result = query.order('name').limit(100).execute()
+        result = await query.order('name').limit(100).execute()
         
         return [ProductListItem(**product) for product in result.data]
     
@@ -123,18 +126,20 @@ class ProductService:
         db = get_db()
         
         # Check if product exists
-        existing = db.table('products').select('id').eq('id', product_id).execute()
+        existing = await db.table('products').select('id').eq('id', product_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Product not found")
         
         # Build update dict
         update_dict = update_data.model_dump(exclude_unset=True)
         if update_dict:
-            result = db.table('products').update(update_dict).eq('id', product_id).execute()
+            result = await db.table('products').update(update_dict).eq('id', product_id).execute()
             
             if not result.data:
                 raise Exception("Failed to update product")
             
+            await reference_cache.invalidate('products', product_id)
+            get_loader().clear('products', product_id)
             return ProductResponse(**result.data[0])
         
         return await ProductService.get_product_by_id(product_id)
@@ -145,25 +150,27 @@ class ProductService:
         db = get_db()
         
         # Check if product has BOMs
-        boms = db.table('boms').select('id').eq('product_id', product_id).execute()
+        boms = await db.table('boms').select('id').eq('product_id', product_id).execute()
         if boms.data:
             raise ConflictException(
                 detail="Cannot delete product with existing BOMs. Deactivate instead."
             )
         
         # Check if used in any BOM materials
-        materials = db.table('bom_materials').select('id').eq('material_id', product_id).execute()
+        materials = await db.table('bom_materials').select('id').eq('material_id', product_id).execute()
         if materials.data:
             raise ConflictException(
                 detail="Cannot delete product used in BOMs. Deactivate instead."
             )
         
         # Deactivate product
-        result = db.table('products').update({'is_active': False}).eq('id', product_id).execute()
+        result = await db.table('products').update({'is_active': False}).eq('id', product_id).execute()
         
         if not result.data:
             raise NotFoundException(detail="Product not found")
         
+        await reference_cache.invalidate('products', product_id)
+        get_loader().clear('products', product_id)
         return {"message": "Product deactivated successfully"}
     
     @staticmethod
@@ -171,7 +178,7 @@ class ProductService:
         """Get all unique product categories."""
         db = get_db()
         
-        result = db.table('products').select('category').execute()
+        result = await db.table('products').select('category').execute()
         
         # Extract unique categories
         categories = list(set(item['category'] for item in result.data if item.get('category')))
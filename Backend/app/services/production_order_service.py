@@ -6,6 +6,8 @@ import io
 import base64
 import json
 from app.database import get_db
+from app.core.loader import get_loader
+from app.core.embedding import Embed, EmbeddedSelect
 from app.schemas.production_order import (
     ProductionOrderCreate, ProductionOrderUpdate, ProductionOrderResponse,
     ProductionOrderListItem, OrderMaterialResponse, OrderStatusUpdate,
@@ -15,16 +17,24 @@ from app.schemas.production_order import (
 from app.core.exceptions import NotFoundException, ValidationException
 
 
+# Order detail with its product and materials (each with its product)
+ORDER_DETAIL_VIEW = EmbeddedSelect(
+    'production_orders', '*',
+    Embed('product', 'products', 'code, name'),
+    Embed('materials', 'order_materials', '*', Embed('product', 'products', 'code, name'), many=True),
+)
+
+
 class ProductionOrderService:
     
     @staticmethod
-    def _generate_order_number() -> str:
+    async def _generate_order_number() -> str:
         """Generate unique order number: PO-YYYY-XXXX"""
         db = get_db()
         year = datetime.now().year
         
         # Get count of orders this year
-        result = db.table('production_orders').select('order_number', count='exact').like(
+        result = await db.table('production_orders').select('order_number', count='exact').like(
             'order_number', f'PO-{year}-%'
         ).execute()
         
@@ -61,7 +71,7 @@ class ProductionOrderService:
         db = get_db()
         
         # Get existing order
-        existing_order = db.table('production_orders').select('*').eq('id', order_id).execute()
+        existing_order = await db.table('production_orders').select('*').eq('id', order_id).execute()
         
         if not existing_order.data:
             raise NotFoundException(detail="Production order not found")
@@ -102,7 +112,7 @@ class ProductionOrderService:
         db = get_db()
         
         # Validate product exists and is finished goods
-        product = db.table('products').select('id', 'category', 'unit').eq(
+        product = await db.table('products').select('id', 'category', 'unit').eq(
             'id', order_data.product_id
         ).execute()
         
@@ -115,7 +125,7 @@ class ProductionOrderService:
         product_unit = product.data[0]['unit']
         
         # Get active BOM for product with version
-        bom = db.table('boms').select('id', 'version', 'batch_size').eq('product_id', order_data.product_id).eq(
+        bom = await db.table('boms').select('id', 'version', 'batch_size').eq('product_id', order_data.product_id).eq(
             'is_active', True
         ).execute()
         
@@ -127,7 +137,7 @@ class ProductionOrderService:
         bom_version = bom_data.get('version', 1)
         
         # Get BOM materials for snapshot
-        bom_materials = db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
+        bom_materials = await db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
         bom_snapshot = {
             'bom_id': bom_id,
             'version': bom_version,
@@ -137,7 +147,7 @@ class ProductionOrderService:
         }
         
         # Generate order number and QR code
-        order_number = ProductionOrderService._generate_order_number()
+        order_number = await ProductionOrderService._generate_order_number()
         qr_code = ProductionOrderService._generate_qr_code(order_number)
         
         # Create production order with BOM version tracking
@@ -163,7 +173,7 @@ class ProductionOrderService:
             'created_by': user_id
         }
         
-        order_result = db.table('production_orders').insert(order_dict).execute()
+        order_result = await db.table('production_orders').insert(order_dict).execute()
         
         if not order_result.data:
             raise Exception("Failed to create production order")
@@ -191,11 +201,11 @@ class ProductionOrderService:
         db = get_db()
         
         # Get BOM details
-        bom = db.table('boms').select('batch_size').eq('id', bom_id).execute()
+        bom = await db.table('boms').select('batch_size').eq('id', bom_id).execute()
         batch_size = Decimal(str(bom.data[0]['batch_size'])) if bom.data else Decimal('100')
         
         # Get BOM materials
-        materials = db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
+        materials = await db.table('bom_materials').select('*').eq('bom_id', bom_id).execute()
         
         for mat in materials.data:
             mat_quantity = Decimal(str(mat['quantity']))
@@ -207,7 +217,7 @@ class ProductionOrderService:
             total_cost = required_qty * unit_cost
             
             # Insert order material
-            db.table('order_materials').insert({
+            await db.table('order_materials').insert({
                 'order_id': order_id,
                 'product_id': mat['material_id'],
                 'required_qty': float(required_qty),
@@ -244,22 +254,32 @@ class ProductionOrderService:
             today = date.today().isoformat()
             query = query.lt('due_date', today).neq('status', 'Completed').neq('status', 'Cancelled')
         
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        
+        products = await get_loader().load_many('products', (o['product_id'] for o in result.data))
+        
+        # Get materials status for the whole page in one query
+        materials_by_order = {}
+        order_ids = [o['id'] for o in result.data]
+        if order_ids:
+            materials = await db.table('order_materials').select('order_id', 'availability_status').in_(
+                'order_id', order_ids
+            ).execute()
+            for m in materials.data:
+                materials_by_order.setdefault(m['order_id'], []).append(m)
         
         orders = []
         for order in result.data:
-            # Get product info
-            product = db.table('products').select('code', 'name').eq('id', order['product_id']).execute()
+            product = products.get(order['product_id'])
             
-            if not product.data:
+            if not product:
                 continue
             
-            # Get materials status
-            materials = db.table('order_materials').select('availability_status').eq('order_id', order['id']).execute()
+            order_materials = materials_by_order.get(order['id'], [])
             
-            total_materials = len(materials.data)
-            shortage = sum(1 for m in materials.data if m['availability_status'] == 'Shortage')
-            available = sum(1 for m in materials.data if m['availability_status'] == 'Available')
+            total_materials = len(order_materials)
+            shortage = sum(1 for m in order_materials if m['availability_status'] == 'Shortage')
+            available = sum(1 for m in order_materials if m['availability_status'] == 'Available')
             
             if total_materials == 0:
                 materials_status = "No Materials"
@@ -279,16 +299,16 @@ class ProductionOrderService:
             if search:
                 search_lower = search.lower()
                 if (search_lower not in order['order_number'].lower() and
-                    search_lower not in product.data[0]['code'].lower() and
-                    search_lower not in product.data[0]['name'].lower()):
+                    search_lower not in product['code'].lower() and
+                    search_lower not in product['name'].lower()):
                     continue
             
             orders.append(ProductionOrderListItem(
                 id=order['id'],
                 order_number=order['order_number'],
                 product_id=order['product_id'],
-                product_code=product.data[0]['code'],
-                product_name=product.data[0]['name'],
+                product_code=product['code'],
+                product_name=product['name'],
                 quantity=Decimal(str(order['quantity'])),
                 unit=order['unit'],
                 due_date=due_date_obj,
@@ -307,37 +327,29 @@ class ProductionOrderService:
         """Get production order by ID with all materials"""
         db = get_db()
         
-        # Get order
-        order_result = db.table('production_orders').select('*').eq('id', order_id).execute()
+        # Get order with product and materials in one round trip
+        order_result = await ORDER_DETAIL_VIEW.query(db).eq('id', order_id).execute()
         
         if not order_result.data:
             raise NotFoundException(detail="Production order not found")
         
-        order = order_result.data[0]
+        order = ORDER_DETAIL_VIEW.flatten(order_result.data[0])
         
-        # Get product info
-        product = db.table('products').select('code', 'name').eq('id', order['product_id']).execute()
-        product_code = product.data[0]['code'] if product.data else None
-        product_name = product.data[0]['name'] if product.data else None
-        
-        # Get order materials
-        materials_result = db.table('order_materials').select('*').eq('order_id', order_id).execute()
+        product_code = order.get('product_code')
+        product_name = order.get('product_name')
         
         materials = []
         total_cost = Decimal('0')
         
-        for mat in materials_result.data:
-            # Get material product info (order_materials uses 'product_id' column)
-            mat_product = db.table('products').select('code', 'name').eq('id', mat['product_id']).execute()
-            
+        for mat in order['materials']:
             mat_total_cost = Decimal('0')  # total_cost column doesn't exist in schema
             
             materials.append(OrderMaterialResponse(
                 id=mat['id'],
                 order_id=mat['order_id'],
                 material_id=mat['product_id'],  # Map product_id to material_id for response
-                material_code=mat_product.data[0]['code'] if mat_product.data else None,
-                material_name=mat_product.data[0]['name'] if mat_product.data else None,
+                material_code=mat.get('product_code'),
+                material_name=mat.get('product_name'),
                 required_qty=Decimal(str(mat['required_qty'])),
                 allocated_qty=Decimal(str(mat.get('allocated_qty', 0))),
                 issued_qty=Decimal(str(mat.get('issued_qty', 0))),
@@ -383,7 +395,7 @@ class ProductionOrderService:
         db = get_db()
         
         # Check if order exists
-        existing = db.table('production_orders').select('id', 'status').eq('id', order_id).execute()
+        existing = await db.table('production_orders').select('id', 'status').eq('id', order_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Production order not found")
         
@@ -426,7 +438,7 @@ class ProductionOrderService:
         if update_data.production_stage is not None:
             update_dict['production_stage'] = update_data.production_stage
         
-        db.table('production_orders').update(update_dict).eq('id', order_id).execute()
+        await db.table('production_orders').update(update_dict).eq('id', order_id).execute()
         
         return await ProductionOrderService.get_order_by_id(order_id)
     
@@ -439,7 +451,7 @@ class ProductionOrderService:
         db = get_db()
         
         # Check if order exists
-        existing = db.table('production_orders').select('id', 'status', 'is_archived').eq('id', order_id).execute()
+        existing = await db.table('production_orders').select('id', 'status', 'is_archived').eq('id', order_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Production order not found")
         
@@ -457,7 +469,7 @@ class ProductionOrderService:
             'archived_by': user_id
         }
         
-        db.table('production_orders').update(update_dict).eq('id', order_id).execute()
+        await db.table('production_orders').update(update_dict).eq('id', order_id).execute()
         
         return await ProductionOrderService.get_order_by_id(order_id)
     
@@ -470,7 +482,7 @@ class ProductionOrderService:
         db = get_db()
         
         # Check if order exists
-        existing = db.table('production_orders').select('id', 'status').eq('id', order_id).execute()
+        existing = await db.table('production_orders').select('id', 'status').eq('id', order_id).execute()
         if not existing.data:
             raise NotFoundException(detail="Production order not found")
         
@@ -486,7 +498,7 @@ class ProductionOrderService:
         if user_id:
             update_dict['updated_by'] = user_id
         
-        db.table('production_orders').update(update_dict).eq('id', order_id).execute()
+        await db.table('production_orders').update(update_dict).eq('id', order_id).execute()
         
         return {"message": "Production order cancelled successfully"}
     
@@ -508,16 +520,14 @@ class ProductionOrderService:
         from app.services.bom_service import bom_service
         from app.schemas.production_order import OrderMaterialWithShortage, ProductionOrderValidation
         
-        db = get_db()
-        
         # Get product details
-        product = db.table('products').select('code', 'name').eq('id', product_id).execute()
+        product = await get_loader().load('products', product_id)
         
-        if not product.data:
+        if not product:
             raise NotFoundException(detail="Product not found")
         
-        product_code = product.data[0]['code']
-        product_name = product.data[0]['name']
+        product_code = product['code']
+        product_name = product['name']
         
         # Use BOM service to calculate shortages
         shortage_calc = await bom_service.calculate_requirements_with_shortages(
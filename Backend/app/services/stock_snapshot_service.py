@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from app.config import settings
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class StockSnapshotService:
+    """
+    Takes stock balance snapshots every STOCK_SNAPSHOT_INTERVAL_HOURS.
+
+    Snapshot times are aligned to the interval (midnight UTC for daily
+    snapshots) and trail the clock by STOCK_SNAPSHOT_LAG_MINUTES so
+    in-flight movements are committed first. take_stock_snapshot is
+    idempotent, so every worker can run the job.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def due_snapshot_at(now: Optional[datetime] = None) -> datetime:
+        """Latest interval boundary that is at least the lag in the past."""
+        interval = timedelta(hours=settings.STOCK_SNAPSHOT_INTERVAL_HOURS)
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=settings.STOCK_SNAPSHOT_LAG_MINUTES)
+        return _EPOCH + ((cutoff - _EPOCH) // interval) * interval
+
+    @staticmethod
+    async def take_snapshot(snapshot_at: Optional[datetime] = None) -> dict:
+        """Take the snapshot for `snapshot_at` (default: the one due now)."""
+        db = get_db()
+        snapshot_at = snapshot_at or StockSnapshotService.due_snapshot_at()
+
+        result = await db.rpc('take_stock_snapshot', {
+            'p_snapshot_at': snapshot_at.isoformat()
+        }).execute()
+
+        return {'snapshot_at': snapshot_at, 'row_count': result.data or 0}
+
+    async def _run(self):
+        interval = timedelta(hours=settings.STOCK_SNAPSHOT_INTERVAL_HOURS)
+        lag = timedelta(minutes=settings.STOCK_SNAPSHOT_LAG_MINUTES)
+        while True:
+            try:
+                snapshot = await self.take_snapshot()
+                if snapshot['row_count']:
+                    logger.info(f"Stock snapshot {snapshot['snapshot_at'].isoformat()}: {snapshot['row_count']} rows")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Stock snapshot failed: {e}")
+
+            next_run = self.due_snapshot_at() + interval + lag
+            delay = (next_run - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(max(delay, 60))
+
+    async def start(self):
+        if settings.STOCK_SNAPSHOT_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Singleton instance
+stock_snapshot_service = StockSnapshotService()
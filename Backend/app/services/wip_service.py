@@ -1,12 +1,23 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from decimal import Decimal
 from app.database import get_db
+from app.core.live import publish, alerts_room
 from app.schemas.wip import (
     WorkingOrderCreate, WorkingOrderUpdate, WorkingOrderResponse, WorkingOrderListItem,
     WIPStageMetricsResponse, WIPStageMetricsListItem, WIPDashboardResponse,
     WIPSummaryStats, BottleneckAlert, StagePerformanceHistoryResponse
 )
+from app.schemas.alert import AlertHistoryResponse
+
+# Stage metric columns pushed to live WIP boards
+LIVE_STAGE_COLUMNS = 'id, stage_name, stage_sequence, orders_count, units_count, avg_time_minutes, utilization_percentage, health_status'
+
+# Working order fields pushed to live WIP boards
+LIVE_ORDER_FIELDS = {
+    'id', 'work_order_number', 'production_order_id', 'operation', 'workstation',
+    'status', 'target_qty', 'completed_qty', 'rejected_qty', 'priority'
+}
 
 
 class WIPService:
@@ -25,7 +36,7 @@ class WIPService:
         db = get_db()
         
         # Generate work order number
-        result = db.rpc('nextval', {'sequence_name': 'working_order_seq'}).execute()
+        result = await db.rpc('nextval', {'sequence_name': 'working_order_seq'}).execute()
         seq_num = result.data
         work_order_number = f"WO-{datetime.now().year}-{str(seq_num).zfill(4)}"
         
@@ -36,15 +47,18 @@ class WIPService:
             'created_by': created_by
         }
         
-        result = db.table('working_orders').insert(insert_data).execute()
+        result = await db.table('working_orders').insert(insert_data).execute()
         
         if not result.data:
             raise Exception("Failed to create working order")
         
+        order = WorkingOrderResponse(**result.data[0])
+        await WIPService._publish_order(order)
+        
         # Update WIP metrics
         await WIPService._update_stage_metrics()
         
-        return WorkingOrderResponse(**result.data[0])
+        return order
     
     @staticmethod
     async def list_working_orders(
@@ -70,7 +84,7 @@ class WIPService:
         if production_order_id:
             query = query.eq('production_order_id', production_order_id)
         
-        result = query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        result = await query.order('created_at', desc=True).range(offset, offset + limit - 1).execute()
         
         return [WorkingOrderListItem(**wo) for wo in result.data]
     
@@ -79,7 +93,7 @@ class WIPService:
         """Get working order by ID"""
         db = get_db()
         
-        result = db.table('working_orders').select('*').eq('id', order_id).execute()
+        result = await db.table('working_orders').select('*').eq('id', order_id).execute()
         
         if not result.data:
             raise Exception(f"Working order {order_id} not found")
@@ -100,27 +114,31 @@ class WIPService:
         if not update_data:
             return await WIPService.get_working_order_by_id(order_id)
         
-        result = db.table('working_orders').update(update_data).eq('id', order_id).execute()
+        result = await db.table('working_orders').update(update_data).eq('id', order_id).execute()
         
         if not result.data:
             raise Exception(f"Working order {order_id} not found")
         
+        order = WorkingOrderResponse(**result.data[0])
+        await WIPService._publish_order(order)
+        
         # Update WIP metrics if status or completion changed
         if 'status' in update_data or 'completed_qty' in update_data:
             await WIPService._update_stage_metrics()
         
-        return WorkingOrderResponse(**result.data[0])
+        return order
     
     @staticmethod
     async def delete_working_order(order_id: str) -> dict:
         """Delete/cancel working order"""
         db = get_db()
         
-        result = db.table('working_orders').update({'status': 'Cancelled'}).eq('id', order_id).execute()
+        result = await db.table('working_orders').update({'status': 'Cancelled'}).eq('id', order_id).execute()
         
         if not result.data:
             raise Exception(f"Working order {order_id} not found")
         
+        await WIPService._publish_order(WorkingOrderResponse(**result.data[0]))
         await WIPService._update_stage_metrics()
         
         return {"message": "Working order cancelled successfully"}
@@ -135,7 +153,7 @@ class WIPService:
         db = get_db()
         
         # Get all active stage metrics
-        result = db.table('wip_stage_metrics').select('*').eq('is_active', True).order('stage_sequence').execute()
+        result = await db.table('wip_stage_metrics').select('*').eq('is_active', True).order('stage_sequence').execute()
         
         stages = [WIPStageMetricsListItem(**stage) for stage in result.data]
         
@@ -164,7 +182,7 @@ class WIPService:
         """Get all WIP stage metrics"""
         db = get_db()
         
-        result = db.table('wip_stage_metrics').select('*').eq('is_active', True).order('stage_sequence').execute()
+        result = await db.table('wip_stage_metrics').select('*').eq('is_active', True).order('stage_sequence').execute()
         
         return [WIPStageMetricsResponse(**stage) for stage in result.data]
     
@@ -173,7 +191,7 @@ class WIPService:
         """Get bottleneck alerts for delayed stages"""
         db = get_db()
         
-        result = db.table('wip_stage_metrics').select('*').in_('health_status', ['warning', 'delayed']).order('utilization_percentage', desc=True).execute()
+        result = await db.table('wip_stage_metrics').select('*').in_('health_status', ['warning', 'delayed']).order('utilization_percentage', desc=True).execute()
         
         alerts = []
         for stage in result.data:
@@ -195,7 +213,7 @@ class WIPService:
         """Get WIP summary statistics"""
         db = get_db()
         
-        result = db.table('wip_stage_metrics').select('*').eq('is_active', True).execute()
+        result = await db.table('wip_stage_metrics').select('*').eq('is_active', True).execute()
         
         stages = result.data
         total_orders = sum(s['orders_count'] for s in stages)
@@ -229,25 +247,75 @@ class WIPService:
         """Get historical performance for a stage"""
         db = get_db()
         
-        result = db.table('stage_performance_history').select('*').eq('stage_name', stage_name).order('date', desc=True).limit(days).execute()
+        result = await db.table('stage_performance_history').select('*').eq('stage_name', stage_name).order('date', desc=True).limit(days).execute()
         
         return [StagePerformanceHistoryResponse(**record) for record in result.data]
     
+    # ============================================
+    # ALERTS
+    # ============================================
+    
+    @staticmethod
+    async def check_alerts() -> List[AlertHistoryResponse]:
+        """
+        Check WIP metrics against the alert thresholds and push the alerts
+        this created to the live rooms of their configured notify roles.
+        """
+        db = get_db()
+        
+        # Ids of the alerts this call created (see migration 030)
+        created = await db.rpc('check_wip_alerts').execute()
+        if not created.data:
+            return []
+        
+        result = await db.table('wip_alert_history').select(
+            '*, wip_alert_config(notify_roles)'
+        ).in_('id', created.data).order('created_at').execute()
+        
+        alerts = []
+        for row in result.data or []:
+            config = row.pop('wip_alert_config', None) or {}
+            alert = AlertHistoryResponse(**row)
+            alerts.append(alert)
+            for role in config.get('notify_roles') or []:
+                await publish(alerts_room(role), 'alert:new', alert.model_dump(mode='json'))
+        
+        return alerts
+    
     # ============================================
     # INTERNAL HELPERS
     # ============================================
     
+    @staticmethod
+    async def _stage_metrics_by_id(db) -> Dict[str, dict]:
+        result = await db.table('wip_stage_metrics').select(LIVE_STAGE_COLUMNS).eq('is_active', True).execute()
+        return {row['id']: row for row in result.data or []}
+    
+    @staticmethod
+    async def _publish_order(order: WorkingOrderResponse):
+        await publish('wip', 'wip:order', order.model_dump(mode='json', include=LIVE_ORDER_FIELDS))
+    
     @staticmethod
     async def _update_stage_metrics():
-        """Update WIP stage metrics by calling database function"""
+        """
+        Update WIP stage metrics by calling database function; stages whose
+        metrics changed are pushed to live WIP boards.
+        """
         db = get_db()
         
         try:
-            db.rpc('update_wip_stage_metrics').execute()
+            before = await WIPService._stage_metrics_by_id(db)
+            await db.rpc('update_wip_stage_metrics').execute()
+            after = await WIPService._stage_metrics_by_id(db)
+            
+            changed = [row for stage_id, row in after.items() if before.get(stage_id) != row]
+            if changed:
+                changed.sort(key=lambda row: row['stage_sequence'])
+                await publish('wip', 'wip:stages', {'stages': changed})
             
             # Trigger alert checking after metrics update
             try:
-                db.rpc('check_wip_alerts').execute()
+                await WIPService.check_alerts()
             except Exception:
                 pass
                 
@@ -0,0 +1,173 @@
+-- =============================================
+-- ATOMIC STOCK MOVEMENTS
+-- One call applies a RECEIPT / ISSUE / TRANSFER / ADJUSTMENT,
+-- writes the ledger row and returns the new balances
+-- =============================================
+
+-- =============================================
+-- STEP 1: APPLY A DELTA TO ONE INVENTORY BALANCE
+-- =============================================
+-- Caller must already hold the advisory lock for the balance key
+-- (see lock_inventory_balance) so concurrent inserts of the same
+-- (product, location, lot) cannot race.
+
+CREATE OR REPLACE FUNCTION lock_inventory_balance(
+    p_product_id UUID,
+    p_location_id UUID,
+    p_lot_number VARCHAR
+)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(
+        hashtextextended(p_product_id::TEXT || ':' || p_location_id::TEXT || ':' || COALESCE(p_lot_number, ''), 0)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_inventory_delta(
+    p_product_id UUID,
+    p_location_id UUID,
+    p_lot_number VARCHAR,
+    p_delta DECIMAL
+)
+RETURNS inventory AS $$
+DECLARE
+    v_row inventory;
+BEGIN
+    SELECT * INTO v_row
+    FROM inventory
+    WHERE product_id = p_product_id
+      AND location_id = p_location_id
+      AND lot_number IS NOT DISTINCT FROM p_lot_number
+    FOR UPDATE;
+
+    IF FOUND THEN
+        IF v_row.available_qty + p_delta < 0 THEN
+            RAISE EXCEPTION 'Insufficient stock for this operation'
+                USING ERRCODE = 'check_violation';
+        END IF;
+
+        UPDATE inventory
+        SET available_qty = available_qty + p_delta
+        WHERE id = v_row.id
+        RETURNING * INTO v_row;
+    ELSE
+        IF p_delta < 0 THEN
+            RAISE EXCEPTION 'Cannot create inventory with negative quantity'
+                USING ERRCODE = 'check_violation';
+        END IF;
+
+        INSERT INTO inventory (product_id, location_id, available_qty, allocated_qty, in_transit_qty, lot_number, last_transaction_at)
+        VALUES (p_product_id, p_location_id, p_delta, 0, 0, p_lot_number, NOW())
+        RETURNING * INTO v_row;
+    END IF;
+
+    RETURN v_row;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 2: STOCK MOVEMENT (LEDGER + BALANCES)
+-- =============================================
+-- Returns {"transaction": {...}, "balances": [{location_id, lot_number,
+-- available_qty, allocated_qty, free_qty}, ...]}.
+-- ADJUSTMENT adds stock at to_location_id, or removes it from
+-- from_location_id.
+
+CREATE OR REPLACE FUNCTION apply_stock_movement(
+    p_product_id UUID,
+    p_transaction_type VARCHAR,
+    p_quantity DECIMAL,
+    p_from_location_id UUID DEFAULT NULL,
+    p_to_location_id UUID DEFAULT NULL,
+    p_lot_number VARCHAR DEFAULT NULL,
+    p_reference_id UUID DEFAULT NULL,
+    p_reference_type VARCHAR DEFAULT NULL,
+    p_notes TEXT DEFAULT NULL,
+    p_performed_by UUID DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_locations UUID[];
+    v_deltas DECIMAL[];
+    v_location UUID;
+    v_row inventory;
+    v_transaction inventory_transactions;
+    v_balances JSONB := '[]'::JSONB;
+    i INT;
+BEGIN
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        RAISE EXCEPTION 'Quantity must be greater than zero'
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    CASE p_transaction_type
+        WHEN 'RECEIPT' THEN
+            IF p_to_location_id IS NULL THEN
+                RAISE EXCEPTION 'RECEIPT requires to_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_to_location_id];
+            v_deltas := ARRAY[p_quantity];
+        WHEN 'ISSUE' THEN
+            IF p_from_location_id IS NULL THEN
+                RAISE EXCEPTION 'ISSUE requires from_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_from_location_id];
+            v_deltas := ARRAY[-p_quantity];
+        WHEN 'TRANSFER' THEN
+            IF p_from_location_id IS NULL OR p_to_location_id IS NULL THEN
+                RAISE EXCEPTION 'TRANSFER requires from_location_id and to_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            IF p_from_location_id = p_to_location_id THEN
+                RAISE EXCEPTION 'TRANSFER source and destination must differ' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_from_location_id, p_to_location_id];
+            v_deltas := ARRAY[-p_quantity, p_quantity];
+        WHEN 'ADJUSTMENT' THEN
+            IF p_to_location_id IS NOT NULL THEN
+                v_locations := ARRAY[p_to_location_id];
+                v_deltas := ARRAY[p_quantity];
+            ELSIF p_from_location_id IS NOT NULL THEN
+                v_locations := ARRAY[p_from_location_id];
+                v_deltas := ARRAY[-p_quantity];
+            ELSE
+                RAISE EXCEPTION 'ADJUSTMENT requires to_location_id or from_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be one of: RECEIPT, ISSUE, TRANSFER, ADJUSTMENT'
+                USING ERRCODE = 'invalid_parameter_value';
+    END CASE;
+
+    -- Lock balances in a fixed order so opposite transfers cannot deadlock
+    FOR v_location IN SELECT DISTINCT l FROM unnest(v_locations) AS l ORDER BY l LOOP
+        PERFORM lock_inventory_balance(p_product_id, v_location, p_lot_number);
+    END LOOP;
+
+    FOR i IN 1 .. array_length(v_locations, 1) LOOP
+        v_row := apply_inventory_delta(p_product_id, v_locations[i], p_lot_number, v_deltas[i]);
+        v_balances := v_balances || jsonb_build_object(
+            'location_id', v_row.location_id,
+            'lot_number', v_row.lot_number,
+            'available_qty', v_row.available_qty,
+            'allocated_qty', v_row.allocated_qty,
+            'free_qty', v_row.available_qty - v_row.allocated_qty
+        );
+    END LOOP;
+
+    INSERT INTO inventory_transactions (
+        product_id, transaction_type, quantity, from_location_id, to_location_id,
+        reference_id, reference_type, notes, performed_by
+    ) VALUES (
+        p_product_id, p_transaction_type, p_quantity, p_from_location_id, p_to_location_id,
+        p_reference_id, p_reference_type, p_notes, p_performed_by
+    )
+    RETURNING * INTO v_transaction;
+
+    RETURN jsonb_build_object(
+        'transaction', to_jsonb(v_transaction),
+        'balances', v_balances
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION apply_stock_movement IS 'Atomically applies a stock movement, writes the inventory_transactions ledger row and returns the updated balances';
@@ -0,0 +1,160 @@
+-- =============================================
+-- BULK STOCK MOVEMENTS
+-- Applies a batch of movements (goods receipt, stock-take) with
+-- one multi-row ledger insert and set-based balance updates
+-- =============================================
+
+-- =============================================
+-- STEP 1: BULK MOVEMENT FUNCTION
+-- =============================================
+-- p_movements is a JSON array of objects with the keys line,
+-- product_id, transaction_type, quantity, from_location_id,
+-- to_location_id, lot_number, reference_id, reference_type and notes.
+-- Lines are expected to be validated by the caller.
+--
+-- Returns {"transactions": [{line, id}, ...], "shortages": []}. If any
+-- balance would go negative nothing is written and "shortages" lists
+-- those balances instead, so the caller can drop the affected lines
+-- and resubmit the rest.
+
+CREATE OR REPLACE FUNCTION apply_stock_movements_bulk(
+    p_movements JSONB,
+    p_performed_by UUID DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_shortages JSONB;
+BEGIN
+    DROP TABLE IF EXISTS _bulk_movements;
+    DROP TABLE IF EXISTS _bulk_deltas;
+
+    CREATE TEMP TABLE _bulk_movements ON COMMIT DROP AS
+    SELECT
+        gen_random_uuid() AS id,
+        m.line,
+        m.product_id,
+        m.transaction_type,
+        m.quantity,
+        m.from_location_id,
+        m.to_location_id,
+        NULLIF(m.lot_number, '') AS lot_number,
+        m.reference_id,
+        m.reference_type,
+        m.notes
+    FROM jsonb_to_recordset(p_movements) AS m(
+        line INT,
+        product_id UUID,
+        transaction_type VARCHAR,
+        quantity DECIMAL,
+        from_location_id UUID,
+        to_location_id UUID,
+        lot_number VARCHAR,
+        reference_id UUID,
+        reference_type VARCHAR,
+        notes TEXT
+    );
+
+    IF EXISTS (
+        SELECT 1 FROM _bulk_movements m
+        WHERE m.quantity IS NULL OR m.quantity <= 0
+           OR m.transaction_type NOT IN ('RECEIPT', 'ISSUE', 'TRANSFER', 'ADJUSTMENT')
+           OR (m.transaction_type = 'RECEIPT' AND m.to_location_id IS NULL)
+           OR (m.transaction_type = 'ISSUE' AND m.from_location_id IS NULL)
+           OR (m.transaction_type = 'TRANSFER' AND (
+                m.from_location_id IS NULL OR m.to_location_id IS NULL
+                OR m.from_location_id = m.to_location_id))
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.from_location_id IS NULL AND m.to_location_id IS NULL)
+    ) THEN
+        RAISE EXCEPTION 'Batch contains invalid stock movements'
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    -- Net delta per balance key; same legs as apply_stock_movement
+    CREATE TEMP TABLE _bulk_deltas ON COMMIT DROP AS
+    SELECT legs.product_id, legs.location_id, legs.lot_number, SUM(legs.delta) AS delta
+    FROM (
+        SELECT m.product_id, m.to_location_id AS location_id, m.lot_number, m.quantity AS delta
+        FROM _bulk_movements m
+        WHERE m.transaction_type IN ('RECEIPT', 'TRANSFER')
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.to_location_id IS NOT NULL)
+        UNION ALL
+        SELECT m.product_id, m.from_location_id, m.lot_number, -m.quantity
+        FROM _bulk_movements m
+        WHERE m.transaction_type IN ('ISSUE', 'TRANSFER')
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.to_location_id IS NULL)
+    ) legs
+    GROUP BY legs.product_id, legs.location_id, legs.lot_number;
+
+    -- Same advisory locks as single movements, taken in a fixed order
+    PERFORM lock_inventory_balance(d.product_id, d.location_id, d.lot_number)
+    FROM (
+        SELECT * FROM _bulk_deltas
+        ORDER BY product_id, location_id, lot_number NULLS FIRST
+    ) d;
+
+    SELECT jsonb_agg(jsonb_build_object(
+        'product_id', d.product_id,
+        'location_id', d.location_id,
+        'lot_number', d.lot_number,
+        'available_qty', COALESCE(i.available_qty, 0),
+        'delta', d.delta
+    ))
+    INTO v_shortages
+    FROM _bulk_deltas d
+    LEFT JOIN inventory i
+      ON i.product_id = d.product_id
+     AND i.location_id = d.location_id
+     AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+    WHERE COALESCE(i.available_qty, 0) + d.delta < 0;
+
+    IF v_shortages IS NOT NULL THEN
+        RETURN jsonb_build_object('transactions', '[]'::JSONB, 'shortages', v_shortages);
+    END IF;
+
+    -- =============================================
+    -- Balances: one UPDATE for existing rows, one INSERT for new ones
+    -- =============================================
+    UPDATE inventory i
+    SET available_qty = i.available_qty + d.delta,
+        last_transaction_at = NOW()
+    FROM _bulk_deltas d
+    WHERE i.product_id = d.product_id
+      AND i.location_id = d.location_id
+      AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+      AND d.delta <> 0;
+
+    INSERT INTO inventory (product_id, location_id, available_qty, allocated_qty, in_transit_qty, lot_number, last_transaction_at)
+    SELECT d.product_id, d.location_id, d.delta, 0, 0, d.lot_number, NOW()
+    FROM _bulk_deltas d
+    WHERE d.delta <> 0
+      AND NOT EXISTS (
+        SELECT 1 FROM inventory i
+        WHERE i.product_id = d.product_id
+          AND i.location_id = d.location_id
+          AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+    );
+
+    -- =============================================
+    -- Ledger: one multi-row insert in line order
+    -- =============================================
+    INSERT INTO inventory_transactions (
+        id, product_id, transaction_type, quantity, from_location_id, to_location_id,
+        reference_id, reference_type, notes, performed_by
+    )
+    SELECT
+        m.id, m.product_id, m.transaction_type, m.quantity, m.from_location_id, m.to_location_id,
+        m.reference_id, m.reference_type, m.notes, p_performed_by
+    FROM _bulk_movements m
+    ORDER BY m.line;
+
+    RETURN jsonb_build_object(
+        'transactions', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('line', m.line, 'id', m.id) ORDER BY m.line), '[]'::JSONB)
+            FROM _bulk_movements m
+        ),
+        'shortages', '[]'::JSONB
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION apply_stock_movements_bulk IS 'Applies a batch of stock movements with set-based balance updates and a single ledger insert; writes nothing and reports shortages if any balance would go negative';
@@ -0,0 +1,66 @@
+-- =============================================
+-- INVENTORY LIST VIEW
+-- Inventory rows joined with product, location and active stock
+-- alert so search / low-stock filters run before pagination
+-- =============================================
+
+-- =============================================
+-- STEP 1: TRIGRAM SEARCH INDEXES
+-- =============================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Back ILIKE '%term%' searches on product code and name
+CREATE INDEX IF NOT EXISTS idx_products_code_trgm ON products USING GIN (code gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+
+-- Active alert lookup per balance
+CREATE INDEX IF NOT EXISTS idx_stock_alerts_active_product_location
+    ON stock_alerts(product_id, location_id) WHERE is_active = true;
+
+-- Stable paging order
+CREATE INDEX IF NOT EXISTS idx_inventory_product_location ON inventory(product_id, location_id);
+
+-- =============================================
+-- STEP 2: LIST VIEW
+-- =============================================
+-- status: 'Critical' (alert and nothing available), 'Low Stock'
+-- (below the alert's min_qty) or 'Sufficient'. Rows without an
+-- active alert for their location are always 'Sufficient'.
+
+CREATE OR REPLACE VIEW inventory_list_view AS
+SELECT
+    i.id,
+    i.product_id,
+    p.code AS product_code,
+    p.name AS product_name,
+    p.unit,
+    i.location_id,
+    l.code AS location_code,
+    l.name AS location_name,
+    i.available_qty,
+    i.allocated_qty,
+    i.available_qty - i.allocated_qty AS free_qty,
+    i.lot_number,
+    sa.min_qty AS reorder_level,
+    CASE
+        WHEN sa.min_qty IS NULL THEN 'Sufficient'
+        WHEN i.available_qty = 0 THEN 'Critical'
+        WHEN i.available_qty < sa.min_qty THEN 'Low Stock'
+        ELSE 'Sufficient'
+    END AS status,
+    (sa.min_qty IS NOT NULL AND (i.available_qty = 0 OR i.available_qty < sa.min_qty)) AS is_low_stock
+FROM inventory i
+JOIN products p ON p.id = i.product_id
+JOIN locations l ON l.id = i.location_id
+LEFT JOIN LATERAL (
+    SELECT a.min_qty
+    FROM stock_alerts a
+    WHERE a.product_id = i.product_id
+      AND a.location_id = i.location_id
+      AND a.is_active = true
+    ORDER BY a.min_qty DESC
+    LIMIT 1
+) sa ON true;
+
+COMMENT ON VIEW inventory_list_view IS 'Inventory list rows with product/location details and stock status; filter and page through PostgREST';
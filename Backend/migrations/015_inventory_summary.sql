@@ -0,0 +1,254 @@
+-- =============================================
+-- INVENTORY SUMMARY KPIs
+-- Counters kept up to date by triggers so the dashboard reads
+-- one row instead of scanning inventory and stock_alerts
+-- =============================================
+
+-- =============================================
+-- STEP 1: TABLES
+-- =============================================
+
+-- Status of every inventory row against its active stock alert
+CREATE TABLE IF NOT EXISTS inventory_stock_status (
+    inventory_id UUID PRIMARY KEY,
+    product_id UUID NOT NULL,
+    location_id UUID NOT NULL,
+    available_qty DECIMAL(15,3) NOT NULL,
+    allocated_qty DECIMAL(15,3) NOT NULL,
+    min_qty DECIMAL(15,3),
+    status VARCHAR(20) NOT NULL  -- 'Sufficient', 'Low Stock', 'Critical'
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_stock_status_key ON inventory_stock_status(product_id, location_id);
+
+-- Inventory rows per product, to count distinct SKUs incrementally
+CREATE TABLE IF NOT EXISTS inventory_summary_products (
+    product_id UUID PRIMARY KEY,
+    row_count INT NOT NULL DEFAULT 0
+);
+
+-- Single-row counters
+CREATE TABLE IF NOT EXISTS inventory_summary (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    total_materials BIGINT NOT NULL DEFAULT 0,
+    total_skus BIGINT NOT NULL DEFAULT 0,
+    sufficient_count BIGINT NOT NULL DEFAULT 0,
+    low_stock_count BIGINT NOT NULL DEFAULT 0,
+    critical_count BIGINT NOT NULL DEFAULT 0,
+    out_of_stock_count BIGINT NOT NULL DEFAULT 0,
+    total_available_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    total_allocated_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- =============================================
+-- STEP 2: STATUS REFRESH
+-- =============================================
+-- Same rules as inventory_list_view: 'Critical' when an alert exists and
+-- nothing is available, 'Low Stock' below the alert's min_qty.
+
+CREATE OR REPLACE FUNCTION refresh_inventory_stock_status(p_inventory_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO inventory_stock_status AS s (
+        inventory_id, product_id, location_id, available_qty, allocated_qty, min_qty, status
+    )
+    SELECT
+        i.id, i.product_id, i.location_id, i.available_qty, i.allocated_qty, sa.min_qty,
+        CASE
+            WHEN sa.min_qty IS NULL THEN 'Sufficient'
+            WHEN i.available_qty = 0 THEN 'Critical'
+            WHEN i.available_qty < sa.min_qty THEN 'Low Stock'
+            ELSE 'Sufficient'
+        END
+    FROM inventory i
+    LEFT JOIN LATERAL (
+        SELECT a.min_qty
+        FROM stock_alerts a
+        WHERE a.product_id = i.product_id
+          AND a.location_id = i.location_id
+          AND a.is_active = true
+        ORDER BY a.min_qty DESC
+        LIMIT 1
+    ) sa ON true
+    WHERE i.id = ANY(p_inventory_ids)
+    ON CONFLICT (inventory_id) DO UPDATE SET
+        product_id = EXCLUDED.product_id,
+        location_id = EXCLUDED.location_id,
+        available_qty = EXCLUDED.available_qty,
+        allocated_qty = EXCLUDED.allocated_qty,
+        min_qty = EXCLUDED.min_qty,
+        status = EXCLUDED.status
+    WHERE (s.product_id, s.location_id, s.available_qty, s.allocated_qty, s.min_qty, s.status)
+          IS DISTINCT FROM
+          (EXCLUDED.product_id, EXCLUDED.location_id, EXCLUDED.available_qty, EXCLUDED.allocated_qty, EXCLUDED.min_qty, EXCLUDED.status);
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 3: COUNTER MAINTENANCE
+-- =============================================
+-- Statement-level so a bulk movement touches the counter row once.
+-- Old rows count -1 and new rows +1; the net change is added to the
+-- counters.
+
+CREATE OR REPLACE FUNCTION apply_inventory_stock_status_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS _status_changes (
+        product_id UUID,
+        available_qty DECIMAL(15,3),
+        allocated_qty DECIMAL(15,3),
+        status VARCHAR(20),
+        sign INT
+    ) ON COMMIT DROP;
+    TRUNCATE _status_changes;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO _status_changes
+        SELECT product_id, available_qty, allocated_qty, status, 1 FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO _status_changes
+        SELECT product_id, available_qty, allocated_qty, status, -1 FROM old_rows;
+    END IF;
+
+    WITH deltas AS (
+        SELECT product_id, SUM(sign) AS delta
+        FROM _status_changes
+        GROUP BY product_id
+        HAVING SUM(sign) <> 0
+    ),
+    counted AS (
+        INSERT INTO inventory_summary_products AS p (product_id, row_count)
+        SELECT product_id, delta FROM deltas
+        ON CONFLICT (product_id) DO UPDATE SET row_count = p.row_count + EXCLUDED.row_count
+        RETURNING p.product_id, p.row_count
+    )
+    UPDATE inventory_summary s SET
+        total_skus = s.total_skus + (
+            SELECT COUNT(*) FILTER (WHERE c.row_count > 0 AND c.row_count - d.delta <= 0)
+                 - COUNT(*) FILTER (WHERE c.row_count <= 0 AND c.row_count - d.delta > 0)
+            FROM counted c JOIN deltas d ON d.product_id = c.product_id
+        ),
+        total_materials = s.total_materials + t.rows,
+        sufficient_count = s.sufficient_count + t.sufficient,
+        low_stock_count = s.low_stock_count + t.low_stock,
+        critical_count = s.critical_count + t.critical,
+        out_of_stock_count = s.out_of_stock_count + t.out_of_stock,
+        total_available_qty = s.total_available_qty + t.available,
+        total_allocated_qty = s.total_allocated_qty + t.allocated,
+        updated_at = NOW()
+    FROM (
+        SELECT
+            COALESCE(SUM(sign), 0) AS rows,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Sufficient'), 0) AS sufficient,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Low Stock'), 0) AS low_stock,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Critical'), 0) AS critical,
+            COALESCE(SUM(sign) FILTER (WHERE available_qty <= 0), 0) AS out_of_stock,
+            COALESCE(SUM(sign * available_qty), 0) AS available,
+            COALESCE(SUM(sign * allocated_qty), 0) AS allocated
+        FROM _status_changes
+    ) t
+    WHERE s.id AND EXISTS (SELECT 1 FROM _status_changes);
+
+    DELETE FROM inventory_summary_products WHERE row_count <= 0;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_stock_status_insert ON inventory_stock_status;
+CREATE TRIGGER trg_inventory_stock_status_insert
+    AFTER INSERT ON inventory_stock_status
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_stock_status_changes();
+
+DROP TRIGGER IF EXISTS trg_inventory_stock_status_update ON inventory_stock_status;
+CREATE TRIGGER trg_inventory_stock_status_update
+    AFTER UPDATE ON inventory_stock_status
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_stock_status_changes();
+
+DROP TRIGGER IF EXISTS trg_inventory_stock_status_delete ON inventory_stock_status;
+CREATE TRIGGER trg_inventory_stock_status_delete
+    AFTER DELETE ON inventory_stock_status
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_inventory_stock_status_changes();
+
+-- =============================================
+-- STEP 4: SOURCE TABLE TRIGGERS
+-- =============================================
+
+CREATE OR REPLACE FUNCTION sync_inventory_stock_status()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM inventory_stock_status
+        WHERE inventory_id IN (SELECT id FROM old_rows);
+    ELSE
+        PERFORM refresh_inventory_stock_status(ARRAY(SELECT id FROM new_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_status_insert ON inventory;
+CREATE TRIGGER trg_inventory_status_insert
+    AFTER INSERT ON inventory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_inventory_stock_status();
+
+DROP TRIGGER IF EXISTS trg_inventory_status_update ON inventory;
+CREATE TRIGGER trg_inventory_status_update
+    AFTER UPDATE ON inventory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_inventory_stock_status();
+
+DROP TRIGGER IF EXISTS trg_inventory_status_delete ON inventory;
+CREATE TRIGGER trg_inventory_status_delete
+    AFTER DELETE ON inventory
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_inventory_stock_status();
+
+-- Alert thresholds change the status of the balances they cover
+CREATE OR REPLACE FUNCTION sync_stock_alert_status()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_inventory_stock_status(ARRAY(
+        SELECT i.id FROM inventory i
+        WHERE (TG_OP <> 'DELETE' AND i.product_id = NEW.product_id AND i.location_id = NEW.location_id)
+           OR (TG_OP <> 'INSERT' AND i.product_id = OLD.product_id AND i.location_id = OLD.location_id)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stock_alerts_status ON stock_alerts;
+CREATE TRIGGER trg_stock_alerts_status
+    AFTER INSERT OR UPDATE OR DELETE ON stock_alerts
+    FOR EACH ROW EXECUTE FUNCTION sync_stock_alert_status();
+
+-- =============================================
+-- STEP 5: BACKFILL / RECONCILE
+-- =============================================
+-- Rebuilds status rows and counters from scratch; safe to rerun if the
+-- counters are ever suspected to have drifted.
+
+CREATE OR REPLACE FUNCTION rebuild_inventory_summary()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE inventory_summary IN EXCLUSIVE MODE;
+
+    DELETE FROM inventory_stock_status;
+    DELETE FROM inventory_summary_products;
+    DELETE FROM inventory_summary;
+    INSERT INTO inventory_summary (id) VALUES (true);
+
+    PERFORM refresh_inventory_stock_status(ARRAY(SELECT id FROM inventory));
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_inventory_summary();
+
+COMMENT ON TABLE inventory_summary IS 'Inventory KPI counters maintained by triggers on inventory and stock_alerts';
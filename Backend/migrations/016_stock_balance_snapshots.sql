@@ -0,0 +1,483 @@
+-- =============================================
+-- STOCK BALANCE SNAPSHOTS
+-- Periodic per product/location/lot balances and cumulative
+-- movement counters, so point-in-time stock and movement
+-- summaries replay only the ledger between a snapshot and the
+-- requested time
+-- =============================================
+-- Ledger rows record the lot they moved (written by the movement
+-- functions replaced in STEP 5)
+ALTER TABLE inventory_transactions
+ADD COLUMN IF NOT EXISTS lot_number VARCHAR(100);
+
+CREATE INDEX IF NOT EXISTS idx_inv_trans_product_date ON inventory_transactions(product_id, created_at);
+
+-- =============================================
+-- STEP 1: LEDGER LEGS
+-- =============================================
+-- One row per location a ledger row touches. delta is the change to
+-- available stock at that location; transfer_* isolate internal moves
+-- so product-level totals only count stock entering or leaving the
+-- plant. transaction_count attributes each ledger row to one leg.
+-- ALLOCATION / RELEASE rows do not change available stock.
+
+CREATE OR REPLACE VIEW inventory_ledger_legs AS
+SELECT
+    t.id AS transaction_id,
+    t.created_at,
+    t.product_id,
+    t.to_location_id AS location_id,
+    t.lot_number,
+    t.quantity AS delta,
+    t.quantity AS in_qty,
+    0::DECIMAL AS out_qty,
+    CASE WHEN t.from_location_id IS NOT NULL THEN t.quantity ELSE 0 END AS transfer_in_qty,
+    0::DECIMAL AS transfer_out_qty,
+    1 AS transaction_count
+FROM inventory_transactions t
+WHERE t.to_location_id IS NOT NULL
+  AND t.transaction_type NOT IN ('ALLOCATION', 'RELEASE')
+UNION ALL
+SELECT
+    t.id,
+    t.created_at,
+    t.product_id,
+    t.from_location_id,
+    t.lot_number,
+    -t.quantity,
+    0::DECIMAL,
+    t.quantity,
+    0::DECIMAL,
+    CASE WHEN t.to_location_id IS NOT NULL THEN t.quantity ELSE 0 END,
+    CASE WHEN t.to_location_id IS NULL THEN 1 ELSE 0 END
+FROM inventory_transactions t
+WHERE t.from_location_id IS NOT NULL
+  AND t.transaction_type NOT IN ('ALLOCATION', 'RELEASE');
+
+-- =============================================
+-- STEP 2: SNAPSHOT TABLES
+-- =============================================
+
+-- A run row marks a completed snapshot
+CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+    snapshot_at TIMESTAMPTZ PRIMARY KEY,
+    row_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Balances and cumulative counters (since the start of the ledger) as of snapshot_at
+CREATE TABLE IF NOT EXISTS stock_balance_snapshots (
+    snapshot_at TIMESTAMPTZ NOT NULL,
+    product_id UUID NOT NULL,
+    location_id UUID NOT NULL,
+    lot_key VARCHAR(100) NOT NULL DEFAULT '',  -- lot_number, '' when none
+    on_hand_qty DECIMAL(15,3) NOT NULL DEFAULT 0,
+    in_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    out_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    transfer_in_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    transfer_out_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    transaction_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (snapshot_at, product_id, location_id, lot_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_snapshots_product ON stock_balance_snapshots(snapshot_at, product_id);
+
+-- =============================================
+-- STEP 3: POSITION AT A POINT IN TIME
+-- =============================================
+-- Starts from the snapshot nearest to p_at and replays only the ledger
+-- between the two (forwards or backwards). Before the first snapshot
+-- exists, balances start from current inventory and counters from the
+-- beginning of the ledger.
+
+CREATE OR REPLACE FUNCTION stock_position_at(
+    p_at TIMESTAMPTZ,
+    p_product_id UUID DEFAULT NULL,
+    p_location_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    product_id UUID,
+    location_id UUID,
+    lot_number VARCHAR,
+    on_hand_qty DECIMAL,
+    in_qty DECIMAL,
+    out_qty DECIMAL,
+    transfer_in_qty DECIMAL,
+    transfer_out_qty DECIMAL,
+    transaction_count BIGINT
+) AS $$
+    WITH base AS (
+        SELECT r.snapshot_at
+        FROM stock_snapshot_runs r
+        ORDER BY ABS(EXTRACT(EPOCH FROM r.snapshot_at - p_at))
+        LIMIT 1
+    ),
+    bounds AS (
+        SELECT
+            COALESCE((SELECT snapshot_at FROM base), NOW()) AS balance_base,
+            COALESCE((SELECT snapshot_at FROM base), '-infinity'::TIMESTAMPTZ) AS counter_base
+    ),
+    entries AS (
+        SELECT s.product_id, s.location_id, s.lot_key,
+               s.on_hand_qty, s.in_qty, s.out_qty, s.transfer_in_qty, s.transfer_out_qty, s.transaction_count
+        FROM stock_balance_snapshots s
+        JOIN base b ON s.snapshot_at = b.snapshot_at
+        WHERE (p_product_id IS NULL OR s.product_id = p_product_id)
+          AND (p_location_id IS NULL OR s.location_id = p_location_id)
+
+        UNION ALL
+
+        SELECT i.product_id, i.location_id, COALESCE(i.lot_number, ''),
+               i.available_qty, 0, 0, 0, 0, 0
+        FROM inventory i
+        WHERE NOT EXISTS (SELECT 1 FROM base)
+          AND (p_product_id IS NULL OR i.product_id = p_product_id)
+          AND (p_location_id IS NULL OR i.location_id = p_location_id)
+
+        UNION ALL
+
+        -- Ledger between each base and p_at; entries after p_at are undone
+        SELECT g.product_id, g.location_id, COALESCE(g.lot_number, ''),
+               CASE WHEN in_balance THEN sign * g.delta ELSE 0 END,
+               CASE WHEN in_counters THEN sign * g.in_qty ELSE 0 END,
+               CASE WHEN in_counters THEN sign * g.out_qty ELSE 0 END,
+               CASE WHEN in_counters THEN sign * g.transfer_in_qty ELSE 0 END,
+               CASE WHEN in_counters THEN sign * g.transfer_out_qty ELSE 0 END,
+               CASE WHEN in_counters THEN sign * g.transaction_count ELSE 0 END
+        FROM inventory_ledger_legs g
+        CROSS JOIN bounds b
+        CROSS JOIN LATERAL (
+            SELECT
+                CASE WHEN g.created_at <= p_at THEN 1 ELSE -1 END AS sign,
+                g.created_at > LEAST(b.balance_base, p_at) AND g.created_at <= GREATEST(b.balance_base, p_at) AS in_balance,
+                g.created_at > LEAST(b.counter_base, p_at) AND g.created_at <= GREATEST(b.counter_base, p_at) AS in_counters
+        ) w
+        WHERE g.created_at > LEAST(b.balance_base, b.counter_base, p_at)
+          AND g.created_at <= GREATEST(b.balance_base, b.counter_base, p_at)
+          AND (p_product_id IS NULL OR g.product_id = p_product_id)
+          AND (p_location_id IS NULL OR g.location_id = p_location_id)
+    )
+    SELECT
+        r.product_id,
+        r.location_id,
+        NULLIF(r.lot_key, '')::VARCHAR,
+        SUM(r.on_hand_qty),
+        SUM(r.in_qty),
+        SUM(r.out_qty),
+        SUM(r.transfer_in_qty),
+        SUM(r.transfer_out_qty),
+        SUM(r.transaction_count)::BIGINT
+    FROM entries r
+    GROUP BY r.product_id, r.location_id, r.lot_key;
+$$ LANGUAGE sql STABLE;
+
+-- =============================================
+-- STEP 4: TAKE A SNAPSHOT
+-- =============================================
+-- Balances come from current inventory minus ledger entries after
+-- p_snapshot_at, so the snapshot reconciles with the balances table;
+-- counters continue from the previous snapshot. Snapshots can only be
+-- appended after the latest one; taking an existing one is a no-op
+-- (returns 0) so every worker can run the job.
+
+CREATE OR REPLACE FUNCTION take_stock_snapshot(p_snapshot_at TIMESTAMPTZ)
+RETURNS INT AS $$
+DECLARE
+    v_latest TIMESTAMPTZ;
+    v_count INT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtextextended('take_stock_snapshot', 0));
+
+    IF p_snapshot_at > NOW() THEN
+        RAISE EXCEPTION 'Snapshot time cannot be in the future'
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    SELECT MAX(snapshot_at) INTO v_latest FROM stock_snapshot_runs;
+    IF v_latest IS NOT NULL AND p_snapshot_at <= v_latest THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO stock_balance_snapshots (
+        snapshot_at, product_id, location_id, lot_key, on_hand_qty,
+        in_qty, out_qty, transfer_in_qty, transfer_out_qty, transaction_count
+    )
+    SELECT
+        p_snapshot_at, x.product_id, x.location_id, x.lot_key, SUM(x.on_hand_qty),
+        SUM(x.in_qty), SUM(x.out_qty), SUM(x.transfer_in_qty), SUM(x.transfer_out_qty), SUM(x.transaction_count)
+    FROM (
+        SELECT i.product_id, i.location_id, COALESCE(i.lot_number, '') AS lot_key,
+               i.available_qty AS on_hand_qty, 0 AS in_qty, 0 AS out_qty,
+               0 AS transfer_in_qty, 0 AS transfer_out_qty, 0 AS transaction_count
+        FROM inventory i
+
+        UNION ALL
+
+        SELECT g.product_id, g.location_id, COALESCE(g.lot_number, ''), -g.delta, 0, 0, 0, 0, 0
+        FROM inventory_ledger_legs g
+        WHERE g.created_at > p_snapshot_at
+
+        UNION ALL
+
+        SELECT p.product_id, p.location_id, COALESCE(p.lot_number, ''), 0,
+               p.in_qty, p.out_qty, p.transfer_in_qty, p.transfer_out_qty, p.transaction_count
+        FROM stock_position_at(p_snapshot_at) p
+    ) x
+    GROUP BY x.product_id, x.location_id, x.lot_key;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    -- Recorded last: stock_position_at only uses completed runs
+    INSERT INTO stock_snapshot_runs (snapshot_at, row_count) VALUES (p_snapshot_at, v_count);
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TABLE stock_balance_snapshots IS 'Periodic stock balances and cumulative movement counters per product/location/lot; see stock_position_at';
+
+-- =============================================
+-- STEP 5: RECORD LOTS IN THE LEDGER
+-- =============================================
+-- apply_stock_movement (012) and apply_stock_movements_bulk (013),
+-- unchanged except that the ledger insert writes lot_number.
+
+CREATE OR REPLACE FUNCTION apply_stock_movement(
+    p_product_id UUID,
+    p_transaction_type VARCHAR,
+    p_quantity DECIMAL,
+    p_from_location_id UUID DEFAULT NULL,
+    p_to_location_id UUID DEFAULT NULL,
+    p_lot_number VARCHAR DEFAULT NULL,
+    p_reference_id UUID DEFAULT NULL,
+    p_reference_type VARCHAR DEFAULT NULL,
+    p_notes TEXT DEFAULT NULL,
+    p_performed_by UUID DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_locations UUID[];
+    v_deltas DECIMAL[];
+    v_location UUID;
+    v_row inventory;
+    v_transaction inventory_transactions;
+    v_balances JSONB := '[]'::JSONB;
+    i INT;
+BEGIN
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        RAISE EXCEPTION 'Quantity must be greater than zero'
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    CASE p_transaction_type
+        WHEN 'RECEIPT' THEN
+            IF p_to_location_id IS NULL THEN
+                RAISE EXCEPTION 'RECEIPT requires to_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_to_location_id];
+            v_deltas := ARRAY[p_quantity];
+        WHEN 'ISSUE' THEN
+            IF p_from_location_id IS NULL THEN
+                RAISE EXCEPTION 'ISSUE requires from_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_from_location_id];
+            v_deltas := ARRAY[-p_quantity];
+        WHEN 'TRANSFER' THEN
+            IF p_from_location_id IS NULL OR p_to_location_id IS NULL THEN
+                RAISE EXCEPTION 'TRANSFER requires from_location_id and to_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            IF p_from_location_id = p_to_location_id THEN
+                RAISE EXCEPTION 'TRANSFER source and destination must differ' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+            v_locations := ARRAY[p_from_location_id, p_to_location_id];
+            v_deltas := ARRAY[-p_quantity, p_quantity];
+        WHEN 'ADJUSTMENT' THEN
+            IF p_to_location_id IS NOT NULL THEN
+                v_locations := ARRAY[p_to_location_id];
+                v_deltas := ARRAY[p_quantity];
+            ELSIF p_from_location_id IS NOT NULL THEN
+                v_locations := ARRAY[p_from_location_id];
+                v_deltas := ARRAY[-p_quantity];
+            ELSE
+                RAISE EXCEPTION 'ADJUSTMENT requires to_location_id or from_location_id' USING ERRCODE = 'invalid_parameter_value';
+            END IF;
+        ELSE
+            RAISE EXCEPTION 'Invalid transaction type. Must be one of: RECEIPT, ISSUE, TRANSFER, ADJUSTMENT'
+                USING ERRCODE = 'invalid_parameter_value';
+    END CASE;
+
+    -- Lock balances in a fixed order so opposite transfers cannot deadlock
+    FOR v_location IN SELECT DISTINCT l FROM unnest(v_locations) AS l ORDER BY l LOOP
+        PERFORM lock_inventory_balance(p_product_id, v_location, p_lot_number);
+    END LOOP;
+
+    FOR i IN 1 .. array_length(v_locations, 1) LOOP
+        v_row := apply_inventory_delta(p_product_id, v_locations[i], p_lot_number, v_deltas[i]);
+        v_balances := v_balances || jsonb_build_object(
+            'location_id', v_row.location_id,
+            'lot_number', v_row.lot_number,
+            'available_qty', v_row.available_qty,
+            'allocated_qty', v_row.allocated_qty,
+            'free_qty', v_row.available_qty - v_row.allocated_qty
+        );
+    END LOOP;
+
+    INSERT INTO inventory_transactions (
+        product_id, transaction_type, quantity, from_location_id, to_location_id,
+        lot_number, reference_id, reference_type, notes, performed_by
+    ) VALUES (
+        p_product_id, p_transaction_type, p_quantity, p_from_location_id, p_to_location_id,
+        p_lot_number, p_reference_id, p_reference_type, p_notes, p_performed_by
+    )
+    RETURNING * INTO v_transaction;
+
+    RETURN jsonb_build_object(
+        'transaction', to_jsonb(v_transaction),
+        'balances', v_balances
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION apply_stock_movement IS 'Atomically applies a stock movement, writes the inventory_transactions ledger row and returns the updated balances';
+
+CREATE OR REPLACE FUNCTION apply_stock_movements_bulk(
+    p_movements JSONB,
+    p_performed_by UUID DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_shortages JSONB;
+BEGIN
+    DROP TABLE IF EXISTS _bulk_movements;
+    DROP TABLE IF EXISTS _bulk_deltas;
+
+    CREATE TEMP TABLE _bulk_movements ON COMMIT DROP AS
+    SELECT
+        gen_random_uuid() AS id,
+        m.line,
+        m.product_id,
+        m.transaction_type,
+        m.quantity,
+        m.from_location_id,
+        m.to_location_id,
+        NULLIF(m.lot_number, '') AS lot_number,
+        m.reference_id,
+        m.reference_type,
+        m.notes
+    FROM jsonb_to_recordset(p_movements) AS m(
+        line INT,
+        product_id UUID,
+        transaction_type VARCHAR,
+        quantity DECIMAL,
+        from_location_id UUID,
+        to_location_id UUID,
+        lot_number VARCHAR,
+        reference_id UUID,
+        reference_type VARCHAR,
+        notes TEXT
+    );
+
+    IF EXISTS (
+        SELECT 1 FROM _bulk_movements m
+        WHERE m.quantity IS NULL OR m.quantity <= 0
+           OR m.transaction_type NOT IN ('RECEIPT', 'ISSUE', 'TRANSFER', 'ADJUSTMENT')
+           OR (m.transaction_type = 'RECEIPT' AND m.to_location_id IS NULL)
+           OR (m.transaction_type = 'ISSUE' AND m.from_location_id IS NULL)
+           OR (m.transaction_type = 'TRANSFER' AND (
+                m.from_location_id IS NULL OR m.to_location_id IS NULL
+                OR m.from_location_id = m.to_location_id))
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.from_location_id IS NULL AND m.to_location_id IS NULL)
+    ) THEN
+        RAISE EXCEPTION 'Batch contains invalid stock movements'
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+
+    -- Net delta per balance key; same legs as apply_stock_movement
+    CREATE TEMP TABLE _bulk_deltas ON COMMIT DROP AS
+    SELECT legs.product_id, legs.location_id, legs.lot_number, SUM(legs.delta) AS delta
+    FROM (
+        SELECT m.product_id, m.to_location_id AS location_id, m.lot_number, m.quantity AS delta
+        FROM _bulk_movements m
+        WHERE m.transaction_type IN ('RECEIPT', 'TRANSFER')
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.to_location_id IS NOT NULL)
+        UNION ALL
+        SELECT m.product_id, m.from_location_id, m.lot_number, -m.quantity
+        FROM _bulk_movements m
+        WHERE m.transaction_type IN ('ISSUE', 'TRANSFER')
+           OR (m.transaction_type = 'ADJUSTMENT' AND m.to_location_id IS NULL)
+    ) legs
+    GROUP BY legs.product_id, legs.location_id, legs.lot_number;
+
+    -- Same advisory locks as single movements, taken in a fixed order
+    PERFORM lock_inventory_balance(d.product_id, d.location_id, d.lot_number)
+    FROM (
+        SELECT * FROM _bulk_deltas
+        ORDER BY product_id, location_id, lot_number NULLS FIRST
+    ) d;
+
+    SELECT jsonb_agg(jsonb_build_object(
+        'product_id', d.product_id,
+        'location_id', d.location_id,
+        'lot_number', d.lot_number,
+        'available_qty', COALESCE(i.available_qty, 0),
+        'delta', d.delta
+    ))
+    INTO v_shortages
+    FROM _bulk_deltas d
+    LEFT JOIN inventory i
+      ON i.product_id = d.product_id
+     AND i.location_id = d.location_id
+     AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+    WHERE COALESCE(i.available_qty, 0) + d.delta < 0;
+
+    IF v_shortages IS NOT NULL THEN
+        RETURN jsonb_build_object('transactions', '[]'::JSONB, 'shortages', v_shortages);
+    END IF;
+
+    -- =============================================
+    -- Balances: one UPDATE for existing rows, one INSERT for new ones
+    -- =============================================
+    UPDATE inventory i
+    SET available_qty = i.available_qty + d.delta,
+        last_transaction_at = NOW()
+    FROM _bulk_deltas d
+    WHERE i.product_id = d.product_id
+      AND i.location_id = d.location_id
+      AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+      AND d.delta <> 0;
+
+    INSERT INTO inventory (product_id, location_id, available_qty, allocated_qty, in_transit_qty, lot_number, last_transaction_at)
+    SELECT d.product_id, d.location_id, d.delta, 0, 0, d.lot_number, NOW()
+    FROM _bulk_deltas d
+    WHERE d.delta <> 0
+      AND NOT EXISTS (
+        SELECT 1 FROM inventory i
+        WHERE i.product_id = d.product_id
+          AND i.location_id = d.location_id
+          AND i.lot_number IS NOT DISTINCT FROM d.lot_number
+    );
+
+    -- =============================================
+    -- Ledger: one multi-row insert in line order
+    -- =============================================
+    INSERT INTO inventory_transactions (
+        id, product_id, transaction_type, quantity, from_location_id, to_location_id,
+        lot_number, reference_id, reference_type, notes, performed_by
+    )
+    SELECT
+        m.id, m.product_id, m.transaction_type, m.quantity, m.from_location_id, m.to_location_id,
+        m.lot_number, m.reference_id, m.reference_type, m.notes, p_performed_by
+    FROM _bulk_movements m
+    ORDER BY m.line;
+
+    RETURN jsonb_build_object(
+        'transactions', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('line', m.line, 'id', m.id) ORDER BY m.line), '[]'::JSONB)
+            FROM _bulk_movements m
+        ),
+        'shortages', '[]'::JSONB
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION apply_stock_movements_bulk IS 'Applies a batch of stock movements with set-based balance updates and a single ledger insert; writes nothing and reports shortages if any balance would go negative';
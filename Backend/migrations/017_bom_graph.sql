@@ -0,0 +1,38 @@
+-- =============================================
+-- BOM GRAPH LOADER
+-- Fetches every BOM reachable from a set of root BOMs through
+-- sub-assemblies, with all their material lines, in one call
+-- =============================================
+
+-- =============================================
+-- STEP 1: REACHABLE GRAPH
+-- =============================================
+-- Returns {"boms": [...], "materials": [...]}. UNION (not UNION ALL)
+-- stops the recursion on circular references; cycles are reported by
+-- the application when it walks the graph.
+
+CREATE OR REPLACE FUNCTION get_bom_graph(p_bom_ids UUID[])
+RETURNS JSONB AS $$
+    WITH RECURSIVE reachable(bom_id) AS (
+        SELECT unnest(p_bom_ids)
+        UNION
+        SELECT bm.sub_assembly_bom_id
+        FROM bom_materials bm
+        JOIN reachable r ON bm.bom_id = r.bom_id
+        WHERE bm.sub_assembly_bom_id IS NOT NULL
+    )
+    SELECT jsonb_build_object(
+        'boms', COALESCE((
+            SELECT jsonb_agg(to_jsonb(b))
+            FROM boms b
+            JOIN reachable r ON r.bom_id = b.id
+        ), '[]'::JSONB),
+        'materials', COALESCE((
+            SELECT jsonb_agg(to_jsonb(bm) ORDER BY bm.bom_id, bm.sequence_number)
+            FROM bom_materials bm
+            JOIN reachable r ON r.bom_id = bm.bom_id
+        ), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_bom_graph IS 'BOMs and material lines reachable from the given BOMs through sub-assemblies';
@@ -0,0 +1,169 @@
+-- =============================================
+-- BOM WHERE-USED INDEX
+-- For every BOM, every material it consumes at any sub-assembly
+-- level with the effective quantity, kept current by triggers
+-- =============================================
+
+-- =============================================
+-- STEP 1: INDEX TABLE
+-- =============================================
+-- One row per (material, BOM). A material reached through several
+-- paths is consolidated: quantities are summed, levels give the
+-- shallowest and deepest occurrence (0 = directly on the BOM).
+
+CREATE TABLE IF NOT EXISTS bom_where_used (
+    material_id UUID NOT NULL,
+    bom_id UUID NOT NULL REFERENCES boms(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL,            -- product the BOM builds
+    is_active BOOLEAN NOT NULL DEFAULT true,
+    min_level INT NOT NULL,
+    max_level INT NOT NULL,
+    path_count INT NOT NULL,
+    is_direct BOOLEAN NOT NULL,
+    quantity_per_batch DECIMAL(20,6) NOT NULL,  -- per BOM batch, scrap included
+    quantity_per_unit DECIMAL(20,6) NOT NULL,   -- per unit of the BOM's product
+    PRIMARY KEY (material_id, bom_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_bom_where_used_bom ON bom_where_used(bom_id);
+
+-- =============================================
+-- STEP 2: REFRESH
+-- =============================================
+-- Recomputes the given BOMs and every BOM that uses them as a
+-- sub-assembly (directly or indirectly).
+
+CREATE OR REPLACE FUNCTION refresh_bom_where_used(p_bom_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS _where_used_affected (bom_id UUID PRIMARY KEY) ON COMMIT DROP;
+    TRUNCATE _where_used_affected;
+
+    INSERT INTO _where_used_affected
+    WITH RECURSIVE affected(bom_id) AS (
+        SELECT unnest(p_bom_ids)
+        UNION
+        SELECT bm.bom_id
+        FROM bom_materials bm
+        JOIN affected a ON bm.sub_assembly_bom_id = a.bom_id
+        WHERE bm.is_sub_assembly
+    )
+    SELECT a.bom_id FROM affected a WHERE a.bom_id IS NOT NULL;
+
+    DELETE FROM bom_where_used w
+    USING _where_used_affected a
+    WHERE w.bom_id = a.bom_id;
+
+    INSERT INTO bom_where_used (
+        material_id, bom_id, product_id, is_active, min_level, max_level,
+        path_count, is_direct, quantity_per_batch, quantity_per_unit
+    )
+    WITH RECURSIVE walk AS (
+        SELECT
+            b.id AS root_id,
+            bm.material_id,
+            CASE WHEN bm.is_sub_assembly THEN bm.sub_assembly_bom_id END AS sub_bom_id,
+            bm.quantity * (1 + COALESCE(bm.scrap_percentage, 0) / 100) AS qty,
+            0 AS level,
+            ARRAY[b.id] AS path
+        FROM _where_used_affected a
+        JOIN boms b ON b.id = a.bom_id
+        JOIN bom_materials bm ON bm.bom_id = b.id
+
+        UNION ALL
+
+        SELECT
+            w.root_id,
+            bm.material_id,
+            CASE WHEN bm.is_sub_assembly THEN bm.sub_assembly_bom_id END,
+            w.qty * bm.quantity * (1 + COALESCE(bm.scrap_percentage, 0) / 100),
+            w.level + 1,
+            w.path || w.sub_bom_id
+        FROM walk w
+        JOIN bom_materials bm ON bm.bom_id = w.sub_bom_id
+        WHERE NOT (w.sub_bom_id = ANY(w.path))  -- stop on circular references
+    )
+    SELECT
+        w.material_id,
+        w.root_id,
+        b.product_id,
+        COALESCE(b.is_active, true),
+        MIN(w.level),
+        MAX(w.level),
+        COUNT(*),
+        BOOL_OR(w.level = 0),
+        SUM(w.qty),
+        SUM(w.qty) / COALESCE(b.batch_size, 100)
+    FROM walk w
+    JOIN boms b ON b.id = w.root_id
+    GROUP BY w.material_id, w.root_id, b.product_id, b.is_active, b.batch_size;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 3: TRIGGERS
+-- =============================================
+
+CREATE OR REPLACE FUNCTION sync_bom_where_used_materials()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_bom_where_used(ARRAY(SELECT DISTINCT bom_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_bom_where_used(ARRAY(
+            SELECT bom_id FROM new_rows UNION SELECT bom_id FROM old_rows
+        ));
+    ELSE
+        PERFORM refresh_bom_where_used(ARRAY(SELECT DISTINCT bom_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bom_where_used_insert ON bom_materials;
+CREATE TRIGGER trg_bom_where_used_insert
+    AFTER INSERT ON bom_materials
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_where_used_materials();
+
+DROP TRIGGER IF EXISTS trg_bom_where_used_update ON bom_materials;
+CREATE TRIGGER trg_bom_where_used_update
+    AFTER UPDATE ON bom_materials
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_where_used_materials();
+
+DROP TRIGGER IF EXISTS trg_bom_where_used_delete ON bom_materials;
+CREATE TRIGGER trg_bom_where_used_delete
+    AFTER DELETE ON bom_materials
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_where_used_materials();
+
+-- Batch size, activation and product changes affect only the BOM's own rows
+CREATE OR REPLACE FUNCTION sync_bom_where_used_header()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE bom_where_used w SET
+        product_id = NEW.product_id,
+        is_active = COALESCE(NEW.is_active, true),
+        quantity_per_unit = w.quantity_per_batch / COALESCE(NEW.batch_size, 100)
+    WHERE w.bom_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bom_where_used_header ON boms;
+CREATE TRIGGER trg_bom_where_used_header
+    AFTER UPDATE OF batch_size, is_active, product_id ON boms
+    FOR EACH ROW
+    WHEN (OLD.batch_size IS DISTINCT FROM NEW.batch_size
+       OR OLD.is_active IS DISTINCT FROM NEW.is_active
+       OR OLD.product_id IS DISTINCT FROM NEW.product_id)
+    EXECUTE FUNCTION sync_bom_where_used_header();
+
+-- =============================================
+-- STEP 4: BACKFILL
+-- =============================================
+
+SELECT refresh_bom_where_used(ARRAY(SELECT id FROM boms));
+
+COMMENT ON TABLE bom_where_used IS 'Multi-level where-used index: every material each BOM consumes, with effective quantities';
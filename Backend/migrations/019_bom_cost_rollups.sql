@@ -0,0 +1,247 @@
+-- =============================================
+-- BOM COST ROLLUPS
+-- Rolled-up material cost per BOM (all sub-assembly levels),
+-- recomputed on write along the where-used chain so list and
+-- detail views read stored totals
+-- =============================================
+-- Costs are for one batch (the listed quantities). Sub-assembly lines
+-- cost their own rollup times the line quantity and scrap, the same
+-- rule as BOMGraph.explode. Raw materials are priced from
+-- inventory_items (matched to products by code) when the rollup is
+-- computed, falling back to the line's unit_cost.
+
+-- =============================================
+-- STEP 1: ROLLUP TABLE
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS bom_cost_rollups (
+    bom_id UUID PRIMARY KEY REFERENCES boms(id) ON DELETE CASCADE,
+    material_count INT NOT NULL DEFAULT 0,             -- lines on the BOM itself
+    material_cost DECIMAL(20,4) NOT NULL DEFAULT 0,    -- direct raw materials
+    scrap_cost DECIMAL(20,4) NOT NULL DEFAULT 0,       -- scrap allowance on direct raw materials
+    sub_assembly_cost DECIMAL(20,4) NOT NULL DEFAULT 0,-- sub-assembly lines, scrap included
+    total_cost DECIMAL(20,4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- =============================================
+-- STEP 2: REFRESH
+-- =============================================
+-- Recomputes the given BOMs and every BOM above them in one statement.
+
+CREATE OR REPLACE FUNCTION refresh_bom_cost_rollups(p_bom_ids UUID[])
+RETURNS VOID AS $$
+BEGIN
+    WITH RECURSIVE lines AS (
+        -- BOM lines with the current material price
+        SELECT
+            bm.bom_id,
+            bm.quantity,
+            COALESCE(bm.scrap_percentage, 0) AS scrap,
+            COALESCE(ii.unit_cost, bm.unit_cost, 0) AS unit_cost,
+            CASE WHEN bm.is_sub_assembly THEN bm.sub_assembly_bom_id END AS sub_bom_id
+        FROM bom_materials bm
+        LEFT JOIN products p ON p.id = bm.material_id
+        LEFT JOIN inventory_items ii ON ii.material_code = p.code
+    ),
+    affected(bom_id) AS (
+        SELECT unnest(p_bom_ids)
+        UNION
+        SELECT bm.bom_id
+        FROM bom_materials bm
+        JOIN affected a ON bm.sub_assembly_bom_id = a.bom_id
+        WHERE bm.is_sub_assembly
+    ),
+    walk AS (
+        -- factor: quantity of the current BOM per root batch (1 at the root)
+        SELECT
+            b.id AS root_id,
+            1::NUMERIC AS factor,
+            l.quantity,
+            l.scrap,
+            l.unit_cost,
+            l.sub_bom_id,
+            0 AS level,
+            ARRAY[b.id] AS path
+        FROM affected a
+        JOIN boms b ON b.id = a.bom_id
+        JOIN lines l ON l.bom_id = b.id
+
+        UNION ALL
+
+        SELECT
+            w.root_id,
+            w.factor * w.quantity * (1 + w.scrap / 100),
+            l.quantity,
+            l.scrap,
+            l.unit_cost,
+            l.sub_bom_id,
+            w.level + 1,
+            w.path || w.sub_bom_id
+        FROM walk w
+        JOIN lines l ON l.bom_id = w.sub_bom_id
+        WHERE NOT (w.sub_bom_id = ANY(w.path))  -- stop on circular references
+    ),
+    costs AS (
+        SELECT
+            w.root_id,
+            COUNT(*) FILTER (WHERE w.level = 0) AS material_count,
+            COALESCE(SUM(w.quantity * w.unit_cost)
+                FILTER (WHERE w.level = 0 AND w.sub_bom_id IS NULL), 0) AS material_cost,
+            COALESCE(SUM(w.quantity * w.unit_cost * w.scrap / 100)
+                FILTER (WHERE w.level = 0 AND w.sub_bom_id IS NULL), 0) AS scrap_cost,
+            COALESCE(SUM(w.factor * w.quantity * w.unit_cost * (1 + w.scrap / 100))
+                FILTER (WHERE w.level > 0 AND w.sub_bom_id IS NULL), 0) AS sub_assembly_cost
+        FROM walk w
+        GROUP BY w.root_id
+    )
+    INSERT INTO bom_cost_rollups AS r (
+        bom_id, material_count, material_cost, scrap_cost, sub_assembly_cost, total_cost, updated_at
+    )
+    SELECT
+        b.id,
+        COALESCE(c.material_count, 0),
+        COALESCE(c.material_cost, 0),
+        COALESCE(c.scrap_cost, 0),
+        COALESCE(c.sub_assembly_cost, 0),
+        COALESCE(c.material_cost + c.scrap_cost + c.sub_assembly_cost, 0),
+        NOW()
+    FROM affected a
+    JOIN boms b ON b.id = a.bom_id
+    LEFT JOIN costs c ON c.root_id = b.id
+    ON CONFLICT (bom_id) DO UPDATE SET
+        material_count = EXCLUDED.material_count,
+        material_cost = EXCLUDED.material_cost,
+        scrap_cost = EXCLUDED.scrap_cost,
+        sub_assembly_cost = EXCLUDED.sub_assembly_cost,
+        total_cost = EXCLUDED.total_cost,
+        updated_at = EXCLUDED.updated_at
+    WHERE (r.material_count, r.material_cost, r.scrap_cost, r.sub_assembly_cost)
+          IS DISTINCT FROM
+          (EXCLUDED.material_count, EXCLUDED.material_cost, EXCLUDED.scrap_cost, EXCLUDED.sub_assembly_cost);
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 3: BOM WRITE TRIGGERS
+-- =============================================
+-- Replaces the 018 trigger function: material line changes refresh both
+-- the where-used index and the cost rollups, but price-only updates
+-- skip the where-used walk (quantities are unchanged).
+
+CREATE OR REPLACE FUNCTION sync_bom_where_used_materials()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_bom_where_used(ARRAY(SELECT DISTINCT bom_id FROM new_rows));
+        PERFORM refresh_bom_cost_rollups(ARRAY(SELECT DISTINCT bom_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_bom_where_used(ARRAY(
+            SELECT n.bom_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (n.bom_id, n.material_id, n.quantity, n.scrap_percentage, n.is_sub_assembly, n.sub_assembly_bom_id)
+                  IS DISTINCT FROM
+                  (o.bom_id, o.material_id, o.quantity, o.scrap_percentage, o.is_sub_assembly, o.sub_assembly_bom_id)
+            UNION
+            SELECT o.bom_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE n.bom_id IS DISTINCT FROM o.bom_id
+        ));
+        PERFORM refresh_bom_cost_rollups(ARRAY(
+            SELECT bom_id FROM new_rows UNION SELECT bom_id FROM old_rows
+        ));
+    ELSE
+        PERFORM refresh_bom_where_used(ARRAY(SELECT DISTINCT bom_id FROM old_rows));
+        PERFORM refresh_bom_cost_rollups(ARRAY(SELECT DISTINCT bom_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- New BOMs start with an empty rollup
+CREATE OR REPLACE FUNCTION init_bom_cost_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO bom_cost_rollups (bom_id) VALUES (NEW.id)
+    ON CONFLICT (bom_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bom_cost_rollup_init ON boms;
+CREATE TRIGGER trg_bom_cost_rollup_init
+    AFTER INSERT ON boms
+    FOR EACH ROW EXECUTE FUNCTION init_bom_cost_rollup();
+
+-- =============================================
+-- STEP 4: PRICE CHANGES
+-- =============================================
+-- Material prices live on inventory_items (matched to products by
+-- code) and are read by the rollup; bom_materials is not touched. A
+-- statement that changes prices refreshes the BOMs using those
+-- materials (and their parents) once. Transition tables cannot be
+-- combined with UPDATE OF column lists or several events, so there is
+-- one trigger per event and unchanged prices are filtered here.
+
+CREATE OR REPLACE FUNCTION sync_bom_material_prices()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_bom_cost_rollups(ARRAY(
+            SELECT DISTINCT bm.bom_id
+            FROM new_rows n
+            JOIN products p ON p.code = n.material_code
+            JOIN bom_materials bm ON bm.material_id = p.id
+            WHERE NOT COALESCE(bm.is_sub_assembly, false)
+        ));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_bom_cost_rollups(ARRAY(
+            SELECT DISTINCT bm.bom_id
+            FROM (
+                SELECT n.material_code FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE (n.material_code, n.unit_cost) IS DISTINCT FROM (o.material_code, o.unit_cost)
+                UNION
+                SELECT o.material_code FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE n.material_code IS DISTINCT FROM o.material_code
+            ) changed
+            JOIN products p ON p.code = changed.material_code
+            JOIN bom_materials bm ON bm.material_id = p.id
+            WHERE NOT COALESCE(bm.is_sub_assembly, false)
+        ));
+    ELSE
+        PERFORM refresh_bom_cost_rollups(ARRAY(
+            SELECT DISTINCT bm.bom_id
+            FROM old_rows o
+            JOIN products p ON p.code = o.material_code
+            JOIN bom_materials bm ON bm.material_id = p.id
+            WHERE NOT COALESCE(bm.is_sub_assembly, false)
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_items_bom_prices ON inventory_items;
+DROP TRIGGER IF EXISTS trg_inventory_items_bom_prices_insert ON inventory_items;
+CREATE TRIGGER trg_inventory_items_bom_prices_insert
+    AFTER INSERT ON inventory_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_material_prices();
+
+DROP TRIGGER IF EXISTS trg_inventory_items_bom_prices_update ON inventory_items;
+CREATE TRIGGER trg_inventory_items_bom_prices_update
+    AFTER UPDATE ON inventory_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_material_prices();
+
+DROP TRIGGER IF EXISTS trg_inventory_items_bom_prices_delete ON inventory_items;
+CREATE TRIGGER trg_inventory_items_bom_prices_delete
+    AFTER DELETE ON inventory_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_material_prices();
+
+-- =============================================
+-- STEP 5: BACKFILL
+-- =============================================
+
+SELECT refresh_bom_cost_rollups(ARRAY(SELECT id FROM boms));
+
+COMMENT ON TABLE bom_cost_rollups IS 'Rolled-up material cost per BOM batch across all sub-assembly levels, maintained by triggers';
@@ -0,0 +1,71 @@
+-- =============================================
+-- MRP INPUTS
+-- Open production orders, their outstanding material requirements
+-- and the stock position of every required material, in one call
+-- =============================================
+
+CREATE INDEX IF NOT EXISTS idx_prod_orders_open ON production_orders(status, priority, due_date)
+    WHERE status IN ('Planned', 'In Progress');
+
+-- =============================================
+-- STEP 1: INPUT LOADER
+-- =============================================
+-- Requirements come from order_materials (what the order was planned
+-- with) less what has been issued; orders planned before their
+-- materials were recorded fall back to the product's active BOM.
+-- Stock is summed over all locations.
+
+CREATE OR REPLACE FUNCTION get_mrp_inputs(p_statuses TEXT[] DEFAULT ARRAY['Planned', 'In Progress'])
+RETURNS JSONB AS $$
+    WITH orders AS (
+        SELECT o.id, o.order_number, o.product_id, o.quantity, o.status,
+               o.priority, o.due_date, o.created_at
+        FROM production_orders o
+        WHERE o.status = ANY(p_statuses)
+    ),
+    planned AS (
+        SELECT
+            om.order_id,
+            om.product_id AS material_id,
+            SUM(GREATEST(om.required_qty - COALESCE(om.issued_qty, 0), 0)) AS gross_qty,
+            SUM(COALESCE(om.allocated_qty, 0)) AS allocated_qty
+        FROM order_materials om
+        JOIN orders o ON o.id = om.order_id
+        GROUP BY om.order_id, om.product_id
+    ),
+    from_bom AS (
+        SELECT
+            o.id AS order_id,
+            bm.material_id,
+            SUM(o.quantity / COALESCE(b.batch_size, 100) * bm.quantity
+                * (1 + COALESCE(bm.scrap_percentage, 0) / 100)) AS gross_qty,
+            0::DECIMAL AS allocated_qty
+        FROM orders o
+        JOIN boms b ON b.product_id = o.product_id AND b.is_active
+        JOIN bom_materials bm ON bm.bom_id = b.id
+        WHERE NOT EXISTS (SELECT 1 FROM order_materials om WHERE om.order_id = o.id)
+        GROUP BY o.id, bm.material_id
+    ),
+    requirements AS (
+        SELECT * FROM planned
+        UNION ALL
+        SELECT * FROM from_bom
+    ),
+    stock AS (
+        SELECT
+            i.product_id AS material_id,
+            SUM(i.available_qty) AS available_qty,
+            SUM(i.allocated_qty) AS allocated_qty,
+            SUM(COALESCE(i.in_transit_qty, 0)) AS in_transit_qty
+        FROM inventory i
+        WHERE i.product_id IN (SELECT material_id FROM requirements)
+        GROUP BY i.product_id
+    )
+    SELECT jsonb_build_object(
+        'orders', COALESCE((SELECT jsonb_agg(to_jsonb(o)) FROM orders o), '[]'::JSONB),
+        'requirements', COALESCE((SELECT jsonb_agg(to_jsonb(r)) FROM requirements r), '[]'::JSONB),
+        'stock', COALESCE((SELECT jsonb_agg(to_jsonb(s)) FROM stock s), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_mrp_inputs IS 'Open orders, outstanding material requirements and stock totals for an MRP run';
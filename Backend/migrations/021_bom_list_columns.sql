@@ -0,0 +1,118 @@
+-- =============================================
+-- BOM LIST COLUMNS
+-- Product code/name, material count and rolled-up cost copied onto
+-- boms so the BOM list is one indexed query that can search, sort
+-- and filter by cost
+-- =============================================
+
+-- =============================================
+-- STEP 1: COLUMNS & INDEXES
+-- =============================================
+
+ALTER TABLE boms
+ADD COLUMN IF NOT EXISTS product_code VARCHAR(50),
+ADD COLUMN IF NOT EXISTS product_name VARCHAR(255),
+ADD COLUMN IF NOT EXISTS material_count INT NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS total_cost DECIMAL(20,4) NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_boms_created_at ON boms(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_boms_total_cost ON boms(total_cost);
+CREATE INDEX IF NOT EXISTS idx_boms_product_code ON boms(product_code);
+CREATE INDEX IF NOT EXISTS idx_boms_product_code_trgm ON boms USING gin(product_code gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_boms_product_name_trgm ON boms USING gin(product_name gin_trgm_ops);
+
+COMMENT ON COLUMN boms.total_cost IS 'Copy of bom_cost_rollups.total_cost (per batch, all levels)';
+COMMENT ON COLUMN boms.material_count IS 'Copy of bom_cost_rollups.material_count';
+
+-- =============================================
+-- STEP 2: PRODUCT CODE / NAME
+-- =============================================
+
+CREATE OR REPLACE FUNCTION set_bom_product_fields()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT p.code, p.name INTO NEW.product_code, NEW.product_name
+    FROM products p
+    WHERE p.id = NEW.product_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_boms_product_fields ON boms;
+CREATE TRIGGER trg_boms_product_fields
+    BEFORE INSERT OR UPDATE OF product_id ON boms
+    FOR EACH ROW EXECUTE FUNCTION set_bom_product_fields();
+
+CREATE OR REPLACE FUNCTION sync_bom_product_fields()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE boms SET
+        product_code = NEW.code,
+        product_name = NEW.name
+    WHERE product_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_bom_fields ON products;
+CREATE TRIGGER trg_products_bom_fields
+    AFTER UPDATE OF code, name ON products
+    FOR EACH ROW
+    WHEN (OLD.code IS DISTINCT FROM NEW.code OR OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION sync_bom_product_fields();
+
+-- =============================================
+-- STEP 3: COUNT / COST FROM ROLLUPS
+-- =============================================
+-- bom_cost_rollups (019) is refreshed on every material line and price
+-- change; its changes are copied onto the BOM rows.
+
+CREATE OR REPLACE FUNCTION sync_bom_rollup_columns()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE boms b SET
+        material_count = n.material_count,
+        total_cost = n.total_cost
+    FROM new_rows n
+    WHERE b.id = n.bom_id
+      AND (b.material_count, b.total_cost) IS DISTINCT FROM (n.material_count, n.total_cost);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bom_cost_rollups_insert ON bom_cost_rollups;
+CREATE TRIGGER trg_bom_cost_rollups_insert
+    AFTER INSERT ON bom_cost_rollups
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_rollup_columns();
+
+DROP TRIGGER IF EXISTS trg_bom_cost_rollups_update ON bom_cost_rollups;
+CREATE TRIGGER trg_bom_cost_rollups_update
+    AFTER UPDATE ON bom_cost_rollups
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_bom_rollup_columns();
+
+-- Copied columns are not edits to the BOM: leave updated_at alone
+DROP TRIGGER IF EXISTS update_boms_updated_at ON boms;
+CREATE TRIGGER update_boms_updated_at BEFORE UPDATE ON boms
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - ARRAY['product_code', 'product_name', 'material_count', 'total_cost', 'updated_at'])
+          IS DISTINCT FROM
+          (to_jsonb(NEW) - ARRAY['product_code', 'product_name', 'material_count', 'total_cost', 'updated_at']))
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- =============================================
+-- STEP 4: BACKFILL
+-- =============================================
+
+UPDATE boms b SET
+    product_code = p.code,
+    product_name = p.name
+FROM products p
+WHERE p.id = b.product_id;
+
+UPDATE boms b SET
+    material_count = r.material_count,
+    total_cost = r.total_cost
+FROM bom_cost_rollups r
+WHERE r.bom_id = b.id;
@@ -0,0 +1,58 @@
+-- =============================================
+-- BULK BOM MATERIAL WRITES
+-- Writes all material lines of a BOM in one statement and one
+-- transaction, so the bom_materials statement triggers (where-used,
+-- cost rollups) run once per save instead of once per line
+-- =============================================
+
+-- =============================================
+-- STEP 1: SAVE FUNCTION
+-- =============================================
+-- p_materials: [{material_id, quantity, unit, scrap_percentage,
+-- unit_cost, sequence_number}, ...]. With p_replace the BOM's existing
+-- lines are deleted first; either both happen or neither.
+
+CREATE OR REPLACE FUNCTION save_bom_materials(
+    p_bom_id UUID,
+    p_materials JSONB,
+    p_replace BOOLEAN DEFAULT false
+)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM boms WHERE id = p_bom_id) THEN
+        RAISE EXCEPTION 'BOM % not found', p_bom_id
+            USING ERRCODE = 'no_data_found';
+    END IF;
+
+    IF p_replace THEN
+        DELETE FROM bom_materials WHERE bom_id = p_bom_id;
+    END IF;
+
+    INSERT INTO bom_materials (
+        bom_id, material_id, quantity, unit, scrap_percentage, unit_cost, sequence_number
+    )
+    SELECT
+        p_bom_id,
+        m.material_id,
+        m.quantity,
+        m.unit,
+        COALESCE(m.scrap_percentage, 0),
+        COALESCE(m.unit_cost, 0),
+        m.sequence_number
+    FROM jsonb_to_recordset(p_materials) AS m(
+        material_id UUID,
+        quantity DECIMAL,
+        unit VARCHAR,
+        scrap_percentage DECIMAL,
+        unit_cost DECIMAL,
+        sequence_number INT
+    );
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION save_bom_materials IS 'Insert (or replace) all material lines of a BOM in one transaction';
@@ -0,0 +1,28 @@
+-- =============================================
+-- BOM VERSION DIFFS
+-- Versions store the changes against the previous version; only
+-- periodic checkpoints keep a full snapshot
+-- =============================================
+
+-- =============================================
+-- STEP 1: COLUMNS
+-- =============================================
+-- Existing rows hold full snapshots and become checkpoints.
+
+ALTER TABLE bom_versions ALTER COLUMN snapshot DROP NOT NULL;
+
+ALTER TABLE bom_versions
+ADD COLUMN IF NOT EXISTS is_checkpoint BOOLEAN NOT NULL DEFAULT true,
+ADD COLUMN IF NOT EXISTS changes JSONB;  -- diff against the previous version
+
+ALTER TABLE bom_versions DROP CONSTRAINT IF EXISTS check_bom_version_checkpoint;
+ALTER TABLE bom_versions
+ADD CONSTRAINT check_bom_version_checkpoint
+CHECK (NOT is_checkpoint OR snapshot IS NOT NULL);
+
+-- Nearest checkpoint at or before a version
+CREATE INDEX IF NOT EXISTS idx_bom_versions_checkpoints ON bom_versions(bom_id, version DESC)
+    WHERE is_checkpoint;
+
+COMMENT ON COLUMN bom_versions.snapshot IS 'Full BOM state; set on checkpoint versions only';
+COMMENT ON COLUMN bom_versions.changes IS 'Header and material line changes since the previous version';
@@ -0,0 +1,24 @@
+-- =============================================
+-- BOM SUB-ASSEMBLY LINKS
+-- Every parent -> sub-assembly BOM link in one call, for in-memory
+-- cycle checks over the whole plant
+-- =============================================
+
+-- =============================================
+-- STEP 1: LINK LOADER
+-- =============================================
+-- Returned as one JSONB array of [bom_id, sub_assembly_bom_id] pairs
+-- so the result is not cut off by the API row limit.
+
+CREATE OR REPLACE FUNCTION get_bom_sub_assembly_links()
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_agg(jsonb_build_array(l.bom_id, l.sub_assembly_bom_id)), '[]'::JSONB)
+    FROM (
+        SELECT DISTINCT bm.bom_id, bm.sub_assembly_bom_id
+        FROM bom_materials bm
+        WHERE bm.is_sub_assembly
+          AND bm.sub_assembly_bom_id IS NOT NULL
+    ) l;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_bom_sub_assembly_links IS 'All distinct parent -> sub-assembly BOM links';
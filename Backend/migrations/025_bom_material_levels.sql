@@ -0,0 +1,29 @@
+-- =============================================
+-- BOM MATERIAL LEVELS
+-- Writes recalculated hierarchy levels for a whole BOM tree in one
+-- set-based statement
+-- =============================================
+
+-- =============================================
+-- STEP 1: LEVEL WRITER
+-- =============================================
+-- p_levels: [{id, level}, ...] for bom_materials rows. Rows that
+-- already have the level are left untouched.
+
+CREATE OR REPLACE FUNCTION set_bom_material_levels(p_levels JSONB)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    UPDATE bom_materials bm
+    SET level = l.level
+    FROM jsonb_to_recordset(p_levels) AS l(id UUID, level INT)
+    WHERE bm.id = l.id
+      AND bm.level IS DISTINCT FROM l.level;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION set_bom_material_levels IS 'Set hierarchy levels of many bom_materials rows in one statement';
@@ -0,0 +1,258 @@
+-- =============================================
+-- ACTIVITY EVENTS
+-- Append-only activity feed with denormalised display fields, so the
+-- recent-activity widget and the activity page are one indexed read
+-- =============================================
+
+-- =============================================
+-- STEP 1: TABLE
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS activity_events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    activity_type VARCHAR(50) NOT NULL,  -- e.g. inventory_in, gate_entry_accepted, transfer, user_registered
+    source_type VARCHAR(50) NOT NULL,    -- inventory_item_transaction, inventory_transaction, gate_entry, user
+    source_id UUID NOT NULL,
+    subject_code VARCHAR(100),           -- Material / product code, gate entry number, username
+    subject_name VARCHAR(255),
+    quantity DECIMAL(15,3),
+    unit VARCHAR(20),
+    details JSONB NOT NULL DEFAULT '{}'::JSONB,
+    user_id UUID,
+    user_name VARCHAR(255),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Feed order and keyset pagination
+CREATE INDEX IF NOT EXISTS idx_activity_events_feed ON activity_events(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_activity_events_type_feed ON activity_events(activity_type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_activity_events_source ON activity_events(source_type, source_id);
+
+COMMENT ON TABLE activity_events IS 'Append-only activity feed, written by triggers on the source tables';
+
+-- =============================================
+-- STEP 2: WRITERS
+-- =============================================
+-- Statement-level triggers, so bulk inserts (e.g. bulk stock
+-- movements) add their events in one statement.
+
+CREATE OR REPLACE FUNCTION log_inventory_item_transaction_events()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        quantity, unit, details, user_id, user_name, created_at
+    )
+    SELECT
+        'inventory_' || lower(n.transaction_type),
+        'inventory_item_transaction',
+        n.id,
+        i.material_code,
+        i.material_name,
+        n.quantity_change,
+        COALESCE(n.unit, i.unit),
+        jsonb_build_object('transaction_type', n.transaction_type, 'reason', n.reason),
+        n.created_by,
+        COALESCE(u.full_name, u.username),
+        COALESCE(n.transaction_date, NOW())
+    FROM new_rows n
+    LEFT JOIN inventory_items i ON i.id = n.inventory_item_id
+    LEFT JOIN users u ON u.id = n.created_by;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_item_transactions_activity ON inventory_item_transactions;
+CREATE TRIGGER trg_inventory_item_transactions_activity
+    AFTER INSERT ON inventory_item_transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_inventory_item_transaction_events();
+
+CREATE OR REPLACE FUNCTION log_inventory_transaction_events()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        quantity, unit, details, user_id, user_name, created_at
+    )
+    SELECT
+        lower(n.transaction_type),
+        'inventory_transaction',
+        n.id,
+        p.code,
+        p.name,
+        n.quantity,
+        p.unit,
+        jsonb_build_object('transaction_type', n.transaction_type, 'notes', n.notes),
+        n.performed_by,
+        COALESCE(u.full_name, u.username),
+        COALESCE(n.created_at, NOW())
+    FROM new_rows n
+    LEFT JOIN products p ON p.id = n.product_id
+    LEFT JOIN users u ON u.id = n.performed_by;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_inventory_transactions_activity ON inventory_transactions;
+CREATE TRIGGER trg_inventory_transactions_activity
+    AFTER INSERT ON inventory_transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_inventory_transaction_events();
+
+-- Gate entries log an event on arrival and on every status change
+CREATE OR REPLACE FUNCTION log_gate_entry_events()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- old_rows only exists for updates
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO activity_events (
+            activity_type, source_type, source_id, subject_code, subject_name,
+            details, user_id, user_name, created_at
+        )
+        SELECT
+            'gate_entry_' || n.status,
+            'gate_entry',
+            n.id,
+            n.entry_number,
+            n.vendor,
+            jsonb_build_object(
+                'entry_type', n.entry_type,
+                'status', n.status,
+                'vendor', n.vendor,
+                'destination_department', n.destination_department
+            ),
+            n.created_by,
+            COALESCE(u.full_name, u.username),
+            COALESCE(n.created_at, NOW())
+        FROM new_rows n
+        LEFT JOIN users u ON u.id = n.created_by;
+    ELSE
+        INSERT INTO activity_events (
+            activity_type, source_type, source_id, subject_code, subject_name,
+            details, user_id, user_name, created_at
+        )
+        SELECT
+            'gate_entry_' || n.status,
+            'gate_entry',
+            n.id,
+            n.entry_number,
+            n.vendor,
+            jsonb_build_object(
+                'entry_type', n.entry_type,
+                'status', n.status,
+                'vendor', n.vendor,
+                'destination_department', n.destination_department
+            ),
+            n.created_by,
+            COALESCE(u.full_name, u.username),
+            NOW()
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        LEFT JOIN users u ON u.id = n.created_by
+        WHERE o.status IS DISTINCT FROM n.status;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_gate_entries_activity_insert ON gate_entries;
+CREATE TRIGGER trg_gate_entries_activity_insert
+    AFTER INSERT ON gate_entries
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_gate_entry_events();
+
+DROP TRIGGER IF EXISTS trg_gate_entries_activity_update ON gate_entries;
+CREATE TRIGGER trg_gate_entries_activity_update
+    AFTER UPDATE ON gate_entries
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_gate_entry_events();
+
+CREATE OR REPLACE FUNCTION log_user_registered_events()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        user_id, user_name, created_at
+    )
+    SELECT
+        'user_registered',
+        'user',
+        n.id,
+        n.username,
+        n.full_name,
+        n.id,
+        n.username,
+        COALESCE(n.created_at, NOW())
+    FROM new_rows n;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_activity ON users;
+CREATE TRIGGER trg_users_activity
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_user_registered_events();
+
+-- =============================================
+-- STEP 3: BACKFILL
+-- =============================================
+-- Existing records, one event each (gate entries with their current
+-- status). Skipped if the feed already has events.
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM activity_events) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        quantity, unit, details, user_id, user_name, created_at
+    )
+    SELECT
+        'inventory_' || lower(t.transaction_type), 'inventory_item_transaction', t.id,
+        i.material_code, i.material_name, t.quantity_change, COALESCE(t.unit, i.unit),
+        jsonb_build_object('transaction_type', t.transaction_type, 'reason', t.reason),
+        t.created_by, COALESCE(u.full_name, u.username), COALESCE(t.transaction_date, NOW())
+    FROM inventory_item_transactions t
+    LEFT JOIN inventory_items i ON i.id = t.inventory_item_id
+    LEFT JOIN users u ON u.id = t.created_by;
+
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        quantity, unit, details, user_id, user_name, created_at
+    )
+    SELECT
+        lower(t.transaction_type), 'inventory_transaction', t.id,
+        p.code, p.name, t.quantity, p.unit,
+        jsonb_build_object('transaction_type', t.transaction_type, 'notes', t.notes),
+        t.performed_by, COALESCE(u.full_name, u.username), COALESCE(t.created_at, NOW())
+    FROM inventory_transactions t
+    LEFT JOIN products p ON p.id = t.product_id
+    LEFT JOIN users u ON u.id = t.performed_by;
+
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        details, user_id, user_name, created_at
+    )
+    SELECT
+        'gate_entry_' || g.status, 'gate_entry', g.id, g.entry_number, g.vendor,
+        jsonb_build_object(
+            'entry_type', g.entry_type,
+            'status', g.status,
+            'vendor', g.vendor,
+            'destination_department', g.destination_department
+        ),
+        g.created_by, COALESCE(u.full_name, u.username), COALESCE(g.created_at, NOW())
+    FROM gate_entries g
+    LEFT JOIN users u ON u.id = g.created_by;
+
+    INSERT INTO activity_events (
+        activity_type, source_type, source_id, subject_code, subject_name,
+        user_id, user_name, created_at
+    )
+    SELECT 'user_registered', 'user', u.id, u.username, u.full_name, u.id, u.username, COALESCE(u.created_at, NOW())
+    FROM users u;
+END $$;
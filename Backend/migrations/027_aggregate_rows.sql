@@ -0,0 +1,102 @@
+-- =============================================
+-- GROUPED AGGREGATES
+-- Counts and sums per group computed in Postgres, so status widgets
+-- transfer one row per group instead of every row
+-- =============================================
+
+-- =============================================
+-- STEP 1: AGGREGATE FUNCTION
+-- =============================================
+-- p_grouping_sets: [["status"], ["entry_type"], []] - one pass over the
+--   table with GROUP BY GROUPING SETS; [] is the grand total
+-- p_sums: columns to SUM per group
+-- p_filters: [["is_active", "eq", "true"], ["created_at", "gte", "2024-01-01"], ...]
+--   ops: eq, neq, gt, gte, lt, lte
+--
+-- Returns {"columns": [...], "rows": [{"mask", "keys", "count", "sums"}]}
+-- where bit i of mask (counting from the left, in `columns` order) is
+-- set when columns[i] is not part of the row's grouping set.
+--
+-- Identifiers are quoted with %I and values with %L; only the tables
+-- listed below can be aggregated.
+
+CREATE OR REPLACE FUNCTION aggregate_rows(
+    p_table TEXT,
+    p_grouping_sets JSONB DEFAULT '[[]]'::JSONB,
+    p_sums TEXT[] DEFAULT '{}',
+    p_filters JSONB DEFAULT '[]'::JSONB
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_columns TEXT[];
+    v_mask TEXT := '0';
+    v_keys TEXT := '''{}''::JSONB';
+    v_sums TEXT := '''{}''::JSONB';
+    v_sets TEXT;
+    v_where TEXT := 'true';
+    v_filter JSONB;
+    v_op TEXT;
+    v_result JSONB;
+BEGIN
+    IF p_table NOT IN ('production_orders', 'gate_entries', 'inventory_items') THEN
+        RAISE EXCEPTION 'Aggregation is not allowed on table %', p_table
+            USING ERRCODE = 'insufficient_privilege';
+    END IF;
+
+    v_columns := ARRAY(
+        SELECT DISTINCT c
+        FROM jsonb_array_elements(p_grouping_sets) s, jsonb_array_elements_text(s) c
+    );
+
+    IF cardinality(v_columns) > 0 THEN
+        SELECT
+            format('GROUPING(%s)', string_agg(format('%I', c), ', ' ORDER BY i)),
+            format('jsonb_build_object(%s)', string_agg(format('%L, %I', c, c), ', ' ORDER BY i))
+        INTO v_mask, v_keys
+        FROM unnest(v_columns) WITH ORDINALITY AS u(c, i);
+    END IF;
+
+    SELECT string_agg(
+        '(' || COALESCE((SELECT string_agg(format('%I', c), ', ') FROM jsonb_array_elements_text(s) c), '') || ')',
+        ', '
+    )
+    INTO v_sets
+    FROM jsonb_array_elements(p_grouping_sets) s;
+
+    IF cardinality(p_sums) > 0 THEN
+        SELECT format('jsonb_build_object(%s)', string_agg(format('%L, SUM(%I)', c, c), ', '))
+        INTO v_sums
+        FROM unnest(p_sums) c;
+    END IF;
+
+    FOR v_filter IN SELECT * FROM jsonb_array_elements(p_filters) LOOP
+        v_op := CASE v_filter->>1
+            WHEN 'eq' THEN '='
+            WHEN 'neq' THEN '<>'
+            WHEN 'gt' THEN '>'
+            WHEN 'gte' THEN '>='
+            WHEN 'lt' THEN '<'
+            WHEN 'lte' THEN '<='
+        END;
+        IF v_op IS NULL THEN
+            RAISE EXCEPTION 'Unknown filter operator %', v_filter->>1;
+        END IF;
+        v_where := v_where || format(' AND %I %s %L', v_filter->>0, v_op, v_filter->>2);
+    END LOOP;
+
+    EXECUTE format(
+        'SELECT jsonb_build_object(''columns'', to_jsonb(%L::TEXT[]), ''rows'', COALESCE(jsonb_agg(r), ''[]''::JSONB))
+         FROM (
+             SELECT %s AS "mask", %s AS "keys", COUNT(*) AS "count", %s AS "sums"
+             FROM %I
+             WHERE %s
+             GROUP BY GROUPING SETS (%s)
+         ) r',
+        v_columns, v_mask, v_keys, v_sums, p_table, v_where, COALESCE(v_sets, '()')
+    ) INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+COMMENT ON FUNCTION aggregate_rows IS 'Grouped counts and sums (GROUPING SETS) over an allowed table';
@@ -0,0 +1,72 @@
+-- =============================================
+-- MRP INPUTS: MULTI-LEVEL BOM FALLBACK
+-- Orders without recorded materials are exploded through their
+-- product's BOM down to leaf materials (in the application, with
+-- BOMGraph), instead of reading the BOM's single-level lines
+-- =============================================
+
+-- =============================================
+-- STEP 1: INPUT LOADER
+-- =============================================
+-- Requirements come from order_materials (what the order was planned
+-- with) less what has been issued. Orders planned before their
+-- materials were recorded are returned in `bom_orders` with one active
+-- BOM each (highest version, then most recently updated, if a product
+-- has several). Stock covers every material those BOMs use at any
+-- level (bom_where_used, migration 018), summed over all locations.
+
+CREATE OR REPLACE FUNCTION get_mrp_inputs(p_statuses TEXT[] DEFAULT ARRAY['Planned', 'In Progress'])
+RETURNS JSONB AS $$
+    WITH orders AS (
+        SELECT o.id, o.order_number, o.product_id, o.quantity, o.status,
+               o.priority, o.due_date, o.created_at
+        FROM production_orders o
+        WHERE o.status = ANY(p_statuses)
+    ),
+    planned AS (
+        SELECT
+            om.order_id,
+            om.product_id AS material_id,
+            SUM(GREATEST(om.required_qty - COALESCE(om.issued_qty, 0), 0)) AS gross_qty,
+            SUM(COALESCE(om.allocated_qty, 0)) AS allocated_qty
+        FROM order_materials om
+        JOIN orders o ON o.id = om.order_id
+        GROUP BY om.order_id, om.product_id
+    ),
+    bom_orders AS (
+        SELECT DISTINCT ON (o.id)
+            o.id AS order_id,
+            b.id AS bom_id,
+            o.quantity,
+            COALESCE(b.batch_size, 100) AS batch_size
+        FROM orders o
+        JOIN boms b ON b.product_id = o.product_id AND b.is_active
+        WHERE NOT EXISTS (SELECT 1 FROM order_materials om WHERE om.order_id = o.id)
+        ORDER BY o.id, b.version DESC NULLS LAST, b.updated_at DESC NULLS LAST, b.id
+    ),
+    materials AS (
+        SELECT material_id FROM planned
+        UNION
+        SELECT w.material_id
+        FROM bom_where_used w
+        JOIN bom_orders bo ON bo.bom_id = w.bom_id
+    ),
+    stock AS (
+        SELECT
+            i.product_id AS material_id,
+            SUM(i.available_qty) AS available_qty,
+            SUM(i.allocated_qty) AS allocated_qty,
+            SUM(COALESCE(i.in_transit_qty, 0)) AS in_transit_qty
+        FROM inventory i
+        WHERE i.product_id IN (SELECT material_id FROM materials)
+        GROUP BY i.product_id
+    )
+    SELECT jsonb_build_object(
+        'orders', COALESCE((SELECT jsonb_agg(to_jsonb(o)) FROM orders o), '[]'::JSONB),
+        'requirements', COALESCE((SELECT jsonb_agg(to_jsonb(r)) FROM planned r), '[]'::JSONB),
+        'bom_orders', COALESCE((SELECT jsonb_agg(to_jsonb(bo)) FROM bom_orders bo), '[]'::JSONB),
+        'stock', COALESCE((SELECT jsonb_agg(to_jsonb(s)) FROM stock s), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_mrp_inputs IS 'Open orders, recorded material requirements, orders to explode through their BOM and stock totals for an MRP run';
@@ -0,0 +1,161 @@
+-- =============================================
+-- INVENTORY SUMMARY COUNTER SHARDS
+-- The single counter row from migration 015 was updated by every
+-- inventory write (quantities change on every movement), serialising
+-- concurrent stock writes on its row lock. Counters are now spread
+-- over shard rows, each session adding to its own shard, and summed
+-- on read through inventory_summary_totals.
+-- =============================================
+
+-- =============================================
+-- STEP 1: TABLE AND READ VIEW
+-- =============================================
+-- Counters are rebuilt in STEP 4, so the table is recreated.
+
+DROP VIEW IF EXISTS inventory_summary_totals;
+DROP TABLE IF EXISTS inventory_summary;
+
+CREATE TABLE inventory_summary (
+    shard SMALLINT PRIMARY KEY CHECK (shard >= 0 AND shard < 16),
+    total_materials BIGINT NOT NULL DEFAULT 0,
+    total_skus BIGINT NOT NULL DEFAULT 0,
+    sufficient_count BIGINT NOT NULL DEFAULT 0,
+    low_stock_count BIGINT NOT NULL DEFAULT 0,
+    critical_count BIGINT NOT NULL DEFAULT 0,
+    out_of_stock_count BIGINT NOT NULL DEFAULT 0,
+    total_available_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    total_allocated_qty DECIMAL(20,3) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Shards hold deltas (a single shard may go negative); only the sum is meaningful
+CREATE VIEW inventory_summary_totals AS
+SELECT
+    COALESCE(SUM(total_materials), 0)::BIGINT AS total_materials,
+    COALESCE(SUM(total_skus), 0)::BIGINT AS total_skus,
+    COALESCE(SUM(sufficient_count), 0)::BIGINT AS sufficient_count,
+    COALESCE(SUM(low_stock_count), 0)::BIGINT AS low_stock_count,
+    COALESCE(SUM(critical_count), 0)::BIGINT AS critical_count,
+    COALESCE(SUM(out_of_stock_count), 0)::BIGINT AS out_of_stock_count,
+    COALESCE(SUM(total_available_qty), 0) AS total_available_qty,
+    COALESCE(SUM(total_allocated_qty), 0) AS total_allocated_qty,
+    MAX(updated_at) AS updated_at
+FROM inventory_summary;
+
+-- =============================================
+-- STEP 2: COUNTER MAINTENANCE
+-- =============================================
+-- Same deltas as migration 015, added to the shard of the current
+-- session, so concurrent writers on different connections do not wait
+-- on each other.
+
+CREATE OR REPLACE FUNCTION inventory_summary_shard()
+RETURNS SMALLINT AS $$
+    SELECT (pg_backend_pid() % 16)::SMALLINT;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION apply_inventory_stock_status_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS _status_changes (
+        product_id UUID,
+        available_qty DECIMAL(15,3),
+        allocated_qty DECIMAL(15,3),
+        status VARCHAR(20),
+        sign INT
+    ) ON COMMIT DROP;
+    TRUNCATE _status_changes;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO _status_changes
+        SELECT product_id, available_qty, allocated_qty, status, 1 FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO _status_changes
+        SELECT product_id, available_qty, allocated_qty, status, -1 FROM old_rows;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM _status_changes) THEN
+        RETURN NULL;
+    END IF;
+
+    WITH deltas AS (
+        SELECT product_id, SUM(sign) AS delta
+        FROM _status_changes
+        GROUP BY product_id
+        HAVING SUM(sign) <> 0
+    ),
+    counted AS (
+        INSERT INTO inventory_summary_products AS p (product_id, row_count)
+        SELECT product_id, delta FROM deltas
+        ON CONFLICT (product_id) DO UPDATE SET row_count = p.row_count + EXCLUDED.row_count
+        RETURNING p.product_id, p.row_count
+    )
+    INSERT INTO inventory_summary AS s (
+        shard, total_skus, total_materials, sufficient_count, low_stock_count,
+        critical_count, out_of_stock_count, total_available_qty, total_allocated_qty, updated_at
+    )
+    SELECT
+        inventory_summary_shard(),
+        (
+            SELECT COUNT(*) FILTER (WHERE c.row_count > 0 AND c.row_count - d.delta <= 0)
+                 - COUNT(*) FILTER (WHERE c.row_count <= 0 AND c.row_count - d.delta > 0)
+            FROM counted c JOIN deltas d ON d.product_id = c.product_id
+        ),
+        t.rows, t.sufficient, t.low_stock, t.critical, t.out_of_stock, t.available, t.allocated,
+        NOW()
+    FROM (
+        SELECT
+            COALESCE(SUM(sign), 0) AS rows,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Sufficient'), 0) AS sufficient,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Low Stock'), 0) AS low_stock,
+            COALESCE(SUM(sign) FILTER (WHERE status = 'Critical'), 0) AS critical,
+            COALESCE(SUM(sign) FILTER (WHERE available_qty <= 0), 0) AS out_of_stock,
+            COALESCE(SUM(sign * available_qty), 0) AS available,
+            COALESCE(SUM(sign * allocated_qty), 0) AS allocated
+        FROM _status_changes
+    ) t
+    ON CONFLICT (shard) DO UPDATE SET
+        total_skus = s.total_skus + EXCLUDED.total_skus,
+        total_materials = s.total_materials + EXCLUDED.total_materials,
+        sufficient_count = s.sufficient_count + EXCLUDED.sufficient_count,
+        low_stock_count = s.low_stock_count + EXCLUDED.low_stock_count,
+        critical_count = s.critical_count + EXCLUDED.critical_count,
+        out_of_stock_count = s.out_of_stock_count + EXCLUDED.out_of_stock_count,
+        total_available_qty = s.total_available_qty + EXCLUDED.total_available_qty,
+        total_allocated_qty = s.total_allocated_qty + EXCLUDED.total_allocated_qty,
+        updated_at = EXCLUDED.updated_at;
+
+    DELETE FROM inventory_summary_products WHERE row_count <= 0;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 3: BACKFILL / RECONCILE
+-- =============================================
+-- Rebuilds status rows and counters from scratch; safe to rerun if the
+-- counters are ever suspected to have drifted.
+
+CREATE OR REPLACE FUNCTION rebuild_inventory_summary()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE inventory_summary IN EXCLUSIVE MODE;
+
+    DELETE FROM inventory_stock_status;
+    DELETE FROM inventory_summary_products;
+    DELETE FROM inventory_summary;
+
+    PERFORM refresh_inventory_stock_status(ARRAY(SELECT id FROM inventory));
+END;
+$$ LANGUAGE plpgsql;
+
+-- =============================================
+-- STEP 4: REBUILD
+-- =============================================
+
+SELECT rebuild_inventory_summary();
+
+COMMENT ON TABLE inventory_summary IS 'Sharded inventory KPI counters maintained by triggers; read through inventory_summary_totals';
+COMMENT ON VIEW inventory_summary_totals IS 'Inventory KPI counters summed over shards';
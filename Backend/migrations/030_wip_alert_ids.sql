@@ -0,0 +1,180 @@
+-- =============================================
+-- WIP ALERT IDS
+-- check_wip_alerts returns the ids of the alerts it created, so the
+-- caller pushes exactly those to live subscribers
+-- =============================================
+
+-- =============================================
+-- STEP 1: CHECK FUNCTION
+-- =============================================
+-- Same checks as migration 007. The return type changes, so the
+-- function is dropped first.
+
+DROP FUNCTION IF EXISTS check_wip_alerts();
+
+CREATE FUNCTION check_wip_alerts()
+RETURNS UUID[] AS $$
+DECLARE
+    stage_record RECORD;
+    config_record RECORD;
+    alert_message TEXT;
+    alert_severity VARCHAR(20);
+    alert_id UUID;
+    created_ids UUID[] := '{}';
+BEGIN
+    -- Check each active stage against alert configurations
+    FOR stage_record IN 
+        SELECT * FROM wip_stage_metrics WHERE is_active = true
+    LOOP
+        -- Check low utilization
+        FOR config_record IN 
+            SELECT * FROM wip_alert_config 
+            WHERE alert_type = 'low_utilization' 
+            AND is_active = true
+            AND (stage_name IS NULL OR stage_name = stage_record.stage_name)
+        LOOP
+            IF stage_record.utilization_percentage < config_record.threshold_value THEN
+                alert_message := format(
+                    'Low utilization detected in %s: %s%% (threshold: %s%%)',
+                    stage_record.stage_name,
+                    ROUND(stage_record.utilization_percentage, 1),
+                    config_record.threshold_value
+                );
+                
+                alert_severity := CASE 
+                    WHEN stage_record.utilization_percentage < config_record.threshold_value * 0.5 THEN 'critical'
+                    WHEN stage_record.utilization_percentage < config_record.threshold_value * 0.8 THEN 'warning'
+                    ELSE 'info'
+                END;
+                
+                -- Create alert if not already exists in last hour
+                INSERT INTO wip_alert_history (
+                    alert_config_id, alert_type, stage_name, severity, message,
+                    current_value, threshold_value, metadata
+                )
+                SELECT 
+                    config_record.id,
+                    'low_utilization',
+                    stage_record.stage_name,
+                    alert_severity,
+                    alert_message,
+                    stage_record.utilization_percentage,
+                    config_record.threshold_value,
+                    jsonb_build_object(
+                        'orders_count', stage_record.orders_count,
+                        'units_count', stage_record.units_count,
+                        'avg_time_minutes', stage_record.avg_time_minutes,
+                        'health_status', stage_record.health_status
+                    )
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM wip_alert_history
+                    WHERE alert_type = 'low_utilization'
+                    AND stage_name = stage_record.stage_name
+                    AND created_at > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+                )
+                RETURNING id INTO alert_id;
+                
+                IF alert_id IS NOT NULL THEN
+                    created_ids := created_ids || alert_id;
+                END IF;
+            END IF;
+        END LOOP;
+        
+        -- Check high average time
+        FOR config_record IN 
+            SELECT * FROM wip_alert_config 
+            WHERE alert_type = 'high_avg_time' 
+            AND is_active = true
+            AND (stage_name IS NULL OR stage_name = stage_record.stage_name)
+        LOOP
+            IF stage_record.avg_time_minutes > (stage_record.target_time_minutes * config_record.threshold_value / 100) THEN
+                alert_message := format(
+                    'High average time in %s: %s min (target: %s min)',
+                    stage_record.stage_name,
+                    ROUND(stage_record.avg_time_minutes, 1),
+                    ROUND(stage_record.target_time_minutes, 1)
+                );
+                
+                INSERT INTO wip_alert_history (
+                    alert_config_id, alert_type, stage_name, severity, message,
+                    current_value, threshold_value, metadata
+                )
+                SELECT 
+                    config_record.id,
+                    'high_avg_time',
+                    stage_record.stage_name,
+                    'warning',
+                    alert_message,
+                    stage_record.avg_time_minutes,
+                    stage_record.target_time_minutes,
+                    jsonb_build_object(
+                        'orders_count', stage_record.orders_count,
+                        'units_count', stage_record.units_count
+                    )
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM wip_alert_history
+                    WHERE alert_type = 'high_avg_time'
+                    AND stage_name = stage_record.stage_name
+                    AND created_at > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+                )
+                RETURNING id INTO alert_id;
+                
+                IF alert_id IS NOT NULL THEN
+                    created_ids := created_ids || alert_id;
+                END IF;
+            END IF;
+        END LOOP;
+        
+        -- Check stage delayed
+        IF stage_record.health_status = 'delayed' THEN
+            FOR config_record IN 
+                SELECT * FROM wip_alert_config 
+                WHERE alert_type = 'stage_delayed' 
+                AND is_active = true
+                AND (stage_name IS NULL OR stage_name = stage_record.stage_name)
+            LOOP
+                alert_message := format(
+                    'Stage %s is delayed - %s orders, %s units in queue',
+                    stage_record.stage_name,
+                    stage_record.orders_count,
+                    stage_record.units_count
+                );
+                
+                INSERT INTO wip_alert_history (
+                    alert_config_id, alert_type, stage_name, severity, message,
+                    current_value, threshold_value, metadata
+                )
+                SELECT 
+                    config_record.id,
+                    'stage_delayed',
+                    stage_record.stage_name,
+                    'critical',
+                    alert_message,
+                    stage_record.utilization_percentage,
+                    0,
+                    jsonb_build_object(
+                        'orders_count', stage_record.orders_count,
+                        'units_count', stage_record.units_count,
+                        'avg_time_minutes', stage_record.avg_time_minutes,
+                        'target_time_minutes', stage_record.target_time_minutes
+                    )
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM wip_alert_history
+                    WHERE alert_type = 'stage_delayed'
+                    AND stage_name = stage_record.stage_name
+                    AND created_at > CURRENT_TIMESTAMP - INTERVAL '30 minutes'
+                )
+                RETURNING id INTO alert_id;
+                
+                IF alert_id IS NOT NULL THEN
+                    created_ids := created_ids || alert_id;
+                END IF;
+            END LOOP;
+        END IF;
+    END LOOP;
+    
+    RETURN created_ids;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION check_wip_alerts IS 'Check WIP metrics against alert configurations, create alerts and return their ids';
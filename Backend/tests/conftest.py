@@ -0,0 +1,7 @@
+import os
+
+# Settings needed to import the app; tests never reach Supabase
+os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'test-key')
+os.environ.setdefault('SUPABASE_SERVICE_KEY', 'test-service-key')
+os.environ.setdefault('SECRET_KEY', 'test-secret')
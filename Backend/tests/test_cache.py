@@ -0,0 +1,211 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from pydantic import BaseModel
+
+from app.config import settings
+from app.core.cache import Cache
+from app.core.cache_backends import InMemoryCacheBackend, RedisCacheBackend
+
+CHANNEL = 'test:invalidate'
+
+
+class Item(BaseModel):
+    id: str
+    qty: int
+
+
+class Recorder:
+    """Invalidation handler that records what it receives."""
+
+    def __init__(self):
+        self.calls = []
+        self.received = asyncio.Event()
+
+    async def __call__(self, namespace: str, key: Optional[str]):
+        self.calls.append((namespace, key))
+        self.received.set()
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+async def redis_backends(server):
+    """Two backends sharing one fake Redis, as two workers would."""
+    backends = [
+        RedisCacheBackend(url='', channel=CHANNEL, client=FakeRedis(server=server))
+        for _ in range(2)
+    ]
+    for backend in backends:
+        await backend.start()
+    await asyncio.sleep(0.05)  # let the listeners subscribe
+    yield backends
+    for backend in backends:
+        await backend.close()
+
+
+@pytest.fixture(params=['memory', 'redis'])
+async def backend(request, server):
+    if request.param == 'memory':
+        yield InMemoryCacheBackend(max_entries=100)
+        return
+    redis_backend = RedisCacheBackend(url='', channel=CHANNEL, client=FakeRedis(server=server))
+    yield redis_backend
+    await redis_backend.close()
+
+
+async def test_set_get_round_trips_models(backend):
+    cache = Cache('items', List[Item], ttl_seconds=60, backend=backend)
+    await cache.set('page:1', [Item(id='a', qty=1), Item(id='b', qty=2)])
+
+    value = await cache.get('page:1')
+
+    assert value == [Item(id='a', qty=1), Item(id='b', qty=2)]
+    assert cache.stats.hits == 1
+
+
+async def test_missing_key_is_a_miss(backend):
+    cache = Cache('items', Item, backend=backend)
+
+    assert await cache.get('nope') is None
+    assert cache.stats.misses == 1
+
+
+async def test_entries_expire(backend, monkeypatch):
+    cache = Cache('items', Item, ttl_seconds=1, backend=backend)
+    await cache.set('a', Item(id='a', qty=1))
+
+    if isinstance(backend, RedisCacheBackend):
+        await backend._redis.pexpire(cache._key('a'), 1)
+        await asyncio.sleep(0.01)
+    else:
+        import app.core.cache as cache_module
+        now = cache_module.time.monotonic()
+        monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now + 2)
+
+    assert await cache.get('a') is None
+
+
+async def test_namespaces_are_isolated(backend):
+    items = Cache('items', Item, backend=backend)
+    others = Cache('others', Item, backend=backend)
+    await items.set('a', Item(id='a', qty=1))
+    await others.set('a', Item(id='a', qty=2))
+
+    await items.invalidate()
+
+    assert await items.get('a') is None
+    assert await others.get('a') == Item(id='a', qty=2)
+
+
+async def test_keys_are_prefixed(backend):
+    cache = Cache('items', Item, backend=backend)
+    await cache.set('a', Item(id='a', qty=1))
+
+    assert await backend.get(f'{settings.CACHE_KEY_PREFIX}:items:a') is not None
+
+
+async def test_invalidate_key_deletes_only_that_key(backend):
+    cache = Cache('items', Item, backend=backend)
+    await cache.set('a', Item(id='a', qty=1))
+    await cache.set('b', Item(id='b', qty=2))
+
+    await cache.invalidate('a')
+
+    assert await cache.get('a') is None
+    assert await cache.get('b') == Item(id='b', qty=2)
+
+
+async def test_delete_prefix(backend):
+    await backend.set('omnix:items:1', b'1', 60)
+    await backend.set('omnix:items:2', b'2', 60)
+    await backend.set('omnix:other:1', b'3', 60)
+
+    await backend.delete_prefix('omnix:items:')
+
+    assert await backend.get('omnix:items:1') is None
+    assert await backend.get('omnix:items:2') is None
+    assert await backend.get('omnix:other:1') == b'3'
+
+
+async def test_incompatible_payload_is_dropped(backend):
+    cache = Cache('items', Item, backend=backend)
+    await backend.set(cache._key('a'), b'{"id": "a"}', 60)
+
+    assert await cache.get('a') is None
+    assert await backend.get(cache._key('a')) is None
+    assert cache.stats.misses == 1
+
+
+async def test_memory_invalidation_reaches_local_handlers():
+    backend = InMemoryCacheBackend(max_entries=10)
+    recorder = Recorder()
+    backend.subscribe(recorder)
+
+    await Cache('items', Item, backend=backend).invalidate('a')
+
+    assert recorder.calls == [('items', 'a')]
+
+
+async def test_redis_invalidation_reaches_other_worker(redis_backends):
+    first, second = redis_backends
+    local, remote = Recorder(), Recorder()
+    first.subscribe(local)
+    second.subscribe(remote)
+
+    await Cache('items', Item, backend=first).invalidate('a')
+    await asyncio.wait_for(remote.received.wait(), timeout=2)
+
+    assert local.calls == [('items', 'a')]
+    assert remote.calls == [('items', 'a')]
+
+
+async def test_redis_listener_ignores_own_messages(redis_backends):
+    first, second = redis_backends
+    local = Recorder()
+    first.subscribe(local)
+    remote = Recorder()
+    second.subscribe(remote)
+
+    await first.publish_invalidation('items', None)
+    await asyncio.wait_for(remote.received.wait(), timeout=2)
+    await asyncio.sleep(0.05)
+
+    # Dispatched once locally when publishing, not again from the channel
+    assert local.calls == [('items', None)]
+
+
+async def test_redis_invalidation_evicts_shared_key_for_other_worker(redis_backends):
+    first, second = redis_backends
+    writer = Cache('items', Item, backend=first)
+    reader = Cache('items', Item, backend=second)
+    await writer.set('a', Item(id='a', qty=1))
+    assert await reader.get('a') == Item(id='a', qty=1)
+
+    await writer.invalidate('a')
+
+    assert await reader.get('a') is None
+
+
+async def test_redis_invalidation_evicts_reference_rows_in_other_worker(redis_backends):
+    from app.core.cache import ReferenceCache
+
+    first, second = redis_backends
+    caches = [ReferenceCache(ttl_seconds=60, max_entries=10) for _ in redis_backends]
+    for cache, redis_backend in zip(caches, redis_backends):
+        redis_backend.subscribe(cache._on_invalidation)
+        cache.put('products', {'id': 'p1', 'code': 'P-1'})
+    remote = Recorder()
+    second.subscribe(remote)
+
+    await first.publish_invalidation('reference:products', 'p1')
+    await asyncio.wait_for(remote.received.wait(), timeout=2)
+
+    assert caches[0].get('products', 'p1') is None
+    assert caches[1].get('products', 'p1') is None
@@ -0,0 +1,66 @@
+from typing import List
+
+import pytest
+
+from app.core.cache_backends import InMemoryCacheBackend
+from app.schemas.dashboard import ShortageItem
+from app.services.dashboard_service import DashboardService
+
+SHORTAGE = ShortageItem(
+    item_id='p1',
+    item_name='Steel sheet',
+    current_stock=2.0,
+    required_stock=10.0,
+    shortage_qty=8.0,
+    unit='kg',
+    priority='high'
+)
+
+
+class BrokenDB:
+    """Database client whose queries fail."""
+
+    def table(self, name: str):
+        raise ConnectionError('database unavailable')
+
+
+@pytest.fixture
+def dashboard():
+    service = DashboardService()
+    backend = InMemoryCacheBackend(max_entries=100)
+    for _, cache in service._sections.values():
+        cache._backend = backend
+    return service
+
+
+async def test_failed_section_serves_last_good_value(dashboard):
+    _, cache = dashboard._sections['shortages']
+    await cache.set('latest', [SHORTAGE])
+
+    value, timing = await dashboard._load_section('shortages', BrokenDB())
+
+    assert value == [SHORTAGE]
+    assert timing.status == 'error'
+    assert timing.from_cache is True
+    assert await cache.get('latest') == [SHORTAGE]
+
+
+async def test_failed_section_without_cached_value_raises(dashboard):
+    with pytest.raises(ConnectionError):
+        await dashboard._load_section('kpis', BrokenDB())
+
+
+async def test_loaded_section_replaces_cached_value(dashboard):
+    _, cache = dashboard._sections['shortages']
+    await cache.set('latest', [SHORTAGE])
+
+    async def no_shortages(db) -> List[ShortageItem]:
+        return []
+
+    dashboard._sections['shortages'] = (no_shortages, cache)
+
+    value, timing = await dashboard._load_section('shortages', BrokenDB())
+
+    assert value == []
+    assert timing.status == 'ok'
+    assert await cache.get('latest') == []
@@ -0,0 +1,30 @@
+from app.core.filters import after_keyset, contains_pattern, ilike_any
+
+
+def test_plain_term():
+    assert ilike_any(['code', 'name'], 'bolt') == 'code.ilike."%bolt%",name.ilike."%bolt%"'
+
+
+def test_like_wildcards_are_literal():
+    assert contains_pattern('10%_off') == '%10\\%\\_off%'
+    assert contains_pattern('a\\b') == '%a\\\\b%'
+
+
+def test_postgrest_syntax_is_quoted():
+    # , . ( ) stay inside the quoted value; " and \ are escaped for PostgREST
+    assert ilike_any(['name'], 'M8 (x1.25), "hex"') == 'name.ilike."%M8 (x1.25), \\"hex\\"%"'
+    assert ilike_any(['name'], '5%') == 'name.ilike."%5\\\\%%"'
+
+
+def test_star_is_single_character_wildcard():
+    assert contains_pattern('a*b') == '%a_b%'
+
+
+def test_after_keyset_compares_columns_in_order():
+    assert after_keyset(['a', 'b', 'id'], ['x', 'y', '1']) == (
+        'a.gt."x",and(a.eq."x",b.gt."y"),and(a.eq."x",b.eq."y",id.gt."1")'
+    )
+
+
+def test_after_keyset_quotes_values():
+    assert after_keyset(['code'], ['A,B (1)']) == 'code.gt."A,B (1)"'
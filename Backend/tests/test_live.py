@@ -0,0 +1,143 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import socketio
+
+from app.core import live
+from app.core.security import create_access_token, create_refresh_token
+from app.services.auth_service import auth_service
+
+PATH = '/ws/socket.io/?EIO=4&transport=polling'
+
+
+class PollingClient:
+    """Minimal Socket.IO client over long-polling against the in-process app."""
+
+    def __init__(self, http: httpx.AsyncClient):
+        self.http = http
+        self.url = None
+        self.sid = None
+
+    async def open(self):
+        response = await self.http.get(PATH)
+        sid = json.loads(response.text[1:])['sid']
+        self.url = f'{PATH}&sid={sid}'
+
+    async def send(self, packet: str):
+        await self.http.post(self.url, content=packet)
+
+    async def receive(self) -> str:
+        return (await self.http.get(self.url)).text
+
+    async def connect(self, token: str) -> str:
+        await self.open()
+        await self.send('40' + json.dumps({'token': token}))
+        reply = await self.receive()
+        if reply.startswith('40'):
+            self.sid = json.loads(reply[2:])['sid']
+        return reply
+
+    async def assert_nothing_received(self):
+        """Send a marker to this client alone; it must be the only packet waiting."""
+        await live.sio.emit('marker', to=self.sid)
+        assert await self.receive() == '42["marker"]'
+
+    async def subscribe(self, *topics: str) -> str:
+        await self.send('421' + json.dumps(['subscribe', {'topics': list(topics)}]))
+        return await self.receive()
+
+
+@pytest.fixture
+def users(monkeypatch):
+    roles = {'sup': ['Supervisor'], 'op': ['Operator'], 'off': ['Operator']}
+
+    async def get_current_user(user_id):
+        return SimpleNamespace(id=user_id, roles=roles[user_id], is_active=user_id != 'off')
+
+    monkeypatch.setattr(auth_service, 'get_current_user', get_current_user)
+
+
+@pytest.fixture
+async def http():
+    transport = httpx.ASGITransport(app=live.live_app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+        yield client
+
+
+def token(user_id: str) -> str:
+    return create_access_token({'sub': user_id})
+
+
+def test_memory_broker_is_default():
+    assert type(live.sio.manager) is socketio.AsyncManager
+
+
+def test_unknown_broker_is_rejected(monkeypatch):
+    monkeypatch.setattr(live.settings, 'LIVE_BROKER', 'kafka')
+    with pytest.raises(ValueError):
+        live.create_client_manager()
+
+
+async def test_connect_requires_access_token(users, http):
+    assert (await PollingClient(http).connect(token('sup'))).startswith('40')
+    assert (await PollingClient(http).connect('not-a-token')).startswith('44')
+    assert (await PollingClient(http).connect(create_refresh_token({'sub': 'sup'}))).startswith('44')
+    assert (await PollingClient(http).connect(token('off'))).startswith('44')
+
+
+async def test_subscribe_accepts_known_topics(users, http):
+    client = PollingClient(http)
+    await client.connect(token('sup'))
+
+    reply = await client.subscribe('dashboard', 'alerts', 'bogus')
+
+    assert reply == '431' + json.dumps([{'topics': ['dashboard', 'alerts']}], separators=(',', ':'))
+
+
+async def test_publish_reaches_topic_subscribers_only(users, http):
+    watcher, idle = PollingClient(http), PollingClient(http)
+    await watcher.connect(token('sup'))
+    await idle.connect(token('op'))
+    await watcher.subscribe('wip')
+
+    await live.publish('wip', 'wip:stages', {'stages': []})
+    await live.publish('dashboard', 'dashboard:update', {'sections': {}})
+
+    assert await watcher.receive() == '42["wip:stages",{"stages":[]}]'
+    await idle.assert_nothing_received()
+
+
+async def test_alerts_go_to_subscribed_roles(users, http):
+    supervisor, operator = PollingClient(http), PollingClient(http)
+    await supervisor.connect(token('sup'))
+    await operator.connect(token('op'))
+    await supervisor.subscribe('alerts')
+    await operator.subscribe('alerts')
+
+    await live.publish(live.alerts_room('Supervisor'), 'alert:new', {'id': 'a1'})
+
+    assert await supervisor.receive() == '42["alert:new",{"id":"a1"}]'
+    await operator.assert_nothing_received()
+
+
+async def test_unsubscribe_stops_delivery(users, http):
+    client = PollingClient(http)
+    await client.connect(token('sup'))
+    await client.subscribe('wip')
+    await client.send('422' + json.dumps(['unsubscribe', {'topics': ['wip']}]))
+    await client.receive()
+
+    await live.publish('wip', 'wip:order', {'id': 'o1'})
+
+    await client.assert_nothing_received()
+
+
+async def test_publish_failures_are_swallowed(monkeypatch):
+    async def broken_emit(*args, **kwargs):
+        raise ConnectionError('broker down')
+
+    monkeypatch.setattr(live.sio, 'emit', broken_emit)
+
+    await live.publish('wip', 'wip:order', {'id': 'o1'})